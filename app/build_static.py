@@ -0,0 +1,31 @@
+# /app/build_static.py
+"""
+Static asset build. Writes STATIC_BUILD_DIR (default build/static) from static/:
+
+  * every non-HTML file gets a content-hashed copy (name.<hash>.ext) next to the original;
+  * HTML entry points reference the hashed copies; pages with ES modules (noVNC's
+    vnc.html) get an import map to the hashed modules plus <link rel=modulepreload>
+    for the whole module graph, so a cold browser fetches it in one parallel round
+    instead of one import level at a time;
+  * text assets get .gz variants (and .br when the brotli package is installed).
+
+main.py serves the build, with PrecompressedStaticFiles, while it is newer than every
+source file; otherwise it falls back to static/ as before.
+
+    cd app && python build_static.py
+"""
+import argparse
+import logging
+from pathlib import Path
+
+from configs.config import STATIC_DIR, STATIC_BUILD_DIR
+from methods.assets.assets import build_static
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build hashed, precompressed static assets")
+    parser.add_argument("--src", default=STATIC_DIR)
+    parser.add_argument("--out", default=STATIC_BUILD_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    manifest = build_static(Path(args.src), Path(args.out))
+    print(f"{len(manifest)} hashed assets → {args.out}")
@@ -2,7 +2,8 @@
 from pathlib import Path
 from types import SimpleNamespace
 from dotenv import load_dotenv, find_dotenv
-import os, logging, redis as _redis
+import os, json, socket, logging, redis as _redis
+from configs.logging_setup import setup_logging, parse_rules, multi_process
 
 # --- Load .env ---
 load_dotenv(find_dotenv(filename=".env"), override=False)
@@ -18,6 +19,8 @@ def env(name, default=None, *, required=False, cast=str):
         return str(v).lower() in {"1", "true", "yes", "on"}
     if cast is int:
         return int(v)
+    if cast is float:
+        return float(v)
     return v  # str
 
 # ---------- core app config ----------
@@ -31,6 +34,11 @@ ACCESS_TOKEN_EXPIRE_MINUTES = env("ACCESS_TOKEN_EXPIRE_MINUTES", 30, cast=int)
 COOKIE_MAX_AGE = env("COOKIE_MAX_AGE", 604800, cast=int)
 TG_BOT_TOKEN = env("TG_BOT_TOKEN")
 TG_CHAT_ID = env("TG_CHAT_ID")
+TG_API_BASE = env("TG_API_BASE", "https://api.telegram.org")
+# alert dispatcher: queue bound, HTTP timeout, and window in which repeats of one alert become a digest
+ALERT_QUEUE_MAX      = env("ALERT_QUEUE_MAX", 200, cast=int)
+ALERT_HTTP_TIMEOUT_S = env("ALERT_HTTP_TIMEOUT_S", 5, cast=int)
+ALERT_DIGEST_S       = env("ALERT_DIGEST_S", 300, cast=int)
 
 # uploads
 MAX_ISO_BYTES = 2 * 1024 * 1024 * 1024  # 2 GiB
@@ -43,23 +51,52 @@ VM_PROFILES = {
         "overlay_prefix": "alpine",
         "base_image": Path("/root/myapp/base_images/Alpine/alpine-base.qcow2"),
         "default_memory": 1024,
+        "smp": 1,
     },
     "tiny": {
         "overlay_dir": Path("/root/myapp/overlays/Tiny"),
         "overlay_prefix": "tiny",
         "base_image": Path("/root/myapp/base_images/Tiny/tinycore-base.qcow2"),
         "default_memory": 1024,
+        "smp": 1,
     },
     "ubuntu": {
         "overlay_dir": Path("/root/myapp/overlays/Ubuntu"),
         "overlay_prefix": "ubuntu",
         "base_image": Path("/root/myapp/base_images/Ubuntu/ubuntu20-base.qcow2"),
         "default_memory": 2048,
+        "smp": 2,
+        # optional per-profile overrides: "accel": "kvm"|"tcg", "cpu": "host"|"max"|...
+        # block tuning (see OverlayManager.BLOCK_DEFAULTS); 4M L2 cache maps the whole 20G disk
+        "block": {
+            "aio": "threads",
+            "cache": "writeback",
+            "iothread": True,
+            "l2_cache_size": "4M",
+            "cache_clean_interval": 900,
+            "detect_zeroes": "unmap",
+        },
+        # block I/O limits for the user's throttle group (see IoThrottle); bursts up to 10 s
+        "io": {
+            "iops": 2000,
+            "bps": 200 * 1024 * 1024,
+            "iops_max": 4000,
+            "bps_max": 400 * 1024 * 1024,
+            "max_length": 10,
+        },
+        # VNC server options (see VncQuality.VNC_DEFAULTS): JPEG over Tight, quality adapted per connection
+        "vnc": {
+            "lossy": True,
+            "encodings": ["tight", "zrle", "hextile"],
+            "quality": 8,
+            "audio": False,
+        },
     },
     "custom": {
         "prefix": "{uid}.iso",
         "base_image": Path("/root/myapp/custom/"),
-        "default_memory": 2048
+        "default_memory": 2048,
+        "smp": 2,
         # e.g. Path("/root/myapp/custom/{uid}.iso")
     },
     # "lubuntu": {
@@ -70,6 +107,45 @@ VM_PROFILES = {
     # },
 }
 SNAPSHOTS_PATH = Path("/root/myapp/snapshots/")
+# blank overlays kept pre-created per profile (profile "pool_size" overrides)
+OVERLAY_POOL_SIZE = env("OVERLAY_POOL_SIZE", 2, cast=int)
+# base image page-cache warming: qcow2 metadata + first N MiB; optional mlock budget (0 = off)
+BASE_IMAGE_WARM_MB  = env("BASE_IMAGE_WARM_MB", 256, cast=int)
+BASE_IMAGE_MLOCK_MB = env("BASE_IMAGE_MLOCK_MB", 0, cast=int)
+# orphan reconciler: pass interval, and how old a process/file without a session must be to be reclaimed
+RECONCILE_INTERVAL_S = env("RECONCILE_INTERVAL_S", 60, cast=int)
+ORPHAN_GRACE_S       = env("ORPHAN_GRACE_S", 120, cast=int)
+# guest stats over QMP: sampling interval, and how many users get their own series (rest → "other")
+GUEST_STATS_INTERVAL_S = env("GUEST_STATS_INTERVAL_S", 15, cast=int)
+GUEST_STATS_TOP_K      = env("GUEST_STATS_TOP_K", 10, cast=int)
+# block I/O: per-user overrides of a profile's "io" limits, JSON {"<user_id>": {"iops": 500, ...}}
+IO_USER_LIMITS = json.loads(env("IO_USER_LIMITS", "{}"))
+# fair-share policy: host disk capacity (both 0 = off), share of it that counts as contention,
+# how long a clamp is held after the guest stops exceeding its share, and per-VM floors
+IO_HOST_IOPS         = env("IO_HOST_IOPS", 0, cast=int)
+IO_HOST_BPS          = env("IO_HOST_BPS", 0, cast=int)
+IO_CONTENTION_RATIO  = env("IO_CONTENTION_RATIO", 0.8, cast=float)
+IO_POLICY_INTERVAL_S = env("IO_POLICY_INTERVAL_S", 10, cast=int)
+IO_THROTTLE_HOLD_S   = env("IO_THROTTLE_HOLD_S", 60, cast=int)
+IO_MIN_IOPS          = env("IO_MIN_IOPS", 100, cast=int)
+IO_MIN_BPS           = env("IO_MIN_BPS", 10 * 1024 * 1024, cast=int)
+# memory density: virtio-balloon with free page reporting (profile "balloon" overrides BALLOON);
+# under host RAM pressure idle guests are shrunk to BALLOON_TARGET_PCT, restored below RELEASE
+BALLOON              = env("BALLOON", False, cast=bool)
+BALLOON_PRESSURE_PCT = env("BALLOON_PRESSURE_PCT", 85, cast=int)
+BALLOON_RELEASE_PCT  = env("BALLOON_RELEASE_PCT", 75, cast=int)
+BALLOON_IDLE_CPU_PCT = env("BALLOON_IDLE_CPU_PCT", 5, cast=int)
+BALLOON_TARGET_PCT   = env("BALLOON_TARGET_PCT", 50, cast=int)
+BALLOON_MIN_MB       = env("BALLOON_MIN_MB", 256, cast=int)
+BALLOON_INTERVAL_S   = env("BALLOON_INTERVAL_S", 15, cast=int)
+KSM_ENABLE           = env("KSM_ENABLE", False, cast=bool)   # start the host KSM scanner (root)
+KSM_PAGES_TO_SCAN    = env("KSM_PAGES_TO_SCAN", 1000, cast=int)
+
+# ---------- QEMU accelerator ----------
+QEMU_ACCEL  = env("QEMU_ACCEL", "auto")          # auto|kvm|tcg (auto probes /dev/kvm)
+TCG_TB_SIZE = env("TCG_TB_SIZE", 256, cast=int)  # MiB translation cache per TCG guest
+QEMU_BIN     = env("QEMU_BIN", "qemu-system-x86_64")   # tests/fakes/ has stand-ins for benchmarks
+QEMU_IMG_BIN = env("QEMU_IMG_BIN", "qemu-img")
 
 # ---------- Redis ----------
 REDIS_URL = env("REDIS_URL", "redis://127.0.0.1:6379/0")
@@ -83,22 +159,71 @@ WS_GATEWAY_BASE = env("WS_GATEWAY_BASE", "ws://gateway:6080/ws")  # set to wss:/
 VNC_SOCK_DIR    = env("VNC_SOCK_DIR", "/run/vmshare/vnc")
 SPICE_SOCK_DIR  = env("SPICE_SOCK_DIR", "/run/vmshare/spice")
 DEFAULT_BACKEND = env("DEFAULT_BACKEND", "unix")  # unix|tcp
-SESSION_TTL     = env("SESSION_TTL", 300, cast=int)
+SESSION_TTL     = env("SESSION_TTL", 300, cast=int)  # heartbeat lease; 0 disables leases and the reaper
+SESSION_HEARTBEAT_S = env("SESSION_HEARTBEAT_S", 30, cast=int)  # at most one lease renewal per VM this often
+SESSION_SWEEP_S = env("SESSION_SWEEP_S", 60, cast=int)  # reaper sweep (covers missed expiry notifications)
+LAUNCH_LEASE_S  = env("LAUNCH_LEASE_S", 180, cast=int)  # per-user launch reservation; outlives the slowest boot
+LAUNCH_JOB_TTL_S = env("LAUNCH_JOB_TTL_S", 600, cast=int)  # launch progress kept this long after its last event
+LIFECYCLE_STREAM_MAXLEN = env("LIFECYCLE_STREAM_MAXLEN", 100_000, cast=int)  # events:lifecycle trimmed to ~this
+SHUTDOWN_DEADLINE_S = env("SHUTDOWN_DEADLINE_S", 20, cast=int)  # guest powerdown budget on app exit
+STATIC_DIR      = env("STATIC_DIR", "static")
+STATIC_BUILD_DIR = env("STATIC_BUILD_DIR", "build/static")  # build_static.py output, served while it is current
+VNC_BRIDGE      = env("VNC_BRIDGE", "native")        # native (in-process, instrumented) | websockify
+VNC_WINDOW_S    = env("VNC_WINDOW_S", 5, cast=int)   # bridge metrics window
+VNC_STALL_S     = env("VNC_STALL_S", 5, cast=int)    # unanswered full update request → stall
+VNC_SHARING     = env("VNC_SHARING", "off")          # off (one browser per VM) | shared (1 read-write + N read-only) | view-only
+VNC_MAX_VIEWERS = env("VNC_MAX_VIEWERS", 8, cast=int)  # browsers per shared session
+VNC_VIEWER_QUEUE_BYTES = env("VNC_VIEWER_QUEUE_BYTES", 4 * 1024 * 1024, cast=int)  # backlog before a viewer skips updates
+VNC_OWNER_TOKEN_TTL_S = env("VNC_OWNER_TOKEN_TTL_S", 86400, cast=int)  # owner's (read-write) viewer link stays valid this long
+VNC_SHARE_TTL_S = env("VNC_SHARE_TTL_S", 3600, cast=int)  # a read-only share link can be opened for this long
+VNC_SLOW_RTT_MS = env("VNC_SLOW_RTT_MS", 250, cast=int)  # browser ping RTT that counts as a slow link
+VNC_CONGESTED_BYTES = env("VNC_CONGESTED_BYTES", 256 * 1024, cast=int)  # still queued at window end → slow link
+THUMB_RATE_PER_S = env("THUMB_RATE_PER_S", 2.0, cast=float)  # screendumps per second per node, all VMs together
+THUMB_MIN_INTERVAL_S = env("THUMB_MIN_INTERVAL_S", 10, cast=int)  # a watched VM is re-captured at most this often
+THUMB_DEMAND_S  = env("THUMB_DEMAND_S", 30, cast=int)  # a VM stays watched this long after its thumbnail was requested
+THUMB_WIDTH     = env("THUMB_WIDTH", 320, cast=int)    # thumbnail width in pixels (aspect ratio kept)
 TCP_HOST        = env("TCP_HOST", "127.0.0.1")
 TCP_PORT        = env("TCP_PORT", 5901, cast=int)
 ONE_TIME_TOKENS = env("ONE_TIME_TOKENS", False, cast=bool)
 
+# ---------- Cluster (worker nodes) ----------
+# CLUSTER_MODE: /run-script places VMs on node agents (node_agent.py) instead of booting locally
+CLUSTER_MODE       = env("CLUSTER_MODE", False, cast=bool)
+NODE_ID            = env("NODE_ID", socket.gethostname())
+NODE_PUBLIC_HOST   = env("NODE_PUBLIC_HOST", SERVER_HOST)   # where browsers reach this node's VNC bridges
+NODE_AGENT_URL     = env("NODE_AGENT_URL", "")              # how the API reaches this node's agent
+AGENT_HOST         = env("AGENT_HOST", "0.0.0.0")
+AGENT_PORT         = env("AGENT_PORT", 9100, cast=int)
+AGENT_TOKEN        = env("AGENT_TOKEN", "")                 # shared secret, X-Agent-Token header
+NODE_MEM_MB        = env("NODE_MEM_MB", 0, cast=int)        # RAM VMs may use on this node (0 = all)
+NODE_MEM_RESERVE_MB = env("NODE_MEM_RESERVE_MB", 1024, cast=int)  # kept free for the host
+NODE_HEARTBEAT_S   = env("NODE_HEARTBEAT_S", 5, cast=int)
+NODE_TTL_S         = env("NODE_TTL_S", 15, cast=int)        # node is dead after this long without a heartbeat
+
 # ---------- Logging ----------
 LOG_DIR = env("LOG_DIR", "/root/myapp/logs/")
 LOG_NAME = env("LOG_NAME", "logs.log")
 log_file_path = os.path.join(LOG_DIR, LOG_NAME)
 os.makedirs(LOG_DIR, exist_ok=True)
-logging.basicConfig(
-    filename=log_file_path,
-    level=logging.INFO,
-    format="%(asctime)s.%(msecs)03d [%(levelname)s] %(name)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    force=True,
+LOG_LEVEL     = env("LOG_LEVEL", "INFO").upper()
+LOG_JSON      = env("LOG_JSON", False, cast=bool)
+LOG_MAX_BYTES = env("LOG_MAX_BYTES", 50 * 1024 * 1024, cast=int)  # rotate at this size
+LOG_BACKUPS   = env("LOG_BACKUPS", 5, cast=int)
+# size: this process rotates (single worker only) | external: append only, logrotate rotates
+# auto: external when several workers share the file (WEB_CONCURRENCY > 1 or PROMETHEUS_MULTIPROC_DIR)
+LOG_ROTATE    = env("LOG_ROTATE", "auto")
+# per-logger prefix rules for DEBUG/INFO records: keep a fraction / at most N per second
+LOG_SAMPLE     = parse_rules(env("LOG_SAMPLE", ""))
+LOG_RATE_LIMIT = parse_rules(env("LOG_RATE_LIMIT", "methods.manager.WebsockifyService=20,methods.manager.VncBridge=20"))
+setup_logging(
+    log_file_path,
+    getattr(logging, LOG_LEVEL, logging.INFO),
+    json_output=LOG_JSON,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUPS,
+    sample=LOG_SAMPLE,
+    rate_limit=LOG_RATE_LIMIT,
+    rotate=LOG_ROTATE == "size" or (LOG_ROTATE == "auto" and not multi_process()),
 )
 
 # ---------- namespaces for simple imports ----------
@@ -122,9 +247,37 @@ server = SimpleNamespace(
     SPICE_SOCK_DIR=SPICE_SOCK_DIR,
     DEFAULT_BACKEND=DEFAULT_BACKEND,
     SESSION_TTL=SESSION_TTL,
+    SESSION_HEARTBEAT_S=SESSION_HEARTBEAT_S,
+    SESSION_SWEEP_S=SESSION_SWEEP_S,
+    LAUNCH_LEASE_S=LAUNCH_LEASE_S,
+    LAUNCH_JOB_TTL_S=LAUNCH_JOB_TTL_S,
+    LIFECYCLE_STREAM_MAXLEN=LIFECYCLE_STREAM_MAXLEN,
+    SHUTDOWN_DEADLINE_S=SHUTDOWN_DEADLINE_S,
+    STATIC_DIR=STATIC_DIR,
+    STATIC_BUILD_DIR=STATIC_BUILD_DIR,
+    VNC_BRIDGE=VNC_BRIDGE,
+    VNC_WINDOW_S=VNC_WINDOW_S,
+    VNC_STALL_S=VNC_STALL_S,
+    VNC_SHARING=VNC_SHARING,
+    VNC_MAX_VIEWERS=VNC_MAX_VIEWERS,
+    VNC_VIEWER_QUEUE_BYTES=VNC_VIEWER_QUEUE_BYTES,
+    VNC_OWNER_TOKEN_TTL_S=VNC_OWNER_TOKEN_TTL_S,
+    VNC_SHARE_TTL_S=VNC_SHARE_TTL_S,
+    VNC_SLOW_RTT_MS=VNC_SLOW_RTT_MS,
+    VNC_CONGESTED_BYTES=VNC_CONGESTED_BYTES,
+    THUMB_RATE_PER_S=THUMB_RATE_PER_S,
+    THUMB_MIN_INTERVAL_S=THUMB_MIN_INTERVAL_S,
+    THUMB_DEMAND_S=THUMB_DEMAND_S,
+    THUMB_WIDTH=THUMB_WIDTH,
     TCP_HOST=TCP_HOST,
     TCP_PORT=TCP_PORT,
     ONE_TIME_TOKENS=ONE_TIME_TOKENS,
+    CLUSTER_MODE=CLUSTER_MODE,
+    NODE_ID=NODE_ID,
+    NODE_PUBLIC_HOST=NODE_PUBLIC_HOST,
+    AGENT_PORT=AGENT_PORT,
+    NODE_HEARTBEAT_S=NODE_HEARTBEAT_S,
+    NODE_TTL_S=NODE_TTL_S,
 )
 
 redis = SimpleNamespace(
@@ -135,12 +288,35 @@ redis = SimpleNamespace(
 vm = SimpleNamespace(
     PROFILES=VM_PROFILES,
     SNAPSHOTS_PATH=SNAPSHOTS_PATH,
+    OVERLAY_POOL_SIZE=OVERLAY_POOL_SIZE,
+    BASE_IMAGE_WARM_MB=BASE_IMAGE_WARM_MB,
+    BASE_IMAGE_MLOCK_MB=BASE_IMAGE_MLOCK_MB,
+    RECONCILE_INTERVAL_S=RECONCILE_INTERVAL_S,
+    ORPHAN_GRACE_S=ORPHAN_GRACE_S,
+    GUEST_STATS_INTERVAL_S=GUEST_STATS_INTERVAL_S,
+    GUEST_STATS_TOP_K=GUEST_STATS_TOP_K,
+    IO_USER_LIMITS=IO_USER_LIMITS,
+    IO_HOST_IOPS=IO_HOST_IOPS,
+    IO_HOST_BPS=IO_HOST_BPS,
+    IO_CONTENTION_RATIO=IO_CONTENTION_RATIO,
+    IO_POLICY_INTERVAL_S=IO_POLICY_INTERVAL_S,
+    IO_THROTTLE_HOLD_S=IO_THROTTLE_HOLD_S,
+    BALLOON=BALLOON,
+    BALLOON_PRESSURE_PCT=BALLOON_PRESSURE_PCT,
+    BALLOON_RELEASE_PCT=BALLOON_RELEASE_PCT,
+    KSM_ENABLE=KSM_ENABLE,
+    QEMU_ACCEL=QEMU_ACCEL,
+    TCG_TB_SIZE=TCG_TB_SIZE,
+    QEMU_BIN=QEMU_BIN,
+    QEMU_IMG_BIN=QEMU_IMG_BIN,
 )
 
 logs = SimpleNamespace(
     LOG_DIR=LOG_DIR,
     LOG_NAME=LOG_NAME,
     FILE=log_file_path,
+    LEVEL=LOG_LEVEL,
+    JSON=LOG_JSON,
     logging=logging,  # stdlib logging (already configured)
 )
 
@@ -0,0 +1,198 @@
+# /app/configs/logging_setup.py
+"""
+Non-blocking logging: every handler on the root logger is a QueueHandler; a single
+QueueListener thread owns the file. Callers only pay for formatting the message and a
+queue put, so the event loop never waits on disk.
+
+Rotation: a single process rotates the file itself by size. Several processes writing the
+same file (uvicorn --workers N) must not: each would roll it over on its own and lose or
+truncate the others' lines. There every worker only appends, through a WatchedFileHandler
+that reopens the file after an external logrotate (create or copytruncate) has moved it.
+
+Chatty loggers can be sampled (keep a fraction of DEBUG/INFO records) or rate limited
+(token bucket per logger); WARNING and above always pass.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from typing import Optional
+
+PLAIN_FORMAT = "%(asctime)s.%(msecs)03d [%(levelname)s] %(name)s: %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_rules(spec: Optional[str]) -> dict[str, float]:
+    """'methods.auth=0.1,routers.vm=0.5' → {'methods.auth': 0.1, 'routers.vm': 0.5}"""
+    rules: dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, sep, value = part.strip().partition("=")
+        if sep and name:
+            rules[name.strip()] = float(value)
+    return rules
+
+
+def _match(rules: dict[str, float], name: str) -> Optional[float]:
+    """Value of the most specific rule whose logger prefix covers `name`."""
+    while True:
+        if name in rules:
+            return rules[name]
+        if "." not in name:
+            return None
+        name = name.rsplit(".", 1)[0]
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of sub-WARNING records for the configured loggers."""
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self._rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = _match(self._rates, record.name)
+        return rate is None or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger (records/second, burst = one second's worth) for sub-WARNING
+    records. The first record let through after a drop says how many were suppressed.
+    """
+
+    def __init__(self, limits: dict[str, float]) -> None:
+        super().__init__()
+        self._limits = limits
+        self._buckets: dict[str, list[float]] = {}  # name → [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        limit = _match(self._limits, record.name)
+        if limit is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(record.name, [limit, now, 0])
+            bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = int(bucket[2]), 0
+        if suppressed:
+            record.msg = f"[{suppressed} suppressed] {record.getMessage()}"
+            record.args = None
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback in exc_text instead of folding it into msg,
+    so the writer's formatter (plain or JSON) decides how to render it."""
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg (+ exc)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record, DATE_FORMAT) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False)
+
+
+def setup_logging(
+    log_file: str,
+    level: int = logging.INFO,
+    *,
+    json_output: bool = False,
+    max_bytes: int = 50 * 1024 * 1024,
+    backup_count: int = 5,
+    sample: Optional[dict[str, float]] = None,
+    rate_limit: Optional[dict[str, float]] = None,
+    rotate: bool = True,
+) -> logging.handlers.QueueListener:
+    """
+    Install the queue pipeline on the root logger (replacing its handlers) and start the writer.
+    rotate=False: append only and leave rotation to logrotate (several processes, one file).
+    """
+    global _listener
+    stop_logging()
+
+    if rotate:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+    else:
+        file_handler = logging.handlers.WatchedFileHandler(log_file, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(PLAIN_FORMAT, DATE_FORMAT))
+
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(q)
+    if sample:
+        queue_handler.addFilter(SamplingFilter(sample))
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter(rate_limit))
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+        h.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(q, file_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def multi_process(environ=os.environ) -> bool:
+    """True when several server processes share the log file (uvicorn/gunicorn workers)."""
+    try:
+        workers = int(environ.get("WEB_CONCURRENCY") or 1)
+    except ValueError:
+        workers = 1
+    return workers > 1 or bool(environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def stop_logging() -> None:
+    """Flush what is queued and stop the writer thread (also runs at interpreter exit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -25,14 +25,15 @@ if mp:
 
 # ---- now import the rest ----
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from methods.assets.assets import PrecompressedStaticFiles, static_root
 
 from routers.root import router as root_router
-from routers.vm   import router as vm_router
+from routers.vm   import router as vm_router, drain_launches
 from routers.auth import router as auth_router
 from routers.sessions import router as sessions_router
 from routers.pages import router as pages_router
 from routers.post import router as post_router
+from routers.node_proxy import router as node_proxy_router
 
 from observability.grafana_proxy import router as grafana_router
 
@@ -46,18 +47,47 @@ from observability.metrics import (
 
 from observability.db_metrics import init_db_metrics
 from observability.utils_observability import resource_watchdog
+from observability.guest_metrics import guest_stats_sampler
+from observability.report import get_alert_dispatcher
+from observability.prom_query import get_prom_query_cache
 
 from methods.manager.SessionManager import get_session_store
-from utils import cleanup_vm
+from methods.manager.OverlayManager import detect_accel
+from methods.manager.OverlayPool import get_overlay_pool
+from methods.manager.BaseImageCache import base_image_warmer
+from methods.manager.ShutdownCoordinator import shutdown_all_vms
+from methods.manager.Reconciler import orphan_reconciler
+from methods.manager.SessionLease import session_reaper
+from methods.manager.LifecycleEvents import lifecycle_metrics_consumer
+from methods.manager.IoThrottle import io_fair_share_policy
+from methods.manager.MemoryBalloon import memory_density_loop
+from methods.manager.Thumbnails import get_thumbnail_service
+from observability.qemu_metrics import set_host_accel
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     stop_event = asyncio.Event()
     tasks = []
 
+    accel = detect_accel()
+    set_host_accel(accel)
+    logger.info("main.py: QEMU accelerator resolved to %s", accel)
+
+    # every worker serves /feedback, so every worker gets a dispatcher
+    tasks.append(asyncio.create_task(get_alert_dispatcher().run(stop_event)))
+
     if should_run_samplers():
         tasks.append(asyncio.create_task(metrics_collector(get_session_store, stop_event, interval_sec=15)))
         tasks.append(asyncio.create_task(resource_watchdog(stop_event)))
+        tasks.append(asyncio.create_task(guest_stats_sampler(get_session_store, stop_event)))
+        tasks.append(asyncio.create_task(get_overlay_pool().run(stop_event)))
+        tasks.append(asyncio.create_task(base_image_warmer(get_session_store, stop_event)))
+        tasks.append(asyncio.create_task(orphan_reconciler(get_session_store, stop_event)))
+        tasks.append(asyncio.create_task(session_reaper(get_session_store, stop_event)))
+        tasks.append(asyncio.create_task(lifecycle_metrics_consumer(stop_event)))
+        tasks.append(asyncio.create_task(io_fair_share_policy(get_session_store, stop_event)))
+        tasks.append(asyncio.create_task(memory_density_loop(get_session_store, stop_event)))
+        tasks.append(asyncio.create_task(get_thumbnail_service().run(get_session_store, stop_event)))
 
     try:
         yield
@@ -70,25 +100,15 @@ async def lifespan(app: FastAPI):
             except asyncio.TimeoutError:
                 t.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
+        await get_prom_query_cache().aclose()
 
         logger.info("main.py: lifespan shutdown → beginning cleanup")
-        store = get_session_store()
+        await drain_launches()  # a launch still booting would otherwise leave its VM behind
         try:
-            sessions = store.items()
-            logger.info("main.py: found %d sessions to clean", len(sessions))
+            summary = await shutdown_all_vms(get_session_store())
+            logger.info("main.py: shutdown cleanup done %s", summary)
         except Exception:
-            sessions = []
-            logger.exception("main.py: failed to enumerate sessions")
-
-        for vmid, _ in sessions:
-            try:
-                cleanup_vm(vmid, store)
-            except Exception:
-                logger.exception("cleanup_vm failed for %s", vmid)
-            try:
-                store.delete(vmid)
-            except Exception:
-                logger.exception("store.delete failed for %s", vmid)
+            logger.exception("main.py: shutdown cleanup failed")
 
 app = FastAPI(lifespan=lifespan)
 
@@ -112,8 +132,11 @@ app.include_router(sessions_router)
 app.include_router(metrics_router)
 app.include_router(pages_router)
 app.include_router(post_router)
+app.include_router(node_proxy_router)
 app.include_router(grafana_router)
 
 # ---- Static ----
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/novnc", StaticFiles(directory="static/novnc-ui", html=True), name="novnc")
+# build_static.py output when current (hashed names, .br/.gz, immutable caching), else static/
+STATIC_ROOT = static_root()
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_ROOT), name="static")
+app.mount("/novnc", PrecompressedStaticFiles(directory=STATIC_ROOT / "novnc-ui", html=True), name="novnc")
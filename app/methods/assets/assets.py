@@ -0,0 +1,240 @@
+# /app/methods/assets/assets.py
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from configs.config import STATIC_DIR, STATIC_BUILD_DIR
+
+try:  # optional: .br variants are only built when the brotli package is installed
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+HASH_LEN = 10
+HASHED = re.compile(r"\.([0-9a-f]{%d})\.[A-Za-z0-9]+$" % HASH_LEN)  # name.<hash>.ext
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"  # HTML entry points and unhashed names: always check the ETag
+COMPRESSIBLE = {".html", ".js", ".mjs", ".css", ".svg", ".json", ".txt", ".map", ".ico", ".wasm"}
+MIN_COMPRESS_BYTES = 256
+# (encoding, suffix) in order of preference
+VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+_IMPORT = re.compile(r"""(?:\bimport|\bexport\b[^;'"]*?\bfrom)\s*(?:[\w*{}\s,$]+?\bfrom\s*)?["']([^"']+)["']""")
+_ATTR = re.compile(r"""\b(src|href)=(["'])([^"'#?]+)\2""")
+_MODULE_SCRIPT = re.compile(r"""<script\b[^>]*type=["']module["'][^>]*>(.*?)</script>""", re.S | re.I)
+_MODULE_SRC = re.compile(r"""<script\b[^>]*type=["']module["'][^>]*\bsrc=["']([^"']+)["']""", re.I)
+
+
+# ----- build
+
+def _hashed_name(path: Path, data: bytes) -> str:
+    return f"{path.stem}.{hashlib.sha256(data).hexdigest()[:HASH_LEN]}{path.suffix}"
+
+
+def _imports(source: str) -> list[str]:
+    """Relative ES module specifiers (static import/export ... from) in `source`."""
+    return [s for s in _IMPORT.findall(source) if s.startswith(("./", "../"))]
+
+
+def _module_graph(entries: list[Path], src: Path) -> list[Path]:
+    """Every local module reachable from `entries` through imports (entries excluded)."""
+    seen: dict[Path, None] = {}
+    stack = list(entries)
+    while stack:
+        mod = stack.pop()
+        for spec in _imports(mod.read_text(encoding="utf-8")):
+            dep = (mod.parent / spec).resolve()
+            if dep.is_file() and dep.is_relative_to(src) and dep not in seen:
+                seen[dep] = None
+                stack.append(dep)
+    return list(seen)
+
+
+def _rel(path: Path, base: Path) -> str:
+    return "./" + Path(os.path.relpath(path, base)).as_posix()
+
+
+def _rewrite_html(html: Path, src: Path, names: dict[Path, str]) -> str:
+    """
+    Point src/href at the hashed copies, and give the page an import map + modulepreload
+    links for its whole module graph: imports keep their plain specifiers (the map
+    resolves them to hashed URLs) and the browser fetches every module in parallel
+    instead of discovering them one import level per round trip.
+    """
+    text = html.read_text(encoding="utf-8")
+    base = html.parent
+
+    def target(ref: str) -> Optional[Path]:
+        if "://" in ref or ref.startswith(("//", "data:")):
+            return None
+        for root, rel in ((base, ref), (src, ref.removeprefix("/").removeprefix("static/"))):
+            p = (root / rel).resolve()
+            if p in names:
+                return p
+        return None
+
+    def attr(m: re.Match) -> str:
+        p = target(m.group(3))
+        if p is None:
+            return m.group(0)
+        ref = m.group(3).rsplit("/", 1)
+        ref[-1] = names[p]
+        return f'{m.group(1)}={m.group(2)}{"/".join(ref)}{m.group(2)}'
+
+    # the module graph starts at <script type=module src=...> and at what inline modules import
+    entries = [p for m in _MODULE_SRC.finditer(text) if (p := target(m.group(1))) is not None]
+    inline = [p for m in _MODULE_SCRIPT.finditer(text) for spec in _imports(m.group(1))
+              if (p := (base / spec).resolve()) in names]
+    text = _ATTR.sub(attr, text)
+    graph = [p for p in dict.fromkeys(inline + _module_graph(entries + inline, src)) if p in names]
+    if not graph:
+        return text
+
+    mapping = {_rel(p, base): _rel(p.parent / names[p], base) for p in graph}
+    head = (f'  <script type="importmap">{json.dumps({"imports": mapping}, separators=(",", ":"))}</script>\n'
+            + "".join(f'  <link rel="modulepreload" href="{v}" />\n' for v in mapping.values()))
+    return text.replace("</head>", head + "</head>", 1)
+
+
+def _compress(path: Path) -> list[str]:
+    data = path.read_bytes()
+    if path.suffix not in COMPRESSIBLE or len(data) < MIN_COMPRESS_BYTES:
+        return []
+    out = []
+    variants = [("gzip", ".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(("br", ".br", lambda d: brotli.compress(d, quality=11)))
+    for enc, suffix, fn in variants:
+        packed = fn(data)
+        if len(packed) < len(data) * 0.9:  # not worth a variant otherwise
+            path.with_name(path.name + suffix).write_bytes(packed)
+            out.append(enc)
+    return out
+
+
+def build_static(src: Path = Path(STATIC_DIR), out: Path = Path(STATIC_BUILD_DIR)) -> dict:
+    """
+    Build the served copy of `src` into `out`: every non-HTML file also gets a
+    content-hashed copy (name.<hash>.ext), HTML entry points reference those, and
+    text assets get .gz (and .br with brotli installed) variants next to them.
+    manifest.json maps source paths to hashed ones. Returns the manifest.
+    """
+    src, out = src.resolve(), out.resolve()
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    files = [p for p in sorted(src.rglob("*")) if p.is_file() and not any(part.startswith(".") for part in p.relative_to(src).parts)
+             and out not in p.parents and tmp not in p.parents]
+
+    names = {p: _hashed_name(p, p.read_bytes()) for p in files if p.suffix != ".html"}
+    manifest: dict[str, str] = {}
+    for p in files:
+        rel = p.relative_to(src)
+        dest = tmp / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if p.suffix == ".html":
+            dest.write_text(_rewrite_html(p, src, names), encoding="utf-8")
+            _compress(dest)
+            continue
+        shutil.copy2(p, dest)  # plain name too, for references the build cannot see (templates, old links)
+        hashed = dest.with_name(names[p])
+        shutil.copy2(p, hashed)
+        _compress(dest)
+        _compress(hashed)
+        manifest[rel.as_posix()] = hashed.relative_to(tmp).as_posix()
+
+    (tmp / MANIFEST).write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    old = out.with_name(out.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if out.exists():
+        out.rename(old)
+    tmp.rename(out)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info(f"[assets] built {len(files)} files ({len(manifest)} hashed) from {src} into {out}"
+                f"{'' if brotli else ' (gzip only: brotli not installed)'}")
+    return manifest
+
+
+def static_root(src: Path = Path(STATIC_DIR), build: Path = Path(STATIC_BUILD_DIR)) -> Path:
+    """The build output when it exists and is newer than every source file, else the sources."""
+    manifest = build / MANIFEST
+    if not manifest.exists():
+        return src
+    built, build_abs = manifest.stat().st_mtime, build.resolve()
+    stale = next((p for p in src.resolve().rglob("*") if p.is_file() and build_abs not in p.parents
+                  and p.stat().st_mtime > built), None)
+    if stale is not None:
+        logger.warning(f"[assets] {build} is older than {stale}; serving {src} (re-run build_static.py)")
+        return src
+    return build
+
+
+# ----- serving
+
+def _accepted(header: str) -> set[str]:
+    """Encodings in an Accept-Encoding header, minus the ones refused with q=0."""
+    out = set()
+    for part in header.split(","):
+        enc, *params = [x.strip() for x in part.split(";")]
+        q = next((v for k, _, v in (p.partition("=") for p in params) if k == "q"), "1")
+        if not enc:
+            continue
+        try:
+            if float(q) > 0:
+                out.add(enc.lower())
+        except ValueError:
+            continue
+    return out
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves a file's prebuilt .br/.gz variant when the browser accepts
+    it (Vary: Accept-Encoding), marks content-hashed names immutable and everything
+    else no-cache, and uses the content hash as the ETag where there is one.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        hashed = HASHED.search(os.path.basename(full_path))
+        headers = {"cache-control": IMMUTABLE if hashed else REVALIDATE, "vary": "Accept-Encoding"}
+        accepted = _accepted(request_headers.get("accept-encoding", ""))
+        media_type = None
+        for enc, suffix in VARIANTS:
+            if enc not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            headers["content-encoding"] = enc
+            if hashed:
+                headers["etag"] = f'"{hashed.group(1)}-{enc}"'
+            media_type = guess_type(full_path)[0] or "text/plain"  # the original's type, not application/gzip
+            full_path, stat_result = full_path + suffix, variant_stat
+            break
+        else:
+            if hashed:
+                headers["etag"] = f'"{hashed.group(1)}"'
+
+        response = FileResponse(full_path, status_code=status_code, headers=headers,
+                                media_type=media_type, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
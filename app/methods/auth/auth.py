@@ -57,7 +57,7 @@ class Authentification:
         """Decodes JWT and returns the payload (raises error if invalid)"""
         try:
             decoded = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            logger.info(f"VM_share/app/methods/auth/auth.py: Access token decoded for user '{decoded.get('sub', 'unknown')}'")
+            logger.debug("VM_share/app/methods/auth/auth.py: Access token decoded for user '%s'", decoded.get('sub', 'unknown'))
             return decoded
         except JWTError:
             logger.warning("VM_share/app/methods/auth/auth.py: Failed to decode access token: invalid or expired token")
@@ -89,7 +89,7 @@ async def get_current_user(request: Request) -> User:
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
 
-        logger.info(f"VM_share/app/methods/auth/auth.py: Authenticated request from user '{login}'")
+        logger.debug("VM_share/app/methods/auth/auth.py: Authenticated request from user '%s'", login)
         return user
 
     except JWTError as e:
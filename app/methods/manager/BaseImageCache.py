@@ -0,0 +1,257 @@
+# /app/methods/manager/BaseImageCache.py
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Callable, Optional
+
+from configs.config import VM_PROFILES, BASE_IMAGE_WARM_MB, BASE_IMAGE_MLOCK_MB
+from observability.qemu_metrics import (
+    BASE_IMAGE_BYTES,
+    BASE_IMAGE_RESIDENT_BYTES,
+    BASE_IMAGE_LOCKED_BYTES,
+)
+
+logger = logging.getLogger(__name__)
+
+PAGE = mmap.PAGESIZE
+QCOW2_MAGIC = b"QFI\xfb"
+L2_OFFSET_MASK = 0x00FFFFFFFFFFFE00
+
+# ---- libc (Linux): mmap/mincore/mlock are not exposed by the stdlib mmap module ----
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _libc.mmap.restype = ctypes.c_void_p
+    _libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                           ctypes.c_int, ctypes.c_int, ctypes.c_int64]
+    _libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    _libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+    _libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    _libc.munlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+except (OSError, AttributeError, TypeError):
+    _libc = None
+
+_MAP_FAILED = ctypes.c_void_p(-1).value
+
+
+def _map_readonly(fd: int, size: int) -> int:
+    addr = _libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+    if addr in (None, _MAP_FAILED):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return addr
+
+
+def _merge(ranges: list[tuple[int, int]], limit: int) -> list[tuple[int, int]]:
+    """Page-align, clip to `limit` and merge (offset, length) ranges."""
+    out: list[list[int]] = []
+    for off, length in sorted(ranges):
+        start = max(0, off - off % PAGE)
+        end = min(limit, off + length)
+        if end <= start:
+            continue
+        if out and start <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], end)
+        else:
+            out.append([start, end])
+    return [(s, e - s) for s, e in out]
+
+
+def hot_ranges(path: Path, budget_bytes: int) -> list[tuple[int, int]]:
+    """
+    Page-aligned, merged byte ranges of an image worth keeping in the page cache.
+    For qcow2 that is the metadata every guest read walks through (header, L1,
+    refcount table, all L2 tables) plus the leading `budget_bytes` of the file,
+    where installers place the boot loader, kernel and early-boot data.
+    Anything else just gets its first `budget_bytes`.
+    """
+    size = path.stat().st_size
+    ranges: list[tuple[int, int]] = []
+    with path.open("rb") as f:
+        hdr = f.read(72)
+        if len(hdr) >= 72 and hdr[:4] == QCOW2_MAGIC:
+            cluster_bits, = struct.unpack(">I", hdr[20:24])
+            l1_size, l1_off, rc_off, rc_clusters = struct.unpack(">IQQI", hdr[36:60])
+            cluster = 1 << cluster_bits
+            ranges += [(0, cluster), (l1_off, l1_size * 8), (rc_off, rc_clusters * cluster)]
+            f.seek(l1_off)
+            l1 = f.read(l1_size * 8)
+            for (entry,) in struct.iter_unpack(">Q", l1[: len(l1) - len(l1) % 8]):
+                l2_off = entry & L2_OFFSET_MASK
+                if l2_off:
+                    ranges.append((l2_off, cluster))
+    ranges.append((0, budget_bytes))
+    return _merge(ranges, size)
+
+
+def warm(path: Path, budget_bytes: int) -> int:
+    """Ask the kernel to read the hot ranges ahead (non-blocking readahead). Returns bytes hinted."""
+    hinted = 0
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        for off, length in hot_ranges(path, budget_bytes):
+            os.posix_fadvise(fd, off, length, os.POSIX_FADV_WILLNEED)
+            hinted += length
+    finally:
+        os.close(fd)
+    return hinted
+
+
+def residency(path: Path) -> Optional[tuple[int, int]]:
+    """(resident_bytes, size_bytes) of a file in the page cache via mincore(2); None if unsupported."""
+    if _libc is None:
+        return None
+    size = path.stat().st_size
+    if size == 0:
+        return 0, 0
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        addr = _map_readonly(fd, size)
+    finally:
+        os.close(fd)
+    try:
+        pages = (size + PAGE - 1) // PAGE
+        vec = (ctypes.c_ubyte * pages)()
+        if _libc.mincore(addr, size, vec) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        resident = sum(b & 1 for b in bytes(vec))
+    finally:
+        _libc.munmap(addr, size)
+    return min(resident * PAGE, size), size
+
+
+class _Pin:
+    """A read-only mapping of one base image with its hot ranges mlock()ed."""
+
+    def __init__(self, os_type: str, path: Path, budget_bytes: int) -> None:
+        self.os_type = os_type
+        self.path = path
+        self.size = path.stat().st_size
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            self.addr = _map_readonly(fd, self.size)
+        finally:
+            os.close(fd)
+        self.locked: list[tuple[int, int]] = []
+        left = budget_bytes
+        for off, length in hot_ranges(path, budget_bytes):
+            length = min(length, left)
+            if length <= 0:
+                break
+            if _libc.mlock(self.addr + off, length) != 0:
+                err = ctypes.get_errno()
+                logger.warning(f"[base_image] mlock {path} failed: {os.strerror(err)} "
+                               f"(check RLIMIT_MEMLOCK / CAP_IPC_LOCK)")
+                break
+            self.locked.append((off, length))
+            left -= length
+
+    @property
+    def locked_bytes(self) -> int:
+        return sum(length for _, length in self.locked)
+
+    def release(self) -> None:
+        for off, length in self.locked:
+            _libc.munlock(self.addr + off, length)
+        _libc.munmap(self.addr, self.size)
+        self.locked = []
+
+
+class BaseImageCache:
+    """
+    Keeps the shared base images warm in the page cache so the first launches after a
+    reboot or memory pressure do not page them in at random, reports per-profile
+    residency, and optionally pins the most-used profile's hot ranges with mlock under
+    BASE_IMAGE_MLOCK_MB.
+    """
+
+    def __init__(self, profiles: Optional[dict] = None,
+                 warm_mb: int = BASE_IMAGE_WARM_MB, mlock_mb: int = BASE_IMAGE_MLOCK_MB) -> None:
+        self._profiles = VM_PROFILES if profiles is None else profiles
+        self._warm_bytes = max(0, warm_mb) * 1024 * 1024
+        self._mlock_bytes = max(0, mlock_mb) * 1024 * 1024
+        self._pin: Optional[_Pin] = None
+
+    def _images(self) -> dict[str, Path]:
+        out = {}
+        for os_type, profile in self._profiles.items():
+            if not profile.get("overlay_dir"):
+                continue  # ISO-only profiles have no shared base image
+            base = Path(profile["base_image"])
+            if base.is_file():
+                out[os_type] = base
+        return out
+
+    def refresh(self, usage: Optional[dict[str, int]] = None) -> None:
+        """One pass: warm, measure residency, and move the mlock pin if needed."""
+        images = self._images()
+        for os_type, path in images.items():
+            try:
+                warm(path, self._warm_bytes)
+                res = residency(path)
+                size = path.stat().st_size
+                BASE_IMAGE_BYTES.labels(os_type=os_type).set(size)
+                if res is not None:
+                    BASE_IMAGE_RESIDENT_BYTES.labels(os_type=os_type).set(res[0])
+                    logger.debug("[base_image] %s resident=%d/%d", os_type, res[0], size)
+            except Exception:
+                logger.exception(f"[base_image] warming failed for {os_type} ({path})")
+
+        if self._mlock_bytes and _libc is not None:
+            self._repin(images, usage or {})
+
+    def _repin(self, images: dict[str, Path], usage: dict[str, int]) -> None:
+        candidates = [o for o in images if usage.get(o)]
+        top = max(candidates, key=lambda o: usage[o]) if candidates else None
+        if self._pin and (self._pin.os_type != top or self._pin.path != images.get(top)):
+            self.unpin()
+        if top and self._pin is None:
+            try:
+                self._pin = _Pin(top, images[top], self._mlock_bytes)
+                logger.info(f"[base_image] pinned {self._pin.locked_bytes}B of {top} ({images[top]})")
+            except Exception:
+                logger.exception(f"[base_image] failed to pin {top}")
+                self._pin = None
+        for os_type in images:
+            locked = self._pin.locked_bytes if self._pin and self._pin.os_type == os_type else 0
+            BASE_IMAGE_LOCKED_BYTES.labels(os_type=os_type).set(locked)
+
+    def unpin(self) -> None:
+        if self._pin:
+            BASE_IMAGE_LOCKED_BYTES.labels(os_type=self._pin.os_type).set(0)
+            self._pin.release()
+            self._pin = None
+
+
+async def base_image_warmer(
+    store_factory: Callable,
+    stop_event: asyncio.Event,
+    interval_sec: int = 300,
+    cache: Optional[BaseImageCache] = None,
+) -> None:
+    """Warm on startup, then re-warm/re-measure every `interval_sec`."""
+    cache = cache or BaseImageCache()
+    try:
+        while not stop_event.is_set():
+            usage: dict[str, int] = {}
+            if cache._mlock_bytes:
+                try:
+                    store = store_factory()
+                    usage = {o: store.count_by_os(o) for o in cache._images()}
+                except Exception:
+                    logger.warning("[base_image] could not read per-profile usage from Redis")
+            try:
+                await asyncio.to_thread(cache.refresh, usage)
+            except Exception:
+                logger.exception("[base_image] refresh failed")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval_sec)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        cache.unpin()
@@ -0,0 +1,295 @@
+# /app/methods/manager/IoThrottle.py
+"""
+Block I/O limits for guests.
+
+Limits come from a profile's "io" section with the user's IO_USER_LIMITS entry on top:
+    {"iops": 2000, "bps": 200 << 20, "iops_max": 4000, "bps_max": 400 << 20, "max_length": 10}
+(iops/bps = sustained totals, *_max = burst rate, max_length = burst duration in seconds;
+missing or 0 = unlimited). All disks of one user join the throttle group "io-u<user_id>",
+so the budget is per user rather than per disk.
+
+At launch the limits go on the -drive line (throttling.*) or, for -blockdev disks, into a
+throttle-group object under a throttle filter node. A running VM is adjusted over QMP:
+block_set_io_throttle for -drive disks, qom-set on the group's "limits" for -blockdev.
+
+Network caps are not covered: the guests use QEMU's user-mode (slirp) netdev, which has no
+rate-limiting options.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+from configs.config import (
+    VM_PROFILES,
+    IO_USER_LIMITS,
+    IO_HOST_IOPS,
+    IO_HOST_BPS,
+    IO_CONTENTION_RATIO,
+    IO_POLICY_INTERVAL_S,
+    IO_THROTTLE_HOLD_S,
+    IO_MIN_IOPS,
+    IO_MIN_BPS,
+)
+from observability.guest_metrics import sum_blockstats
+from observability.qemu_metrics import IO_THROTTLE_ACTIONS, IO_THROTTLED_VMS, IO_CONTENDED
+from utils import RUN_DIR
+from .QMPClient import QMPClient, QMPError
+from .SessionManager import local_sessions
+
+logger = logging.getLogger(__name__)
+
+IO_KEYS = ("iops", "bps", "iops_max", "bps_max", "max_length")
+# our keys → QEMU ThrottleLimits / -drive throttling.* names
+_QOM_KEYS = {"iops": "iops-total", "bps": "bps-total", "iops_max": "iops-total-max", "bps_max": "bps-total-max"}
+
+
+def normalize_io_limits(raw: Optional[dict]) -> dict[str, int]:
+    """Validate a limits dict and drop unlimited (None/0) entries."""
+    raw = raw or {}
+    unknown = set(raw) - set(IO_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown I/O limit keys: {sorted(unknown)}")
+    limits = {k: int(v) for k, v in raw.items() if v}
+    if any(v < 0 for v in limits.values()):
+        raise ValueError("I/O limits must be non-negative")
+    for kind in ("iops", "bps"):
+        burst = limits.get(f"{kind}_max")
+        if burst is not None and burst < limits.get(kind, burst + 1):
+            raise ValueError(f"{kind}_max needs {kind} set and at least as large")
+    if "max_length" in limits and not ("iops_max" in limits or "bps_max" in limits):
+        raise ValueError("max_length needs iops_max or bps_max")
+    return limits
+
+
+def io_limits(profile: dict, user_id: Optional[str] = None) -> dict[str, int]:
+    """Profile "io" limits with the user's IO_USER_LIMITS override merged on top."""
+    return normalize_io_limits({**(profile.get("io") or {}), **(IO_USER_LIMITS.get(str(user_id)) or {})})
+
+
+def throttle_group(user_id: str) -> str:
+    return f"io-u{user_id}"
+
+
+def qom_limits(limits: dict[str, int], full: bool = False) -> dict[str, int]:
+    """
+    ThrottleLimits for -object throttle-group / -drive throttling.* / qom-set.
+    qom-set leaves omitted fields untouched, so `full` writes 0 (unlimited) for them.
+    """
+    out = {q: limits.get(k, 0) for k, q in _QOM_KEYS.items() if full or limits.get(k)}
+    for kind in ("iops", "bps"):
+        if limits.get(f"{kind}_max") and limits.get("max_length"):
+            out[f"{kind}-total-max-length"] = limits["max_length"]
+        elif full:
+            out[f"{kind}-total-max-length"] = 1  # QEMU's default burst length
+    return out
+
+
+def drive_throttle_opts(limits: dict[str, int], group: str) -> list[str]:
+    """throttling.* key=value pairs for a legacy -drive (empty when unlimited)."""
+    if not limits:
+        return []
+    return [f"throttling.{k}={v}" for k, v in qom_limits(limits).items()] + [f"throttling.group={group}"]
+
+
+def throttle_group_object(limits: dict[str, int], group: str) -> str:
+    """-object value for a throttle-group holding `limits` (an empty group is just unlimited)."""
+    return ",".join(["throttle-group", f"id={group}", *(f"x-{k}={v}" for k, v in qom_limits(limits).items())])
+
+
+def _block_set_io_throttle_args(limits: dict[str, int]) -> dict:
+    args = {k: 0 for k in ("bps", "bps_rd", "bps_wr", "iops", "iops_rd", "iops_wr")}
+    args["iops"] = limits.get("iops", 0)
+    args["bps"] = limits.get("bps", 0)
+    for kind in ("iops", "bps"):
+        if limits.get(f"{kind}_max"):
+            args[f"{kind}_max"] = limits[f"{kind}_max"]
+            if limits.get("max_length"):
+                args[f"{kind}_max_length"] = limits["max_length"]
+    return args
+
+
+async def set_io_limits(qmp_sock: str, limits: dict[str, int], *, group: str,
+                        blockdev: bool = False, timeout: float = 5.0) -> int:
+    """Apply `limits` to a running VM; returns how many disks (or groups) were updated."""
+    async with QMPClient(qmp_sock, timeout=timeout) as qmp:
+        if blockdev:
+            await qmp.execute("qom-set", {"path": f"/objects/{group}", "property": "limits",
+                                          "value": qom_limits(limits, full=True)})
+            return 1
+        n = 0
+        for dev in await qmp.execute("query-block"):
+            if dev.get("removable") or not dev.get("inserted"):
+                continue  # CD-ROMs: read-only and not part of the disk budget
+            target = {"device": dev["device"]} if dev.get("device") else {"id": dev.get("qdev")}
+            await qmp.execute("block_set_io_throttle",
+                              {**target, **_block_set_io_throttle_args(limits), "group": group})
+            n += 1
+        return n
+
+
+async def set_vm_io_limits(vmid: str, sess: dict, limits: dict[str, int]) -> int:
+    """set_io_limits() for a session from the store (socket, group and disk layout from it)."""
+    profile = VM_PROFILES.get(sess.get("os_type") or "", {})
+    return await set_io_limits(
+        sess.get("qmp_socket") or str(RUN_DIR / f"qmp-{vmid}.sock"),
+        limits,
+        group=throttle_group(sess.get("user_id") or ""),
+        blockdev=bool((profile.get("block") or {}).get("blockdev")),
+    )
+
+
+class IoFairShare:
+    """
+    Tightens noisy guests while the host disk is contended.
+
+    Every pass reads each VM's query-blockstats and turns the deltas into IOPS and bytes/s.
+    When the guests together use at least `contention` of the host capacity (IO_HOST_IOPS /
+    IO_HOST_BPS), every VM above its fair share (capacity / running VMs, never below the
+    floors) is clamped to that share with bursts off. A clamp is held for `hold_s` after the
+    last contended pass in which the VM was still over its share, then the profile/user
+    limits are restored.
+    """
+
+    def __init__(
+        self,
+        host_iops: int = IO_HOST_IOPS,
+        host_bps: int = IO_HOST_BPS,
+        contention: float = IO_CONTENTION_RATIO,
+        hold_s: float = IO_THROTTLE_HOLD_S,
+        min_iops: int = IO_MIN_IOPS,
+        min_bps: int = IO_MIN_BPS,
+        timeout_s: float = 2.0,
+        apply: Callable = set_vm_io_limits,
+    ) -> None:
+        self.host_iops, self.host_bps = host_iops, host_bps
+        self.contention = contention
+        self.hold_s = hold_s
+        self.min_iops, self.min_bps = min_iops, min_bps
+        self._timeout_s = timeout_s
+        self._apply = apply
+        self._prev: dict[str, tuple[float, int, int]] = {}       # vmid → (t, ops, bytes)
+        self._clamped: dict[str, tuple[dict, float]] = {}        # vmid → (limits, held until)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.host_iops or self.host_bps)
+
+    async def _poll(self, vmid: str, sess: dict) -> Optional[tuple[int, int]]:
+        qmp_sock = sess.get("qmp_socket") or str(RUN_DIR / f"qmp-{vmid}.sock")
+        try:
+            async with QMPClient(qmp_sock, timeout=self._timeout_s) as qmp:
+                block = sum_blockstats(await qmp.execute("query-blockstats"))
+        except QMPError as e:
+            logger.debug("[io_policy] %s: %s", vmid, e)
+            return None
+        ops = block[("ops", "read")] + block[("ops", "write")]
+        nbytes = block[("bytes", "read")] + block[("bytes", "write")]
+        return ops, nbytes
+
+    async def _rates(self, sessions: list[tuple[str, dict]], now: float) -> dict[str, tuple[float, float]]:
+        results = await asyncio.gather(*(self._poll(v, s) for v, s in sessions))
+        rates: dict[str, tuple[float, float]] = {}
+        for (vmid, _), res in zip(sessions, results):
+            if res is None:
+                continue
+            prev = self._prev.get(vmid)
+            self._prev[vmid] = (now, *res)
+            if prev is None:
+                continue
+            dt = max(now - prev[0], 1e-6)
+            # counters restart with QEMU; a negative delta means "since restart"
+            d_ops = res[0] - prev[1] if res[0] >= prev[1] else res[0]
+            d_bytes = res[1] - prev[2] if res[1] >= prev[2] else res[1]
+            rates[vmid] = (d_ops / dt, d_bytes / dt)
+        return rates
+
+    def _clamp(self, base: dict[str, int], fair_iops: float, fair_bps: float) -> dict[str, int]:
+        limits = dict(base)
+        for kind, fair in (("iops", fair_iops), ("bps", fair_bps)):
+            if fair:
+                limits[kind] = int(min(base.get(kind) or fair, fair))
+                limits.pop(f"{kind}_max", None)
+        if "iops_max" not in limits and "bps_max" not in limits:
+            limits.pop("max_length", None)
+        return limits
+
+    async def _set(self, vmid: str, sess: dict, limits: dict[str, int], action: str) -> bool:
+        try:
+            await self._apply(vmid, sess, limits)
+        except (QMPError, ValueError) as e:
+            IO_THROTTLE_ACTIONS.labels(action="error").inc()
+            logger.warning(f"[io_policy:{vmid}] {action} failed: {e}")
+            return False
+        IO_THROTTLE_ACTIONS.labels(action=action).inc()
+        logger.info(f"[io_policy:{vmid}] {action} → {limits or 'unlimited'}")
+        return True
+
+    async def evaluate(self, sessions: list[tuple[str, dict]], now: Optional[float] = None) -> dict:
+        now = time.monotonic() if now is None else now
+        by_id = dict(sessions)
+        for vmid in set(self._prev) - set(by_id):
+            self._prev.pop(vmid, None)
+        for vmid in set(self._clamped) - set(by_id):
+            self._clamped.pop(vmid, None)
+
+        rates = await self._rates(sessions, now)
+        total_iops = sum(r[0] for r in rates.values())
+        total_bps = sum(r[1] for r in rates.values())
+        contended = bool(
+            (self.host_iops and total_iops >= self.contention * self.host_iops)
+            or (self.host_bps and total_bps >= self.contention * self.host_bps)
+        )
+        IO_CONTENDED.set(1 if contended else 0)
+        summary = {"contended": contended, "tightened": [], "restored": []}
+
+        if contended and sessions:
+            n = len(sessions)
+            fair_iops = max(self.host_iops / n, self.min_iops) if self.host_iops else 0
+            fair_bps = max(self.host_bps / n, self.min_bps) if self.host_bps else 0
+            for vmid, (iops, bps) in rates.items():
+                if not ((fair_iops and iops > fair_iops) or (fair_bps and bps > fair_bps)):
+                    continue
+                sess = by_id[vmid]
+                limits = self._clamp(io_limits(VM_PROFILES.get(sess.get("os_type") or "", {}),
+                                               sess.get("user_id")), fair_iops, fair_bps)
+                current = self._clamped.get(vmid)
+                if current is None or current[0] != limits:
+                    if not await self._set(vmid, sess, limits, "tighten"):
+                        continue
+                    summary["tightened"].append(vmid)
+                self._clamped[vmid] = (limits, now + self.hold_s)
+
+        for vmid, (_, until) in list(self._clamped.items()):
+            if until > now:
+                continue
+            sess = by_id[vmid]
+            base = io_limits(VM_PROFILES.get(sess.get("os_type") or "", {}), sess.get("user_id"))
+            if await self._set(vmid, sess, base, "restore"):
+                del self._clamped[vmid]
+                summary["restored"].append(vmid)
+
+        IO_THROTTLED_VMS.set(len(self._clamped))
+        return summary
+
+
+async def io_fair_share_policy(
+    store_factory: Callable,
+    stop_event: asyncio.Event,
+    interval_sec: int = IO_POLICY_INTERVAL_S,
+    policy: Optional[IoFairShare] = None,
+) -> None:
+    policy = policy or IoFairShare()
+    if not policy.enabled:
+        logger.info("[io_policy] IO_HOST_IOPS/IO_HOST_BPS not set; fair-share policy disabled")
+        return
+    while not stop_event.is_set():
+        try:
+            sessions = local_sessions(await asyncio.to_thread(store_factory().items))
+            await policy.evaluate(sessions)
+        except Exception:
+            logger.exception("[io_policy] pass failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval_sec)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,79 @@
+# /app/methods/manager/LaunchJobs.py
+from __future__ import annotations
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from configs.config import get_redis, LAUNCH_JOB_TTL_S
+from .SessionManager import now_ms
+
+logger = logging.getLogger(__name__)
+
+# reserved → overlay_ready → qemu_started → bridge_ready → done | failed
+# (ISO/snapshot launches skip overlay_ready; cluster launches go straight to bridge_ready)
+FINAL_STAGES = ("done", "failed")
+MAX_EVENTS = 64
+
+
+class LaunchJobs:
+    """
+    Progress of VM launches, kept in Redis so whichever worker serves the progress
+    stream sees it. The job id is the launch's vmid, which is also what the user's
+    launch reservation holds, so a duplicate request can point at the job in flight.
+    Keys (both expire `ttl_s` after the last event):
+      launch:{job}         (HASH)   user_id, state (running|done|failed), created_at
+      launch:{job}:events  (STREAM) stage, ts (ms), data (JSON)
+    """
+    def __init__(self, r: Optional[redis.Redis] = None, ttl_s: int = LAUNCH_JOB_TTL_S) -> None:
+        self.r = r or get_redis()
+        self.ttl_s = ttl_s
+
+    def _k_job(self, job: str) -> str:
+        return f"launch:{job}"
+    def _k_events(self, job: str) -> str:
+        return f"launch:{job}:events"
+
+    def create(self, job: str, user_id: str) -> None:
+        """Start a job record (replacing a finished one with the same id, e.g. a snapshot relaunch)."""
+        pipe = self.r.pipeline()
+        pipe.delete(self._k_job(job), self._k_events(job))
+        pipe.hset(self._k_job(job), mapping={"user_id": user_id, "state": "running", "created_at": str(now_ms())})
+        pipe.expire(self._k_job(job), self.ttl_s)
+        pipe.execute()
+
+    def get(self, job: str) -> Optional[dict]:
+        h = self.r.hgetall(self._k_job(job))
+        return {"job": job, **h} if h else None
+
+    def emit(self, job: str, stage: str, **data) -> str:
+        pipe = self.r.pipeline()
+        pipe.xadd(self._k_events(job), {"stage": stage, "ts": str(now_ms()), "data": json.dumps(data)},
+                  maxlen=MAX_EVENTS, approximate=True)
+        if stage in FINAL_STAGES:
+            pipe.hset(self._k_job(job), "state", stage)
+        pipe.expire(self._k_events(job), self.ttl_s)
+        pipe.expire(self._k_job(job), self.ttl_s)
+        return pipe.execute()[0]
+
+    def progress(self, job: str) -> Callable[..., None]:
+        """emit() bound to one job, for the launch code to call at each stage (best effort)."""
+        def emit(stage: str, **data) -> None:
+            try:
+                self.emit(job, stage, **data)
+            except redis.RedisError as e:
+                logger.warning(f"[launch:{job}] could not record stage {stage}: {e}")
+        return emit
+
+    def events(self, job: str, after: str = "0-0") -> List[Tuple[str, Dict]]:
+        """Events newer than stream id `after`, oldest first: [(id, {stage, ts, **data})]."""
+        out = []
+        for eid, fields in self.r.xrange(self._k_events(job), min=f"({after}" if after != "0-0" else "-"):
+            out.append((eid, {"stage": fields.get("stage"), "ts": int(fields.get("ts") or 0),
+                              **json.loads(fields.get("data") or "{}")}))
+        return out
+
+
+def get_launch_jobs() -> LaunchJobs:
+    return LaunchJobs()
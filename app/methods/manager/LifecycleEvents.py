@@ -0,0 +1,172 @@
+# /app/methods/manager/LifecycleEvents.py
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from configs.config import get_redis, NODE_ID, LIFECYCLE_STREAM_MAXLEN
+from observability.qemu_metrics import LIFECYCLE_EVENTS, LAUNCH_TO_CONNECT, SESSION_LIFETIME
+
+logger = logging.getLogger(__name__)
+
+STREAM = "events:lifecycle"
+KINDS = (
+    "launched", "connected", "disconnected",
+    "snapshot_started", "snapshot_completed", "snapshot_failed",
+    "expired", "cleaned_up",
+)
+
+Event = Dict[str, str]
+
+
+def _event(kind: str, vmid: str, fields: dict) -> Event:
+    ev = {"kind": kind, "vmid": vmid, "ts": str(int(time.time() * 1000)), "node_id": NODE_ID}
+    ev.update({k: str(v) for k, v in fields.items() if v is not None})
+    return ev
+
+
+def add_event(pipe, kind: str, vmid: str, maxlen: int = LIFECYCLE_STREAM_MAXLEN, **fields) -> None:
+    """Queue the XADD on a pipeline, so the event commits together with the state change it describes."""
+    pipe.xadd(STREAM, _event(kind, vmid, fields), maxlen=maxlen, approximate=True)
+
+
+class LifecycleEvents:
+    """
+    Every VM lifecycle transition, appended to one capped Redis Stream:
+      events:lifecycle  (STREAM) kind, vmid, ts (ms), node_id, + user_id/os_type/... per kind
+    launched/cleaned_up are written by SessionStore in the same MULTI as the session;
+    the bridges, the snapshot endpoint and the session reaper publish the rest.
+
+    Readers use consumer groups (one group per purpose: metrics, alerting, quota, UI),
+    each getting every event once, with pending entries replayed after a crash; the
+    stream itself (XRANGE) doubles as the audit trail, trimmed to ~`maxlen` entries.
+    """
+    def __init__(self, r: Optional[redis.Redis] = None, stream: str = STREAM,
+                 maxlen: int = LIFECYCLE_STREAM_MAXLEN) -> None:
+        self.r = r or get_redis()
+        self.stream = stream
+        self.maxlen = maxlen
+
+    def publish(self, kind: str, vmid: str, **fields) -> Optional[str]:
+        """Append one event; best effort (a lost event must never fail the transition itself)."""
+        try:
+            return self.r.xadd(self.stream, _event(kind, vmid, fields), maxlen=self.maxlen, approximate=True)
+        except redis.RedisError as e:
+            logger.warning(f"[lifecycle] could not publish {kind} for {vmid}: {e}")
+            return None
+
+    def history(self, start: str = "-", end: str = "+", count: int = 100) -> List[Tuple[str, Event]]:
+        return self.r.xrange(self.stream, min=start, max=end, count=count)
+
+    # ----- consumer groups
+    def ensure_group(self, group: str, start: str = "$") -> None:
+        """Create `group` reading from `start` ("$" = new events only, "0" = the whole backlog)."""
+        try:
+            self.r.xgroup_create(self.stream, group, id=start, mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read(self, group: str, consumer: str, count: int = 100, pending: bool = False) -> List[Tuple[str, Event]]:
+        """Next undelivered events for this consumer, or (pending=True) the ones it has not acked yet."""
+        res = self.r.xreadgroup(group, consumer, {self.stream: "0" if pending else ">"}, count=count)
+        return [(eid, ev) for _, entries in res or [] for eid, ev in entries if ev]
+
+    def ack(self, group: str, ids: List[str]) -> None:
+        if ids:
+            self.r.xack(self.stream, group, *ids)
+
+    def claim(self, group: str, consumer: str, min_idle_ms: int, count: int = 100) -> List[Tuple[str, Event]]:
+        """Take over events another consumer read but did not ack for `min_idle_ms` (it died)."""
+        res = self.r.xautoclaim(self.stream, group, consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count)
+        return [(eid, ev) for eid, ev in res[1] if ev]
+
+
+def get_lifecycle_events() -> LifecycleEvents:
+    return LifecycleEvents()
+
+
+async def consume(
+    group: str,
+    handler: Callable[[Event], None],
+    stop_event: asyncio.Event,
+    events: Optional[LifecycleEvents] = None,
+    consumer: Optional[str] = None,
+    interval_sec: float = 1.0,
+    claim_idle_ms: int = 60_000,
+) -> None:
+    """
+    Feed every event to `handler`, at least once: this consumer's unacked events (from
+    before a restart) come first, then new ones, plus anything a dead consumer of the
+    group left pending for `claim_idle_ms`. Events are acked after the handler returns;
+    a handler error is logged and the event acked so one bad event cannot wedge the group.
+    """
+    events = events or get_lifecycle_events()
+    consumer = consumer or f"{NODE_ID}:{os.getpid()}"
+    pending = True
+    next_claim = 0.0
+    while not stop_event.is_set():
+        batch: List[Tuple[str, Event]] = []
+        try:
+            if pending:
+                await asyncio.to_thread(events.ensure_group, group)
+                batch = await asyncio.to_thread(events.read, group, consumer, 100, True)
+                pending = bool(batch)
+            if not batch and time.monotonic() >= next_claim:
+                batch = await asyncio.to_thread(events.claim, group, consumer, claim_idle_ms)
+                next_claim = time.monotonic() + claim_idle_ms / 1000
+            if not batch:
+                batch = await asyncio.to_thread(events.read, group, consumer)
+            for eid, ev in batch:
+                try:
+                    handler(ev)
+                except Exception:
+                    logger.exception(f"[lifecycle:{group}] handler failed on {eid} {ev}")
+            await asyncio.to_thread(events.ack, group, [eid for eid, _ in batch])
+        except redis.RedisError as e:
+            logger.warning(f"[lifecycle:{group}] redis error: {e}")
+            pending = True  # re-create the group / replay if the stream was lost
+        if batch:
+            continue
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval_sec)
+        except asyncio.TimeoutError:
+            pass
+
+
+class LifecycleMetrics:
+    """
+    Consumer-group handler for Prometheus: event counts per kind, launch → first
+    connect latency and session lifetime, computed from event timestamps.
+    """
+    MAX_TRACKED = 10_000  # launched VMs remembered until their cleaned_up event
+
+    def __init__(self) -> None:
+        self._launched: Dict[str, Tuple[int, str]] = {}  # vmid → (launched ts ms, os_type)
+        self._connected: set[str] = set()
+
+    def __call__(self, ev: Event) -> None:
+        kind, vmid = ev.get("kind") or "unknown", ev.get("vmid") or ""
+        ts = int(ev.get("ts") or 0)
+        LIFECYCLE_EVENTS.labels(kind=kind).inc()
+        if kind == "launched":
+            if len(self._launched) >= self.MAX_TRACKED:  # VMs whose cleanup we never saw
+                oldest = next(iter(self._launched))
+                self._launched.pop(oldest)
+                self._connected.discard(oldest)
+            self._launched[vmid] = (ts, ev.get("os_type") or "unknown")
+        elif kind == "connected" and vmid in self._launched and vmid not in self._connected:
+            self._connected.add(vmid)
+            started, os_type = self._launched[vmid]
+            LAUNCH_TO_CONNECT.labels(os_type=os_type).observe(max(0, ts - started) / 1000)
+        elif kind == "cleaned_up" and vmid in self._launched:
+            started, os_type = self._launched.pop(vmid)
+            self._connected.discard(vmid)
+            SESSION_LIFETIME.labels(os_type=os_type).observe(max(0, ts - started) / 1000)
+
+
+async def lifecycle_metrics_consumer(stop_event: asyncio.Event) -> None:
+    await consume("metrics", LifecycleMetrics(), stop_event)
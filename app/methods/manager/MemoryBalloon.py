@@ -0,0 +1,210 @@
+# /app/methods/manager/MemoryBalloon.py
+"""
+Memory density for many small, identical guests.
+
+* virtio-balloon (profile "balloon", default BALLOON) with free-page-reporting: guests hand
+  freed pages back to the host on their own; deflate-on-oom lets a guest take back
+  ballooned memory before it OOMs.
+* BalloonPolicy: under host memory pressure, idle guests are asked (QMP "balloon") to shrink
+  to BALLOON_TARGET_PCT of their RAM; they get it back when pressure is gone or they wake up.
+* KSM: optional enablement (KSM_ENABLE) and merge statistics; QEMU marks guest RAM
+  mergeable by default (-machine mem-merge=on), so identical alpine/ubuntu pages collapse.
+* VMs per GiB of used host RAM, to measure what all of the above buys.
+"""
+import asyncio
+import logging
+import mmap
+from pathlib import Path
+from typing import Callable, Optional
+
+import psutil
+
+from configs.config import (
+    VM_PROFILES,
+    BALLOON,
+    BALLOON_PRESSURE_PCT,
+    BALLOON_RELEASE_PCT,
+    BALLOON_IDLE_CPU_PCT,
+    BALLOON_TARGET_PCT,
+    BALLOON_MIN_MB,
+    BALLOON_INTERVAL_S,
+    KSM_ENABLE,
+    KSM_PAGES_TO_SCAN,
+)
+from observability.qemu_metrics import (
+    BALLOON_ACTIONS,
+    BALLOON_INFLATED_VMS,
+    BALLOON_RECLAIMED_BYTES,
+    KSM_PAGES,
+    KSM_SAVED_BYTES,
+    KSM_FULL_SCANS,
+    VMS_PER_GIB,
+)
+from utils import RUN_DIR, _to_int
+from .QMPClient import qmp_execute, QMPError
+from .SessionManager import local_sessions
+
+logger = logging.getLogger(__name__)
+
+KSM_DIR = Path("/sys/kernel/mm/ksm")
+KSM_COUNTERS = ("pages_shared", "pages_sharing", "pages_unshared", "pages_volatile", "full_scans")
+
+
+def balloon_enabled(profile: dict) -> bool:
+    value = profile.get("balloon")
+    return BALLOON if value is None else bool(value)
+
+
+def balloon_args(profile: dict) -> list[str]:
+    """-device for virtio-balloon with free page reporting (empty when ballooning is off)."""
+    if not balloon_enabled(profile):
+        return []
+    return ["-device", "virtio-balloon-pci,id=balloon0,free-page-reporting=on,deflate-on-oom=on"]
+
+
+def ksm_enable(pages_to_scan: int = KSM_PAGES_TO_SCAN, ksm_dir: Path = KSM_DIR) -> bool:
+    """Start the KSM scanner (needs root); False if the kernel or permissions say no."""
+    try:
+        (ksm_dir / "pages_to_scan").write_text(str(int(pages_to_scan)))
+        (ksm_dir / "run").write_text("1")
+    except OSError as e:
+        logger.warning(f"[ksm] cannot enable KSM in {ksm_dir}: {e}")
+        return False
+    logger.info(f"[ksm] enabled, pages_to_scan={pages_to_scan}")
+    return True
+
+
+def ksm_stats(ksm_dir: Path = KSM_DIR) -> Optional[dict[str, int]]:
+    try:
+        return {name: int((ksm_dir / name).read_text()) for name in KSM_COUNTERS}
+    except (OSError, ValueError):
+        return None
+
+
+def vm_memory_mb(sess: dict) -> int:
+    profile = VM_PROFILES.get(sess.get("os_type") or "", {})
+    return _to_int(sess.get("memory_mb")) or int(profile.get("default_memory") or 0)
+
+
+async def set_balloon(vmid: str, sess: dict, target_mb: int) -> None:
+    qmp_sock = sess.get("qmp_socket") or str(RUN_DIR / f"qmp-{vmid}.sock")
+    await qmp_execute(qmp_sock, "balloon", {"value": int(target_mb) << 20}, timeout=2.0)
+
+
+class BalloonPolicy:
+    """
+    One pass per interval over this node's ballooned VMs:
+      host RAM use >= pressure_pct → inflate idle guests (QEMU CPU < idle_cpu_pct since
+                                      the previous pass) down to target_pct of their RAM;
+      host RAM use <= release_pct  → give every inflated guest its full RAM back;
+      an inflated guest that is busy again is deflated straight away.
+    """
+
+    def __init__(
+        self,
+        pressure_pct: float = BALLOON_PRESSURE_PCT,
+        release_pct: float = BALLOON_RELEASE_PCT,
+        idle_cpu_pct: float = BALLOON_IDLE_CPU_PCT,
+        target_pct: float = BALLOON_TARGET_PCT,
+        min_mb: int = BALLOON_MIN_MB,
+        memory: Callable = psutil.virtual_memory,
+        apply: Callable = set_balloon,
+    ) -> None:
+        self.pressure_pct, self.release_pct = pressure_pct, release_pct
+        self.idle_cpu_pct = idle_cpu_pct
+        self.target_pct, self.min_mb = target_pct, min_mb
+        self._memory = memory
+        self._apply = apply
+        self._procs: dict[str, psutil.Process] = {}
+        self._inflated: dict[str, tuple[int, int]] = {}  # vmid → (target MiB, full MiB)
+
+    def _cpu_percent(self, vmid: str, sess: dict) -> Optional[float]:
+        """QEMU CPU % since the previous pass; None on first sight or if the process is gone."""
+        pid = _to_int(sess.get("pid"))
+        proc = self._procs.get(vmid)
+        try:
+            if proc is None or proc.pid != pid:
+                if pid is None:
+                    return None
+                self._procs[vmid] = psutil.Process(pid)
+                self._procs[vmid].cpu_percent(None)
+                return None
+            return proc.cpu_percent(None)
+        except psutil.Error:
+            self._procs.pop(vmid, None)
+            return None
+
+    async def _set(self, vmid: str, sess: dict, target_mb: int, action: str) -> bool:
+        try:
+            await self._apply(vmid, sess, target_mb)
+        except QMPError as e:
+            BALLOON_ACTIONS.labels(action="error").inc()
+            logger.warning(f"[balloon:{vmid}] {action} to {target_mb} MiB failed: {e}")
+            return False
+        BALLOON_ACTIONS.labels(action=action).inc()
+        logger.info(f"[balloon:{vmid}] {action} → {target_mb} MiB")
+        return True
+
+    async def evaluate(self, sessions: list[tuple[str, dict]]) -> dict:
+        used_pct = self._memory().percent
+        vms = {v: s for v, s in sessions
+               if balloon_enabled(VM_PROFILES.get(s.get("os_type") or "", {})) and vm_memory_mb(s)}
+        for vmid in set(self._procs) - set(vms):
+            self._procs.pop(vmid, None)
+        for vmid in set(self._inflated) - set(vms):
+            self._inflated.pop(vmid, None)
+        summary = {"used_pct": used_pct, "inflated": [], "deflated": []}
+
+        for vmid, sess in vms.items():
+            cpu = self._cpu_percent(vmid, sess)
+            idle = cpu is not None and cpu < self.idle_cpu_pct
+            full = vm_memory_mb(sess)
+            if vmid in self._inflated:
+                if used_pct <= self.release_pct or (cpu is not None and not idle):
+                    if await self._set(vmid, sess, full, "deflate"):
+                        del self._inflated[vmid]
+                        summary["deflated"].append(vmid)
+            elif used_pct >= self.pressure_pct and idle:
+                target = max(self.min_mb, int(full * self.target_pct / 100))
+                if target < full and await self._set(vmid, sess, target, "inflate"):
+                    self._inflated[vmid] = (target, full)
+                    summary["inflated"].append(vmid)
+
+        BALLOON_INFLATED_VMS.set(len(self._inflated))
+        BALLOON_RECLAIMED_BYTES.set(sum(full - t for t, full in self._inflated.values()) << 20)
+        return summary
+
+
+def export_density(n_vms: int, ksm_dir: Path = KSM_DIR) -> None:
+    vm = psutil.virtual_memory()
+    used_gib = (vm.total - vm.available) / (1 << 30)
+    VMS_PER_GIB.set(n_vms / used_gib if used_gib > 0 else 0)
+    stats = ksm_stats(ksm_dir)
+    if stats is None:
+        return
+    for name in ("pages_shared", "pages_sharing", "pages_unshared", "pages_volatile"):
+        KSM_PAGES.labels(state=name[len("pages_"):]).set(stats[name])
+    KSM_SAVED_BYTES.set(stats["pages_sharing"] * mmap.PAGESIZE)
+    KSM_FULL_SCANS.set(stats["full_scans"])
+
+
+async def memory_density_loop(
+    store_factory: Callable,
+    stop_event: asyncio.Event,
+    interval_sec: int = BALLOON_INTERVAL_S,
+    policy: Optional[BalloonPolicy] = None,
+) -> None:
+    if KSM_ENABLE:
+        await asyncio.to_thread(ksm_enable)
+    policy = policy or BalloonPolicy()
+    while not stop_event.is_set():
+        try:
+            sessions = local_sessions(await asyncio.to_thread(store_factory().items))
+            await asyncio.to_thread(export_density, len(sessions))
+            await policy.evaluate(sessions)
+        except Exception:
+            logger.exception("[balloon] pass failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval_sec)
+        except asyncio.TimeoutError:
+            pass
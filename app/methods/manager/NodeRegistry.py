@@ -0,0 +1,175 @@
+# /app/methods/manager/NodeRegistry.py
+from __future__ import annotations
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import psutil
+import redis
+
+from configs.config import get_redis, VM_PROFILES, NODE_MEM_MB, NODE_TTL_S, AGENT_TOKEN
+from .BaseImageCache import residency
+from .SessionManager import now_ms
+
+logger = logging.getLogger(__name__)
+
+
+class NodeRegistry:
+    """
+    Worker nodes and their capacity in Redis (written by node agents, read by the scheduler).
+    Keys:
+      node:{id}    (HASH, expires NODE_TTL_S after the last heartbeat)
+                   url, public_host, mem_total_mb, mem_free_mb, cpus, load, vms,
+                   images (JSON {os_type: page-cache resident fraction}), heartbeat_ms,
+                   pending_mb (memory of launches placed but not started yet)
+      nodes        (ZSET)  id → last heartbeat (ms)
+    """
+
+    def __init__(self, r: Optional[redis.Redis] = None, ttl_s: int = NODE_TTL_S) -> None:
+        self.r = r or get_redis()
+        self.ttl_s = ttl_s
+
+    def _k_node(self, node_id: str) -> str:
+        return f"node:{node_id}"
+
+    def _k_nodes(self) -> str:
+        return "nodes"
+
+    def heartbeat(self, node_id: str, info: dict) -> None:
+        data = {k: (json.dumps(v) if isinstance(v, dict) else str(v)) for k, v in info.items()}
+        ts = now_ms()
+        data["heartbeat_ms"] = str(ts)
+        pipe = self.r.pipeline()
+        pipe.hset(self._k_node(node_id), mapping=data)
+        pipe.expire(self._k_node(node_id), self.ttl_s)
+        pipe.zadd(self._k_nodes(), {node_id: ts})
+        pipe.execute()
+
+    def remove(self, node_id: str) -> None:
+        pipe = self.r.pipeline()
+        pipe.delete(self._k_node(node_id))
+        pipe.zrem(self._k_nodes(), node_id)
+        pipe.execute()
+
+    def alive(self) -> list[dict]:
+        """Nodes with a heartbeat within the TTL, parsed; stale index entries are pruned."""
+        cutoff = now_ms() - self.ttl_s * 1000
+        self.r.zremrangebyscore(self._k_nodes(), "-inf", f"({cutoff}")
+        ids = list(self.r.zrange(self._k_nodes(), 0, -1))
+        if not ids:
+            return []
+        pipe = self.r.pipeline(transaction=False)
+        for node_id in ids:
+            pipe.hgetall(self._k_node(node_id))
+        return [parse_node(node_id, h) for node_id, h in zip(ids, pipe.execute()) if h]
+
+    def url(self, node_id: str) -> Optional[str]:
+        """Agent URL of a live node; None once its heartbeat has expired."""
+        return self.r.hget(self._k_node(node_id), "url") or None
+
+    def reserve(self, node_id: str, mem_mb: int) -> None:
+        self.r.hincrby(self._k_node(node_id), "pending_mb", int(mem_mb))
+
+    def release(self, node_id: str, mem_mb: int) -> None:
+        self.r.hincrby(self._k_node(node_id), "pending_mb", -int(mem_mb))
+
+
+def parse_node(node_id: str, h: dict) -> dict:
+    def num(key: str, cast=float):
+        try:
+            return cast(h.get(key) or 0)
+        except ValueError:
+            return cast(0)
+    try:
+        images = json.loads(h.get("images") or "{}")
+    except ValueError:
+        images = {}
+    return {
+        "id": node_id,
+        "url": h.get("url", ""),
+        "public_host": h.get("public_host", ""),
+        "mem_total_mb": num("mem_total_mb", int),
+        "mem_free_mb": num("mem_free_mb", int),
+        "pending_mb": max(num("pending_mb", int), 0),
+        "cpus": max(num("cpus", int), 1),
+        "load": num("load"),
+        "vms": num("vms", int),
+        "images": images,
+        "heartbeat_ms": num("heartbeat_ms", int),
+    }
+
+
+def image_locality(profiles: Optional[dict] = None) -> dict[str, float]:
+    """
+    Profiles this node can boot (base image on local disk), valued by how much of the
+    image is in the page cache; 1.0 when residency cannot be measured.
+    """
+    out: dict[str, float] = {}
+    for os_type, profile in (profiles or VM_PROFILES).items():
+        base = profile.get("base_image")
+        if not base or not profile.get("overlay_dir"):
+            continue  # ISO-only profiles are launched by the API host
+        path = Path(base)
+        if not path.is_file():
+            continue
+        try:
+            res = residency(path)
+        except OSError:
+            res = None
+        out[os_type] = 1.0 if not res or not res[1] else round(res[0] / res[1], 3)
+    return out
+
+
+def node_capacity(committed_mb: int, vms: int, profiles: Optional[dict] = None) -> dict:
+    """Heartbeat payload: memory VMs may still use, CPU load and base-image locality."""
+    vm = psutil.virtual_memory()
+    total_mb = vm.total // (1 << 20)
+    free_mb = vm.available // (1 << 20)
+    if NODE_MEM_MB:
+        total_mb = min(total_mb, NODE_MEM_MB)
+        free_mb = min(free_mb, max(NODE_MEM_MB - committed_mb, 0))
+    try:
+        load = os.getloadavg()[0]
+    except OSError:
+        load = psutil.cpu_percent() / 100 * (os.cpu_count() or 1)
+    return {
+        "mem_total_mb": total_mb,
+        "mem_free_mb": free_mb,
+        "cpus": os.cpu_count() or 1,
+        "load": round(load, 2),
+        "vms": vms,
+        "images": image_locality(profiles),
+    }
+
+
+def agent_headers(token: str = AGENT_TOKEN) -> dict:
+    return {"X-Agent-Token": token} if token else {}
+
+
+def stop_on_node(node_id: str, vmid: str, registry: Optional[NodeRegistry] = None,
+                 timeout_s: float = 10.0) -> Optional[bool]:
+    """
+    POST /agent/stop {vmid} to the node running the VM. True: stopped (or no longer there);
+    False: the agent failed or could not be reached; None: the node is dead (no heartbeat).
+    """
+    url = (registry or get_node_registry()).url(node_id)
+    if not url:
+        return None
+    try:
+        resp = httpx.post(f"{url}/agent/stop", json={"vmid": vmid}, headers=agent_headers(), timeout=timeout_s)
+    except httpx.HTTPError as e:
+        logger.warning(f"[nodes] stop of {vmid} on {node_id} failed: {e}")
+        return False
+    if resp.status_code != 404 and resp.is_error:
+        logger.warning(f"[nodes] stop of {vmid} on {node_id} failed: HTTP {resp.status_code}")
+        return False
+    return True
+
+
+NODE_REGISTRY = NodeRegistry()
+
+def get_node_registry() -> NodeRegistry:
+    return NODE_REGISTRY
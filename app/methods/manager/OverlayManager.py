@@ -1,7 +1,13 @@
 # /app/methods/manager/OverlayManager.py
 import platform, shutil, subprocess, os, tempfile, time, json, re, socket
-from configs.config import SNAPSHOTS_PATH, VM_PROFILES
+from configs.config import SNAPSHOTS_PATH, VM_PROFILES, QEMU_ACCEL, TCG_TB_SIZE, QEMU_BIN, QEMU_IMG_BIN
+from observability.qemu_metrics import QEMU_LAUNCHES
+from .OverlayPool import get_overlay_pool
+from .IoThrottle import io_limits, throttle_group, drive_throttle_opts, throttle_group_object
+from .MemoryBalloon import balloon_args
+from .VncQuality import vnc_args
 import logging
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime, timezone
 
@@ -10,9 +16,82 @@ logger = logging.getLogger(__name__)
 RUN_DIR = Path("/tmp/qemu")
 RUN_DIR.mkdir(parents=True, exist_ok=True)
 
+KVM_DEVICE = Path("/dev/kvm")
+
+# Defaults reproduce the historical "-drive ...,cache=writeback,discard=unmap"
+BLOCK_DEFAULTS = {
+    "cache": "writeback",        # writeback|none|writethrough|directsync|unsafe
+    "aio": "threads",            # threads|native|io_uring
+    "discard": "unmap",
+    "detect_zeroes": None,       # off|on|unmap
+    "l2_cache_size": None,       # qcow2 L2 cache, e.g. "4M" (1M maps 8 GiB at 64k clusters)
+    "cache_clean_interval": None,  # seconds before unused qcow2 cache entries are freed
+    "iothread": False,           # dedicated iothread for the virtio-blk device
+    "blockdev": False,           # -blockdev/-device instead of legacy -drive
+}
+_AIO_MODES = {"threads", "native", "io_uring"}
+# cache mode -> (cache.direct, cache.no-flush, guest write-cache)
+_CACHE_MODES = {
+    "writeback":    ("off", "off", "on"),
+    "none":         ("on",  "off", "on"),
+    "writethrough": ("off", "off", "off"),
+    "directsync":   ("on",  "off", "off"),
+    "unsafe":       ("off", "on",  "on"),
+}
+
 class OnlineSnapshotError(RuntimeError): ...
 
 
+def kvm_available() -> bool:
+    """True if /dev/kvm exists and this process may open it read-write."""
+    try:
+        fd = os.open(KVM_DEVICE, os.O_RDWR | os.O_CLOEXEC)
+    except OSError:
+        return False
+    os.close(fd)
+    return True
+
+
+def block_options(profile: dict) -> dict:
+    """Merge a profile's "block" section over BLOCK_DEFAULTS and validate it."""
+    opts = {**BLOCK_DEFAULTS, **(profile.get("block") or {})}
+    if opts["cache"] not in _CACHE_MODES:
+        raise ValueError(f"Unsupported block cache mode: {opts['cache']}")
+    if opts["aio"] not in _AIO_MODES:
+        raise ValueError(f"Unsupported block aio mode: {opts['aio']}")
+    if opts["aio"] == "native" and _CACHE_MODES[opts["cache"]][0] != "on":
+        raise ValueError("aio=native needs O_DIRECT: use cache=none or cache=directsync")
+    return opts
+
+
+def qcow2_runtime_opts(opts: dict) -> list[str]:
+    """qcow2 driver options (l2-cache-size, cache-clean-interval) as key=value pairs."""
+    out = []
+    if opts.get("l2_cache_size"):
+        out.append(f"l2-cache-size={opts['l2_cache_size']}")
+    if opts.get("cache_clean_interval") is not None:
+        out.append(f"cache-clean-interval={int(opts['cache_clean_interval'])}")
+    if opts.get("detect_zeroes"):
+        out.append(f"detect-zeroes={opts['detect_zeroes']}")
+    return out
+
+
+@lru_cache(maxsize=1)
+def detect_accel() -> str:
+    """
+    Resolve the host accelerator once per process.
+    QEMU_ACCEL=kvm|tcg forces a choice; "auto" probes /dev/kvm and falls back to TCG.
+    """
+    forced = (QEMU_ACCEL or "auto").strip().lower()
+    if forced == "tcg":
+        return "tcg"
+    if kvm_available():
+        return "kvm"
+    if forced == "kvm":
+        logger.warning(f"QEMU_ACCEL=kvm but {KVM_DEVICE} is not usable; falling back to TCG")
+    return "tcg"
+
+
 class QemuOverlayManager:
     """
     Manages a user's qcow2 overlay and a headless QEMU instance with VNC+QMP on UNIX sockets,
@@ -26,6 +105,7 @@ class QemuOverlayManager:
         self.user_id = user_id
         self.vmid = vmid
         self.os_type = os_type
+        self._throttle_groups: set[str] = set()  # throttle-group objects already on the command line
 
     def overlay_path(self) -> Path:
         overlay_dir = self.profile.get("overlay_dir")
@@ -42,8 +122,11 @@ class QemuOverlayManager:
             if overlay.exists():
                 logger.info(f"Overlay already exists for user {self.user_id}: {overlay}")
                 return overlay
+            if get_overlay_pool().take(self.os_type, overlay):
+                logger.info(f"Took pre-created overlay for user {self.user_id}: {overlay}")
+                return overlay
             subprocess.check_call([
-                "qemu-img", "create", "-f", "qcow2",
+                QEMU_IMG_BIN, "create", "-f", "qcow2",
                 "-F", "qcow2", "-b", str(self.profile["base_image"]),
                 str(overlay)
             ])
@@ -53,6 +136,88 @@ class QemuOverlayManager:
             logger.exception(f"Unexpected error during overlay creation for user {self.user_id}: {e}")
             raise
 
+    def _accel_args(self, smp: int | str | None = None) -> tuple[list[str], str]:
+        """
+        Build -accel/-cpu/-smp from the host accelerator and per-profile overrides
+        ("accel", "cpu", "smp"). Returns (argv, accel_name).
+        """
+        accel = (self.profile.get("accel") or detect_accel()).lower()
+        if accel == "kvm" and detect_accel() != "kvm":
+            logger.warning(f"profile '{self.os_type}' asks for KVM but the host has none; using TCG")
+            accel = "tcg"
+
+        if accel == "kvm":
+            args = ["-accel", "kvm"]
+            cpu = self.profile.get("cpu") or "host"
+        else:
+            accel = "tcg"
+            # MTTCG runs one host thread per vCPU; a larger TB cache cuts retranslation
+            args = ["-accel", f"tcg,thread=multi,tb-size={int(TCG_TB_SIZE)}"]
+            cpu = self.profile.get("cpu")
+
+        if cpu:
+            args += ["-cpu", str(cpu)]
+        smp = smp or self.profile.get("smp") or self.profile.get("default_cpus")
+        if smp:
+            args += ["-smp", str(smp)]
+        return args, accel
+
+    def _drive_args(self, image: Path, drive_id: str = "drive0") -> list[str]:
+        """
+        Assemble the QEMU arguments for one qcow2 disk from the profile's "block" options:
+        legacy -drive by default, -drive if=none + -device when an iothread is requested,
+        or a -blockdev file/qcow2 node pair when "blockdev" is set. The disk joins the user's
+        I/O throttle group (profile "io" limits, see IoThrottle).
+        """
+        opts = block_options(self.profile)
+        direct, no_flush, write_cache = _CACHE_MODES[opts["cache"]]
+        limits = io_limits(self.profile, self.user_id)
+        group = throttle_group(self.user_id)
+
+        args: list[str] = []
+        iothread = None
+        if opts["iothread"]:
+            iothread = f"io-{drive_id}"
+            args += ["-object", f"iothread,id={iothread}"]
+
+        if opts["blockdev"]:
+            file_node = f"{drive_id}-file"
+            cache = [f"cache.direct={direct}", f"cache.no-flush={no_flush}"]
+            args += ["-blockdev", ",".join([
+                "driver=file", f"node-name={file_node}", f"filename={image}",
+                f"aio={opts['aio']}", f"discard={opts['discard']}", *cache,
+            ])]
+            args += ["-blockdev", ",".join([
+                "driver=qcow2", f"node-name={drive_id}", f"file={file_node}",
+                f"discard={opts['discard']}", *cache, *qcow2_runtime_opts(opts),
+            ])]
+            # always filtered, so limits can be set live even if the profile has none
+            if group not in self._throttle_groups:
+                self._throttle_groups.add(group)
+                args += ["-object", throttle_group_object(limits, group)]
+            args += ["-blockdev", ",".join([
+                "driver=throttle", f"node-name={drive_id}-throttle", f"throttle-group={group}",
+                f"file={drive_id}",
+            ])]
+            top_node = f"{drive_id}-throttle"
+        else:
+            drive = [
+                f"file={image}", "format=qcow2", f"id={drive_id}",
+                f"cache={opts['cache']}", f"aio={opts['aio']}", f"discard={opts['discard']}",
+                *qcow2_runtime_opts(opts), *drive_throttle_opts(limits, group),
+            ]
+            if iothread is None:
+                return args + ["-drive", ",".join(drive + ["if=virtio"])]
+            args += ["-drive", ",".join(drive + ["if=none"])]
+            top_node = drive_id
+
+        device = ["virtio-blk-pci", f"drive={top_node}", f"id=v{drive_id}"]
+        if iothread:
+            device.append(f"iothread={iothread}")
+        if opts["blockdev"] and write_cache == "off":
+            device.append("write-cache=off")
+        return args + ["-device", ",".join(device)]
+
     def _socket_paths(self, vmid: str):
         vnc = RUN_DIR / f"vnc-{vmid}.sock"
         qmp = RUN_DIR / f"qmp-{vmid}.sock"
@@ -80,21 +245,25 @@ class QemuOverlayManager:
         except Exception as e:
             logger.warning(f"Failed to remove existing pidfile {pidfile}: {e}")
 
+        accel_args, accel = self._accel_args()
+
         cmd = [
-            "qemu-system-x86_64",
-            # "-enable-kvm",
+            QEMU_BIN,
+            *accel_args,
             "-m", mem,
-            "-drive", f"file={image},format=qcow2,if=virtio,cache=writeback,discard=unmap",
+            *self._drive_args(image),
+            *balloon_args(self.profile),
             "-nic", "user,model=virtio-net-pci",
-            "-vnc", f"unix:{vnc_sock}",
+            *vnc_args(vnc_sock, self.profile),
             "-qmp", f"unix:{qmp_sock},server,nowait",
             "-display", "none",
             "-daemonize",
             "-pidfile", str(pidfile),
         ]
 
-        logger.info(f"Launching QEMU for user {self.user_id} with vmid={vmid}, os_type={self.os_type}")
+        logger.info(f"Launching QEMU for user {self.user_id} with vmid={vmid}, os_type={self.os_type}, accel={accel}")
         result = subprocess.run(cmd, capture_output=True, text=True)
+        QEMU_LAUNCHES.labels(os_type=self.os_type, accel=accel).inc()
 
         if result.returncode != 0:
             error_msg = (
@@ -134,6 +303,8 @@ class QemuOverlayManager:
             "overlay": str(image),            # <- reflect the actual image used
             "vnc_socket": str(vnc_sock),
             "qmp_socket": str(qmp_sock),
+            "accel": accel,
+            "memory_mb": int(mem),
             "started_at": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
             "pid": qemu_pid,
         }
@@ -264,7 +435,8 @@ class QemuOverlayManager:
 
         # 1) Resources (defaults from profile)
         mem = str(memory_mb or self.profile.get("default_memory", 2048))
-        smp = str(cpus or self.profile.get("default_cpus", 2))
+        smp = str(cpus or self.profile.get("smp") or self.profile.get("default_cpus", 2))
+        accel_args, accel = self._accel_args(smp=smp)
 
         # 2) Sockets/pidfile
         vnc_sock, qmp_sock = self._socket_paths(vmid)
@@ -286,18 +458,18 @@ class QemuOverlayManager:
             scratch_path = Path(base_dir) / f"iso-scratch-{vmid}.qcow2"
             if not scratch_path.exists():
                 subprocess.check_call([
-                    "qemu-img", "create", "-f", "qcow2", str(scratch_path), f"{int(data_disk_gb)}G"
+                    QEMU_IMG_BIN, "create", "-f", "qcow2", str(scratch_path), f"{int(data_disk_gb)}G"
                 ])
                 logger.info(f"[boot_from_iso] created scratch disk: {scratch_path}")
 
         # 4) Build minimal, VNC‑only, BIOS (SeaBIOS) command
         cmd = [
-            "qemu-system-x86_64",
-            "-machine", "pc,accel=tcg",                # BIOS-friendly, works with -cdrom
-            "-smp", smp,
+            QEMU_BIN,
+            "-machine", "pc",                          # BIOS-friendly, works with -cdrom
+            *accel_args,
             "-m", mem,
             "-display", "none",
-            "-vnc", f"unix:{vnc_sock}",
+            *vnc_args(vnc_sock, self.profile),
             "-qmp", f"unix:{qmp_sock},server,nowait",
             "-daemonize",
             "-pidfile", str(pidfile),
@@ -305,22 +477,24 @@ class QemuOverlayManager:
             "-boot", "d",
             "-nic", "user,model=virtio-net-pci",
             "-vga", "std",
+            *balloon_args(self.profile),
         ]
         if scratch_path:
-            cmd += ["-drive", f"file={scratch_path},format=qcow2,if=virtio,cache=writeback,discard=unmap"]
+            cmd += self._drive_args(scratch_path, "drive1")
         if install_disk_path:
             target = Path(install_disk_path).expanduser().resolve(strict=True)
-            cmd += ["-drive", f"file={target},format=qcow2,if=virtio,cache=writeback,discard=unmap"]
+            cmd += self._drive_args(target, "drive2")
         if extra_qemu_args:
             cmd += list(extra_qemu_args)
 
         logger.info(
-            "Launching ISO (VNC, BIOS) user=%s vmid=%s os=%s iso_abs=%s size=%s mem=%s smp=%s",
-            self.user_id, vmid, self.os_type, str(iso), size, mem, smp
+            "Launching ISO (VNC, BIOS) user=%s vmid=%s os=%s iso_abs=%s size=%s mem=%s smp=%s accel=%s",
+            self.user_id, vmid, self.os_type, str(iso), size, mem, smp, accel
         )
 
         # 5) Launch
         result = subprocess.run(cmd, capture_output=True, text=True)
+        QEMU_LAUNCHES.labels(os_type=self.os_type, accel=accel).inc()
         if result.returncode != 0:
             msg = (
                 f"QEMU ISO boot failed (user={self.user_id} vmid={vmid})\n"
@@ -357,6 +531,8 @@ class QemuOverlayManager:
             "iso": str(iso),
             "vnc_socket": str(vnc_sock),
             "qmp_socket": str(qmp_sock),
+            "accel": accel,
+            "memory_mb": int(mem),
             "pid": qemu_pid,
             "started_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
         }
@@ -422,7 +598,8 @@ class QemuOverlayManager:
                 continue
             fmt = _drv(ins).lower()
             if fmt in ("qcow2", "raw"):            # typical root disk formats
-                dev_name = d.get("device")
+                # -blockdev disks have no legacy device name; drive-backup takes the node-name
+                dev_name = d.get("device") or ins.get("node-name")
                 if dev_name:
                     break
 
@@ -469,7 +646,7 @@ class QemuOverlayManager:
     def list_disk_snapshots(self) -> list[dict]:
         """List internal qcow2 snapshots (disk-only)."""
         overlay = self.overlay_path()
-        cmd = ["qemu-img", "snapshot", "-l", str(overlay)]
+        cmd = [QEMU_IMG_BIN, "snapshot", "-l", str(overlay)]
         result = subprocess.run(cmd, capture_output=True, text=True)
         if result.returncode != 0:
             raise OnlineSnapshotError(f"Failed to list snapshots:\n{result.stderr}")
@@ -487,7 +664,7 @@ class QemuOverlayManager:
     def delete_disk_snapshot(self, name: str) -> None:
         """Delete a qcow2 internal snapshot."""
         overlay = self.overlay_path()
-        cmd = ["qemu-img", "snapshot", "-d", name, str(overlay)]
+        cmd = [QEMU_IMG_BIN, "snapshot", "-d", name, str(overlay)]
         result = subprocess.run(cmd, capture_output=True, text=True)
         if result.returncode != 0:
             raise OnlineSnapshotError(
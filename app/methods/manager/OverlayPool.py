@@ -0,0 +1,183 @@
+# /app/methods/manager/OverlayPool.py
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import subprocess
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from configs.config import VM_PROFILES, OVERLAY_POOL_SIZE, QEMU_IMG_BIN
+from observability.qemu_metrics import OVERLAY_POOL_STOCK, OVERLAY_POOL_TAKES
+
+logger = logging.getLogger(__name__)
+
+STALE_TMP_S = 300  # half-written pool files older than this are removed
+
+
+def base_fingerprint(base: Path) -> Optional[str]:
+    """Short id of a base image's identity (inode, size, mtime); None if it is missing."""
+    try:
+        st = Path(base).stat()
+    except FileNotFoundError:
+        return None
+    raw = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+class OverlayPool:
+    """
+    Keeps a small stock of blank qcow2 overlays per profile inside its overlay_dir, so a
+    launch only has to rename one into place instead of running `qemu-img create`.
+
+    Stock files are hidden and carry the base image fingerprint they were created against:
+      <overlay_dir>/.<prefix>_pool_<fingerprint>_<token>.qcow2
+    A changed base image therefore never hands out an overlay pointing at stale data;
+    mismatching files are removed on the next refill.
+    """
+
+    def __init__(self, profiles: Optional[dict] = None, size: int = OVERLAY_POOL_SIZE) -> None:
+        self._profiles = VM_PROFILES if profiles is None else profiles
+        self._size = size
+        self._lock = Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    # ----- helpers
+    def _target(self, os_type: str) -> int:
+        profile = self._profiles.get(os_type) or {}
+        if not profile.get("overlay_dir") or not profile.get("overlay_prefix"):
+            return 0
+        return int(profile.get("pool_size", self._size) or 0)
+
+    def _glob(self, os_type: str, fingerprint: str = "*") -> list[Path]:
+        profile = self._profiles[os_type]
+        pattern = f".{profile['overlay_prefix']}_pool_{fingerprint}_*.qcow2"
+        return sorted(Path(profile["overlay_dir"]).glob(pattern))
+
+    def stock(self, os_type: str) -> list[Path]:
+        """Ready overlays for the profile's current base image."""
+        if not self._target(os_type):
+            return []
+        fp = base_fingerprint(self._profiles[os_type]["base_image"])
+        return self._glob(os_type, fp) if fp else []
+
+    def _notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+    # ----- API
+    def take(self, os_type: str, dest: Path) -> bool:
+        """
+        Atomically rename one pooled overlay to `dest`. Returns False when the pool is
+        empty or disabled so the caller can fall back to `qemu-img create`.
+        """
+        if not self._target(os_type):
+            return False
+        try:
+            with self._lock:
+                for cand in self.stock(os_type):
+                    try:
+                        # same directory → same filesystem → atomic; a concurrent taker
+                        # (another worker) that lost the race gets FileNotFoundError
+                        os.rename(cand, dest)
+                    except FileNotFoundError:
+                        continue
+                    OVERLAY_POOL_TAKES.labels(os_type=os_type, outcome="hit").inc()
+                    logger.info(f"[overlay_pool] {os_type}: took {cand.name} → {dest.name}")
+                    return True
+            OVERLAY_POOL_TAKES.labels(os_type=os_type, outcome="miss").inc()
+            logger.info(f"[overlay_pool] {os_type}: pool empty, creating overlay inline")
+            return False
+        finally:
+            self._notify()
+
+    def refill(self, os_type: str) -> int:
+        """Drop stale stock and top the profile up to its target size. Returns files created."""
+        target = self._target(os_type)
+        if not target:
+            return 0
+        profile = self._profiles[os_type]
+        base = Path(profile["base_image"])
+        fp = base_fingerprint(base)
+
+        now = time.time()
+        for f in self._glob(os_type):
+            if fp is None or f"_pool_{fp}_" not in f.name:
+                f.unlink(missing_ok=True)
+                logger.info(f"[overlay_pool] {os_type}: base image changed, dropped {f.name}")
+        for f in Path(profile["overlay_dir"]).glob(f".{profile['overlay_prefix']}_pool_*.tmp"):
+            try:
+                if now - f.stat().st_mtime > STALE_TMP_S:
+                    f.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+
+        if fp is None:
+            OVERLAY_POOL_STOCK.labels(os_type=os_type).set(0)
+            return 0
+
+        created = 0
+        while len(self.stock(os_type)) < target:
+            final = Path(profile["overlay_dir"]) / (
+                f".{profile['overlay_prefix']}_pool_{fp}_{secrets.token_hex(4)}.qcow2"
+            )
+            tmp = final.with_name(final.name + ".tmp")
+            try:
+                subprocess.check_call(
+                    [QEMU_IMG_BIN, "create", "-q", "-f", "qcow2", "-F", "qcow2", "-b", str(base), str(tmp)],
+                    stdout=subprocess.DEVNULL,
+                )
+                os.rename(tmp, final)  # only complete files become visible to take()
+                created += 1
+            except Exception:
+                tmp.unlink(missing_ok=True)
+                logger.exception(f"[overlay_pool] {os_type}: failed to pre-create overlay")
+                break
+
+        OVERLAY_POOL_STOCK.labels(os_type=os_type).set(len(self.stock(os_type)))
+        if created:
+            logger.info(f"[overlay_pool] {os_type}: pre-created {created} overlay(s)")
+        return created
+
+    def refill_all(self) -> None:
+        for os_type in self._profiles:
+            try:
+                self.refill(os_type)
+            except Exception:
+                logger.exception(f"[overlay_pool] refill failed for {os_type}")
+
+    async def run(self, stop_event: asyncio.Event, interval_sec: int = 30) -> None:
+        """Keeper loop: refill on start, after every take(), and every `interval_sec`."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        try:
+            while not stop_event.is_set():
+                self._wake.clear()
+                await asyncio.to_thread(self.refill_all)
+
+                waiters = [asyncio.ensure_future(self._wake.wait()),
+                           asyncio.ensure_future(stop_event.wait())]
+                try:
+                    await asyncio.wait(waiters, timeout=interval_sec,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for w in waiters:
+                        w.cancel()
+        finally:
+            self._loop = None
+            self._wake = None
+
+
+OVERLAY_POOL = OverlayPool()
+
+def get_overlay_pool() -> OverlayPool:
+    return OVERLAY_POOL
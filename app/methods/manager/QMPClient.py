@@ -0,0 +1,98 @@
+# /app/methods/manager/QMPClient.py
+from __future__ import annotations
+import asyncio
+import json
+from collections import deque
+from pathlib import Path
+from typing import Any, Optional
+
+
+class QMPError(RuntimeError): ...
+
+
+class QMPClient:
+    """
+    Minimal asyncio QMP client for a VM's UNIX socket:
+    greeting → qmp_capabilities → execute(command) → return value.
+    Asynchronous events received while waiting for a reply are kept in `events`.
+
+    QEMU serves one QMP client per socket at a time, so keep connections short-lived:
+        async with QMPClient(qmp_sock) as qmp:
+            stats = await qmp.execute("query-blockstats")
+    """
+
+    def __init__(self, path: str | Path, timeout: float = 5.0) -> None:
+        self.path = str(path)
+        self.timeout = timeout
+        self.greeting: Optional[dict] = None
+        self.events: deque[dict] = deque(maxlen=100)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def __aenter__(self) -> "QMPClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(self.path, limit=1 << 20), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise QMPError(f"cannot connect to QMP at {self.path}: {e}") from e
+        self.greeting = await self._read()
+        if "QMP" not in self.greeting:
+            raise QMPError(f"unexpected QMP greeting: {self.greeting}")
+        await self.execute("qmp_capabilities")
+
+    async def _read(self) -> dict:
+        try:
+            line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+        except asyncio.TimeoutError as e:
+            raise QMPError(f"QMP read timed out ({self.path})") from e
+        if not line:
+            raise QMPError(f"QMP connection closed ({self.path})")
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            raise QMPError(f"invalid QMP message: {line[:80]!r}") from e
+
+    async def execute(self, command: str, arguments: Optional[dict] = None) -> Any:
+        if self._writer is None:
+            raise QMPError("QMP client is not connected")
+        msg: dict = {"execute": command}
+        if arguments:
+            msg["arguments"] = arguments
+        self._writer.write(json.dumps(msg).encode() + b"\n")
+        await self._writer.drain()
+        while True:
+            resp = await self._read()
+            if "event" in resp:
+                self.events.append(resp)
+                continue
+            if "error" in resp:
+                err = resp["error"]
+                raise QMPError(f"{command}: {err.get('class')}: {err.get('desc')}")
+            if "return" in resp:
+                return resp["return"]
+
+    async def close(self) -> None:
+        if self._writer is None:
+            return
+        try:
+            self._writer.close()
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+        finally:
+            self._reader = self._writer = None
+
+
+async def qmp_execute(path: str | Path, command: str, arguments: Optional[dict] = None,
+                      *, timeout: float = 5.0) -> Any:
+    """One-shot helper: connect, run a single command, disconnect."""
+    async with QMPClient(path, timeout=timeout) as qmp:
+        return await qmp.execute(command, arguments)
@@ -0,0 +1,239 @@
+# /app/methods/manager/Reconciler.py
+import asyncio
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import psutil
+
+from configs.config import VM_PROFILES, ORPHAN_GRACE_S, RECONCILE_INTERVAL_S
+from observability.qemu_metrics import (
+    RECONCILE_ORPHANS,
+    RECONCILE_LEAKED_MEMORY_BYTES,
+    RECONCILE_RECLAIMED_DISK_BYTES,
+    RECONCILE_LAST_RUN,
+)
+from utils import RUN_DIR, session_files, run_files, _to_int
+from .ProcessManager import get_proc_registry
+from .SessionManager import local_sessions
+
+logger = logging.getLogger(__name__)
+
+TERM_WAIT_S = 5  # SIGTERM → SIGKILL escalation for orphan processes
+
+_RUN_FILE_RE = re.compile(r"^(?:(?:vnc|qmp)-(?P<sock>.+)\.sock|qemu-(?P<pid>.+)\.pid)$")
+_CMDLINE_VMID_RE = re.compile(r"(?:vnc|qmp)-([^/,\s]+)\.sock|qemu-([^/,\s]+)\.pid")
+
+
+def _touched(st: os.stat_result) -> float:
+    # rename() bumps ctime but keeps mtime, so an overlay just taken from the pool still looks fresh
+    return max(st.st_mtime, st.st_ctime)
+
+
+def _allocated(st: os.stat_result) -> int:
+    return st.st_blocks * 512 if hasattr(st, "st_blocks") else st.st_size
+
+
+class Reconciler:
+    """
+    Diffs host reality against `vms:active` and reclaims orphans in both directions:
+      - QEMU/websockify processes, RUN_DIR sockets/pidfiles and overlays whose vmid has
+        no session (left behind by crashes or a failed cleanup_vm);
+      - sessions whose QEMU process is gone (or whose pid now belongs to something else).
+    Anything without a session that is younger than `grace_s` is left alone: a launch
+    only writes its session after QEMU and the websocket bridge are up.
+    """
+
+    def __init__(self, profiles: Optional[dict] = None, run_dir: Optional[Path] = None,
+                 grace_s: int = ORPHAN_GRACE_S) -> None:
+        self._profiles = VM_PROFILES if profiles is None else profiles
+        self._run_dir = Path(run_dir or RUN_DIR)
+        self._grace_s = grace_s
+
+    # ----- host scans
+    def _processes(self) -> dict[str, list[psutil.Process]]:
+        """vmid → QEMU/websockify processes referencing this RUN_DIR."""
+        out: dict[str, list[psutil.Process]] = {}
+        run_dir = str(self._run_dir)
+        for p in psutil.process_iter(["cmdline"]):
+            cmd = p.info.get("cmdline") or []
+            if not cmd or not any(run_dir in a for a in cmd):
+                continue
+            exe = Path(cmd[0]).name
+            if not (exe.startswith("qemu-system") or any(Path(a).name == "websockify" for a in cmd[:3])):
+                continue
+            m = _CMDLINE_VMID_RE.search(" ".join(cmd))
+            if m:
+                out.setdefault(m.group(1) or m.group(2), []).append(p)
+        return out
+
+    def _files(self) -> dict[str, list[Path]]:
+        """vmid → RUN_DIR files and overlays/scratch disks named after it."""
+        out: dict[str, list[Path]] = {}
+        if self._run_dir.is_dir():
+            for f in self._run_dir.iterdir():
+                m = _RUN_FILE_RE.match(f.name)
+                if m:
+                    out.setdefault(m.group("sock") or m.group("pid"), []).append(f)
+        seen_dirs = set()
+        for profile in self._profiles.values():
+            d, prefix = profile.get("overlay_dir"), profile.get("overlay_prefix")
+            if not d or not prefix or not Path(d).is_dir():
+                continue
+            # hidden pool files (.<prefix>_pool_*) never match these patterns
+            for f in Path(d).glob(f"{prefix}_*.qcow2"):
+                out.setdefault(f.name[len(prefix) + 1:-len(".qcow2")], []).append(f)
+            if d not in seen_dirs:
+                seen_dirs.add(d)
+                for f in Path(d).glob("iso-scratch-*.qcow2"):
+                    out.setdefault(f.name[len("iso-scratch-"):-len(".qcow2")], []).append(f)
+        return out
+
+    # ----- reclaim
+    def _kill(self, procs: list[psutil.Process]) -> int:
+        """SIGTERM, then SIGKILL after TERM_WAIT_S. Returns the RSS that was freed."""
+        rss, targets = 0, []
+        for p in procs:
+            try:
+                rss += p.memory_info().rss
+                p.terminate()
+                targets.append(p)
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied:
+                logger.warning(f"[reconcile] not allowed to stop pid={p.pid}")
+        _, alive = psutil.wait_procs(targets, timeout=TERM_WAIT_S)
+        for p in alive:
+            try:
+                p.kill()
+            except psutil.NoSuchProcess:
+                pass
+        return rss
+
+    def _unlink(self, paths: list[Path]) -> int:
+        freed = 0
+        for f in paths:
+            try:
+                st = f.stat()
+                f.unlink()
+                freed += _allocated(st)
+                logger.info(f"[reconcile] removed {f}")
+            except FileNotFoundError:
+                pass
+            except Exception:
+                logger.exception(f"[reconcile] failed to remove {f}")
+        return freed
+
+    def _qemu_alive(self, pid: int) -> bool:
+        try:
+            p = psutil.Process(pid)
+            return p.is_running() and p.status() != psutil.STATUS_ZOMBIE and \
+                Path((p.cmdline() or [""])[0]).name.startswith("qemu-system")
+        except (psutil.NoSuchProcess, psutil.ZombieProcess):
+            return False
+        except psutil.AccessDenied:
+            return True
+
+    def reconcile(self, store) -> dict:
+        """One pass. Returns counts plus leaked memory / reclaimed disk in bytes."""
+        now = time.time()
+        cutoff = now - self._grace_s
+        summary = {"qemu": 0, "websockify": 0, "run_file": 0, "overlay": 0, "session": 0,
+                   "memory_bytes": 0, "disk_bytes": 0}
+
+        sessions = dict(local_sessions(store.items()))
+        procs = self._processes()
+
+        # 1) host → Redis: processes without a session
+        killed: set[str] = set()
+        for vmid, plist in procs.items():
+            if vmid in sessions:
+                continue
+            try:
+                young = any(p.create_time() > cutoff for p in plist)
+            except psutil.NoSuchProcess:
+                continue
+            if young:
+                continue
+            logger.warning(f"[reconcile] orphan processes for vmid={vmid}: {[p.pid for p in plist]}")
+            summary["memory_bytes"] += self._kill(plist)
+            for p in plist:
+                kind = "qemu" if Path((p.info.get("cmdline") or [""])[0]).name.startswith("qemu-system") \
+                    else "websockify"
+                summary[kind] += 1
+            killed.add(vmid)
+
+        # 2) Redis → host: sessions whose QEMU is gone
+        stale: list[str] = []
+        for vmid, sess in sessions.items():
+            pid = _to_int(sess.get("qemu_pid") or sess.get("pid"))
+            if pid:
+                if self._qemu_alive(pid):
+                    continue
+            else:
+                created = (_to_int(sess.get("created_at")) or 0) / 1000
+                if vmid in procs or created > cutoff:
+                    continue
+            stale.append(vmid)
+        for vmid in stale:
+            sess = sessions.pop(vmid)
+            logger.warning(f"[reconcile] session {vmid} has no live QEMU (pid={sess.get('pid')}), dropping it")
+            # not cleanup_vm(): its SIGTERM would hit whatever process reused the pid
+            get_proc_registry().stop(f"ws:{vmid}")
+            summary["disk_bytes"] += self._unlink([*session_files(vmid, sess),
+                                                   *(self._run_dir / f.name for f in run_files(vmid))])
+            try:
+                store.delete(vmid)
+                summary["session"] += 1
+            except Exception:
+                logger.exception(f"[reconcile] store.delete failed for {vmid}")
+
+        # 3) files without a session or a live process
+        live = {v for v in procs if v not in killed}
+        for vmid, files in self._files().items():
+            if vmid in sessions or vmid in live:
+                continue
+            doomed = []
+            for f in files:
+                try:
+                    if vmid in killed or _touched(f.stat()) <= cutoff:
+                        doomed.append(f)
+                except FileNotFoundError:
+                    pass
+            for f in doomed:
+                kind = "run_file" if f.parent == self._run_dir else "overlay"
+                freed = self._unlink([f])
+                summary[kind] += 1
+                summary["disk_bytes"] += freed
+
+        for kind in ("qemu", "websockify", "run_file", "overlay", "session"):
+            if summary[kind]:
+                RECONCILE_ORPHANS.labels(kind=kind).inc(summary[kind])
+        RECONCILE_LEAKED_MEMORY_BYTES.set(summary["memory_bytes"])
+        RECONCILE_RECLAIMED_DISK_BYTES.set(summary["disk_bytes"])
+        RECONCILE_LAST_RUN.set(now)
+        return summary
+
+
+async def orphan_reconciler(
+    store_factory: Callable,
+    stop_event: asyncio.Event,
+    interval_sec: int = RECONCILE_INTERVAL_S,
+    reconciler: Optional[Reconciler] = None,
+) -> None:
+    """Reconcile on startup (what a crash left behind), then every `interval_sec`."""
+    reconciler = reconciler or Reconciler()
+    while not stop_event.is_set():
+        try:
+            summary = await asyncio.to_thread(reconciler.reconcile, store_factory())
+            if any(summary[k] for k in ("qemu", "websockify", "run_file", "overlay", "session")):
+                logger.info("[reconcile] %s", summary)
+        except Exception:
+            logger.exception("[reconcile] pass failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval_sec)
+        except asyncio.TimeoutError:
+            pass
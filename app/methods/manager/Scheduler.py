@@ -0,0 +1,113 @@
+# /app/methods/manager/Scheduler.py
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+import httpx
+
+from configs.config import VM_PROFILES, AGENT_TOKEN, NODE_MEM_RESERVE_MB
+from .NodeRegistry import NodeRegistry, get_node_registry
+
+logger = logging.getLogger(__name__)
+
+# score = W_MEM * memory headroom + W_CPU * idle CPU + W_LOCALITY * base image in page cache
+W_MEM = 0.5
+W_CPU = 0.3
+W_LOCALITY = 0.2
+LAUNCH_TIMEOUT_S = 60.0
+
+
+class NoCapacityError(RuntimeError): ...
+
+
+def score_node(node: dict, os_type: str, mem_mb: int, reserve_mb: int = NODE_MEM_RESERVE_MB) -> Optional[float]:
+    """Placement score in [0, 1] (higher is better); None if the node cannot take the VM."""
+    if os_type not in node["images"]:
+        return None  # base image not on this node
+    free = node["mem_free_mb"] - node["pending_mb"] - reserve_mb
+    if free < mem_mb:
+        return None
+    headroom = (free - mem_mb) / max(node["mem_total_mb"], 1)
+    busy = min(node["load"] / node["cpus"], 1.0)
+    locality = float(node["images"][os_type])
+    return W_MEM * min(headroom, 1.0) + W_CPU * (1.0 - busy) + W_LOCALITY * locality
+
+
+def rank_nodes(nodes: Iterable[dict], os_type: str, mem_mb: int) -> list[dict]:
+    scored = [(score_node(n, os_type, mem_mb), n) for n in nodes]
+    return [n for s, n in sorted((x for x in scored if x[0] is not None),
+                                 key=lambda x: (-x[0], x[1]["vms"], x[1]["id"]))]
+
+
+class Scheduler:
+    """
+    Places launches on worker nodes. Nodes are ranked by score_node(); the chosen node's
+    memory is reserved in the registry while its agent boots the VM, so concurrent
+    launches see it. A node that cannot be reached, or that fails the launch (5xx), is
+    skipped and the next one tried; a launch that times out is stopped and not retried.
+    """
+
+    def __init__(self, registry: Optional[NodeRegistry] = None, token: str = AGENT_TOKEN,
+                 timeout_s: float = LAUNCH_TIMEOUT_S, transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        self._registry = registry or get_node_registry()
+        self._token = token
+        self._timeout_s = timeout_s
+        self._transport = transport
+
+    def place(self, os_type: str, mem_mb: int, exclude: Iterable[str] = ()) -> Optional[dict]:
+        skip = set(exclude)
+        ranked = rank_nodes((n for n in self._registry.alive() if n["id"] not in skip), os_type, mem_mb)
+        return ranked[0] if ranked else None
+
+    async def launch(self, user_id: str, vmid: str, os_type: str) -> dict:
+        """Boot the VM on the best node; returns the agent's reply plus the node."""
+        if os_type not in VM_PROFILES:
+            raise ValueError(f"Unsupported OS type: {os_type}")
+        mem_mb = int(VM_PROFILES[os_type]["default_memory"])
+        headers = {"X-Agent-Token": self._token} if self._token else {}
+        tried: list[str] = []
+        async with httpx.AsyncClient(timeout=self._timeout_s, transport=self._transport) as client:
+            while True:
+                node = await asyncio.to_thread(self.place, os_type, mem_mb, tried)
+                if node is None:
+                    raise NoCapacityError(
+                        f"no node can take a {os_type} VM ({mem_mb} MiB); tried {tried or 'none'}"
+                    )
+                tried.append(node["id"])
+                await asyncio.to_thread(self._registry.reserve, node["id"], mem_mb)
+                try:
+                    resp = await client.post(f"{node['url']}/agent/launch", headers=headers,
+                                             json={"user_id": user_id, "vmid": vmid, "os_type": os_type})
+                    resp.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code < 500:
+                        raise  # the request itself was refused; another node would refuse it too
+                    # the agent gave up on it; stop whatever it left running before trying elsewhere
+                    logger.warning(f"[scheduler] launch of {vmid} on {node['id']} failed: {e}")
+                    await self._stop(client, node, vmid, headers)
+                    continue
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    logger.warning(f"[scheduler] node {node['id']} unreachable for {vmid}: {e}")
+                    continue  # the launch never reached the node
+                except httpx.HTTPError as e:
+                    # timed out or cut off mid-launch: the node may still be booting this vmid,
+                    # so trying another node could run it twice
+                    logger.warning(f"[scheduler] launch of {vmid} on {node['id']} failed: {e}")
+                    await self._stop(client, node, vmid, headers)
+                    raise
+                finally:
+                    await asyncio.to_thread(self._registry.release, node["id"], mem_mb)
+                logger.info(f"[scheduler] {vmid} ({os_type}) placed on {node['id']}")
+                return {**resp.json(), "node": node}
+
+    async def _stop(self, client: httpx.AsyncClient, node: dict, vmid: str, headers: dict) -> None:
+        """Best effort /agent/stop; if the VM is not there yet its lease lapses without a heartbeat."""
+        try:
+            await client.post(f"{node['url']}/agent/stop", headers=headers, json={"vmid": vmid})
+        except httpx.HTTPError as e:
+            logger.warning(f"[scheduler] stop of {vmid} on {node['id']} failed: {e}")
+
+
+def get_scheduler() -> Scheduler:
+    return Scheduler()
@@ -0,0 +1,184 @@
+# /app/methods/manager/SessionLease.py
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+import redis
+
+from configs.config import NODE_ID, SESSION_TTL, SESSION_HEARTBEAT_S, SESSION_SWEEP_S, VM_PROFILES
+from observability.qemu_metrics import SESSION_HEARTBEATS, SESSIONS_RECLAIMED
+from utils import cleanup_vm
+from .ProcessManager import get_proc_registry
+from .SessionManager import SessionStore, is_local, local_sessions
+
+logger = logging.getLogger(__name__)
+
+REAP_LOCK_S = 60  # one reclaim per vmid at a time (expiry event, sweep and other workers race)
+
+
+class HeartbeatCoalescer:
+    """
+    Bridges call beat() on every sign of life (a connect, a log line, a metrics window);
+    at most one lease renewal per VM reaches Redis per `interval_s`. Thread-safe: the
+    websockify monitors beat from their own threads.
+    """
+
+    def __init__(self, interval_s: int = SESSION_HEARTBEAT_S, ttl_s: int = SESSION_TTL,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if ttl_s > 0:
+            interval_s = min(interval_s, max(1, ttl_s // 3))  # a connected session never lapses
+        self.interval_s = interval_s
+        self._clock = clock
+        self._last: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def due(self, vmid: str) -> bool:
+        last = self._last.get(vmid)
+        return last is None or self._clock() - last >= self.interval_s
+
+    def beat(self, vmid: str, store: SessionStore, force: bool = False) -> bool:
+        """Renew the lease unless one was written less than `interval_s` ago. True if written."""
+        with self._lock:
+            if not force and not self.due(vmid):
+                SESSION_HEARTBEATS.labels(outcome="coalesced").inc()
+                return False
+            # claimed before the write: a failing Redis is retried next interval, not per line
+            self._last[vmid] = self._clock()
+        try:
+            alive = store.heartbeat(vmid)
+        except Exception as e:
+            SESSION_HEARTBEATS.labels(outcome="error").inc()
+            logger.warning(f"[heartbeat:{vmid}] lease renewal failed: {e}")
+            return False
+        if not alive:
+            self.forget(vmid)
+        SESSION_HEARTBEATS.labels(outcome="written" if alive else "gone").inc()
+        return alive
+
+    def forget(self, vmid: str) -> None:
+        with self._lock:
+            self._last.pop(vmid, None)
+
+
+HEARTBEATS = HeartbeatCoalescer()
+
+
+def get_heartbeats() -> HeartbeatCoalescer:
+    return HEARTBEATS
+
+
+def lease_vmid(key: str) -> Optional[str]:
+    """vm:{vmid}:hb → vmid; None for any other key."""
+    if key.startswith("vm:") and key.endswith(":hb"):
+        return key[3:-3] or None
+    return None
+
+
+def reclaim(store: SessionStore, vmid: str, reason: str) -> bool:
+    """
+    Tear down a local session whose lease has lapsed. Re-checks the lease first: a
+    heartbeat may have renewed it between the expiry and now.
+    """
+    session = store.get(vmid)
+    if session is not None and not is_local(session):
+        return False
+    expired, _ = store.lapsed([vmid])
+    if vmid not in expired:
+        return False
+    if not store.r.set(f"vm:{vmid}:reaping", NODE_ID, nx=True, ex=REAP_LOCK_S):
+        return False
+
+    logger.info(f"[session_reaper:{vmid}] lease expired ({reason}), reclaiming")
+    store.event("expired", vmid, reason=reason, user_id=(session or {}).get("user_id"))
+    get_proc_registry().stop(f"ws:{vmid}")
+    if session is not None:
+        cleanup_vm(vmid, store)
+    else:
+        store.delete(vmid)  # hash already expired: only index entries are left
+    HEARTBEATS.forget(vmid)
+    SESSIONS_RECLAIMED.labels(reason=reason).inc()
+    return True
+
+
+def sweep(store: SessionStore) -> int:
+    """
+    Reclaim local sessions whose lease is gone, whether or not an expiry notification
+    arrived. Sessions from before leases existed get one instead of being reclaimed.
+    """
+    sessions, stale = store.scan_active()
+    expired, unleased = store.lapsed([vmid for vmid, _ in local_sessions(sessions)])
+    for vmid in unleased:
+        store.heartbeat(vmid)
+    if stale:
+        store.drop_indexes(stale, list(VM_PROFILES))
+    return sum(reclaim(store, vmid, "sweep") for vmid in expired)
+
+
+def subscribe_expired(store: SessionStore):
+    """
+    Turn on expired-key events (keeping any flags already set) and subscribe to them.
+    Returns None if the server refuses CONFIG (managed Redis): the sweep still reclaims.
+    """
+    r = store.r
+    try:
+        flags = r.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+        if "E" not in flags or not ({"x", "A"} & set(flags)):
+            r.config_set("notify-keyspace-events", "".join(sorted(set(flags) | {"E", "x"})))
+    except redis.RedisError as e:
+        logger.warning(f"[session_reaper] cannot enable keyspace notifications ({e}); sweeping only")
+        return None
+    db = r.connection_pool.connection_kwargs.get("db", 0)
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(f"__keyevent@{db}__:expired")
+    return pubsub
+
+
+async def session_reaper(
+    store_factory: Callable,
+    stop_event: asyncio.Event,
+    interval_sec: int = SESSION_SWEEP_S,
+) -> None:
+    """
+    Reclaim sessions whose heartbeat lease expired: immediately on the Redis expiry
+    event, and every `interval_sec` by sweep (notifications are fire-and-forget and
+    are lost while this worker is down or disconnected).
+    """
+    if SESSION_TTL <= 0:
+        return
+    store = store_factory()
+    pubsub, listen = None, True
+    next_sweep = time.monotonic() + interval_sec
+    while not stop_event.is_set():
+        try:
+            if pubsub is None and listen:
+                pubsub = await asyncio.to_thread(subscribe_expired, store)
+                listen = pubsub is not None
+            if pubsub is not None:
+                msg = await asyncio.to_thread(pubsub.get_message, timeout=1.0)
+                vmid = lease_vmid(msg["data"]) if msg and isinstance(msg.get("data"), str) else None
+                if vmid:
+                    await asyncio.to_thread(reclaim, store, vmid, "expired")
+            else:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=max(0.0, next_sweep - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+            if time.monotonic() >= next_sweep and not stop_event.is_set():
+                n = await asyncio.to_thread(sweep, store)
+                if n:
+                    logger.info(f"[session_reaper] sweep reclaimed {n} session(s)")
+                next_sweep = time.monotonic() + interval_sec
+        except redis.RedisError as e:
+            logger.warning(f"[session_reaper] redis error: {e}")
+            pubsub, listen = None, True
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+        except Exception:
+            logger.exception("[session_reaper] pass failed")
+            next_sweep = time.monotonic() + interval_sec
+    if pubsub is not None:
+        pubsub.close()
@@ -3,11 +3,20 @@ from __future__ import annotations
 from typing import Optional, Dict, List, Tuple
 import time
 import redis
-from configs.config import get_redis
+from configs.config import get_redis, NODE_ID, SESSION_TTL, LAUNCH_LEASE_S
+from .LifecycleEvents import LifecycleEvents, add_event
 
 def now_ms() -> int:
     return int(time.time() * 1000)
 
+def is_local(session: dict) -> bool:
+    """True if the VM runs on this node (sessions from before node_id existed count as local)."""
+    return (session.get("node_id") or NODE_ID) == NODE_ID
+
+def local_sessions(items: List[Tuple[str, Dict[str, str]]]) -> List[Tuple[str, Dict[str, str]]]:
+    """Filter store.items() down to VMs whose processes and files live on this node."""
+    return [(vmid, s) for vmid, s in items if is_local(s)]
+
 class SessionStore:
     """
     Redis-backed session store with the SAME interface you used before.
@@ -17,9 +26,17 @@ class SessionStore:
       user:{uid}:vms       (ZSET)  → vmid score=created_at (ms)
       vms:by_os:{os}       (SET)   → vmids  (only used if os_type present)
       vm:by_pid:{pid}      (STR)   → vmid (PID→VM reverse index)
+      vm:{vmid}:hb         (STR)   → heartbeat lease, expires `ttl_s` after the last heartbeat
+      user:{uid}:launch    (STR)   → vmid of the user's launch in flight (SET NX reservation)
+    Every session records the node_id of the host running it (defaults to this node).
+    set() and delete() append launched/cleaned_up to events:lifecycle in the same MULTI.
+
+    With a ttl the hash, its PID index and the user's ZSET expire one more `ttl_s` after
+    the lease, so whoever reacts to the lease expiring still finds what to clean up.
     """
-    def __init__(self, r: Optional[redis.Redis] = None) -> None:
+    def __init__(self, r: Optional[redis.Redis] = None, ttl_s: int = SESSION_TTL) -> None:
         self.r = r or get_redis()
+        self.ttl_s = ttl_s
         # fail fast if Redis is not reachable
         self.r.ping()
 
@@ -35,6 +52,12 @@ class SessionStore:
     # PID index (pid → vmid)
     def _k_pid(self, pid: str) -> str:            
         return f"vm:by_pid:{pid}"
+    # heartbeat lease
+    def _k_lease(self, vmid: str) -> str:
+        return f"vm:{vmid}:hb"
+    # launch reservation
+    def _k_launch(self, uid: str) -> str:
+        return f"user:{uid}:launch"
 
     # ----- API
     def get_running_by_user(self, user_id: str) -> Optional[dict]:
@@ -44,6 +67,39 @@ class SessionStore:
                 return {"vmid": vmid, **d}
         return None
 
+    def reserve_launch(self, user_id: str, vmid: str, lease_s: int = LAUNCH_LEASE_S) -> Optional[str]:
+        """
+        Take the user's launch reservation for `vmid` (SET NX; it expires after `lease_s`
+        so a crashed launch cannot block the user for good). Returns None if taken,
+        otherwise the vmid of the launch already holding it.
+        """
+        key = self._k_launch(user_id)
+        while True:
+            if self.r.set(key, vmid, nx=True, ex=lease_s):
+                return None
+            holder = self.r.get(key)
+            if holder is not None:
+                return holder
+            # released between SET and GET: try again
+
+    def launch_holder(self, user_id: str) -> Optional[str]:
+        """The vmid holding the user's launch reservation, if any."""
+        return self.r.get(self._k_launch(user_id))
+
+    def release_launch(self, user_id: str, vmid: str) -> None:
+        """Drop the reservation if `vmid` still holds it (compare-and-delete under WATCH)."""
+        key = self._k_launch(user_id)
+        with self.r.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != vmid:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+            except redis.WatchError:
+                pass  # changed under us: no longer ours to release
+
     def get(self, vmid: str) -> Optional[dict]:
         h = self.r.hgetall(self._k_vm(vmid))
         return {"vmid": vmid, **h} if h else None
@@ -60,6 +116,7 @@ class SessionStore:
 
     def set(self, vmid: str, payload: dict) -> None:
         data = {k: ("" if v is None else str(v)) for k, v in payload.items()}
+        data.setdefault("node_id", NODE_ID)
         uid     = data.get("user_id")
         os_type = data.get("os_type")
         created = float(data.get("created_at") or now_ms())
@@ -75,8 +132,62 @@ class SessionStore:
         # Maintain PID → VMID index if pid present
         if pid:
             pipe.set(self._k_pid(pid), vmid)
+        if self.ttl_s > 0:
+            self._lease(pipe, vmid, uid, pid)
+        add_event(pipe, "launched", vmid, user_id=uid, os_type=os_type, node_id=data["node_id"], pid=pid or None)
         pipe.execute()
 
+    def _lease(self, pipe, vmid: str, uid: Optional[str], pid: Optional[str]) -> None:
+        hold = 2 * self.ttl_s
+        pipe.set(self._k_lease(vmid), NODE_ID, ex=self.ttl_s)
+        pipe.expire(self._k_vm(vmid), hold)
+        if uid:
+            pipe.expire(self._k_user_vms(uid), hold)
+        if pid:
+            pipe.expire(self._k_pid(pid), hold)
+
+    def heartbeat(self, vmid: str) -> bool:
+        """
+        Renew the session's lease and stamp last_seen. Returns False (and writes nothing)
+        if the session is already gone, so a late heartbeat cannot resurrect it: the check
+        and the write run under WATCH, so a delete() in between aborts the write.
+        """
+        key = self._k_vm(vmid)
+        with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    if not pipe.exists(key):
+                        return False
+                    uid, pid = pipe.hmget(key, "user_id", "pid")
+                    pipe.multi()
+                    pipe.hset(key, "last_seen", str(now_ms()))
+                    if self.ttl_s > 0:
+                        self._lease(pipe, vmid, uid, pid)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue  # changed under us (deleted or updated): look again
+
+    def lapsed(self, vmids: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Split sessions without a live lease into (expired, unleased): expired ones had a
+        lease that ran out; unleased ones predate leases (their hash never got a TTL).
+        """
+        vmids = list(vmids)
+        if not vmids:
+            return [], []
+        pipe = self.r.pipeline(transaction=False)
+        for vmid in vmids:
+            pipe.exists(self._k_lease(vmid))
+            pipe.ttl(self._k_vm(vmid))
+        res = pipe.execute()
+        expired, unleased = [], []
+        for vmid, alive, ttl in zip(vmids, res[::2], res[1::2]):
+            if not alive:
+                (unleased if ttl == -1 else expired).append(vmid)
+        return expired, unleased
+
     def update(self, vmid: str, **fields) -> None:
         if not fields:
             return
@@ -112,7 +223,7 @@ class SessionStore:
         pid     = d.get("pid") or ""
 
         pipe = self.r.pipeline()
-        pipe.delete(self._k_vm(vmid))
+        pipe.delete(self._k_vm(vmid), self._k_lease(vmid))
         pipe.srem(self._k_active(), vmid)
         if uid:
             pipe.zrem(self._k_user_vms(uid), vmid)
@@ -121,17 +232,74 @@ class SessionStore:
         # remove PID reverse index
         if pid:
             pipe.delete(self._k_pid(str(pid)))
+        if d:
+            add_event(pipe, "cleaned_up", vmid, user_id=uid, os_type=os_type, node_id=d.get("node_id"))
         pipe.execute()
 
+    def event(self, kind: str, vmid: str, **fields) -> None:
+        """Append a lifecycle event that is not a session write (connected, snapshot_*, ...); best effort."""
+        LifecycleEvents(self.r).publish(kind, vmid, **fields)
+
+    def count_by_os(self, os_type: str) -> int:
+        return int(self.r.scard(self._k_by_os(os_type)) or 0)
+
     # ----- helpers (optional but handy for shutdown/inspection)
     def items(self) -> List[Tuple[str, Dict[str, str]]]:
+        return self.scan_active()[0]
+
+    def scan_active(self) -> Tuple[List[Tuple[str, Dict[str, str]]], List[str]]:
+        """items(), plus the vmids still in vms:active whose hash has already expired."""
         vmids = list(self.r.smembers(self._k_active()))
+        if not vmids:
+            return [], []
+        # one round trip for all hashes instead of one HGETALL per VM
+        pipe = self.r.pipeline(transaction=False)
+        for vmid in vmids:
+            pipe.hgetall(self._k_vm(vmid))
         out: List[Tuple[str, Dict[str, str]]] = []
+        stale: List[str] = []
+        for vmid, h in zip(vmids, pipe.execute()):
+            if h:
+                out.append((vmid, {"vmid": vmid, **h}))
+            else:
+                stale.append(vmid)
+        return out, stale
+
+    def delete_many(self, vmids: List[str]) -> None:
+        """delete() for many VMs in two pipelined round trips (read indexes, then drop)."""
+        vmids = list(vmids)
+        if not vmids:
+            return
+        pipe = self.r.pipeline(transaction=False)
         for vmid in vmids:
-            d = self.get(vmid)
-            if d:
-                out.append((vmid, d))
-        return out
+            pipe.hmget(self._k_vm(vmid), "user_id", "os_type", "pid", "node_id")
+        fields = pipe.execute()
+
+        pipe = self.r.pipeline()
+        pipe.srem(self._k_active(), *vmids)
+        for vmid, (uid, os_type, pid, node_id) in zip(vmids, fields):
+            pipe.delete(self._k_vm(vmid), self._k_lease(vmid))
+            if uid:
+                pipe.zrem(self._k_user_vms(uid), vmid)
+            if os_type:
+                pipe.srem(self._k_by_os(os_type), vmid)
+            if pid:
+                pipe.delete(self._k_pid(str(pid)))
+            if uid or os_type or pid or node_id:
+                add_event(pipe, "cleaned_up", vmid, user_id=uid, os_type=os_type, node_id=node_id)
+        pipe.execute()
+
+    def drop_indexes(self, vmids: List[str], os_types: List[str]) -> None:
+        """Remove index entries of sessions whose hash has already expired (fields unknown)."""
+        vmids = list(vmids)
+        if not vmids:
+            return
+        pipe = self.r.pipeline()
+        pipe.srem(self._k_active(), *vmids)
+        for os_type in os_types:
+            pipe.srem(self._k_by_os(os_type), *vmids)
+        pipe.delete(*(self._k_lease(vmid) for vmid in vmids))
+        pipe.execute()
 
 # DI factory (unchanged signature)
 def get_session_store() -> SessionStore:
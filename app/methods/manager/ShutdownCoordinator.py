@@ -0,0 +1,127 @@
+# /app/methods/manager/ShutdownCoordinator.py
+import asyncio
+import logging
+import os
+import re
+import signal
+import subprocess
+from pathlib import Path
+
+from configs.config import SHUTDOWN_DEADLINE_S
+from observability.ops_metrics import time_op_async
+from utils import RUN_DIR, session_files, run_files, _to_int
+from .ProcessManager import get_proc_registry
+from .QMPClient import qmp_execute, QMPError
+from .SessionManager import local_sessions
+
+logger = logging.getLogger(__name__)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _signal(pid: int, sig: int) -> bool:
+    try:
+        os.kill(pid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+    except Exception:
+        logger.exception(f"[shutdown] failed to send {sig} to pid={pid}")
+        return False
+
+
+def _remove_files(paths: list[Path]) -> int:
+    removed = 0
+    for p in paths:
+        try:
+            p.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception(f"[shutdown] failed to delete {p}")
+    return removed
+
+
+async def shutdown_all_vms(store, deadline_s: float = SHUTDOWN_DEADLINE_S, poll_s: float = 0.2) -> dict:
+    """
+    Stop every active session at once instead of one cleanup_vm() after another:
+      1. stop all websocket bridges (nothing to flush there);
+      2. send QMP system_powerdown to every guest concurrently;
+      3. wait for QEMU PIDs to exit until `deadline_s` from start, then SIGKILL stragglers;
+      4. delete overlays/ISOs, sockets and pidfiles in one worker-thread pass;
+      5. drop all Redis state with SessionStore.delete_many (pipelined).
+    Returns a small summary dict for logging.
+    """
+    async with time_op_async("shutdown_all_vms"):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_s
+
+        sessions = local_sessions(await asyncio.to_thread(store.items))
+        summary = {"sessions": len(sessions), "powered_off": 0, "killed": 0, "files_removed": 0}
+        if not sessions:
+            return summary
+
+        # 1) bridges
+        get_proc_registry().stop_all()
+        for _, sess in sessions:
+            ws_pid = _to_int(sess.get("websockify_pid") or sess.get("ws_pid"))
+            if ws_pid:
+                _signal(ws_pid, signal.SIGTERM)
+
+        # 2) ACPI powerdown, all guests in parallel
+        pids: dict[str, int] = {}
+        no_pid: list[str] = []
+        for vmid, sess in sessions:
+            pid = _to_int(sess.get("qemu_pid") or sess.get("pid"))
+            if pid:
+                pids[vmid] = pid
+            else:
+                no_pid.append(vmid)
+
+        async def _powerdown(vmid: str, sess: dict) -> None:
+            qmp_sock = sess.get("qmp_socket") or str(RUN_DIR / f"qmp-{vmid}.sock")
+            timeout = max(0.1, min(2.0, deadline - loop.time()))
+            try:
+                await qmp_execute(qmp_sock, "system_powerdown", timeout=timeout)
+            except QMPError as e:
+                logger.info(f"[shutdown] powerdown skipped for {vmid}: {e}")
+
+        await asyncio.gather(*(_powerdown(v, s) for v, s in sessions if v in pids),
+                             return_exceptions=True)
+
+        # 3) wait for guests, then kill whatever is left
+        alive = {v: p for v, p in pids.items() if _alive(p)}
+        while alive and loop.time() < deadline:
+            await asyncio.sleep(poll_s)
+            alive = {v: p for v, p in alive.items() if _alive(p)}
+        summary["powered_off"] = len(pids) - len(alive)
+        for vmid, pid in alive.items():
+            if _signal(pid, signal.SIGKILL):
+                summary["killed"] += 1
+                logger.warning(f"[shutdown] SIGKILL → qemu pid={pid} (vmid={vmid}) after deadline")
+        if no_pid:
+            # same fallback as cleanup_vm, but one pkill for all PID-less sessions
+            pattern = "|".join(re.escape(v) for v in no_pid)
+            await asyncio.to_thread(subprocess.run, ["pkill", "-KILL", "-f", pattern], check=False)
+
+        # 4) files
+        paths = [p for vmid, sess in sessions for p in (*session_files(vmid, sess), *run_files(vmid))]
+        summary["files_removed"] = await asyncio.to_thread(_remove_files, paths)
+
+        # 5) Redis
+        try:
+            await asyncio.to_thread(store.delete_many, [vmid for vmid, _ in sessions])
+        except Exception:
+            logger.exception("[shutdown] failed to drop session state from Redis")
+
+        logger.info("[shutdown] %s", summary)
+        return summary
@@ -0,0 +1,265 @@
+# /app/methods/manager/Thumbnails.py
+"""
+Screen thumbnails of running VMs (profile page, session listings).
+
+* Demand driven: every thumbnail request marks its VM as watched (thumbs:watched) for
+  THUMB_DEMAND_S. Only watched VMs are ever captured; a VM nobody looks at costs nothing.
+* Bounded: each node runs one ThumbnailService that captures its own watched VMs one
+  QMP screendump at a time, at most THUMB_RATE_PER_S. The per-VM refresh interval
+  stretches with the number of watched VMs (never below THUMB_MIN_INTERVAL_S), so more
+  viewers mean older thumbnails, not more captures.
+* Cached: the downscaled image (WebP with Pillow installed, PNG otherwise) goes to Redis
+  with a content-hash ETag, so every node can serve it and an unchanged screen gives the
+  same ETag (304 for the browser); the last image per VM is also kept in memory.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import re
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+import redis
+
+from configs.config import get_redis, THUMB_RATE_PER_S, THUMB_MIN_INTERVAL_S, THUMB_DEMAND_S, THUMB_WIDTH
+from observability.vnc_metrics import THUMB_CAPTURES, THUMB_CAPTURE_SECONDS, THUMB_WATCHED
+from utils import RUN_DIR
+from .QMPClient import qmp_execute, QMPError
+from .SessionManager import is_local
+
+try:  # optional: WebP and a proper resampling filter when Pillow is installed
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+WATCHED = "thumbs:watched"  # ZSET vmid → time its thumbnail was last requested
+TTL_S = 600                 # a thumbnail outlives its last refresh by this much
+WEBP_QUALITY = 75
+
+_SEP = rb"(?:\s|#[^\n]*\n)+"  # PPM header whitespace, comments included
+_PPM = re.compile(rb"P6" + _SEP + rb"(\d+)" + _SEP + rb"(\d+)" + _SEP + rb"(\d+)\s")
+
+
+class Thumbnail(NamedTuple):
+    etag: str
+    media_type: str
+    data: bytes
+    ts: float
+
+
+# ----- image
+
+def parse_ppm(data: bytes) -> tuple[int, int, bytes]:
+    """(width, height, RGB bytes) of a binary PPM with maxval 255, as QEMU's screendump writes it."""
+    m = _PPM.match(data)
+    if m is None or int(m.group(3)) != 255:
+        raise ValueError("not an 8-bit P6 PPM")
+    w, h = int(m.group(1)), int(m.group(2))
+    pixels = data[m.end():m.end() + w * h * 3]
+    if len(pixels) != w * h * 3:
+        raise ValueError(f"truncated PPM: {len(pixels)} of {w * h * 3} pixel bytes")
+    return w, h, pixels
+
+
+def downscale(w: int, h: int, rgb: bytes, width: int) -> tuple[int, int, bytes]:
+    """Nearest-neighbour resize to `width` (aspect ratio kept); never upscales."""
+    if w <= width:
+        return w, h, rgb
+    th = max(1, round(h * width / w))
+    stride = w * 3
+    idx = [(x * w // width) * 3 + c for x in range(width) for c in range(3)]
+    out = bytearray()
+    for y in range(th):
+        row = rgb[(y * h // th) * stride:(y * h // th + 1) * stride]
+        out += bytes(map(row.__getitem__, idx))
+    return width, th, bytes(out)
+
+
+def encode_png(w: int, h: int, rgb: bytes) -> bytes:
+    def chunk(tag: bytes, body: bytes) -> bytes:
+        return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body))
+
+    stride = w * 3
+    raw = b"".join(b"\x00" + rgb[y * stride:(y + 1) * stride] for y in range(h))  # filter 0 per row
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def render(ppm: bytes, width: int = THUMB_WIDTH) -> tuple[bytes, str]:
+    """A screendump PPM → (thumbnail bytes, media type)."""
+    if Image is not None:
+        img = Image.open(io.BytesIO(ppm))
+        img.thumbnail((width, img.height), Image.Resampling.BILINEAR)
+        buf = io.BytesIO()
+        img.save(buf, "WEBP", quality=WEBP_QUALITY)
+        return buf.getvalue(), "image/webp"
+    return encode_png(*downscale(*parse_ppm(ppm), width)), "image/png"
+
+
+# ----- cache
+
+class ThumbnailCache:
+    """
+    Redis:
+      thumb:{vmid}    (HASH) etag, type, ts, data (base64); expires TTL_S after the last capture
+      thumbs:watched  (ZSET) vmid → last request time; entries older than THUMB_DEMAND_S are dropped
+    plus the last image per VM in memory, reused while its ETag is current.
+    """
+    MEMORY = 256  # images kept in process
+
+    def __init__(self, r: Optional[redis.Redis] = None, demand_s: int = THUMB_DEMAND_S) -> None:
+        self.r = r or get_redis()
+        self.demand_s = demand_s
+        self._memory: OrderedDict[str, Thumbnail] = OrderedDict()
+
+    @staticmethod
+    def _k(vmid: str) -> str:
+        return f"thumb:{vmid}"
+
+    def want(self, vmid: str) -> None:
+        """Someone is looking at this VM's thumbnail: keep it on the capture list."""
+        self.r.zadd(WATCHED, {vmid: time.time()})
+
+    def watched(self) -> list[str]:
+        pipe = self.r.pipeline()
+        pipe.zremrangebyscore(WATCHED, "-inf", time.time() - self.demand_s)
+        pipe.zrange(WATCHED, 0, -1)
+        return pipe.execute()[1]
+
+    def etag(self, vmid: str) -> Optional[str]:
+        return self.r.hget(self._k(vmid), "etag")
+
+    def put(self, vmid: str, data: bytes, media_type: str) -> str:
+        etag = hashlib.sha256(data).hexdigest()[:16]
+        pipe = self.r.pipeline()
+        if self.etag(vmid) == etag:  # screen unchanged: keep the entry (and clients' copies) valid
+            pipe.hset(self._k(vmid), "ts", time.time())
+        else:
+            pipe.hset(self._k(vmid), mapping={
+                "etag": etag, "type": media_type, "ts": time.time(),
+                "data": base64.b64encode(data).decode(),
+            })
+        pipe.expire(self._k(vmid), TTL_S)
+        pipe.execute()
+        return etag
+
+    def get(self, vmid: str) -> Optional[Thumbnail]:
+        etag = self.etag(vmid)
+        if etag is None:
+            return None
+        hit = self._memory.get(vmid)
+        if hit is not None and hit.etag == etag:
+            self._memory.move_to_end(vmid)
+            return hit
+        h = self.r.hgetall(self._k(vmid))
+        if not h.get("data"):
+            return None
+        thumb = Thumbnail(h["etag"], h["type"], base64.b64decode(h["data"]), float(h["ts"]))
+        self._memory[vmid] = thumb
+        self._memory.move_to_end(vmid)
+        while len(self._memory) > self.MEMORY:
+            self._memory.popitem(last=False)
+        return thumb
+
+
+# ----- capture
+
+class ThumbnailService:
+    """
+    Captures this node's watched VMs, stalest first, one screendump at a time and no more
+    than `rate` per second; a watched VM is re-captured every max(min_interval_s,
+    watched / rate) seconds. VMs of other nodes are skipped (their node captures them).
+    """
+
+    def __init__(self, cache: Optional[ThumbnailCache] = None, rate: float = THUMB_RATE_PER_S,
+                 min_interval_s: float = THUMB_MIN_INTERVAL_S, width: int = THUMB_WIDTH,
+                 timeout_s: float = 5.0) -> None:
+        self.cache = cache or ThumbnailCache()
+        self.rate = rate
+        self.min_interval_s = min_interval_s
+        self.width = width
+        self.timeout_s = timeout_s
+        self._last: dict[str, float] = {}   # vmid → monotonic time of its last capture attempt
+        self._remote: set[str] = set()      # watched VMs that run on another node
+
+    def interval(self, watched: int) -> float:
+        return max(self.min_interval_s, watched / self.rate)
+
+    async def capture(self, vmid: str, sess: dict) -> Optional[str]:
+        """screendump → downscale → encode → cache; the new ETag, or None if it failed."""
+        os_type = sess.get("os_type") or "unknown"
+        qmp_sock = sess.get("qmp_socket") or str(RUN_DIR / f"qmp-{vmid}.sock")
+        path = RUN_DIR / f"thumb-{vmid}.ppm"
+        started = time.monotonic()
+        try:
+            await qmp_execute(qmp_sock, "screendump", {"filename": str(path)}, timeout=self.timeout_s)
+            ppm = await asyncio.to_thread(path.read_bytes)
+            data, media_type = await asyncio.to_thread(render, ppm, self.width)
+            etag = await asyncio.to_thread(self.cache.put, vmid, data, media_type)
+        except (QMPError, OSError, ValueError, redis.RedisError) as e:
+            THUMB_CAPTURES.labels(os_type=os_type, result="error").inc()
+            logger.debug(f"[thumbs] {vmid}: {e}")
+            return None
+        finally:
+            path.unlink(missing_ok=True)
+        THUMB_CAPTURES.labels(os_type=os_type, result="ok").inc()
+        THUMB_CAPTURE_SECONDS.labels(os_type=os_type).observe(time.monotonic() - started)
+        return etag
+
+    async def step(self, store) -> bool:
+        """Capture the stalest due VM, if any; True if a capture was attempted."""
+        watched = [v for v in await asyncio.to_thread(self.cache.watched) if v not in self._remote]
+        keep = set(watched)
+        self._last = {v: t for v, t in self._last.items() if v in keep}
+        self._remote &= keep
+        THUMB_WATCHED.set(len(watched))
+
+        now = time.monotonic()
+        interval = self.interval(len(watched))
+        never = float("-inf")
+        due = sorted((v for v in watched if now - self._last.get(v, never) >= interval),
+                     key=lambda v: self._last.get(v, never))
+        for vmid in due:
+            self._last[vmid] = now
+            sess = await asyncio.to_thread(store.get, vmid)
+            if sess is None:
+                continue
+            if not is_local(sess):
+                self._remote.add(vmid)
+                continue
+            await self.capture(vmid, sess)
+            return True
+        return False
+
+    async def run(self, store_factory: Callable, stop_event: asyncio.Event) -> None:
+        while not stop_event.is_set():
+            started = time.monotonic()
+            try:
+                captured = await self.step(store_factory())
+            except Exception:
+                logger.exception("[thumbs] capture pass failed")
+                captured = False
+            # after a capture the rate budget decides; otherwise poll for new demand
+            wait = 1 / self.rate - (time.monotonic() - started) if captured else 1.0
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=max(0.0, wait))
+            except asyncio.TimeoutError:
+                pass
+
+
+THUMBNAILS = ThumbnailService()
+
+def get_thumbnail_service() -> ThumbnailService:
+    return THUMBNAILS
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    return THUMBNAILS.cache
@@ -0,0 +1,39 @@
+# /app/methods/manager/ViewerTokens.py
+"""
+Signed viewer tokens for shared VNC sessions.
+
+Every noVNC redirect carries `token=<role>.<expires>.<signature>` on its WebSocket path.
+The signature is an HMAC (SECRET_KEY) over vmid, role and expiry, so the bridge, on
+whichever node, can trust the role without a lookup: a share link ("ro") cannot be
+edited into the owner's ("rw"), moved to another VM or used after it expires.
+"""
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+from configs.config import SECRET_KEY
+
+ROLES = ("rw", "ro")  # rw: the owner (may take the read-write seat); ro: a share link
+
+
+def _sign(vmid: str, role: str, expires: int) -> str:
+    msg = f"{vmid}:{role}:{expires}".encode()
+    return hmac.new(SECRET_KEY.encode(), msg, hashlib.sha256).hexdigest()[:32]
+
+
+def viewer_token(vmid: str, role: str, ttl_s: int, now: Optional[float] = None) -> str:
+    expires = int((time.time() if now is None else now) + ttl_s)
+    return f"{role}.{expires}.{_sign(vmid, role, expires)}"
+
+
+def viewer_role(vmid: str, token: Optional[str], now: Optional[float] = None) -> Optional[str]:
+    """The role `token` grants on `vmid`; None if it is missing, forged, for another VM or expired."""
+    try:
+        role, expires, sig = (token or "").split(".")
+        expires_at = int(expires)
+    except ValueError:
+        return None
+    if role not in ROLES or not hmac.compare_digest(sig, _sign(vmid, role, expires_at)):
+        return None
+    return role if expires_at > (time.time() if now is None else now) else None
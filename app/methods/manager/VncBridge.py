@@ -0,0 +1,835 @@
+# /app/methods/manager/VncBridge.py
+import asyncio
+import logging
+import struct
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import websockets
+
+from configs.config import (
+    VM_PROFILES, VNC_WINDOW_S, VNC_STALL_S, VNC_SHARING, VNC_MAX_VIEWERS, VNC_VIEWER_QUEUE_BYTES,
+)
+from observability.vnc_metrics import (
+    VNC_SESSIONS,
+    VNC_BYTES,
+    VNC_MESSAGES,
+    VNC_THROUGHPUT,
+    VNC_SEND_BUFFER,
+    VNC_FIRST_FRAME,
+    VNC_UPDATE_LATENCY,
+    VNC_SESSION_DURATION,
+    VNC_STALLS,
+    VNC_VIEWERS,
+    VNC_DROPPED_UPDATES,
+    VNC_RTT,
+    VNC_QUALITY_CHANGES,
+)
+from utils import cleanup_vm
+from .ProcessManager import ProcRegistry
+from .SessionLease import HeartbeatCoalescer, get_heartbeats
+from .SessionManager import get_session_store
+from .VncQuality import QualityController, vnc_options, set_encodings
+from .ViewerTokens import viewer_role
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 64 * 1024
+STALL_BUFFER_BYTES = 1024 * 1024  # send buffer still this full at the end of a window → stall
+
+# RFB client → server message sizes (RFC 6143 + QEMU/noVNC extensions)
+_FIXED = {0: 20, 3: 10, 4: 8, 5: 6, 150: 10}
+FBUR = 3
+
+
+def _client_msg_len(buf: bytearray) -> Optional[int]:
+    """Length of the client message at the head of `buf`; None if more bytes are needed."""
+    t = buf[0]
+    if t in _FIXED:
+        return _FIXED[t]
+    if t == 2:  # SetEncodings
+        return None if len(buf) < 4 else 4 + 4 * struct.unpack_from(">H", buf, 2)[0]
+    if t == 6:  # ClientCutText (negative length = extended clipboard)
+        return None if len(buf) < 8 else 8 + abs(struct.unpack_from(">i", buf, 4)[0])
+    if t == 248:  # ClientFence
+        return None if len(buf) < 9 else 9 + buf[8]
+    if t == 251:  # SetDesktopSize
+        return None if len(buf) < 8 else 8 + 16 * buf[6]
+    if t == 255:  # QEMU client message
+        if len(buf) < 2:
+            return None
+        if buf[1] == 0:
+            return 12  # extended key event
+        if buf[1] == 1:
+            if len(buf) < 4:
+                return None
+            return 10 if struct.unpack_from(">H", buf, 2)[0] == 2 else 4  # audio
+    raise ValueError(f"unknown RFB client message type {t}")
+
+
+class RfbClientParser:
+    """
+    Parser for the browser → VM half of an RFB stream. It walks the handshake (version,
+    security type, VNC-auth response, ClientInit) and then message framing, reporting
+    each FramebufferUpdateRequest. Anything it does not understand switches it off.
+
+    feed() returns the bytes to relay. Without `on_set_encodings` that is always the
+    input, untouched; with it, whole messages only, SetEncodings replaced by the hook's
+    list (a message split across WebSocket frames waits for its tail).
+    """
+
+    def __init__(self, on_update_request: Callable[[bool], None],
+                 on_set_encodings: Optional[Callable[[list[int]], list[int]]] = None) -> None:
+        self._on_fbur = on_update_request
+        self._on_encodings = on_set_encodings
+        self._buf = bytearray()
+        self._need = 12
+        self._stage = "version"
+
+    @property
+    def active(self) -> bool:
+        return self._stage != "off"
+
+    def feed(self, data: bytes) -> bytes:
+        if self._stage == "off":
+            return data
+        self._buf += data
+        out = bytearray()
+        try:
+            while self._stage != "off":
+                if self._stage == "messages":
+                    if not self._buf:
+                        break
+                    n = _client_msg_len(self._buf)
+                    if n is None or len(self._buf) < n:
+                        break
+                    if self._buf[0] == FBUR:
+                        self._on_fbur(bool(self._buf[1]))
+                    if self._buf[0] == 2 and self._on_encodings is not None:
+                        out += set_encodings(self._on_encodings(list(struct.unpack_from(f">{(n - 4) // 4}i", self._buf, 4))))
+                    else:
+                        out += self._buf[:n]
+                    del self._buf[:n]
+                    continue
+                if len(self._buf) < self._need:
+                    break
+                chunk = bytes(self._buf[:self._need])
+                del self._buf[:self._need]
+                out += chunk
+                self._advance(chunk)
+        except (ValueError, struct.error) as e:
+            logger.debug("[vnc_bridge] RFB parser off: %s", e)
+            out += self._buf
+            self._stage, self._buf = "off", bytearray()
+        return data if self._on_encodings is None else bytes(out)
+
+    def _advance(self, chunk: bytes) -> None:
+        if self._stage == "version":
+            # RFB 3.3 has the server pick the security type; the client sends no choice
+            self._stage, self._need = ("init", 1) if chunk.startswith(b"RFB 003.003") else ("security", 1)
+        elif self._stage == "security":
+            if chunk[0] == 1:        # None
+                self._stage, self._need = "init", 1
+            elif chunk[0] == 2:      # VNC auth: 16-byte response
+                self._stage, self._need = "auth", 16
+            else:                    # VeNCrypt & co: framing we do not follow
+                self._stage = "off"
+        elif self._stage == "auth":
+            self._stage, self._need = "init", 1
+        elif self._stage == "init":
+            self._stage = "messages"
+
+
+class _SessionStats:
+    """Per-connection counters, flushed into the profile-labelled series once per window."""
+
+    def __init__(self, os_type: str, on_set_encodings: Optional[Callable[[list[int]], list[int]]] = None) -> None:
+        self.os_type = os_type
+        self.t_open = time.monotonic()
+        self.first_frame = False
+        self.pending: deque[tuple[float, bool]] = deque()  # outstanding update requests
+        self.window = {"up": 0, "down": 0}
+        self.t_window = self.t_open
+        self.parser = RfbClientParser(self._on_update_request, on_set_encodings)
+        VNC_SESSIONS.labels(os_type=os_type).inc()
+
+    def _on_update_request(self, incremental: bool) -> None:
+        self.pending.append((time.monotonic(), incremental))
+
+    def from_client(self, data: bytes) -> bytes:
+        """Count `data`; returns what to relay (see RfbClientParser.feed)."""
+        self.window["up"] += len(data)
+        VNC_BYTES.labels(os_type=self.os_type, direction="up").inc(len(data))
+        VNC_MESSAGES.labels(os_type=self.os_type, direction="up").inc()
+        return self.parser.feed(data)
+
+    def from_server(self, data: bytes) -> None:
+        now = time.monotonic()
+        self.window["down"] += len(data)
+        VNC_BYTES.labels(os_type=self.os_type, direction="down").inc(len(data))
+        VNC_MESSAGES.labels(os_type=self.os_type, direction="down").inc()
+        if self.pending:
+            # QEMU answers outstanding requests with one update; the first bytes mark its arrival
+            if not self.first_frame:
+                self.first_frame = True
+                VNC_FIRST_FRAME.labels(os_type=self.os_type).observe(now - self.t_open)
+            for t, incremental in self.pending:
+                VNC_UPDATE_LATENCY.labels(os_type=self.os_type,
+                                          incremental=str(int(incremental))).observe(now - t)
+            self.pending.clear()
+
+    def flush_window(self, send_buffer: int, rtt: Optional[float] = None) -> bool:
+        """Close the window; True if it stalled."""
+        now = time.monotonic()
+        elapsed = max(now - self.t_window, 1e-6)
+        for d, n in self.window.items():
+            VNC_THROUGHPUT.labels(os_type=self.os_type, direction=d).observe(n / elapsed)
+            self.window[d] = 0
+        self.t_window = now
+        VNC_SEND_BUFFER.labels(os_type=self.os_type).observe(send_buffer)
+        if rtt is not None:
+            VNC_RTT.labels(os_type=self.os_type).observe(rtt)
+        waiting = any(not inc and now - t > VNC_STALL_S for t, inc in self.pending)
+        if waiting or send_buffer >= STALL_BUFFER_BYTES:
+            VNC_STALLS.labels(os_type=self.os_type).inc()
+            return True
+        return False
+
+    def close(self) -> None:
+        VNC_SESSIONS.labels(os_type=self.os_type).dec()
+        VNC_SESSION_DURATION.labels(os_type=self.os_type).observe(time.monotonic() - self.t_open)
+
+
+def _select_subprotocol(first, second):
+    # websockets >= 14 calls (connection, offered), the legacy server (offered, supported).
+    # Accept "binary" when offered, and plain connections (current noVNC) otherwise.
+    offered = first if isinstance(first, (list, tuple)) else second
+    return "binary" if "binary" in (offered or ()) else None
+
+
+async def _rtt(ws) -> Optional[float]:
+    """WebSocket ping → pong; the ping queues behind unsent frames, so a backed-up link shows up here."""
+    t0 = time.monotonic()
+    try:
+        pong = await ws.ping()
+        await asyncio.wait_for(pong, timeout=VNC_WINDOW_S)
+    except asyncio.TimeoutError:
+        return float(VNC_WINDOW_S)
+    except (websockets.ConnectionClosed, RuntimeError):
+        return None
+    return time.monotonic() - t0
+
+
+def _send_buffer(ws) -> int:
+    transport = getattr(ws, "transport", None)
+    try:
+        return transport.get_write_buffer_size() if transport else 0
+    except Exception:
+        return 0
+
+
+# ----- shared sessions (VNC_SHARING): one upstream RFB connection, many browsers
+
+# The hub picks the pixel format (noVNC's own: 32bpp little-endian RGBX) and only
+# stateless encodings, so any update can be skipped or joined mid-stream; ZRLE/Tight
+# keep zlib state across updates and would break every viewer that missed one.
+PIXEL_FORMAT = struct.pack(">BBBBHHHBBB3x", 32, 24, 0, 1, 255, 255, 255, 0, 8, 16)
+BPP = 4
+RAW, COPYRECT, HEXTILE, CURSOR, DESKTOP_SIZE, QEMU_EXT_KEY = 0, 1, 5, -239, -223, -258
+ENCODINGS = (COPYRECT, HEXTILE, RAW, CURSOR, DESKTOP_SIZE, QEMU_EXT_KEY)
+INPUT = {4, 5, 6, 251, 255}  # key, pointer, clipboard, resize, QEMU key: read-write viewer only
+
+
+class RfbServerFramer:
+    """
+    Splits the VM → bridge half of an RFB stream (after ServerInit) into whole messages,
+    for the encodings the hub negotiates. feed() returns (type, bytes, droppable): a
+    FramebufferUpdate of plain pixels may be skipped by a viewer that is behind; cursor
+    shape, desktop size and every other message must reach everyone.
+    """
+
+    def __init__(self, width: int = 0, height: int = 0) -> None:
+        self.size = (width, height)
+        self.cursor: Optional[bytes] = None  # last cursor shape, as a one-rect update for late joiners
+        self._buf = bytearray()
+        self._pos = 0
+        self._droppable = False
+        self._gen = self._messages()
+        self._want = next(self._gen)
+
+    def feed(self, data: bytes) -> list[tuple[int, bytes, bool]]:
+        self._buf += data
+        out = []
+        while True:
+            want = self._want
+            if want is None:  # message boundary
+                msg = bytes(self._buf[:self._pos])
+                del self._buf[:self._pos]
+                self._pos = 0
+                out.append((msg[0], msg, self._droppable))
+                self._want = next(self._gen)
+                continue
+            n = abs(want)
+            if len(self._buf) - self._pos < n:
+                return out
+            chunk = bytes(self._buf[self._pos:self._pos + n]) if want > 0 else b""
+            self._pos += n
+            self._want = self._gen.send(chunk)
+
+    # The generators yield n > 0 to read n bytes, -n to skip n bytes, None at the end of a message.
+    def _messages(self):
+        while True:
+            t = (yield 1)[0]
+            self._droppable = False
+            if t == 0:    # FramebufferUpdate
+                yield from self._update()
+            elif t == 1:  # SetColourMapEntries
+                (n,) = struct.unpack(">3xH", (yield 5))
+                yield -6 * n
+            elif t == 3:  # ServerCutText
+                (n,) = struct.unpack(">3xI", (yield 7))
+                if n:
+                    yield -n
+            elif t != 2:  # Bell has no body
+                raise ValueError(f"unexpected RFB server message type {t}")
+            yield None
+
+    def _update(self):
+        (n,) = struct.unpack(">xH", (yield 3))
+        self._droppable = True
+        for _ in range(n):
+            start = self._pos
+            _, _, w, h, enc = struct.unpack(">HHHHi", (yield 12))
+            if enc == HEXTILE:
+                yield from self._hextile(w, h)
+            elif enc in (RAW, COPYRECT, CURSOR):
+                size = 4 if enc == COPYRECT else w * h * BPP + (((w + 7) // 8) * h if enc == CURSOR else 0)
+                if size:
+                    yield -size
+            elif enc not in (DESKTOP_SIZE, QEMU_EXT_KEY):
+                raise ValueError(f"unexpected RFB encoding {enc}")
+            if enc < 0:
+                self._droppable = False
+                if enc == DESKTOP_SIZE:
+                    self.size = (w, h)
+                elif enc == CURSOR:
+                    self.cursor = struct.pack(">BxH", 0, 1) + bytes(self._buf[start:self._pos])
+
+    def _hextile(self, w: int, h: int):
+        for ty in range(0, h, 16):
+            for tx in range(0, w, 16):
+                tw, th = min(16, w - tx), min(16, h - ty)
+                mask = (yield 1)[0]
+                if mask & 1:  # raw tile
+                    yield -tw * th * BPP
+                    continue
+                colours = BPP * (bool(mask & 2) + bool(mask & 4))  # background, foreground
+                if colours:
+                    yield -colours
+                if mask & 8:  # subrects, each with its own colour when bit 16 is set
+                    n = (yield 1)[0]
+                    if n:
+                        yield -n * (2 + (BPP if mask & 16 else 0))
+
+
+class _Viewer:
+    """One browser on a shared session: its role, what is queued for it and whether it fell behind."""
+
+    def __init__(self, ws, role: str, stats: _SessionStats, max_queue: int = VNC_VIEWER_QUEUE_BYTES) -> None:
+        self.ws = ws
+        self.role = role
+        self.stats = stats
+        self.max_queue = max_queue
+        self.queue: deque[bytes] = deque()
+        self.queued = 0
+        self.behind = False  # skipped an update; gets a full refresh once the queue drains
+        self._wakeup = asyncio.Event()
+
+    def offer(self, msg: bytes, droppable: bool) -> bool:
+        """Queue `msg`, unless it is a droppable update and this viewer is (or would get) backed up."""
+        if droppable and (self.behind or self.queued + len(msg) > self.max_queue):
+            self.behind = True
+            return False
+        self.queue.append(msg)
+        self.queued += len(msg)
+        self._wakeup.set()
+        return True
+
+    async def pump(self, resync: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            if not self.queue:
+                if self.behind:
+                    self.behind = False
+                    await resync()
+                self._wakeup.clear()
+                if not self.queue:
+                    await self._wakeup.wait()
+                continue
+            msg = self.queue.popleft()
+            self.queued -= len(msg)
+            await self.ws.send(msg)
+            self.stats.from_server(msg)
+
+
+class VncHub:
+    """
+    One upstream RFB connection for a VM, shared by every browser viewing it. Towards
+    QEMU the hub is the RFB client (it negotiates pixel format and encodings once);
+    towards each browser it is the server, replaying the ServerInit and cursor on join.
+    Updates go to every viewer and update requests are coalesced; input is forwarded
+    from the read-write viewer only, and only an owner connection (a "rw" viewer
+    token) can hold that seat. The session lasts while an owner is connected. A viewer
+    with more than `max_queue` bytes queued skips plain updates and gets a full refresh
+    once it catches up, so a slow link never holds back the others.
+    """
+
+    def __init__(self, vmid: str, open_target: Callable[[], Awaitable], policy: str = VNC_SHARING,
+                 max_viewers: int = VNC_MAX_VIEWERS) -> None:
+        self.vmid = vmid
+        self.policy = policy
+        self.max_viewers = max_viewers
+        self.viewers: list[_Viewer] = []
+        self.closed = False  # no new viewers (the session ended, or QEMU closed the connection)
+        self._ended = False  # the session end has been handled (once)
+        self._seats = 0
+        self._owners = 0  # connections with the owner's token; read-only viewers never keep the session
+        self._rw_taken = False
+        self._open_target = open_target
+        self._lock = asyncio.Lock()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._framer = RfbServerFramer()
+        self._name = b""
+        self._requested = False  # an incremental update request is outstanding upstream
+
+    def admit(self, owner: bool) -> Optional[str]:
+        """Take a seat: "rw" for an owner while it is free (unless view-only), "ro" for the rest; None when full."""
+        if self._seats >= self.max_viewers:
+            return None
+        role = "rw" if owner and self.policy != "view-only" and not self._rw_taken else "ro"
+        self._seats += 1
+        self._owners += owner
+        self._rw_taken = self._rw_taken or role == "rw"
+        return role
+
+    def release(self, role: str, owner: bool) -> None:
+        self._seats -= 1
+        self._owners -= owner
+        if role == "rw":
+            self._rw_taken = False  # the owner's next connection gets control
+
+    async def open(self) -> None:
+        """Connect upstream unless already connected; raises OSError/ConnectionError."""
+        async with self._lock:
+            if self.closed:
+                raise ConnectionError("session is shutting down")
+            if self._writer is not None:
+                return
+            reader, writer = await self._open_target()
+            try:
+                await self._handshake(reader, writer)
+            except (asyncio.IncompleteReadError, struct.error) as e:
+                writer.close()
+                raise ConnectionError(f"VNC handshake failed: {e}") from e
+            except BaseException:
+                writer.close()
+                raise
+            self._writer = writer
+            self._pump_task = asyncio.ensure_future(self._pump(reader))
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        version = await reader.readexactly(12)
+        writer.write(min(version, b"RFB 003.008\n"))
+        if version < b"RFB 003.007":  # 3.3: the server picks the security type
+            types = struct.unpack(">I", await reader.readexactly(4))
+        else:
+            n = (await reader.readexactly(1))[0]
+            types = await reader.readexactly(n)
+        if 1 not in types:
+            raise ConnectionError("VNC server wants authentication the bridge cannot provide")
+        if version >= b"RFB 003.007":
+            writer.write(b"\x01")
+        if version >= b"RFB 003.008":
+            (result,) = struct.unpack(">I", await reader.readexactly(4))
+            if result:
+                raise ConnectionError("VNC security handshake rejected")
+        writer.write(b"\x01")  # ClientInit: shared
+        w, h, _, name_len = struct.unpack(">HH16sI", await reader.readexactly(24))
+        self._name = await reader.readexactly(name_len)
+        self._framer = RfbServerFramer(w, h)
+        writer.write(struct.pack(">B3x", 0) + PIXEL_FORMAT)
+        writer.write(set_encodings(list(ENCODINGS)))
+        await writer.drain()
+
+    async def _pump(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while data := await reader.read(READ_CHUNK):
+                for t, msg, droppable in self._framer.feed(data):
+                    if t == 0:
+                        self._requested = False
+                    for v in self.viewers:
+                        if not v.offer(msg, droppable):
+                            VNC_DROPPED_UPDATES.labels(os_type=v.stats.os_type).inc()
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"[vnc_bridge:{self.vmid}] shared upstream failed: {e}")
+        logger.info(f"[vnc_bridge:{self.vmid}] VNC server closed the shared connection")
+        self.closed = True  # nobody joins a dead upstream; the owners' close() still cleans up
+        await asyncio.gather(*(v.ws.close(1011, "VNC target closed") for v in list(self.viewers)),
+                             return_exceptions=True)
+
+    def _upstream(self, msg: bytes) -> None:
+        if msg[0] == FBUR:
+            if msg[1] and self._requested:
+                return  # QEMU answers all outstanding requests with one update
+            self._requested = self._requested or bool(msg[1])
+        self._writer.write(msg)
+
+    async def _full_refresh(self) -> None:
+        w, h = self._framer.size
+        self._upstream(struct.pack(">BBHHHH", FBUR, 0, 0, 0, w, h))
+        await self._writer.drain()
+
+    async def _greet(self, viewer: _Viewer, inbox: bytearray) -> None:
+        """Server side of the handshake (security None), answered by the hub itself."""
+        async def read(n: int) -> bytes:
+            while len(inbox) < n:
+                msg = await viewer.ws.recv()
+                data = msg.encode() if isinstance(msg, str) else msg
+                viewer.stats.from_client(data)
+                inbox.extend(data)
+            chunk = bytes(inbox[:n])
+            del inbox[:n]
+            return chunk
+
+        await viewer.ws.send(b"RFB 003.008\n")
+        version = await read(12)
+        if version < b"RFB 003.007":
+            await viewer.ws.send(struct.pack(">I", 1))
+        else:
+            await viewer.ws.send(b"\x01\x01")
+            await read(1)
+            if version >= b"RFB 003.008":
+                await viewer.ws.send(struct.pack(">I", 0))
+        await read(1)  # ClientInit; every viewer shares
+        w, h = self._framer.size
+        await viewer.ws.send(struct.pack(">HH", w, h) + PIXEL_FORMAT + struct.pack(">I", len(self._name)) + self._name)
+
+    async def _input(self, viewer: _Viewer, inbox: bytearray) -> None:
+        async def handle() -> None:
+            while inbox:
+                n = _client_msg_len(inbox)
+                if n is None or len(inbox) < n:
+                    break
+                msg = bytes(inbox[:n])
+                del inbox[:n]
+                if msg[0] == FBUR or (msg[0] in INPUT and viewer.role == "rw"):
+                    self._upstream(msg)
+                # pixel format and encodings are the hub's; fences/continuous updates were not offered
+            await self._writer.drain()
+
+        await handle()
+        async for msg in viewer.ws:
+            data = msg.encode() if isinstance(msg, str) else msg
+            viewer.stats.from_client(data)
+            inbox.extend(data)
+            await handle()
+
+    async def serve(self, viewer: _Viewer) -> None:
+        """Run one viewer until it or the VM goes away."""
+        inbox = bytearray()
+        try:
+            await self._greet(viewer, inbox)
+            if self._framer.cursor:
+                viewer.offer(self._framer.cursor, False)
+            self.viewers.append(viewer)
+            VNC_VIEWERS.labels(os_type=viewer.stats.os_type, role=viewer.role).inc()
+            tasks = [asyncio.ensure_future(c) for c in (viewer.pump(self._full_refresh), self._input(viewer, inbox))]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for t in tasks:
+                    t.cancel()
+                res = await asyncio.gather(*tasks, return_exceptions=True)
+                for e in res:
+                    if isinstance(e, (ValueError, struct.error)):
+                        logger.info(f"[vnc_bridge:{self.vmid}] dropping {viewer.role} viewer: {e}")
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if viewer in self.viewers:
+                self.viewers.remove(viewer)
+                VNC_VIEWERS.labels(os_type=viewer.stats.os_type, role=viewer.role).dec()
+
+    async def close(self, owner: bool) -> bool:
+        """
+        Called as each viewer leaves. When the last owner connection goes the session ends:
+        read-only viewers are disconnected, the upstream connection is dropped, and True
+        tells that caller to clean up. A read-only viewer leaving changes nothing.
+        """
+        if self._ended or not owner or self._owners:
+            return False
+        self._ended = self.closed = True
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        await asyncio.gather(*(v.ws.close(1001, "Session ended") for v in list(self.viewers)),
+                             return_exceptions=True)
+        return True
+
+
+def _token_role(ws, vmid: str) -> Optional[str]:
+    """The role granted by the signed `token` on the WebSocket path (ViewerTokens); None without a valid one."""
+    # websockets >= 14 exposes the handshake as ws.request, the legacy server as ws.path
+    path = getattr(getattr(ws, "request", None), "path", None) or getattr(ws, "path", "") or ""
+    return viewer_role(vmid, parse_qs(urlsplit(path).query).get("token", [None])[0])
+
+
+class _BridgeHandle:
+    """Popen look-alike so the bridge lives in ProcRegistry next to websockify processes."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self.server = None
+        self.closed = False
+
+    def poll(self) -> Optional[int]:
+        return 0 if self.closed else None
+
+    def terminate(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self.server is not None:
+            self._loop.call_soon_threadsafe(self.server.close)
+
+
+class _BridgeLoop:
+    """One event loop thread for all bridges, so relaying never competes with request handling."""
+
+    _lock = threading.Lock()
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def get(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if cls._loop is None or cls._loop.is_closed():
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._loop.run_forever, name="vnc-bridge", daemon=True).start()
+            return cls._loop
+
+
+class VncBridgeService:
+    """
+    In-process replacement for websockify: a WebSocket server per VM relaying binary
+    frames to the VM's VNC socket, with the same start()/stop() contract and lifecycle
+    (heartbeat on connect and while connected, cleanup_vm when the browser goes away).
+
+    Because it sees the RFB stream it also exports, per profile: bytes/messages each way,
+    per-window throughput and send-buffer occupancy, time to first frame, update-request
+    latency, stalls and session duration (see observability/vnc_metrics.py).
+
+    With VNC_SHARING=shared|view-only every browser on a VM goes through one VncHub
+    instead (one upstream connection, N viewers). Browsers need a valid viewer token
+    there; only owner connections heartbeat the session, and the VM is cleaned up when
+    the last of them leaves.
+    """
+
+    def __init__(self, registry: ProcRegistry, store_factory: Callable = get_session_store,
+                 heartbeats: Optional[HeartbeatCoalescer] = None) -> None:
+        self._registry = registry
+        self._store_factory = store_factory
+        self._heartbeats = heartbeats or get_heartbeats()
+
+    def start(self, vmid: str, target: str) -> int:
+        """Start the bridge for this VM and return the public TCP port it listens on."""
+        loop = _BridgeLoop.get()
+        handle = _BridgeHandle(loop)
+        fut = asyncio.run_coroutine_threadsafe(self._serve(vmid, target, handle), loop)
+        port = fut.result(timeout=10)
+        self._registry.set(f"ws:{vmid}", handle)
+        logger.info(f"[VncBridge.start:{vmid}] listening on :{port} → {target}")
+        return port
+
+    def stop(self, vmid: str) -> None:
+        self._registry.stop(f"ws:{vmid}")
+
+    async def _serve(self, vmid: str, target: str, handle: _BridgeHandle) -> int:
+        hub: Optional[VncHub] = None
+        policy: Optional[str] = None
+
+        async def handler(ws) -> None:
+            nonlocal hub, policy
+            if policy is None:  # the session (and its profile) is written after the bridge starts
+                policy = await self._share_policy(vmid)
+            if policy == "off":
+                await self._relay(vmid, target, ws)
+                return
+            if hub is None:
+                hub = VncHub(vmid, lambda: self._open_target(target), policy=policy, max_viewers=VNC_MAX_VIEWERS)
+            await self._share(vmid, hub, ws)
+
+        handle.server = await websockets.serve(
+            handler, "0.0.0.0", 0,
+            subprotocols=["binary"], select_subprotocol=_select_subprotocol,
+            compression=None, max_size=None,
+        )
+        return handle.server.sockets[0].getsockname()[1]
+
+    async def _open_target(self, target: str):
+        if target.startswith("/"):
+            return await asyncio.open_unix_connection(target)
+        host, port = target.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+
+    async def _share_policy(self, vmid: str) -> str:
+        """The profile's "vnc" share policy, else VNC_SHARING."""
+        def lookup() -> str:
+            session = self._store_factory().get(vmid) or {}
+            return vnc_options(VM_PROFILES.get(session.get("os_type"), {}))["share"] or VNC_SHARING
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, lookup)
+        except Exception:
+            return VNC_SHARING
+
+    async def _on_connect(self, vmid: str, store, beat: bool = True, **fields) -> dict:
+        def on_connect() -> dict:
+            session = store.get(vmid) or {}
+            if beat:
+                self._heartbeats.beat(vmid, store, force=True)
+            store.event("connected", vmid, user_id=session.get("user_id"), os_type=session.get("os_type"), **fields)
+            return session
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, on_connect)
+        except Exception:
+            return {}
+
+    async def _windows(self, vmid: str, store, ws, stats: _SessionStats, queued: Callable[[], int] = lambda: 0,
+                       quality: Optional[QualityController] = None, writer=None, beat: bool = True) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(VNC_WINDOW_S)
+            buffered = _send_buffer(ws) + queued()
+            rtt = await _rtt(ws)
+            stalled = stats.flush_window(buffered, rtt)
+            # re-sent between whole messages only, so not once the parser has lost the framing
+            if quality is not None and quality.client is not None and stats.parser.active:
+                before = quality.quality
+                if quality.adapt(rtt, buffered, stalled):
+                    writer.write(set_encodings(quality.encodings()))
+                    VNC_QUALITY_CHANGES.labels(os_type=stats.os_type,
+                                               direction="down" if quality.quality < before else "up").inc()
+                    logger.info(f"[vnc_bridge:{vmid}] quality {before} → {quality.quality} "
+                                f"(rtt={rtt if rtt is None else round(rtt * 1000)}ms, queued={buffered}B)")
+            # an open connection is a live session, traffic or not; renewals are coalesced
+            if beat and self._heartbeats.due(vmid):
+                await loop.run_in_executor(None, self._heartbeats.beat, vmid, store)
+
+    async def _on_disconnect(self, vmid: str, store, connected_at: float, cleanup: bool = True, **fields) -> None:
+        if not cleanup:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, lambda: store.event(
+                    "disconnected", vmid, duration_s=round(time.monotonic() - connected_at, 3), **fields))
+            except Exception:
+                logger.warning(f"[vnc_bridge:{vmid}] could not record viewer disconnect")
+            return
+        logger.info(f"[vnc_bridge:{vmid}] Client disconnected. Clean-up starts.")
+
+        def on_disconnect() -> None:
+            store.event("disconnected", vmid, duration_s=round(time.monotonic() - connected_at, 3), **fields)
+            cleanup_vm(vmid, store)
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, on_disconnect)
+        except Exception:
+            logger.exception(f"[vnc_bridge:{vmid}] cleanup_vm failed after disconnect")
+        self._heartbeats.forget(vmid)
+        self.stop(vmid)
+
+    async def _relay(self, vmid: str, target: str, ws) -> None:
+        store = self._store_factory()
+        connected_at = time.monotonic()
+        session = await self._on_connect(vmid, store)
+        os_type = session.get("os_type") or "unknown"
+        quality = QualityController(vnc_options(VM_PROFILES.get(os_type, {})))
+        stats = _SessionStats(os_type, quality.rewrite)
+        logger.info(f"[vnc_bridge:{vmid}] client connected")
+
+        try:
+            reader, writer = await self._open_target(target)
+        except OSError as e:
+            logger.warning(f"[vnc_bridge:{vmid}] cannot reach VNC target {target}: {e}")
+            stats.close()
+            await ws.close(1011, "VNC target unavailable")
+            return
+
+        async def down() -> None:
+            while data := await reader.read(READ_CHUNK):
+                stats.from_server(data)
+                await ws.send(data)
+
+        async def up() -> None:
+            async for msg in ws:
+                data = msg.encode() if isinstance(msg, str) else msg
+                writer.write(stats.from_client(data))
+                await writer.drain()
+
+        windows = self._windows(vmid, store, ws, stats, quality=quality, writer=writer)
+        tasks = [asyncio.ensure_future(c) for c in (down(), up(), windows)]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            stats.close()
+        await self._on_disconnect(vmid, store, connected_at)
+
+    async def _share(self, vmid: str, hub: VncHub, ws) -> None:
+        granted = _token_role(ws, vmid)
+        if granted is None:
+            logger.info(f"[vnc_bridge:{vmid}] viewer refused: missing, invalid or expired token")
+            await ws.close(1008, "Invalid or expired link")
+            return
+        owner = granted == "rw"  # a share link never holds the seat or keeps the VM alive
+        role = hub.admit(owner)
+        if role is None:
+            logger.info(f"[vnc_bridge:{vmid}] viewer refused: {hub.max_viewers} already watching")
+            await ws.close(1013, "Too many viewers")
+            return
+        store = self._store_factory()
+        connected_at = time.monotonic()
+        session = await self._on_connect(vmid, store, beat=owner, role=role)
+        stats = _SessionStats(session.get("os_type") or "unknown")
+        try:
+            await hub.open()
+        except (OSError, ConnectionError) as e:
+            logger.warning(f"[vnc_bridge:{vmid}] cannot reach VNC target: {e}")
+            hub.release(role, owner)
+            stats.close()
+            await ws.close(1011, "VNC target unavailable")
+            return
+        viewer = _Viewer(ws, role, stats, max_queue=VNC_VIEWER_QUEUE_BYTES)
+        logger.info(f"[vnc_bridge:{vmid}] {role} viewer joined ({len(hub.viewers) + 1} watching)")
+
+        tasks = [asyncio.ensure_future(c) for c in
+                 (hub.serve(viewer), self._windows(vmid, store, ws, stats, lambda: viewer.queued, beat=owner))]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            hub.release(role, owner)
+            stats.close()
+
+        last = await hub.close(owner)  # only once no owner is left
+        if not last:
+            logger.info(f"[vnc_bridge:{vmid}] {role} viewer left ({len(hub.viewers)} watching)")
+        await self._on_disconnect(vmid, store, connected_at, cleanup=last, role=role)
@@ -0,0 +1,128 @@
+# /app/methods/manager/VncQuality.py
+import logging
+import struct
+from typing import Optional
+
+from configs.config import VNC_SLOW_RTT_MS, VNC_CONGESTED_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Per-profile "vnc" section (VM_PROFILES[os]["vnc"]); the defaults reproduce a bare -vnc unix:<sock>
+VNC_DEFAULTS = {
+    "lossy": False,        # let QEMU's Tight encoder send JPEG (QEMU lossy=on)
+    "encodings": None,     # preferred order, e.g. ["tight", "zrle"]; None = the browser's order
+    "quality": None,       # JPEG quality ceiling 0-9; None = what the browser asks for
+    "compression": None,   # zlib level 0-9 at full quality; None = what the browser asks for
+    "audio": False,        # QEMU audio over VNC (guest HDA + audiodev); off = the request is stripped
+    "share": None,         # bridge sharing policy off|shared|view-only; None = VNC_SHARING
+    "adaptive": True,      # lower quality / raise compression per connection on slow links
+}
+ENCODINGS = {"raw": 0, "copyrect": 1, "rre": 2, "hextile": 5, "zlib": 6, "tight": 7, "zrle": 16}
+_SHARE_POLICIES = {None, "off", "shared", "view-only"}
+
+QUALITY_BASE = -32     # -32..-23: JPEG quality 0..9
+COMPRESS_BASE = -256   # -256..-247: compression level 0..9
+AUDIO = -259           # QEMU audio pseudo-encoding
+RECOVER_WINDOWS = 3    # clean windows in a row before quality steps back up
+QUALITY_DROP = 3       # levels lost per congested window
+
+
+def vnc_options(profile: dict) -> dict:
+    """Merge a profile's "vnc" section over VNC_DEFAULTS and validate it."""
+    opts = {**VNC_DEFAULTS, **(profile.get("vnc") or {})}
+    for key in ("quality", "compression"):
+        if opts[key] is not None and not 0 <= int(opts[key]) <= 9:
+            raise ValueError(f"vnc {key} must be 0-9, got {opts[key]}")
+    unknown = set(opts["encodings"] or ()) - set(ENCODINGS)
+    if unknown:
+        raise ValueError(f"Unsupported VNC encodings: {', '.join(sorted(unknown))}")
+    if opts["share"] not in _SHARE_POLICIES:
+        raise ValueError(f"Unsupported VNC share policy: {opts['share']}")
+    return opts
+
+
+def vnc_args(vnc_sock, profile: dict) -> list[str]:
+    """QEMU -vnc (plus the audio backend it needs) from the profile's "vnc" options."""
+    opts = vnc_options(profile)
+    display = f"unix:{vnc_sock}"
+    extra = []
+    if opts["lossy"]:
+        display += ",lossy=on"
+    if opts["audio"]:
+        display += ",audiodev=vnc-audio"
+        extra = ["-audiodev", "none,id=vnc-audio",
+                 "-device", "intel-hda", "-device", "hda-duplex,audiodev=vnc-audio"]
+    return ["-vnc", display, *extra]
+
+
+def set_encodings(encodings: list[int]) -> bytes:
+    return struct.pack(f">BxH{len(encodings)}i", 2, len(encodings), *encodings)
+
+
+def _level(encodings: list[int], base: int) -> Optional[int]:
+    return next((e - base for e in encodings if base <= e <= base + 9), None)
+
+
+class QualityController:
+    """
+    QEMU has no runtime control for VNC encoding or quality: it encodes with whatever the
+    client's last SetEncodings asked for. So the bridge edits that message per connection
+    (profile encoding order, audio, JPEG quality and zlib level pseudo-encodings) and sends
+    a fresh one whenever its measurements move the quality level.
+
+    Each window is congested if the ping RTT reached VNC_SLOW_RTT_MS, VNC_CONGESTED_BYTES
+    were still queued towards the browser, or a full update request went unanswered; that
+    costs QUALITY_DROP levels at once, and every RECOVER_WINDOWS clean windows win one back
+    up to the ceiling. Compression rises by one for every level below the ceiling.
+    """
+
+    def __init__(self, opts: dict) -> None:
+        self.opts = opts
+        self.client: Optional[list[int]] = None  # the browser's last SetEncodings
+        self.ceiling = opts["quality"] if opts["quality"] is not None else 9
+        self.quality = self.ceiling
+        self._clean = 0
+
+    @property
+    def compression(self) -> int:
+        base = self.opts["compression"]
+        if base is None:
+            base = _level(self.client or [], COMPRESS_BASE)
+        return min(9, (2 if base is None else base) + self.ceiling - self.quality)
+
+    def rewrite(self, encodings: list[int]) -> list[int]:
+        """What to send QEMU instead of the browser's SetEncodings."""
+        asked = _level(encodings, QUALITY_BASE)
+        if self.opts["quality"] is None and asked is not None:  # the browser's setting is the ceiling
+            self.quality = asked if self.client is None else min(self.quality, asked)
+            self.ceiling = asked
+        self.client = list(encodings)
+        return self.encodings()
+
+    def encodings(self) -> list[int]:
+        encs = [e for e in self.client or []
+                if _level([e], QUALITY_BASE) is None and _level([e], COMPRESS_BASE) is None
+                and (self.opts["audio"] or e != AUDIO)]
+        if self.opts["encodings"]:
+            preferred = [ENCODINGS[name] for name in self.opts["encodings"]]
+            encs = [e for e in preferred if e in encs] + [e for e in encs if e not in preferred]
+        return encs + [QUALITY_BASE + self.quality, COMPRESS_BASE + self.compression]
+
+    def adapt(self, rtt: Optional[float], send_buffer: int, stalled: bool) -> bool:
+        """Feed one window's measurements; True when the level moved (send encodings() again)."""
+        if not self.opts["adaptive"]:
+            return False
+        congested = stalled or send_buffer >= VNC_CONGESTED_BYTES or (rtt is not None and rtt * 1000 >= VNC_SLOW_RTT_MS)
+        if congested:
+            self._clean = 0
+            level = max(0, self.quality - QUALITY_DROP)
+        else:
+            self._clean += 1
+            if self._clean < RECOVER_WINDOWS:
+                return False
+            self._clean = 0
+            level = min(self.ceiling, self.quality + 1)
+        if level == self.quality:
+            return False
+        self.quality = level
+        return True
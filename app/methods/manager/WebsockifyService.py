@@ -4,11 +4,12 @@ import os
 import shlex
 import subprocess
 from pathlib import Path
-from threading import Thread
+from threading import Event, Thread
 from typing import Optional, Any
 
 from utils import find_free_port, cleanup_vm
 from .ProcessManager import ProcRegistry
+from .SessionLease import HeartbeatCoalescer, get_heartbeats
 from .SessionManager import get_session_store
 
 logger = logging.getLogger(__name__)
@@ -18,21 +19,19 @@ class WebsockifyService:
     """
     Starts/stops a websockify process to bridge a VM's VNC endpoint to a local TCP port.
     Target can be a unix socket (e.g. /tmp/vm-<id>.sock) or host:port.
-    Monitors stdout to detect connects/disconnects and trigger cleanup.
+    Monitors stdout to detect connects/disconnects and trigger cleanup; while a client is
+    connected the session lease is renewed (coalesced, not once per log line).
     """
 
-    def __init__(self, registry: ProcRegistry) -> None:
+    def __init__(self, registry: ProcRegistry, heartbeats: Optional[HeartbeatCoalescer] = None) -> None:
         self._registry = registry
+        self._heartbeats = heartbeats or get_heartbeats()
         self._bin = os.environ.get("WEBSOCKIFY_BIN", "websockify")
 
-        # Allow overriding where the static files live (for --web).
-        # Fallback tries ../../static relative to this file: /app/static
+        # --web is opt-in: the app already serves noVNC (/novnc, precompressed and cached),
+        # so a per-VM static file server is only started when WEBSOCKIFY_WEB_DIR names one.
         static_env = os.environ.get("WEBSOCKIFY_WEB_DIR")
-        if static_env:
-            self._static_dir = Path(static_env)
-        else:
-            # .../methods/manager/WebsockifyService.py -> /app/static
-            self._static_dir = Path(__file__).resolve().parents[2] / "static"
+        self._static_dir = Path(static_env) if static_env else None
 
     def start(self, vmid: str, target: str) -> int:
         """
@@ -43,20 +42,19 @@ class WebsockifyService:
             vmid: VM identifier (used in logs/registry keys).
             target: Either a unix socket path ("/tmp/vm-<id>.sock") or "host:port".
             port: Optional explicit public TCP port. If None, a free port is chosen.
-            store: Optional Redis-backed SessionStore with `update(vmid, last_seen=...)`.
         """
         
         port = find_free_port()
 
         store = get_session_store()
+        heartbeats = self._heartbeats
+        disconnected = Event()
 
         # Build argv (no shell) + normalize target form websockify expects.
-        argv = [
-            self._bin,
-            "--web", str(self._static_dir),
-            "--verbose",
-            f"0.0.0.0:{port}",
-        ]
+        argv = [self._bin]
+        if self._static_dir is not None:
+            argv += ["--web", str(self._static_dir)]
+        argv += ["--verbose", f"0.0.0.0:{port}"]
 
         if target.startswith("/"):
             argv += ["--unix-target", target]
@@ -76,45 +74,50 @@ class WebsockifyService:
         # Register before we spin up the monitor, so stop() can find it immediately
         self._registry.set(f"ws:{vmid}", proc)
 
+        def _keepalive() -> None:
+            # websockify is silent while frames flow; an open connection still keeps the lease
+            while not disconnected.wait(heartbeats.interval_s):
+                heartbeats.beat(vmid, store)
+
         def _monitor_output() -> None:
+            keepalive: Optional[Thread] = None
             try:
                 if not proc.stdout:
                     return
 
                 for raw in proc.stdout:
                     line = raw.strip()
-                    logger.info(f"[websockify:{vmid}] {line}")
+                    logger.debug("[websockify:%s] %s", vmid, line)
                     lower = line.lower()
 
                     # Heuristics based on typical websockify logs
                     if "client closed connection" in lower:
-                        # Best-effort: bump last_seen
-                        try:
-                            # Keep your original pattern: use fs mtime in ms
-                            last_seen_ms = int(Path().stat().st_mtime_ns // 1_000_000)
-                            if store is not None:
-                                store.update(vmid, last_seen=str(last_seen_ms))
-                        except Exception:
-                            pass
-
+                        disconnected.set()
+                        heartbeats.forget(vmid)
                         logger.info(f"[websockify:{vmid}] Client disconnected. Clean-up starts.")
                         try:
+                            store.event("disconnected", vmid)
                             cleanup_vm(vmid, store)
                         except Exception:
                             logger.exception(f"[websockify:{vmid}] cleanup_vm failed after disconnect")
+                        # the VM is gone; don't leave websockify listening (the native bridge stops too)
+                        self.stop(vmid)
 
                     elif ("connecting to unix socket" in lower) or ("accepted connection" in lower):
-                        # Connection established/attempted -> update last_seen
-                        try:
-                            last_seen_ms = int(Path().stat().st_mtime_ns // 1_000_000)
-                            if store is not None:
-                                store.update(vmid, last_seen=str(last_seen_ms))
-                        except Exception:
-                            pass
+                        # Connection established/attempted -> renew the lease now, then keep it alive
+                        heartbeats.beat(vmid, store, force=True)
+                        if keepalive is None:
+                            store.event("connected", vmid)
+                            keepalive = Thread(target=_keepalive, daemon=True)
+                            keepalive.start()
+
+                    else:
+                        heartbeats.beat(vmid, store)
 
             except Exception:
                 logger.exception(f"[websockify:{vmid}] monitor error")
             finally:
+                disconnected.set()
                 try:
                     # If process exited, ensure cleanup
                     if proc.poll() is not None:
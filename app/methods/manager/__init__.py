@@ -1,6 +1,10 @@
 # /app/methods/manager/__init__.py
+from configs.config import VNC_BRIDGE
 from .ProcessManager import get_proc_registry
 from .WebsockifyService import WebsockifyService
+from .VncBridge import VncBridgeService
 
-def get_websockify_service() -> WebsockifyService:
-    return WebsockifyService(get_proc_registry())
\ No newline at end of file
+def get_websockify_service() -> WebsockifyService | VncBridgeService:
+    if VNC_BRIDGE == "websockify":
+        return WebsockifyService(get_proc_registry())
+    return VncBridgeService(get_proc_registry())
@@ -0,0 +1,170 @@
+# /app/node_agent.py
+"""
+Worker node agent for CLUSTER_MODE. One per node, next to QEMU:
+
+  POST /agent/launch  {user_id, vmid, os_type} → overlay + QEMU + VNC bridge, session in Redis
+  POST /agent/stop    {vmid}                   → cleanup_vm for a VM on this node
+  GET  /agent/health
+  GET  /metrics                                → Prometheus: guest stats, I/O policy, memory density of this node
+
+It heartbeats the node's capacity (free memory, load, base-image locality) into the
+NodeRegistry every NODE_HEARTBEAT_S; the API's Scheduler picks nodes from there.
+Sessions carry node_id/node_host so the API can send the browser to the right bridge.
+It also captures the screen thumbnails of its own VMs (the API serves them from Redis).
+
+    NODE_ID=n1 NODE_AGENT_URL=http://10.0.0.5:9100 NODE_PUBLIC_HOST=10.0.0.5 python node_agent.py
+"""
+from contextlib import asynccontextmanager
+import asyncio, logging, socket
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from pydantic import BaseModel
+
+from configs.config import (
+    NODE_ID,
+    NODE_PUBLIC_HOST,
+    NODE_AGENT_URL,
+    AGENT_HOST,
+    AGENT_PORT,
+    AGENT_TOKEN,
+    NODE_HEARTBEAT_S,
+)
+from methods.manager import get_websockify_service
+from methods.manager.NodeRegistry import get_node_registry, node_capacity
+from methods.manager.OverlayManager import QemuOverlayManager
+from methods.manager.IoThrottle import io_fair_share_policy
+from methods.manager.MemoryBalloon import memory_density_loop, vm_memory_mb
+from methods.manager.Reconciler import orphan_reconciler
+from methods.manager.SessionLease import session_reaper
+from methods.manager.SessionManager import get_session_store, local_sessions, is_local
+from methods.manager.ShutdownCoordinator import shutdown_all_vms
+from methods.manager.Thumbnails import get_thumbnail_service
+from observability.guest_metrics import guest_stats_sampler
+from utils import cleanup_vm
+
+logger = logging.getLogger(__name__)
+
+AGENT_URL = NODE_AGENT_URL or f"http://{socket.gethostname()}:{AGENT_PORT}"
+
+
+class LaunchRequest(BaseModel):
+    user_id: str
+    vmid: str
+    os_type: str
+
+class StopRequest(BaseModel):
+    vmid: str
+
+
+def require_token(x_agent_token: str = Header(default="")) -> None:
+    if AGENT_TOKEN and x_agent_token != AGENT_TOKEN:
+        raise HTTPException(status_code=401, detail="Bad agent token")
+
+
+def heartbeat_once(registry, store) -> dict:
+    sessions = local_sessions(store.items())
+    committed = sum(vm_memory_mb(s) for _, s in sessions)
+    info = {"url": AGENT_URL, "public_host": NODE_PUBLIC_HOST,
+            **node_capacity(committed, len(sessions))}
+    registry.heartbeat(NODE_ID, info)
+    return info
+
+
+async def heartbeat_loop(stop_event: asyncio.Event, interval_sec: int = NODE_HEARTBEAT_S) -> None:
+    registry = get_node_registry()
+    while not stop_event.is_set():
+        try:
+            await asyncio.to_thread(heartbeat_once, registry, get_session_store())
+        except Exception:
+            logger.exception(f"[agent:{NODE_ID}] heartbeat failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval_sec)
+        except asyncio.TimeoutError:
+            pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_event = asyncio.Event()
+    tasks = [
+        asyncio.create_task(heartbeat_loop(stop_event)),
+        asyncio.create_task(orphan_reconciler(get_session_store, stop_event)),
+        asyncio.create_task(session_reaper(get_session_store, stop_event)),
+        asyncio.create_task(memory_density_loop(get_session_store, stop_event)),
+        asyncio.create_task(guest_stats_sampler(get_session_store, stop_event)),
+        asyncio.create_task(io_fair_share_policy(get_session_store, stop_event)),
+        asyncio.create_task(get_thumbnail_service().run(get_session_store, stop_event)),
+    ]
+    logger.info(f"[agent:{NODE_ID}] serving at {AGENT_URL}, VNC bridges on {NODE_PUBLIC_HOST}")
+    try:
+        yield
+    finally:
+        stop_event.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.to_thread(get_node_registry().remove, NODE_ID)
+        except Exception:
+            logger.exception(f"[agent:{NODE_ID}] deregistration failed")
+        try:
+            summary = await shutdown_all_vms(get_session_store())
+            logger.info(f"[agent:{NODE_ID}] shutdown cleanup done {summary}")
+        except Exception:
+            logger.exception(f"[agent:{NODE_ID}] shutdown cleanup failed")
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/agent/health")
+def health():
+    return {"node_id": NODE_ID, "url": AGENT_URL}
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post("/agent/launch", dependencies=[Depends(require_token)])
+def launch(payload: LaunchRequest, store=Depends(get_session_store), ws=Depends(get_websockify_service)):
+    vmid = payload.vmid
+    try:
+        manager = QemuOverlayManager(payload.user_id, vmid, payload.os_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        manager.create_overlay()
+        meta = manager.boot_vm(vmid)
+        target = meta.get("vnc_socket") or f"{meta['vnc_host']}:{meta['vnc_port']}"
+        http_port = ws.start(vmid, target)
+        store.set(vmid, {
+            **meta,
+            "user_id": payload.user_id,
+            "http_port": http_port,
+            "os_type": payload.os_type,
+            "pid": meta["pid"],
+            "node_id": NODE_ID,
+            "node_host": NODE_PUBLIC_HOST,
+        })
+    except Exception as e:
+        logger.exception(f"[agent:{NODE_ID}] launch of {vmid} failed: {e}")
+        raise HTTPException(status_code=500, detail="Launch failed")
+    logger.info(f"[agent:{NODE_ID}] VM {vmid} up, bridge on :{http_port}")
+    return {"vm": {"vmid": vmid, **meta}, "http_port": http_port,
+            "node_id": NODE_ID, "node_host": NODE_PUBLIC_HOST}
+
+
+@app.post("/agent/stop", dependencies=[Depends(require_token)])
+def stop(payload: StopRequest, store=Depends(get_session_store), ws=Depends(get_websockify_service)):
+    sess = store.get(payload.vmid)
+    if not sess or not is_local(sess):
+        raise HTTPException(status_code=404, detail=f"VM {payload.vmid} is not running on {NODE_ID}")
+    ws.stop(payload.vmid)
+    cleanup_vm(payload.vmid, store)
+    return {"vmid": payload.vmid, "stopped": True}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=AGENT_HOST, port=AGENT_PORT)
@@ -0,0 +1,203 @@
+# /app/observability/guest_metrics.py
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+
+from prometheus_client import Counter, Gauge
+
+from configs.config import GUEST_STATS_INTERVAL_S, GUEST_STATS_TOP_K
+from methods.manager.QMPClient import QMPClient, QMPError
+from methods.manager.SessionManager import local_sessions
+from utils import RUN_DIR
+
+logger = logging.getLogger(__name__)
+
+OTHER = "other"  # per-user series outside the top-K are summed under this user_id
+DIRECTIONS = ("read", "write")
+
+# ---- per VM (one series set per running VM; removed when the VM goes away)
+VM_BLOCK_BYTES = Counter(
+    "vmshare_vm_block_bytes_total", "Guest block I/O bytes (QMP query-blockstats)",
+    ["vmid", "os_type", "direction"]
+)
+VM_BLOCK_OPS = Counter(
+    "vmshare_vm_block_ops_total", "Guest block I/O operations (QMP query-blockstats)",
+    ["vmid", "os_type", "direction"]
+)
+VM_BLOCK_TIME = Counter(
+    "vmshare_vm_block_time_seconds_total",
+    "Time guest block requests spent in QEMU (ops → mean latency)",
+    ["vmid", "os_type", "direction"]
+)
+VM_BALLOON_BYTES = Gauge(
+    "vmshare_vm_balloon_actual_bytes", "Guest RAM as seen through the balloon (QMP query-balloon)",
+    ["vmid", "os_type"]
+)
+VM_QMP_UP = Gauge(
+    "vmshare_vm_qmp_up", "1 if the last QMP stats poll of the VM succeeded", ["vmid", "os_type"]
+)
+
+# ---- per user, top-K by block throughput + "other"
+USER_BLOCK_BPS = Gauge(
+    "vmshare_user_block_bytes_per_second", "Guest block throughput per user over the last interval",
+    ["user_id", "direction"]
+)
+USER_BLOCK_IOPS = Gauge(
+    "vmshare_user_block_iops", "Guest block operations per second per user over the last interval",
+    ["user_id", "direction"]
+)
+
+# query-blockstats field per (metric, direction)
+_FIELDS = {
+    ("bytes", "read"): "rd_bytes", ("bytes", "write"): "wr_bytes",
+    ("ops", "read"): "rd_operations", ("ops", "write"): "wr_operations",
+    ("time_ns", "read"): "rd_total_time_ns", ("time_ns", "write"): "wr_total_time_ns",
+}
+
+
+def sum_blockstats(devices: list[dict]) -> dict[tuple[str, str], int]:
+    """Sum query-blockstats counters over all of a VM's block devices."""
+    out = {k: 0 for k in _FIELDS}
+    for dev in devices or []:
+        stats = dev.get("stats") or {}
+        for k, field in _FIELDS.items():
+            out[k] += int(stats.get(field) or 0)
+    return out
+
+
+def top_k_users(per_user: dict[str, float], k: int) -> tuple[list[str], list[str]]:
+    """(users that keep their own series, users folded into OTHER), by descending value."""
+    ranked = sorted(per_user, key=lambda u: per_user[u], reverse=True)
+    return ranked[:k], ranked[k:]
+
+
+class GuestStatsSampler:
+    """
+    Polls every running VM over QMP (query-blockstats, query-balloon) concurrently and
+    exports per-VM counters plus per-user rates limited to the top-K users.
+
+    Guest counters restart from zero with their QEMU process; exported counters only
+    ever move by the non-negative delta between two polls.
+    """
+
+    def __init__(self, top_k: int = GUEST_STATS_TOP_K, timeout_s: float = 2.0) -> None:
+        self._top_k = top_k
+        self._timeout_s = timeout_s
+        self._prev: dict[str, tuple[float, dict]] = {}     # vmid → (t, blockstats totals)
+        self._vm_labels: dict[str, str] = {}               # vmid → os_type of exported series
+        self._user_series: set[str] = set()
+
+    async def _poll(self, vmid: str, sess: dict) -> Optional[tuple[dict, Optional[int]]]:
+        qmp_sock = sess.get("qmp_socket") or str(RUN_DIR / f"qmp-{vmid}.sock")
+        try:
+            async with QMPClient(qmp_sock, timeout=self._timeout_s) as qmp:
+                block = sum_blockstats(await qmp.execute("query-blockstats"))
+                try:
+                    balloon = (await qmp.execute("query-balloon")).get("actual")
+                except QMPError:
+                    balloon = None  # no balloon device on this VM
+            return block, balloon
+        except QMPError as e:
+            logger.debug("[guest_stats] %s: %s", vmid, e)
+            return None
+
+    def _forget_vm(self, vmid: str) -> None:
+        os_type = self._vm_labels.pop(vmid, None)
+        self._prev.pop(vmid, None)
+        if os_type is None:
+            return
+        for d in DIRECTIONS:
+            for c in (VM_BLOCK_BYTES, VM_BLOCK_OPS, VM_BLOCK_TIME):
+                try:
+                    c.remove(vmid, os_type, d)
+                except KeyError:
+                    pass
+        for g in (VM_BALLOON_BYTES, VM_QMP_UP):
+            try:
+                g.remove(vmid, os_type)
+            except KeyError:
+                pass
+
+    async def sample(self, sessions: list[tuple[str, dict]]) -> None:
+        now = time.monotonic()
+        results = await asyncio.gather(*(self._poll(v, s) for v, s in sessions))
+
+        user_rates: dict[str, dict[tuple[str, str], float]] = defaultdict(lambda: defaultdict(float))
+        for (vmid, sess), res in zip(sessions, results):
+            os_type = sess.get("os_type") or "unknown"
+            uid = (sess.get("user_id") or "").strip() or "unknown"
+            if self._vm_labels.get(vmid, os_type) != os_type:
+                self._forget_vm(vmid)
+            self._vm_labels[vmid] = os_type
+            VM_QMP_UP.labels(vmid=vmid, os_type=os_type).set(0 if res is None else 1)
+            user_rates[uid]  # users with idle/unreachable VMs still rank (at 0)
+            if res is None:
+                continue
+            block, balloon = res
+            if balloon is not None:
+                VM_BALLOON_BYTES.labels(vmid=vmid, os_type=os_type).set(balloon)
+
+            prev_t, prev = self._prev.get(vmid, (None, None))
+            self._prev[vmid] = (now, block)
+            if prev is None:
+                continue  # first sight: nothing to diff against yet
+            for (metric, d), value in block.items():
+                delta = value - prev[(metric, d)]
+                if delta < 0:       # QEMU restarted under the same vmid
+                    delta = value
+                if metric == "bytes":
+                    VM_BLOCK_BYTES.labels(vmid=vmid, os_type=os_type, direction=d).inc(delta)
+                    user_rates[uid][("bytes", d)] += delta / max(now - prev_t, 1e-6)
+                elif metric == "ops":
+                    VM_BLOCK_OPS.labels(vmid=vmid, os_type=os_type, direction=d).inc(delta)
+                    user_rates[uid][("ops", d)] += delta / max(now - prev_t, 1e-6)
+                else:
+                    VM_BLOCK_TIME.labels(vmid=vmid, os_type=os_type, direction=d).inc(delta / 1e9)
+
+        for vmid in set(self._vm_labels) - {v for v, _ in sessions}:
+            self._forget_vm(vmid)
+        self._export_users(user_rates)
+
+    def _export_users(self, user_rates: dict[str, dict[tuple[str, str], float]]) -> None:
+        total_bps = {u: sum(v for (m, _), v in r.items() if m == "bytes") for u, r in user_rates.items()}
+        top, rest = top_k_users(total_bps, self._top_k)
+        series: dict[str, dict[tuple[str, str], float]] = {u: user_rates[u] for u in top}
+        if rest:
+            other: dict[tuple[str, str], float] = defaultdict(float)
+            for u in rest:
+                for k, v in user_rates[u].items():
+                    other[k] += v
+            series[OTHER] = other
+        for uid, rates in series.items():
+            for d in DIRECTIONS:
+                USER_BLOCK_BPS.labels(user_id=uid, direction=d).set(rates.get(("bytes", d), 0.0))
+                USER_BLOCK_IOPS.labels(user_id=uid, direction=d).set(rates.get(("ops", d), 0.0))
+        for uid in self._user_series - set(series):
+            for d in DIRECTIONS:
+                for g in (USER_BLOCK_BPS, USER_BLOCK_IOPS):
+                    try:
+                        g.remove(uid, d)
+                    except KeyError:
+                        pass
+        self._user_series = set(series)
+
+
+async def guest_stats_sampler(
+    store_factory: Callable,
+    stop_event: asyncio.Event,
+    interval_sec: int = GUEST_STATS_INTERVAL_S,
+    sampler: Optional[GuestStatsSampler] = None,
+) -> None:
+    sampler = sampler or GuestStatsSampler()
+    while not stop_event.is_set():
+        try:
+            sessions = local_sessions(await asyncio.to_thread(store_factory().items))
+            await sampler.sample(sessions)
+        except Exception:
+            logger.exception("[guest_stats] sampling failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval_sec)
+        except asyncio.TimeoutError:
+            pass
@@ -1,49 +1,115 @@
 # observability/http_metrics.py
-import re, time
-from typing import Optional
+import time
+
 from prometheus_client import Counter, Histogram
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
-from starlette.exceptions import HTTPException as StarletteHTTPException
-from fastapi import HTTPException as FastAPIHTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 REQS = Counter(
-    "vmshare_requests_total", "HTTP requests",
+    "vmshare_requests_total", "Total HTTP requests",
     ["method", "path", "status"]
 )
 LAT = Histogram(
-    "vmshare_request_duration_seconds", "HTTP request latency (s)",
-    ["method", "path"],
-    buckets=(0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10)
+    "vmshare_request_duration_seconds", "Request duration (seconds)",
+    ["method", "path", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+_SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+REQ_SIZE = Histogram(
+    "vmshare_request_size_bytes", "HTTP request body size (bytes)",
+    ["method", "path"], buckets=_SIZE_BUCKETS
 )
+RESP_SIZE = Histogram(
+    "vmshare_response_size_bytes", "HTTP response body size (bytes)",
+    ["method", "path"], buckets=_SIZE_BUCKETS
+)
+
+UNMATCHED = "<unmatched>"  # 404s and anything the router did not resolve
+_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
 
-_uuid = re.compile(r"[0-9a-fA-F-]{8}-[0-9a-fA-F-]{4}-[0-9a-fA-F-]{4}-[0-9a-fA-F-]{4}-[0-9a-fA-F-]{12}")
-_int  = re.compile(r"/\d+")
-def _norm_path(scope) -> str:
+
+def _route_template(scope: Scope, root_path: str) -> str:
+    """Route template the router resolved (read after the app ran, so routing has happened)."""
     route = scope.get("route")
-    p: Optional[str] = getattr(route, "path", None)
-    if p:
-        return p                     # e.g., "/vm/{id}"
-    raw = scope.get("path") or "/"
-    return _int.sub("/{id}", _uuid.sub("/{uuid}", raw))
-
-class HTTPMetricsMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+    path = getattr(route, "path", None)
+    if path:
+        return path                                  # e.g. "/vm/{vmid}"
+    mounted = scope.get("root_path", "")
+    if mounted != root_path:                         # StaticFiles & co. under app.mount()
+        return mounted[len(root_path):] + "/{path:path}"
+    return UNMATCHED
+
+
+class HTTPMetricsMiddleware:
+    """
+    Pure-ASGI request metrics: count, latency, request and response body sizes, labelled
+    with the route template instead of the raw URL so label cardinality stays bounded.
+
+    Unlike BaseHTTPMiddleware it does not re-wrap the response in a stream, so streaming
+    responses pass through untouched and the per-request cost is a couple of closures.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._children: dict[tuple, tuple] = {}  # cached .labels() lookups
+
+    def _observe(self, method: str, path: str, status: int, elapsed: float,
+                 req_bytes: int, resp_bytes: int) -> None:
+        key = (method, path, status)
+        children = self._children.get(key)
+        if children is None:
+            s = str(status)
+            children = self._children[key] = (
+                REQS.labels(method=method, path=path, status=s),
+                LAT.labels(method=method, path=path, status=s),
+                REQ_SIZE.labels(method=method, path=path),
+                RESP_SIZE.labels(method=method, path=path),
+            )
+        count, lat, req_size, resp_size = children
+        count.inc()
+        lat.observe(elapsed)
+        req_size.observe(req_bytes)
+        resp_size.observe(resp_bytes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         t0 = time.perf_counter()
-        method = request.method
-        path   = _norm_path(request.scope)
+        root_path = scope.get("root_path", "")
         status = 500
+        req_bytes = 0
+        resp_bytes = 0
+
+        content_length = None
+        for k, v in scope.get("headers") or ():
+            if k == b"content-length":
+                content_length = v
+                break
+        if content_length is not None:
+            try:
+                req_bytes = int(content_length)
+            except ValueError:
+                pass
+            wrapped_receive = receive
+        else:
+            async def wrapped_receive() -> Message:
+                nonlocal req_bytes
+                message = await receive()
+                req_bytes += len(message.get("body", b""))
+                return message
+
+        async def wrapped_send(message: Message) -> None:
+            nonlocal status, resp_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                resp_bytes += len(message.get("body", b""))
+            await send(message)
+
         try:
-            resp = await call_next(request)
-            status = getattr(resp, "status_code", 200)
-            return resp
-        except (FastAPIHTTPException, StarletteHTTPException) as ex:
-            status = getattr(ex, "status_code", 500)
-            raise
-        except Exception:
-            status = 500
-            raise
+            await self.app(scope, wrapped_receive, wrapped_send)
         finally:
-            LAT.labels(method=method, path=path).observe(time.perf_counter() - t0)
-            REQS.labels(method=method, path=path, status=str(status)).inc()
+            method = scope["method"] if scope["method"] in _METHODS else "OTHER"
+            self._observe(method, _route_template(scope, root_path), status,
+                          time.perf_counter() - t0, req_bytes, resp_bytes)
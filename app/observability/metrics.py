@@ -7,7 +7,7 @@ from datetime import datetime
 from typing import Optional
 
 import psutil
-from fastapi import APIRouter, Response, HTTPException, Query, Request
+from fastapi import APIRouter, Response, HTTPException, Query
 from fastapi.responses import JSONResponse
 import httpx
 
@@ -16,15 +16,15 @@ from prometheus_client import (
     REGISTRY,
     CONTENT_TYPE_LATEST,
     generate_latest,
-    Counter,
-    Histogram,
     CollectorRegistry,
 )
 from prometheus_client import multiprocess  # NEW
 
 from methods.database.database import SessionLocal
 from methods.database.models import User
-from methods.manager.SessionManager import get_session_store  # Redis-backed
+from methods.manager.SessionManager import get_session_store, local_sessions  # Redis-backed
+from observability.http_metrics import HTTPMetricsMiddleware
+from observability.prom_query import PromResponseError, get_prom_query_cache
 
 # -----------------------
 # Registry / multiprocess
@@ -44,27 +44,6 @@ def _get_registry():
 
 REG = _get_registry()
 
-# -----------------------
-# Config
-# -----------------------
-PROM_URL = os.getenv("PROM_URL", "http://localhost:9090")
-
-# -----------------------
-# HTTP request metrics (middleware will fill these)
-# -----------------------
-REQ_LATENCY = Histogram(
-    "vmshare_request_duration_seconds",
-    "Request duration (seconds)",
-    ["path", "method", "status"],
-    registry=REG,
-)
-REQ_COUNT = Counter(
-    "vmshare_requests_total",
-    "Total HTTP requests",
-    ["path", "method", "status"],
-    registry=REG,
-)
-
 # -----------------------
 # Prometheus metrics
 # -----------------------
@@ -112,53 +91,27 @@ async def metrics(
     if query is None and start is None and end is None and step is None:
         return Response(generate_latest(REG), media_type=CONTENT_TYPE_LATEST)
 
-    # Otherwise proxy to Prometheus HTTP API (for your UI)
+    # Otherwise proxy to Prometheus HTTP API (for your UI), cached + coalesced
     if query is None:
         raise HTTPException(status_code=400, detail="Missing 'query' parameter for Prometheus API")
 
-    use_range = start is not None and end is not None and step is not None
-    api_path = "/api/v1/query_range" if use_range else "/api/v1/query"
-    params = {"query": query}
-    if use_range:
-        params.update({"start": start, "end": end, "step": step})
-
-    url = f"{PROM_URL.rstrip('/')}{api_path}"
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.get(url, params=params)
-        try:
-            data = r.json()
-        except ValueError:
-            snippet = (r.text or "")[:80]
-            raise HTTPException(
-                status_code=500,
-                detail=f"Prometheus did not return JSON (check PROM_URL). First bytes: {snippet}"
-            )
-        return JSONResponse(status_code=r.status_code, content=data)
+        status, data = await get_prom_query_cache().query(query, start, end, step)
+    except PromResponseError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Prometheus did not return JSON (check PROM_URL). First bytes: {e}"
+        )
     except httpx.RequestError as e:
         raise HTTPException(status_code=502, detail=f"Prometheus unreachable: {e}")
+    return JSONResponse(status_code=status, content=data)
 
 # -----------------------
 # HTTP middleware installer
 # -----------------------
 def install_http_metrics(app):
-    @app.middleware("http")
-    async def _metrics_middleware(request: Request, call_next):
-        path = getattr(request.scope.get("route"), "path", request.url.path)
-        method = request.method
-        import time
-        start = time.perf_counter()
-        try:
-            resp = await call_next(request)
-            elapsed = time.perf_counter() - start
-            status = str(resp.status_code)
-            REQ_LATENCY.labels(path=path, method=method, status=status).observe(elapsed)
-            REQ_COUNT.labels(path=path, method=method, status=status).inc()
-            return resp
-        except Exception:
-            REQ_COUNT.labels(path=path, method=method, status="500").inc()
-            REQ_LATENCY.labels(path=path, method=method, status="500").observe(0.0)
-            raise
+    """Request metrics are recorded by the pure-ASGI HTTPMetricsMiddleware (observability/http_metrics.py)."""
+    app.add_middleware(HTTPMetricsMiddleware)
 
 # -----------------------
 # Helpers (unchanged except where noted)
@@ -254,11 +207,11 @@ async def metrics_collector(_unused, stop_event: asyncio.Event, interval_sec: in
             items = []
         SESSIONS_CURR.set(len(items))
 
-        # Per-user agg
+        # Per-user agg (host view: only VMs whose QEMU runs here, so pids resolve to the right process)
         per_user = defaultdict(lambda: {"vms": 0, "cpu": 0.0, "rss": 0})
         seen_users: set[str] = set()
 
-        for vmid_raw, data in items:
+        for vmid_raw, data in local_sessions(items):
             vmid = _as_text(vmid_raw)
             uid = _as_text(data.get("user_id")).strip() or "unknown"
 
@@ -0,0 +1,139 @@
+# /app/observability/prom_query.py
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+PROM_URL          = os.getenv("PROM_URL", "http://localhost:9090")
+PROM_CACHE_TTL_S  = float(os.getenv("PROM_CACHE_TTL_S", "10"))
+PROM_CACHE_MAX    = int(os.getenv("PROM_CACHE_MAX", "512"))
+PROM_TIMEOUT_S    = float(os.getenv("PROM_TIMEOUT_S", "15"))
+
+PROM_PROXY_REQUESTS = Counter(
+    "vmshare_prom_proxy_requests_total", "PromQL proxy requests by cache result",
+    ["result"]  # result=hit|miss|coalesced
+)
+PROM_UPSTREAM_LAT = Histogram(
+    "vmshare_prom_upstream_duration_seconds", "Prometheus HTTP API latency (s)",
+    ["endpoint", "outcome"],  # endpoint=query|query_range, outcome=ok|http_error|error
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+)
+
+
+class PromResponseError(ValueError):
+    """Prometheus answered with something that is not JSON."""
+
+
+def align_range(start: float, end: float, step: float) -> tuple[float, float]:
+    """Snap start/end down to multiples of step, so 'now'-anchored panels share cache entries."""
+    if step <= 0:
+        return start, end
+    return math.floor(start / step) * step, math.floor(end / step) * step
+
+
+class PromQueryCache:
+    """
+    Front for the Prometheus HTTP API used by the /metrics?query=… proxy:
+      - one pooled httpx.AsyncClient (keep-alive) instead of a client per request;
+      - successful results cached for `ttl_s`, keyed by (endpoint, query, start, end, step)
+        with start/end aligned to step, LRU-bounded to `max_entries`;
+      - identical queries already in flight are coalesced onto the same upstream call.
+    """
+
+    def __init__(self, base_url: str = PROM_URL, *, ttl_s: float = PROM_CACHE_TTL_S,
+                 max_entries: int = PROM_CACHE_MAX, timeout_s: float = PROM_TIMEOUT_S,
+                 transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        self._base_url = base_url.rstrip("/")
+        self._ttl_s = ttl_s
+        self._max_entries = max_entries
+        self._timeout_s = timeout_s
+        self._transport = transport
+        self._cache: OrderedDict[tuple, tuple[float, int, dict]] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self._base_url,
+                timeout=self._timeout_s,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                transport=self._transport,
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def _fetch(self, key: tuple, endpoint: str, params: dict) -> tuple[int, dict]:
+        t0 = time.perf_counter()
+        outcome = "error"
+        try:
+            r = await self._http().get(f"/api/v1/{endpoint}", params=params)
+            outcome = "ok" if r.status_code == 200 else "http_error"
+        finally:
+            PROM_UPSTREAM_LAT.labels(endpoint=endpoint, outcome=outcome).observe(time.perf_counter() - t0)
+        try:
+            data = r.json()
+        except ValueError:
+            raise PromResponseError((r.text or "")[:80])
+        if r.status_code == 200:
+            self._cache[key] = (time.monotonic() + self._ttl_s, r.status_code, data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+        return r.status_code, data
+
+    def _done(self, key: tuple, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here so followers that went away do not leave warnings
+
+    async def query(self, query: str, start: Optional[float] = None, end: Optional[float] = None,
+                    step: Optional[float] = None) -> tuple[int, dict]:
+        """(status_code, JSON body) from Prometheus, served from cache when possible."""
+        if start is not None and end is not None and step is not None:
+            start, end = align_range(start, end, step)
+            endpoint, params = "query_range", {"query": query, "start": start, "end": end, "step": step}
+        else:
+            start = end = step = None
+            endpoint, params = "query", {"query": query}
+        key = (endpoint, query, start, end, step)
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                PROM_PROXY_REQUESTS.labels(result="hit").inc()
+                return cached[1], cached[2]
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            PROM_PROXY_REQUESTS.labels(result="coalesced").inc()
+        else:
+            PROM_PROXY_REQUESTS.labels(result="miss").inc()
+            task = asyncio.ensure_future(self._fetch(key, endpoint, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        # shield: a caller that disconnects must not cancel the fetch others are waiting on
+        return await asyncio.shield(task)
+
+
+PROM_QUERY_CACHE = PromQueryCache()
+
+def get_prom_query_cache() -> PromQueryCache:
+    return PROM_QUERY_CACHE
@@ -0,0 +1,108 @@
+# /app/observability/qemu_metrics.py
+from prometheus_client import Counter, Gauge, Histogram
+
+# Which accelerator this host resolved at startup (one series set to 1)
+QEMU_ACCEL = Gauge(
+    "vmshare_qemu_accel_info", "Host QEMU accelerator selected at startup (1 = selected)",
+    ["accel"]
+)
+
+# Launches per profile and the accelerator actually passed to QEMU
+QEMU_LAUNCHES = Counter(
+    "vmshare_qemu_launches_total", "QEMU launches", ["os_type", "accel"]
+)
+
+# Overlay pre-creation pool
+OVERLAY_POOL_STOCK = Gauge(
+    "vmshare_overlay_pool_stock", "Pre-created blank overlays ready per profile", ["os_type"]
+)
+OVERLAY_POOL_TAKES = Counter(
+    "vmshare_overlay_pool_takes_total", "Overlay requests served from the pool",
+    ["os_type", "outcome"]  # outcome=hit|miss
+)
+
+# Base image page cache (label = profile)
+BASE_IMAGE_BYTES = Gauge(
+    "vmshare_base_image_bytes", "Base image file size", ["os_type"]
+)
+BASE_IMAGE_RESIDENT_BYTES = Gauge(
+    "vmshare_base_image_resident_bytes", "Base image bytes resident in the page cache", ["os_type"]
+)
+BASE_IMAGE_LOCKED_BYTES = Gauge(
+    "vmshare_base_image_locked_bytes", "Base image bytes pinned with mlock", ["os_type"]
+)
+
+# Orphan reconciler (kind = qemu|websockify|run_file|overlay|session)
+RECONCILE_ORPHANS = Counter(
+    "vmshare_reconcile_orphans_total", "Orphans reclaimed by the reconciler", ["kind"]
+)
+RECONCILE_LEAKED_MEMORY_BYTES = Gauge(
+    "vmshare_reconcile_leaked_memory_bytes", "RSS of orphan processes killed in the last reconcile pass"
+)
+RECONCILE_RECLAIMED_DISK_BYTES = Gauge(
+    "vmshare_reconcile_reclaimed_disk_bytes", "Disk space freed by the last reconcile pass"
+)
+RECONCILE_LAST_RUN = Gauge(
+    "vmshare_reconcile_last_run_timestamp_seconds", "Unix time of the last completed reconcile pass"
+)
+
+# Block I/O fair-share policy (action = tighten|restore|error)
+IO_THROTTLE_ACTIONS = Counter(
+    "vmshare_io_throttle_actions_total", "Live I/O limit changes made by the fair-share policy", ["action"]
+)
+IO_THROTTLED_VMS = Gauge(
+    "vmshare_io_throttled_vms", "VMs currently clamped to their fair share of host disk I/O"
+)
+IO_CONTENDED = Gauge(
+    "vmshare_io_contended", "1 if guest disk I/O crossed the contention threshold in the last policy pass"
+)
+
+# Memory density: balloon policy (action = inflate|deflate|error), KSM and VMs per GiB
+BALLOON_ACTIONS = Counter(
+    "vmshare_balloon_actions_total", "Balloon target changes made by the host memory policy", ["action"]
+)
+BALLOON_INFLATED_VMS = Gauge(
+    "vmshare_balloon_inflated_vms", "Idle guests currently shrunk by their balloon"
+)
+BALLOON_RECLAIMED_BYTES = Gauge(
+    "vmshare_balloon_reclaimed_bytes", "Guest RAM currently handed back to the host by inflated balloons"
+)
+KSM_PAGES = Gauge(
+    "vmshare_ksm_pages", "KSM page counts from /sys/kernel/mm/ksm", ["state"]  # shared|sharing|unshared|volatile
+)
+KSM_SAVED_BYTES = Gauge(
+    "vmshare_ksm_saved_bytes", "Memory saved by KSM merging (pages_sharing × page size)"
+)
+KSM_FULL_SCANS = Gauge(
+    "vmshare_ksm_full_scans", "Completed KSM full scans"
+)
+VMS_PER_GIB = Gauge(
+    "vmshare_vms_per_gib", "Running VMs on this node per GiB of used host RAM"
+)
+
+# Session leases: heartbeat writes (outcome = written|coalesced|gone|error) and reclaims
+SESSION_HEARTBEATS = Counter(
+    "vmshare_session_heartbeats_total", "Bridge heartbeats, by whether they reached Redis", ["outcome"]
+)
+SESSIONS_RECLAIMED = Counter(
+    "vmshare_sessions_reclaimed_total", "Sessions reclaimed after their heartbeat lease expired",
+    ["reason"]  # expired (keyspace notification) | sweep
+)
+
+# Lifecycle event stream (metrics consumer group)
+LIFECYCLE_EVENTS = Counter(
+    "vmshare_lifecycle_events_total", "Lifecycle events read from the events:lifecycle stream", ["kind"]
+)
+LAUNCH_TO_CONNECT = Histogram(
+    "vmshare_launch_to_connect_seconds", "Session written → first viewer connected", ["os_type"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+)
+SESSION_LIFETIME = Histogram(
+    "vmshare_session_lifetime_seconds", "Session written → session cleaned up", ["os_type"],
+    buckets=(10, 30, 60, 300, 600, 1800, 3600, 7200, 21600)
+)
+
+
+def set_host_accel(accel: str) -> None:
+    for a in ("kvm", "tcg"):
+        QEMU_ACCEL.labels(accel=a).set(1 if a == accel else 0)
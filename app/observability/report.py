@@ -1,31 +1,187 @@
 # /app/observability/report.py
-from configs.config import TG_BOT_TOKEN, TG_CHAT_ID
-import urllib.request, json, logging
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+from configs.config import (
+    TG_BOT_TOKEN,
+    TG_CHAT_ID,
+    TG_API_BASE,
+    ALERT_QUEUE_MAX,
+    ALERT_HTTP_TIMEOUT_S,
+    ALERT_DIGEST_S,
+)
 
 logger = logging.getLogger(__name__)
 
+TG_MAX_CHARS = 4096  # sendMessage text limit
+
+ALERTS = Counter(
+    "vmshare_alerts_total", "Alerts handled by the dispatcher",
+    ["outcome"]  # outcome=sent|error|dropped|coalesced
+)
+ALERT_QUEUE_DEPTH = Gauge("vmshare_alert_queue_depth", "Alerts waiting to be sent")
+
+
+class AlertDispatcher:
+    """
+    Sends Telegram alerts from a single asyncio task so callers never wait on the API.
+
+    `submit()` only enqueues into a bounded queue (full → the alert is dropped and counted)
+    and is safe to call from the event loop or from worker threads. One httpx.AsyncClient
+    is reused for every request, each with a timeout.
+
+    Alerts are coalesced by `key` (the message itself by default): the first one is sent
+    right away, repeats within `digest_s` are counted and later sent as one digest message.
+    """
+
+    def __init__(self, api_base: str = TG_API_BASE, token: Optional[str] = TG_BOT_TOKEN,
+                 chat_id: Optional[str] = TG_CHAT_ID, *, maxsize: int = ALERT_QUEUE_MAX,
+                 timeout_s: float = ALERT_HTTP_TIMEOUT_S, digest_s: float = ALERT_DIGEST_S) -> None:
+        self._api_base = api_base.rstrip("/")
+        self._token = token
+        self._chat_id = chat_id
+        self._maxsize = maxsize
+        self._timeout_s = timeout_s
+        self._digest_s = digest_s
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._last_sent: dict[str, float] = {}
+        self._pending: dict[str, list] = {}  # key → [repeats, latest message]
+
+    # ----- producer side
+    def submit(self, message: str, key: Optional[str] = None) -> bool:
+        loop = self._loop
+        if loop is None:
+            ALERTS.labels(outcome="dropped").inc()
+            logger.warning(f"[alerts] dispatcher not running, dropped: {message[:200]}")
+            return False
+        item = (key or message, message)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return self._put(item)
+        try:
+            loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:  # loop closed underneath us
+            ALERTS.labels(outcome="dropped").inc()
+            return False
+        return True
+
+    def _put(self, item: tuple[str, str]) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            ALERTS.labels(outcome="dropped").inc()
+            logger.warning(f"[alerts] queue full, dropped: {item[1][:200]}")
+            return False
+        ALERT_QUEUE_DEPTH.set(self._queue.qsize())
+        return True
 
-def telegram_reporting(message: str) -> None:
-            logger.info('app/observability/report.py: telegram_reporting has been triggered')
+    # ----- consumer side
+    async def _send(self, text: str) -> bool:
+        if not self._token or not self._chat_id:
+            ALERTS.labels(outcome="error").inc()
+            logger.warning("[alerts] TG_BOT_TOKEN/TG_CHAT_ID not set, alert not sent")
+            return False
+        payload = {"chat_id": self._chat_id, "text": text[:TG_MAX_CHARS], "parse_mode": "HTML"}
+        for attempt in range(2):
             try:
-                import ssl
-                ssl_context = ssl._create_unverified_context()
-                url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
-                data = {
-                    "chat_id": TG_CHAT_ID,
-                    "text": message,
-                    "parse_mode": "HTML"
-                }
-                data_bytes = json.dumps(data).encode('utf-8')
-                req = urllib.request.Request(
-                    url,
-                    data=data_bytes,
-                    headers={'Content-Type': 'application/json'},
-                    method='POST'
-                )
-                with urllib.request.urlopen(req, context=ssl_context) as response:
-                    logger.info('app/observability/report.py: Telegram message sent successfully')
-                    return None
-            except Exception as e:
-                logger.error(
-                    f'app/observability/report.py: Error {e}')
+                resp = await self._client.post(f"/bot{self._token}/sendMessage", json=payload)
+            except httpx.HTTPError as e:
+                ALERTS.labels(outcome="error").inc()
+                logger.error(f"[alerts] Telegram request failed: {e!r}")
+                return False
+            if resp.status_code == 429 and attempt == 0:
+                try:
+                    retry_after = float(resp.json().get("parameters", {}).get("retry_after", 1))
+                except ValueError:
+                    retry_after = 1.0
+                await asyncio.sleep(min(retry_after, self._timeout_s))
+                continue
+            if resp.is_success:
+                ALERTS.labels(outcome="sent").inc()
+                return True
+            ALERTS.labels(outcome="error").inc()
+            logger.error(f"[alerts] Telegram replied {resp.status_code}: {resp.text[:200]}")
+            return False
+        return False
+
+    async def _handle(self, key: str, message: str) -> None:
+        now = time.monotonic()
+        last = self._last_sent.get(key)
+        if last is not None and now - last < self._digest_s:
+            entry = self._pending.setdefault(key, [0, message])
+            entry[0] += 1
+            entry[1] = message
+            ALERTS.labels(outcome="coalesced").inc()
+            return
+        self._last_sent[key] = now
+        await self._send(message)
+
+    async def _flush_digests(self, force: bool = False) -> None:
+        now = time.monotonic()
+        due = [k for k in self._pending if force or now - self._last_sent[k] >= self._digest_s]
+        if due:
+            lines = []
+            for k in due:
+                repeats, message = self._pending.pop(k)
+                lines.append(f"×{repeats} {message}")
+                self._last_sent[k] = now
+            await self._send(f"<b>Digest</b> (repeats within {int(self._digest_s)}s)\n" + "\n".join(lines))
+        for k in [k for k, t in self._last_sent.items() if k not in self._pending and now - t >= self._digest_s]:
+            del self._last_sent[k]
+
+    def _next_digest_in(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(self._last_sent[k] + self._digest_s - now for k in self._pending))
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        self._queue = asyncio.Queue(maxsize=self._maxsize)
+        self._loop = asyncio.get_running_loop()
+        async with httpx.AsyncClient(base_url=self._api_base, timeout=self._timeout_s) as client:
+            self._client = client
+            try:
+                while not stop_event.is_set():
+                    getter = asyncio.ensure_future(self._queue.get())
+                    stopper = asyncio.ensure_future(stop_event.wait())
+                    try:
+                        await asyncio.wait({getter, stopper}, timeout=self._next_digest_in(),
+                                           return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        stopper.cancel()
+                        if not getter.done():
+                            getter.cancel()
+                    if getter.done() and not getter.cancelled():
+                        ALERT_QUEUE_DEPTH.set(self._queue.qsize())
+                        await self._handle(*getter.result())
+                    await self._flush_digests()
+            finally:
+                # no new alerts from here on; send what is queued and every open digest
+                self._loop = None
+                while not self._queue.empty():
+                    await self._handle(*self._queue.get_nowait())
+                await self._flush_digests(force=True)
+                ALERT_QUEUE_DEPTH.set(0)
+                self._client = None
+
+
+ALERT_DISPATCHER = AlertDispatcher()
+
+def get_alert_dispatcher() -> AlertDispatcher:
+    return ALERT_DISPATCHER
+
+
+def telegram_reporting(message: str, key: Optional[str] = None) -> None:
+    """Queue a Telegram alert (non-blocking). Alerts sharing `key` are coalesced into digests."""
+    logger.info('app/observability/report.py: telegram_reporting has been triggered')
+    get_alert_dispatcher().submit(message, key=key)
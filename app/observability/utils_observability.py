@@ -13,7 +13,7 @@ try:
     from .report import telegram_reporting
 except Exception as _e:
     logger.error("Failed to import telegram_reporting: %s", _e)
-    def telegram_reporting(message: str) -> None:  # no-op fallback
+    def telegram_reporting(message: str, key: str | None = None) -> None:  # no-op fallback
         logger.error("telegram_reporting not available; message was: %s", message)
 
 # ---- Thresholds ----
@@ -101,7 +101,7 @@ async def resource_watchdog(stop_event: asyncio.Event):
                 logger.warning(msg)
                 capture_message(msg, level="warning")
                 try:
-                    telegram_reporting(msg)
+                    telegram_reporting(msg, key="cpu")
                 except Exception as e:
                     logger.error("telegram_reporting CPU error: %s", e)
                 cpu_alert_open = True
@@ -115,7 +115,7 @@ async def resource_watchdog(stop_event: asyncio.Event):
                 logger.info(msg)
                 capture_message(msg, level="info")
                 try:
-                    telegram_reporting(msg)
+                    telegram_reporting(msg, key="cpu_recovered")
                 except Exception as e:
                     logger.error("telegram_reporting CPU recovery error: %s", e)
                 cpu_alert_open = False
@@ -143,7 +143,7 @@ async def resource_watchdog(stop_event: asyncio.Event):
                 logger.warning(msg)
                 capture_message(msg, level="warning")
                 try:
-                    telegram_reporting(msg)
+                    telegram_reporting(msg, key="ram")
                 except Exception as e:
                     logger.error("telegram_reporting RAM error: %s", e)
                 ram_alert_open = True
@@ -157,7 +157,7 @@ async def resource_watchdog(stop_event: asyncio.Event):
                 logger.info(msg)
                 capture_message(msg, level="info")
                 try:
-                    telegram_reporting(msg)
+                    telegram_reporting(msg, key="ram_recovered")
                 except Exception as e:
                     logger.error("telegram_reporting RAM recovery error: %s", e)
                 ram_alert_open = False
@@ -190,7 +190,7 @@ async def resource_watchdog(stop_event: asyncio.Event):
                     logger.warning(msg)
                     capture_message(msg, level="warning")
                     try:
-                        telegram_reporting(msg)
+                        telegram_reporting(msg, key=f"disk:{dev}")
                     except Exception as e:
                         logger.error("telegram_reporting DISK error: %s", e)
                     over_disk_free[dev] = now
@@ -0,0 +1,77 @@
+# /app/observability/vnc_metrics.py
+from prometheus_client import Counter, Gauge, Histogram
+
+# All series are labelled by profile (os_type) only; per-session detail goes into histograms.
+# direction: "down" = VM → browser, "up" = browser → VM
+
+VNC_SESSIONS = Gauge(
+    "vmshare_vnc_sessions", "Open browser connections on the VNC bridge", ["os_type"]
+)
+VNC_BYTES = Counter(
+    "vmshare_vnc_bytes_total", "Bytes relayed by the VNC bridge", ["os_type", "direction"]
+)
+VNC_MESSAGES = Counter(
+    "vmshare_vnc_messages_total", "WebSocket messages relayed by the VNC bridge", ["os_type", "direction"]
+)
+VNC_THROUGHPUT = Histogram(
+    "vmshare_vnc_throughput_bytes_per_second", "Per-session throughput, one sample per window",
+    ["os_type", "direction"],
+    buckets=(1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7)
+)
+VNC_SEND_BUFFER = Histogram(
+    "vmshare_vnc_send_buffer_bytes", "Bytes queued towards the browser, one sample per window",
+    ["os_type"],
+    buckets=(0, 1e3, 1e4, 6.4e4, 2.56e5, 1e6, 4e6, 1.6e7)
+)
+VNC_FIRST_FRAME = Histogram(
+    "vmshare_vnc_time_to_first_frame_seconds", "WebSocket accept → first framebuffer update",
+    ["os_type"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+VNC_UPDATE_LATENCY = Histogram(
+    "vmshare_vnc_update_latency_seconds",
+    "FramebufferUpdateRequest → next server data (incremental=1 also includes idle screen time)",
+    ["os_type", "incremental"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+VNC_SESSION_DURATION = Histogram(
+    "vmshare_vnc_session_duration_seconds", "Browser connection lifetime",
+    ["os_type"],
+    buckets=(10, 60, 300, 900, 1800, 3600, 7200, 14400)
+)
+VNC_STALLS = Counter(
+    "vmshare_vnc_stalls_total",
+    "Windows in which a browser had an update request pending or a backed-up send buffer for too long",
+    ["os_type"]
+)
+VNC_VIEWERS = Gauge(
+    "vmshare_vnc_viewers", "Browsers attached to shared VNC sessions (VNC_SHARING)", ["os_type", "role"]
+)
+VNC_DROPPED_UPDATES = Counter(
+    "vmshare_vnc_dropped_updates_total",
+    "Framebuffer updates a shared-session viewer skipped because its queue was backed up",
+    ["os_type"]
+)
+VNC_RTT = Histogram(
+    "vmshare_vnc_rtt_seconds", "WebSocket ping → pong, one sample per session per window (includes queued frames)",
+    ["os_type"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+VNC_QUALITY_CHANGES = Counter(
+    "vmshare_vnc_quality_changes_total", "Adaptive quality steps sent to QEMU (direction: down|up)",
+    ["os_type", "direction"]
+)
+
+# ---- thumbnails (Thumbnails.ThumbnailService)
+THUMB_CAPTURES = Counter(
+    "vmshare_thumbnail_captures_total", "QMP screendump captures for thumbnails (result: ok|error)",
+    ["os_type", "result"]
+)
+THUMB_CAPTURE_SECONDS = Histogram(
+    "vmshare_thumbnail_capture_seconds", "screendump + downscale + encode of one thumbnail",
+    ["os_type"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+THUMB_WATCHED = Gauge(
+    "vmshare_thumbnail_watched_vms", "VMs on this node whose thumbnail was requested in the last THUMB_DEMAND_S"
+)
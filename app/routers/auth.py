@@ -10,7 +10,7 @@ from methods.database.models import User
 from pydantic import BaseModel, Field
 from methods.auth.auth import get_current_user, Authentification
 from configs.config import COOKIE_MAX_AGE
-from methods.manager.SessionManager import get_session_store, SessionStore
+from methods.manager.SessionManager import get_session_store, SessionStore, is_local
 from security.recaptcha import verify_recaptcha_or_400
 from utils import cleanup_vm
 
@@ -167,6 +167,7 @@ def logout_user(
         logger.exception("Failed to delete access_token cookie for user %s", getattr(user, "id", "?"))
 
     vmid = None
+    sess = None
     try:
         sess = store.get_running_by_user(user.id) 
         if isinstance(sess, dict):
@@ -177,13 +178,14 @@ def logout_user(
     if vmid:
         logger.info("Terminating VM %s for user %s ...", vmid, user.id)
         try:
-            cleanup_vm(vmid, store)
+            cleanup_vm(vmid, store)  # a VM on a worker node is stopped by that node's agent
         except Exception:
             logger.exception("cleanup_vm failed for vmid=%s (user=%s)", vmid, user.id)
-        try:
-            store.delete(vmid)
-        except Exception:
-            logger.exception("store.delete failed for vmid=%s", vmid)
+        if is_local(sess):
+            try:
+                store.delete(vmid)
+            except Exception:
+                logger.exception("store.delete failed for vmid=%s", vmid)
     else:
         logger.info("Logout: no active VM for user %s (nothing to terminate).", user.id)
 
@@ -0,0 +1,80 @@
+# /app/routers/node_proxy.py
+"""
+Same-origin WebSocket path to the VNC bridges of worker nodes (CLUSTER_MODE).
+
+Bridges of VMs on the API host are reached through the front proxy at /ws/<port>. A
+worker node's bridge only speaks plain ws:// on that node, which breaks behind HTTPS and
+would expose every bridge port, so the API relays /ws/<node_id>/<port> to it instead.
+Only ports that belong to a session on that node are relayed.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import websockets
+from fastapi import APIRouter, Depends, WebSocket
+from starlette.websockets import WebSocketDisconnect
+
+from methods.manager.SessionManager import get_session_store, is_local
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+OPEN_TIMEOUT_S = 10
+
+
+def _bridge_host(sessions, node_id: str, port: int) -> Optional[str]:
+    """The node host of the remote session whose bridge listens on `port`, if any."""
+    return next((s.get("node_host") for _, s in sessions
+                 if s.get("node_id") == node_id and s.get("http_port") == str(port)
+                 and s.get("node_host") and not is_local(s)), None)
+
+
+@router.websocket("/ws/{node_id}/{port}")
+async def node_bridge(ws: WebSocket, node_id: str, port: int, store=Depends(get_session_store)):
+    host = _bridge_host(await asyncio.to_thread(store.items), node_id, port)
+    if host is None:
+        await ws.close(code=1008)
+        return
+    sub = "binary" if "binary" in (ws.scope.get("subprotocols") or ()) else None
+    query = ws.url.query
+    url = f"ws://{host}:{port}/ws/{port}" + (f"?{query}" if query else "")  # the viewer token rides along
+    try:
+        upstream = await websockets.connect(url, subprotocols=[sub] if sub else None, compression=None,
+                                            max_size=None, open_timeout=OPEN_TIMEOUT_S)
+    except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+        logger.warning(f"[node_proxy] {node_id}:{port} unreachable: {e}")
+        await ws.close(code=1011)
+        return
+    await ws.accept(subprotocol=sub)
+
+    async def down() -> None:
+        async for msg in upstream:
+            if isinstance(msg, bytes):
+                await ws.send_bytes(msg)
+            else:
+                await ws.send_text(msg)
+
+    async def up() -> None:
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                return
+            if msg.get("bytes") is not None:
+                await upstream.send(msg["bytes"])
+            elif msg.get("text") is not None:
+                await upstream.send(msg["text"])
+
+    tasks = [asyncio.create_task(down()), asyncio.create_task(up())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await upstream.close()
+        try:
+            await ws.close()
+        except (RuntimeError, WebSocketDisconnect):
+            pass  # the browser is already gone
@@ -1,14 +1,17 @@
 # /app/routers/root.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 import time
 from fastapi.responses import FileResponse
+from methods.assets.assets import PrecompressedStaticFiles, static_root
 from methods.manager.SessionManager import get_session_store
 
 router = APIRouter()
+_site = PrecompressedStaticFiles(directory=static_root())
 
 @router.get("/", response_class=FileResponse)
-async def serve_index():
-    return FileResponse("static/index.html")
+async def serve_index(request: Request):
+    # same root, encodings and ETag revalidation as /static
+    return await _site.get_response("index.html", request.scope)
 
 @router.get("/debug/redis")
 def debug_redis(store = Depends(get_session_store)):
@@ -7,7 +7,7 @@ from methods.manager.SessionManager import get_session_store
 
 router = APIRouter(prefix="/api", tags=["sessions"])
 
-EXPOSE_FIELDS = {"vmid","user_id","os_type","state","http_port","created_at","last_seen"}
+EXPOSE_FIELDS = {"vmid","user_id","os_type","state","http_port","created_at","last_seen","accel"}
 
 # @router.get("/sessions/active")
 # def my_active_sessions(
@@ -1,28 +1,44 @@
 # /app/routers/vm.py
-import secrets, logging, socket, os, time
+import asyncio, json, secrets, logging, socket, os, time
 from datetime import datetime, timezone
+from email.utils import formatdate
 from pathlib import Path
+from typing import Awaitable, Callable
 from urllib.parse import quote
 from pydantic import BaseModel
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 
-from configs.config import server, VM_PROFILES, SNAPSHOTS_PATH
+from configs.config import (server, VM_PROFILES, SNAPSHOTS_PATH, CLUSTER_MODE, LAUNCH_LEASE_S, VNC_BRIDGE, VNC_SHARING,
+                            VNC_OWNER_TOKEN_TTL_S, VNC_SHARE_TTL_S, THUMB_RATE_PER_S, THUMB_MIN_INTERVAL_S)
 from methods.manager.OverlayManager import QemuOverlayManager, OnlineSnapshotError
 from methods.database.database import get_db
 from methods.auth.auth import get_current_user
 from methods.database.models import User
 
-from methods.manager.SessionManager import get_session_store, SessionStore
+from methods.manager.SessionManager import get_session_store, SessionStore, is_local
+from methods.manager.LaunchJobs import LaunchJobs, FINAL_STAGES
+from methods.manager.Scheduler import get_scheduler, NoCapacityError
 from methods.manager import get_websockify_service
 from methods.manager.WebsockifyService import WebsockifyService
+from methods.manager.IoThrottle import normalize_io_limits, set_vm_io_limits
+from methods.manager.QMPClient import QMPError
+from methods.manager.VncQuality import vnc_options
+from methods.manager.ViewerTokens import viewer_token
+from methods.manager.Thumbnails import ThumbnailCache, get_thumbnail_cache
 
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+LAUNCH_POLL_S = 0.25  # how often a duplicate launch request (or a progress stream) checks on the one in flight
+SSE_KEEPALIVE_S = 15  # comment line so proxies don't cut an idle progress stream
+LAUNCH_DRAIN_S = 10   # on shutdown, how long background launches get to finish before they are cancelled
+
+_LAUNCH_TASKS: set[asyncio.Task] = set()  # background launches (keeps them from being garbage-collected)
+
 def _wait_listen(host: str, port: int, timeout: float = 10.0, step: float = 0.05):
     """Block until (host, port) accepts TCP; raise if not ready in time."""
     deadline = time.time() + timeout
@@ -37,6 +53,138 @@ def _wait_listen(host: str, port: int, timeout: float = 10.0, step: float = 0.05
     raise RuntimeError(f"websockify not listening on {host}:{port} after {timeout}s ({last_err})")
 
 
+async def _reserve_launch(store: SessionStore, user_id: str, vmid: str) -> dict | None:
+    """
+    One VM per user, atomically: take the user's launch reservation before any expensive
+    work. Returns the user's session if they already have a VM, or once the launch that
+    holds the reservation (double-click, second tab) has produced one; None means this
+    request owns the launch and must release the reservation when it ends.
+    """
+    deadline = time.monotonic() + LAUNCH_LEASE_S
+    attached = False
+    while True:
+        existing, holder = _try_reserve(store, user_id, vmid)
+        if holder is None:
+            return existing
+        if not attached:
+            logger.info(f"[launch] user {user_id}: launch {holder} in flight, attaching")
+            attached = True
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=409, detail="A launch is already in progress")
+        # if the holder fails it releases the reservation and the next pass takes it over
+        await asyncio.sleep(LAUNCH_POLL_S)
+
+
+def _try_reserve(store: SessionStore, user_id: str, vmid: str) -> tuple[dict | None, str | None]:
+    """
+    One reservation attempt: (the user's session, None) if they already have a VM,
+    (None, holder vmid) if another launch is in flight, (None, None) if it is ours.
+    """
+    existing = store.get_running_by_user(user_id)
+    if existing is not None:
+        return existing, None
+    holder = store.reserve_launch(user_id, vmid)
+    if holder is None:
+        # a launch may have written its session between the check and the SET
+        existing = store.get_running_by_user(user_id)
+        if existing is not None:
+            store.release_launch(user_id, vmid)
+    return existing, holder
+
+
+def _wants_async(req: Request) -> bool:
+    """`Prefer: respond-async` (RFC 7240): answer 202 + job and launch in the background."""
+    return "respond-async" in (req.headers.get("prefer") or "").lower()
+
+
+def _accepted(job: str) -> JSONResponse:
+    return JSONResponse(
+        {"job": job, "status": f"/vm/launch/{job}", "events": f"/vm/launch/{job}/events"},
+        status_code=202,
+        headers={"Location": f"/vm/launch/{job}"},
+    )
+
+
+async def _reserve_or_attach(req: Request, store: SessionStore, user_id: str, vmid: str) -> dict | JSONResponse | None:
+    """
+    _reserve_launch, except that an async request (`Prefer: respond-async`) is answered
+    with the in-flight launch's job (202) at once instead of waiting for its session.
+    """
+    if not _wants_async(req):
+        return await _reserve_launch(store, user_id, vmid)
+    existing, holder = _try_reserve(store, user_id, vmid)
+    return _accepted(holder) if holder is not None else existing
+
+
+def _failure_detail(e: Exception) -> str:
+    """What a launch failure looks like to the user (same wording as the synchronous errors)."""
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    if isinstance(e, NoCapacityError):
+        return "No capacity for a new VM right now, try again later"
+    if isinstance(e, FileNotFoundError):
+        return str(e)
+    return "Internal server error"
+
+
+async def _run_launch(req: Request, store: SessionStore, user_id: str, vmid: str, tag: str,
+                      launch: Callable[[Callable[..., None]], Awaitable[dict]]) -> JSONResponse:
+    """
+    Drive `launch(progress)` to its final payload, recording stage events under job
+    `vmid`, and release the user's launch reservation when it ends. By default the
+    request waits for it; with `Prefer: respond-async` it runs in the background and
+    the reply is 202 with the job, whose progress /vm/launch/{job}/events streams.
+    """
+    jobs = LaunchJobs(store.r)
+    try:
+        jobs.create(vmid, user_id)
+        progress = jobs.progress(vmid)
+        progress("reserved", vmid=vmid)
+    except BaseException:
+        store.release_launch(user_id, vmid)  # the caller handed the reservation over to us
+        raise
+
+    async def run() -> dict:
+        try:
+            result = await launch(progress)
+        except Exception as e:
+            progress("failed", detail=_failure_detail(e))
+            raise
+        finally:
+            store.release_launch(user_id, vmid)
+        progress("done", **result)
+        return result
+
+    if not _wants_async(req):
+        return JSONResponse(await run())
+
+    async def background() -> None:
+        try:
+            await run()
+        except Exception as e:
+            logger.exception(f"[{tag}] Background launch {vmid} failed for user {user_id}: {e}")
+
+    task = asyncio.create_task(background())
+    _LAUNCH_TASKS.add(task)
+    task.add_done_callback(_LAUNCH_TASKS.discard)
+    return _accepted(vmid)
+
+
+async def drain_launches(timeout_s: float = LAUNCH_DRAIN_S) -> None:
+    """
+    Shutdown: give background launches `timeout_s` to finish (so their VMs have a session
+    for the shutdown cleanup to find), then cancel the rest and wait for them.
+    """
+    pending = list(_LAUNCH_TASKS)
+    if not pending:
+        return
+    logger.info(f"[launch] waiting for {len(pending)} background launch(es)")
+    _, late = await asyncio.wait(pending, timeout=timeout_s)
+    for t in late:
+        t.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
 def parse_snapshot_name(name: str):
     """
     Parse "<userId>__<os_type>__<vmid>.qcow2" (path or filename).
@@ -56,6 +204,18 @@ def _novnc_redirect(req: Request, ws_path: str) -> str:
     host   = req.headers.get("x-forwarded-host")  or req.headers.get("host") or req.url.netloc
     return f"{scheme}://{host}/novnc/vnc.html?autoconnect=1&path={quote(ws_path, safe='/')}"
 
+def _viewer_query(vmid: str, role: str = "rw") -> str:
+    """`?token=…` for the WebSocket path: the owner's ("rw") or a share link's ("ro"), see ViewerTokens."""
+    ttl_s = VNC_OWNER_TOKEN_TTL_S if role == "rw" else VNC_SHARE_TTL_S
+    return f"?token={viewer_token(vmid, role, ttl_s)}"
+
+def _vm_redirect(req: Request, vmid: str, vm: dict, role: str = "rw") -> str:
+    """Same-origin noVNC redirect; VMs on worker nodes go through the API's relay (routers/node_proxy.py)."""
+    query = _viewer_query(vmid, role)
+    if is_local(vm) or not vm.get("node_host"):
+        return _novnc_redirect(req, f"ws/{vm['http_port']}{query}")
+    return _novnc_redirect(req, f"ws/{quote(vm['node_id'], safe='')}/{vm['http_port']}{query}")
+
 class RunScriptRequest(BaseModel):
     os_type: str
     snapshot: str | None = None  # optional, used by /run_snaphot
@@ -70,6 +230,14 @@ class RemoveSnapshotRequest(BaseModel):
     #vmid: str | None = None
     snapshot: str | None = None
 
+class IoLimitsRequest(BaseModel):
+    vmid: str
+    iops: int | None = None
+    bps: int | None = None
+    iops_max: int | None = None
+    bps_max: int | None = None
+    max_length: int | None = None
+
 
 @router.post("/run-script")
 async def run_vm_script(
@@ -79,51 +247,83 @@ async def run_vm_script(
     store: SessionStore = Depends(get_session_store),
     ws: WebsockifyService = Depends(get_websockify_service),
 ):
+    reserved = False
     try:
         user_id = str(user.id)
         vmid = secrets.token_hex(6)
         os_type = payload.os_type
 
-        # One VM per user
-        existing = store.get_running_by_user(user_id)
+        # One VM per user (a duplicate request attaches to the launch in flight)
+        existing = await _reserve_or_attach(req, store, user_id, vmid)
+        if isinstance(existing, JSONResponse):
+            return existing
+        reserved = existing is None
         if existing is not None:
             logger.info(f"[run_vm_script] User {user_id} already has VM {existing['vmid']}")
             return JSONResponse({
                 "message": f"VM already running for user {user.login}",
                 "vm": existing,
-                "redirect": _novnc_redirect(req, f"ws/{existing['http_port']}"),
+                "redirect": _vm_redirect(req, existing["vmid"], existing),
             })
 
         logger.info(f"[run_vm_script] Launch requested by {user.login} (id={user_id}); vmid={vmid}")
 
-        manager = QemuOverlayManager(user_id, vmid, os_type)
-        overlay_path = manager.create_overlay()
-        logger.info(f"[run_vm_script] Overlay ready at {overlay_path}")
-
-        meta = manager.boot_vm(vmid)  # returns vnc_socket or vnc_host+vnc_port (+ pid)
-        logger.info(f"[run_vm_script] VM booted (vmid={vmid})")
-
-        target = meta.get("vnc_socket") or f"{meta['vnc_host']}:{meta['vnc_port']}"
-        http_port = ws.start(vmid, target)
-        logger.info(f"[run_vm_script] Websockify on :{http_port} for VM {vmid}")
+        async def launch(progress) -> dict:
+            if CLUSTER_MODE:
+                placed = await get_scheduler().launch(user_id, vmid, os_type)
+                logger.info(f"[run_vm_script] VM {vmid} launched on node {placed['node_id']}")
+                redirect = _vm_redirect(req, vmid, {k: placed[k] for k in ("node_id", "node_host", "http_port")})
+                progress("bridge_ready", node_id=placed["node_id"], http_port=placed["http_port"], redirect=redirect)
+                return {
+                    "message": f"VM for user {user.login} launched (vmid={vmid})",
+                    "vm": {**placed["vm"], "node_id": placed["node_id"]},
+                    "redirect": redirect,
+                }
+
+            manager = QemuOverlayManager(user_id, vmid, os_type)
+            overlay_path = await asyncio.to_thread(manager.create_overlay)
+            logger.info(f"[run_vm_script] Overlay ready at {overlay_path}")
+            progress("overlay_ready")
+
+            # returns vnc_socket or vnc_host+vnc_port (+ pid)
+            meta = await asyncio.to_thread(manager.boot_vm, vmid)
+            logger.info(f"[run_vm_script] VM booted (vmid={vmid})")
+            progress("qemu_started", pid=meta["pid"])
+
+            target = meta.get("vnc_socket") or f"{meta['vnc_host']}:{meta['vnc_port']}"
+            http_port = await asyncio.to_thread(ws.start, vmid, target)
+            logger.info(f"[run_vm_script] Websockify on :{http_port} for VM {vmid}")
+
+            store.set(vmid, {
+                **meta,
+                "user_id": user_id,
+                "http_port": http_port,
+                "os_type": os_type,
+                "pid": meta['pid'],
+            })
+            redirect = _novnc_redirect(req, f"ws/{http_port}{_viewer_query(vmid)}")
+            progress("bridge_ready", http_port=http_port, redirect=redirect)
 
-        store.set(vmid, {
-            **meta,
-            "user_id": user_id,
-            "http_port": http_port,
-            "os_type": os_type,
-            "pid": meta['pid'],
-        })
+            return {
+                "message": f"VM for user {user.login} launched (vmid={vmid})",
+                "vm": {"vmid": vmid, **meta},
+                "redirect": redirect,
+            }
 
-        return JSONResponse({
-            "message": f"VM for user {user.login} launched (vmid={vmid})",
-            "vm": {"vmid": vmid, **meta},
-            "redirect": _novnc_redirect(req, f"ws/{http_port}"),
-        })
+        reserved = False  # _run_launch releases it from here on
+        return await _run_launch(req, store, user_id, vmid, "run_vm_script", launch)
 
+    except HTTPException:
+        raise
+    except NoCapacityError as e:
+        logger.warning(f"[run_vm_script] {e}")
+        raise HTTPException(status_code=503, detail=_failure_detail(e))
     except Exception as e:
         logger.exception(f"[run_vm_script] Failed for user {user.login} (id={user.id}): {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        if reserved:
+            store.release_launch(user_id, vmid)
 
 
 @router.post("/run-iso")
@@ -133,17 +333,21 @@ async def run_custom_iso(
     store: SessionStore = Depends(get_session_store),
     ws: WebsockifyService = Depends(get_websockify_service),
 ):
+    reserved = False
     try:
         user_id = str(user.id)
         vmid = secrets.token_hex(6)
 
-        # one VM per user
-        existing = store.get_running_by_user(user_id)
+        # one VM per user (a duplicate request attaches to the launch in flight)
+        existing = await _reserve_or_attach(req, store, user_id, vmid)
+        if isinstance(existing, JSONResponse):
+            return existing
+        reserved = existing is None
         if existing:
             return JSONResponse({
                 "message": f"VM already running for user {user.login}",
                 "vm": existing,
-                "redirect": _novnc_redirect(req, f"ws/{existing['http_port']}") + "&reconnect=1&reconnect_delay=1500",
+                "redirect": _vm_redirect(req, existing["vmid"], existing) + "&reconnect=1&reconnect_delay=1500",
             })
 
         # ---- ISO path resolution (unchanged logic) ----
@@ -177,40 +381,51 @@ async def run_custom_iso(
         iso_abs = str(iso_path.resolve(strict=True))
         logger.info(f"[run_custom_iso] Launching custom ISO for {user.login} (vmid={vmid}) at {iso_abs} (size={size} bytes)")
 
-        # Launch without overlays
-        manager = QemuOverlayManager(user_id, vmid, "custom")
-        meta = manager.boot_from_iso(vmid=vmid, iso_path=iso_abs)
-
-        target = meta.get("vnc_socket") or f"{meta['vnc_host']}:{meta['vnc_port']}"
-        http_port = ws.start(vmid, target)
-
-        # *** wait until websockify is actually listening to avoid race ***
-        _wait_listen("127.0.0.1", int(http_port))
-        logger.info(f"[run_custom_iso] websockify ready on 127.0.0.1:{http_port}")
+        async def launch(progress) -> dict:
+            # Launch without overlays
+            manager = QemuOverlayManager(user_id, vmid, "custom")
+            meta = await asyncio.to_thread(manager.boot_from_iso, vmid=vmid, iso_path=iso_abs)
+            progress("qemu_started", pid=meta["pid"])
+
+            target = meta.get("vnc_socket") or f"{meta['vnc_host']}:{meta['vnc_port']}"
+            http_port = await asyncio.to_thread(ws.start, vmid, target)
+
+            # *** wait until websockify is actually listening to avoid race ***
+            await asyncio.to_thread(_wait_listen, "127.0.0.1", int(http_port))
+            logger.info(f"[run_custom_iso] websockify ready on 127.0.0.1:{http_port}")
+
+            store.set(vmid, {
+                **meta,
+                "user_id": user_id,
+                "http_port": http_port,
+                "os_type": "custom",
+                "pid": meta["pid"],
+            })
 
-        store.set(vmid, {
-            **meta,
-            "user_id": user_id,
-            "http_port": http_port,
-            "os_type": "custom",
-            "pid": meta["pid"],
-        })
+            # auto-reconnect helps even if the very first attempt races by milliseconds
+            redirect_url = _novnc_redirect(req, f"ws/{http_port}{_viewer_query(vmid)}") + "&reconnect=1&reconnect_delay=1500"
+            progress("bridge_ready", http_port=http_port, redirect=redirect_url)
 
-        # auto-reconnect helps even if the very first attempt races by milliseconds
-        redirect_url = _novnc_redirect(req, f"ws/{http_port}") + "&reconnect=1&reconnect_delay=1500"
+            return {
+                "message": f"Custom ISO VM for {user.login} launched (vmid={vmid})",
+                "vm": {"vmid": vmid, **meta},
+                "redirect": redirect_url,
+            }
 
-        return JSONResponse({
-            "message": f"Custom ISO VM for {user.login} launched (vmid={vmid})",
-            "vm": {"vmid": vmid, **meta},
-            "redirect": redirect_url,
-        })
+        reserved = False  # _run_launch releases it from here on
+        return await _run_launch(req, store, user_id, vmid, "run_custom_iso", launch)
 
+    except HTTPException:
+        raise
     except FileNotFoundError as e:
         logger.exception(f"[run_custom_iso] ISO not found: {e}")
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.exception(f"[run_custom_iso] Failed for {user.login}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        if reserved:
+            store.release_launch(user_id, vmid)
 
 
 def _bytes_to_mb(n: int) -> int:
@@ -223,13 +438,13 @@ def _alloc_bytes(p: Path) -> int:
         blocks = getattr(st, "st_blocks", 0)
         if blocks:
             used = int(blocks) * 512
-            logger.info("[quota] file=%s blocks=%d used=%dB", p, blocks, used)
+            logger.debug("[quota] file=%s blocks=%d used=%dB", p, blocks, used)
             return used
         used = int(st.st_size)
-        logger.info("[quota] file=%s st_size=%dB (fallback)", p, used)
+        logger.debug("[quota] file=%s st_size=%dB (fallback)", p, used)
         return used
     except FileNotFoundError:
-        logger.info("[quota] file missing: %s", p)
+        logger.debug("[quota] file missing: %s", p)
         return 0
     except Exception as e:
         logger.warning("[quota] stat failed for %s: %s", p, e)
@@ -243,6 +458,7 @@ async def create_snapshot(
     db: Session = Depends(get_db),
 ):
     vmid = None
+    started = False
     try:
         os_type = (request.os_type or "").strip()
         if not os_type:
@@ -309,6 +525,8 @@ async def create_snapshot(
 
         # Create snapshot (your QMP-based or offline implementation)
         snap_name = f"{user.id}__{os_type}__{vmid}"
+        store.event("snapshot_started", vmid, user_id=user.id, os_type=os_type)
+        started = True
         out_path: Path = mgr.create_disk_snapshot(snap_name)
         logger.info("[snapshot] created file=%s billed_source=%s billed=%dMB",
                     str(out_path), charge_src, charge_mb)
@@ -319,6 +537,8 @@ async def create_snapshot(
 
         logger.info("[snapshot] OK user=%s vmid=%s total=%d/%dMB",
                     user.id, vmid, new_total, cap_mb)
+        store.event("snapshot_completed", vmid, user_id=user.id, os_type=os_type,
+                    snapshot=out_path.name, size_mb=charge_mb)
 
         return {
             "status": "ok",
@@ -334,9 +554,13 @@ async def create_snapshot(
         raise
     except OnlineSnapshotError as e:
         logger.error("[snapshot] failed user=%s vmid=%s error=%s", user.id, vmid, e)
+        if started:
+            store.event("snapshot_failed", vmid, user_id=user.id, error=str(e))
         raise HTTPException(status_code=500, detail=f"Snapshot error: {e}")
     except Exception as e:
         logger.exception("[snapshot] unexpected user=%s vmid=%s", user.id, vmid)
+        if started:
+            store.event("snapshot_failed", vmid, user_id=user.id, error=str(e))
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
 
 
@@ -348,6 +572,7 @@ async def run_snapshot(
     store: SessionStore = Depends(get_session_store),
     ws: WebsockifyService = Depends(get_websockify_service),
 ):
+    reserved = False
     try:
         snap_name = (payload.snapshot or "").strip()
         if not snap_name:
@@ -357,14 +582,17 @@ async def run_snapshot(
         user_id, os_type, vmid = parse_snapshot_name(snap_name)
         logger.info(f"[run_snapshot] {snap_name} parsed -> uid={user_id} os={os_type} vmid={vmid}")
 
-        # One VM per user
-        existing = store.get_running_by_user(user_id)
+        # One VM per user (a duplicate request attaches to the launch in flight)
+        existing = await _reserve_or_attach(req, store, user_id, vmid)
+        if isinstance(existing, JSONResponse):
+            return existing
+        reserved = existing is None
         if existing is not None:
             logger.info(f"[run_snapshot] User {user_id} already has VM {existing['vmid']}")
             return JSONResponse({
                 "message": f"VM already running for user {user.login}",
                 "vm": existing,
-                "redirect": _novnc_redirect(req, f"ws/{existing['http_port']}"),
+                "redirect": _vm_redirect(req, existing["vmid"], existing),
             })
 
         # Resolve snapshot path (accept absolute or look up in SNAPSHOTS_PATH)
@@ -377,37 +605,176 @@ async def run_snapshot(
         logger.info(f"[run_snapshot] Launch from snapshot requested by {user.login} "
                     f"(uid={user_id}); vmid={vmid}; snap={snap_path}")
 
-        # Boot directly from snapshot image (no overlay)
-        manager = QemuOverlayManager(user_id=user_id, vmid=vmid, os_type=os_type)
-        meta = manager.boot_vm(vmid, drive_path=str(snap_path))
-        logger.info(f"[run_snapshot] VM booted from snapshot (vmid={vmid}) meta={meta}")
-
-        # Start websockify for the VM's VNC target
-        target = meta.get("vnc_socket") or f"{meta['vnc_host']}:{meta['vnc_port']}"
-        http_port = ws.start(vmid, target)
-        logger.info(f"[run_snapshot] Websockify on :{http_port} for VM {vmid}")
-
-        # Persist session
-        store.set(vmid, {
-            **meta,
-            "user_id": user_id,
-            "http_port": http_port,
-            "os_type": os_type,
-            "pid": meta["pid"],
-        })
-
-        # Same-origin redirect for noVNC (Cloudflare-safe)
-        return JSONResponse({
-            "message": f"VM for user {user.login} launched from snapshot (vmid={vmid})",
-            "vm": {"vmid": vmid, **meta},
-            "redirect": _novnc_redirect(req, f"ws/{http_port}"),
-        })
+        async def launch(progress) -> dict:
+            # Boot directly from snapshot image (no overlay)
+            manager = QemuOverlayManager(user_id=user_id, vmid=vmid, os_type=os_type)
+            meta = await asyncio.to_thread(manager.boot_vm, vmid, drive_path=str(snap_path))
+            logger.info(f"[run_snapshot] VM booted from snapshot (vmid={vmid}) meta={meta}")
+            progress("qemu_started", pid=meta["pid"])
+
+            # Start websockify for the VM's VNC target
+            target = meta.get("vnc_socket") or f"{meta['vnc_host']}:{meta['vnc_port']}"
+            http_port = await asyncio.to_thread(ws.start, vmid, target)
+            logger.info(f"[run_snapshot] Websockify on :{http_port} for VM {vmid}")
+
+            # Persist session
+            store.set(vmid, {
+                **meta,
+                "user_id": user_id,
+                "http_port": http_port,
+                "os_type": os_type,
+                "pid": meta["pid"],
+            })
+
+            # Same-origin redirect for noVNC (Cloudflare-safe)
+            redirect = _novnc_redirect(req, f"ws/{http_port}{_viewer_query(vmid)}")
+            progress("bridge_ready", http_port=http_port, redirect=redirect)
+            return {
+                "message": f"VM for user {user.login} launched from snapshot (vmid={vmid})",
+                "vm": {"vmid": vmid, **meta},
+                "redirect": redirect,
+            }
+
+        reserved = False  # _run_launch releases it from here on
+        return await _run_launch(req, store, user_id, vmid, "run_snapshot", launch)
 
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"[run_snapshot] Failed for user {user.login} (id={user.id}): {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        if reserved:
+            store.release_launch(user_id, vmid)
+
+
+def _job_info(jobs: LaunchJobs, store: SessionStore, job: str, user_id: str) -> dict | None:
+    """
+    The job's record. A duplicate request is pointed at the launch holding the user's
+    reservation, which may not have created its job yet (it validates its input first):
+    while the reservation is live that job is pending, not missing.
+    """
+    info = jobs.get(job)
+    if info is None and store.launch_holder(user_id) == job:
+        return {"job": job, "user_id": user_id, "state": "pending"}
+    return info
+
+
+def _own_job(jobs: LaunchJobs, store: SessionStore, job: str, user: User) -> dict:
+    info = _job_info(jobs, store, job, str(user.id))
+    if info is None or info.get("user_id") != str(user.id):
+        raise HTTPException(status_code=404, detail="Launch not found")
+    return info
+
+
+@router.get("/launch/{job}")
+async def launch_status(
+    job: str,
+    user: User = Depends(get_current_user),
+    store: SessionStore = Depends(get_session_store),
+):
+    """A launch's state and every stage event so far (for clients without EventSource)."""
+    jobs = LaunchJobs(store.r)
+    info = _own_job(jobs, store, job, user)
+    return {**info, "events": [{"id": eid, **ev} for eid, ev in jobs.events(job)]}
+
+
+@router.get("/launch/{job}/events")
+async def launch_events(
+    job: str,
+    req: Request,
+    user: User = Depends(get_current_user),
+    store: SessionStore = Depends(get_session_store),
+):
+    """
+    Server-Sent Events: one event per launch stage (reserved, overlay_ready, qemu_started,
+    bridge_ready with the redirect, then done or failed), replayed from the start or from
+    Last-Event-ID on reconnect. The stream ends after done/failed.
+    """
+    jobs = LaunchJobs(store.r)
+    _own_job(jobs, store, job, user)
+    after = req.headers.get("last-event-id") or "0-0"
+
+    async def stream():
+        last = after
+        quiet_since = time.monotonic()
+        yield "retry: 1000\n\n"
+        while True:
+            batch = jobs.events(job, last)
+            for eid, ev in batch:
+                last = eid
+                yield f"id: {eid}\nevent: {ev['stage']}\ndata: {json.dumps(ev)}\n\n"
+                if ev["stage"] in FINAL_STAGES:
+                    return
+            if batch:
+                quiet_since = time.monotonic()
+            elif _job_info(jobs, store, job, str(user.id)) is None:  # expired, or gave up before it started
+                yield f"event: failed\ndata: {json.dumps({'stage': 'failed', 'detail': 'Launch expired'})}\n\n"
+                return
+            elif time.monotonic() - quiet_since >= SSE_KEEPALIVE_S:
+                quiet_since = time.monotonic()
+                yield ": keepalive\n\n"
+            if await req.is_disconnected():
+                return
+            await asyncio.sleep(LAUNCH_POLL_S)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # nginx: flush each event instead of buffering the response
+    })
+
+
+@router.get("/share/{vmid}")
+async def share_link(
+    vmid: str,
+    req: Request,
+    user: User = Depends(get_current_user),
+    store: SessionStore = Depends(get_session_store),
+):
+    """
+    A read-only viewer link for one of the caller's running VMs. Viewers share the
+    owner's VNC connection (VNC_SHARING or the profile's "vnc" share policy, native
+    bridge only) and never get input. The link's signed token can be opened for
+    VNC_SHARE_TTL_S, and its viewers are dropped when the owner leaves.
+    """
+    vm = store.get(vmid)
+    if not vm or vm.get("user_id") != str(user.id) or not vm.get("http_port"):
+        raise HTTPException(status_code=404, detail=f"VM {vmid} is not running")
+    policy = vnc_options(VM_PROFILES.get(vm.get("os_type"), {}))["share"] or VNC_SHARING
+    if VNC_BRIDGE != "native" or policy == "off":
+        raise HTTPException(status_code=409, detail="Session sharing is disabled")
+    return {"vmid": vmid, "redirect": _vm_redirect(req, vmid, vm, role="ro"), "expires_in": VNC_SHARE_TTL_S}
+
+
+@router.get("/thumb/{vmid}")
+async def vm_thumbnail(
+    vmid: str,
+    req: Request,
+    user: User = Depends(get_current_user),
+    store: SessionStore = Depends(get_session_store),
+    thumbs: ThumbnailCache = Depends(get_thumbnail_cache),
+):
+    """
+    Screen thumbnail of a running VM (owner or admin). Each request keeps the VM on its
+    node's capture list for THUMB_DEMAND_S; until the first capture lands the answer is
+    202 + Retry-After. Revalidate with If-None-Match: an unchanged screen is a 304.
+    """
+    vm = store.get(vmid)
+    if not vm or (vm.get("user_id") != str(user.id) and user.role != "admin"):
+        raise HTTPException(status_code=404, detail=f"VM {vmid} is not running")
+    thumbs.want(vmid)
+    thumb = thumbs.get(vmid)
+    if thumb is None:
+        return JSONResponse({"vmid": vmid, "status": "pending"}, status_code=202,
+                            headers={"Retry-After": str(max(1, round(1 / THUMB_RATE_PER_S)))})
+    headers = {
+        "ETag": f'"{thumb.etag}"',
+        "Cache-Control": f"private, max-age={THUMB_MIN_INTERVAL_S}",
+        "Last-Modified": formatdate(thumb.ts, usegmt=True),
+    }
+    if f'"{thumb.etag}"' in req.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(thumb.data, media_type=thumb.media_type, headers=headers)
 
 
 @router.get("/get_user_snapshots")
@@ -489,4 +856,32 @@ async def remove_snapshot(
         raise
     except Exception as e:
         logger.exception("[snapshot] remove failed user=%s", user.id)
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
+
+
+@router.post("/io_limits")
+async def set_io_limits(
+    payload: IoLimitsRequest,
+    user: User = Depends(get_current_user),
+    store: SessionStore = Depends(get_session_store),
+):
+    """
+    Admin only: replace a running VM's block I/O limits live (unset/0 = unlimited).
+    Holds until the VM restarts or the fair-share policy next tightens/restores it.
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    sess = store.get(payload.vmid)
+    if not sess:
+        raise HTTPException(status_code=404, detail=f"VM {payload.vmid} is not running")
+    try:
+        limits = normalize_io_limits(payload.model_dump(exclude={"vmid"}))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        disks = await set_vm_io_limits(payload.vmid, sess, limits)
+    except QMPError as e:
+        logger.warning(f"[set_io_limits] {payload.vmid}: {e}")
+        raise HTTPException(status_code=502, detail="QMP request failed")
+    logger.info(f"[set_io_limits] {user.login} set {payload.vmid} → {limits or 'unlimited'}")
+    return {"vmid": payload.vmid, "limits": limits, "updated": disks}
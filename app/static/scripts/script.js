@@ -384,11 +384,72 @@ async function ensureAuthOrRedirect() {
   // VM launch — EVENT DELEGATION (works for clones)
   // =====================
 
+  // --- Launch progress: the API answers 202 + job, stages arrive over SSE ---
+  const LAUNCH_STAGES = {
+    reserved: "Reserving your VM…",
+    overlay_ready: "Disk ready, booting…",
+    qemu_started: "VM is up, starting the display…",
+    bridge_ready: "Display ready, connecting…",
+  };
+
+  function showLaunchStatus(text) {
+    let el = document.getElementById("launch-status");
+    if (!el) {
+      el = document.createElement("div");
+      el.id = "launch-status";
+      el.className = "launch-status";
+      el.setAttribute("role", "status");
+      document.body.appendChild(el);
+    }
+    el.textContent = text || "";
+    el.hidden = !text;
+  }
+
+  // Resolves with the redirect as soon as the bridge is ready; rejects with the failure detail.
+  function followLaunch(eventsUrl) {
+    return new Promise((resolve, reject) => {
+      const es = new EventSource(eventsUrl, { withCredentials: true });
+      const on = (stage, fn) => es.addEventListener(stage, (e) => fn(JSON.parse(e.data)));
+      const finish = (fn) => (ev) => { es.close(); fn(ev); };
+
+      Object.keys(LAUNCH_STAGES).forEach((stage) => on(stage, (ev) => {
+        showLaunchStatus(LAUNCH_STAGES[stage]);
+        if (ev.redirect) { es.close(); resolve(ev.redirect); }
+      }));
+      on("done", finish((ev) => resolve(ev.redirect)));
+      on("failed", finish((ev) => reject(new Error(ev.detail || "VM launch failed"))));
+      // transient drops reconnect on their own (Last-Event-ID); a closed stream is final
+      es.onerror = () => {
+        if (es.readyState === EventSource.CLOSED) reject(new Error("Lost track of the VM launch"));
+      };
+    });
+  }
+
+  // POST a launch; 202 → follow its progress, 200 → the user's VM already exists.
+  async function launchVM(url, init = {}) {
+    const res = await fetch(url, {
+      method: "POST",
+      credentials: "include",
+      ...init,
+      headers: { ...(init.headers || {}), Prefer: "respond-async" },
+    });
+    if (res.status !== 202) return res;
+
+    const job = await res.json();
+    try {
+      window.location.href = await followLaunch(job.events);
+    } finally {
+      showLaunchStatus("");
+    }
+    return null;
+  }
+
   // --- Unified launcher with safeguard ---
   async function runVM(os_type) {
     // If custom, go straight to /vm/run-iso (no body)
     if (os_type === "custom") {
-      const res = await fetch("/vm/run-iso", { method: "POST", credentials: "include" });
+      const res = await launchVM("/vm/run-iso");
+      if (!res) return;
       if (res.status === 401) { window.location.href = SIGNUP_URL; return; }
 
       let data = null, text = "";
@@ -401,12 +462,11 @@ async function ensureAuthOrRedirect() {
 
     // Non-custom → /vm/run-script
     try {
-      const res = await fetch("/vm/run-script", {
-        method: "POST",
+      const res = await launchVM("/vm/run-script", {
         headers: { "Content-Type": "application/json" },
-        credentials: "include",
         body: JSON.stringify({ os_type }),
       });
+      if (!res) return;
 
       if (res.status === 401) { window.location.href = SIGNUP_URL; return; }
 
@@ -30,16 +30,57 @@ def _to_int(val: Optional[str]) -> Optional[int]:
         return None
 
 
+def session_files(vmid: str, session: dict) -> list[Path]:
+    """Disk artefacts owned by a session: its overlay (or custom ISO)."""
+    os_type = session.get("os_type")
+    if os_type == "custom":
+        iso_path = session.get("iso")
+        return [Path(iso_path)] if iso_path else []
+    overlay_path = session.get("overlay_path")
+    if overlay_path:
+        return [Path(overlay_path)]
+    if os_type and os_type in VM_PROFILES and VM_PROFILES[os_type].get("overlay_dir"):
+        profile = VM_PROFILES[os_type]
+        return [profile["overlay_dir"] / f"{profile['overlay_prefix']}_{vmid}.qcow2"]
+    return []
+
+
+def run_files(vmid: str) -> list[Path]:
+    """Per-VM runtime files in RUN_DIR (VNC/QMP sockets, QEMU pidfile)."""
+    return [RUN_DIR / f"vnc-{vmid}.sock", RUN_DIR / f"qmp-{vmid}.sock", RUN_DIR / f"qemu-{vmid}.pid"]
+
+
+def _stop_remote(vmid: str, session: dict, store) -> None:
+    """A VM on another node: only that node's agent may kill its processes and delete its files."""
+    from methods.manager.NodeRegistry import stop_on_node  # methods.manager imports utils
+
+    node_id = session.get("node_id")
+    stopped = stop_on_node(node_id, vmid)
+    if stopped is None:
+        logger.warning(f"[cleanup_vm] node {node_id} of VM {vmid} is gone; dropping the session")
+        store.delete(vmid)
+    elif stopped:
+        logger.info(f"[cleanup_vm] VM {vmid} stopped by its node {node_id}")
+    else:
+        logger.warning(f"[cleanup_vm] node {node_id} did not stop VM {vmid}; its session reaper will")
+
+
 def cleanup_vm(vmid: str, store) -> None:
     """
     Cleans up QEMU VM processes, sockets, overlay/scratch/custom ISO file for a given VM ID.
     `store` is a Redis-backed SessionStore with `.get(vmid)` and `.delete(vmid)`.
+    A VM running on another node (cluster mode) is handed to that node's agent (/agent/stop).
     """
+    from methods.manager.SessionManager import is_local
+
     try:
         session = store.get(vmid)
         if not session:
             logger.warning(f"[cleanup_vm] No active session found for VM {vmid}")
             return
+        if not is_local(session):
+            _stop_remote(vmid, session, store)
+            return
 
         user_id = session.get("user_id")
         os_type = session.get("os_type")
@@ -47,22 +88,7 @@ def cleanup_vm(vmid: str, store) -> None:
         logger.info(f"[cleanup_vm] Cleaning VM {vmid} (user={user_id}, os={os_type})")
 
         # Figure out what to remove later
-        files_to_remove = []
-
-        if os_type == "custom":
-            iso_path = session.get("iso")
-            if iso_path:
-                files_to_remove.append(Path(iso_path))
-        else:
-            overlay_path = session.get("overlay_path")
-            if overlay_path:
-                files_to_remove.append(Path(overlay_path))
-            else:
-                if os_type and os_type in VM_PROFILES:
-                    profile = VM_PROFILES[os_type]
-                    files_to_remove.append(
-                        profile["overlay_dir"] / f"{profile['overlay_prefix']}_{vmid}.qcow2"
-                    )
+        files_to_remove = session_files(vmid, session)
 
         # Kill processes
         qemu_pid = _to_int(session.get("qemu_pid") or session.get("pid"))
@@ -97,14 +123,14 @@ def cleanup_vm(vmid: str, store) -> None:
             except Exception:
                 logger.exception(f"[cleanup_vm] Failed to delete {f}")
 
-        # Remove sockets
-        for sock in (RUN_DIR / f"vnc-{vmid}.sock", RUN_DIR / f"qmp-{vmid}.sock"):
+        # Remove sockets and pidfile
+        for sock in run_files(vmid):
             try:
                 if sock.exists():
                     sock.unlink()
-                    logger.info(f"[cleanup_vm] Removed socket {sock}")
+                    logger.info(f"[cleanup_vm] Removed {sock}")
             except Exception:
-                logger.exception(f"[cleanup_vm] Failed to remove socket {sock}")
+                logger.exception(f"[cleanup_vm] Failed to remove {sock}")
 
         # Finally drop from Redis
         try:
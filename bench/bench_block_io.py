@@ -0,0 +1,116 @@
+# /bench/bench_block_io.py
+"""
+Guest-free block I/O benchmark for the per-profile "block" options.
+
+Runs `qemu-img bench` against a fresh qcow2 overlay on top of the profile's base image
+(the same chain a VM boots from) once for the historical defaults, once per single
+option that the profile changes, and once for the full profile, so the effect of each
+knob is visible in isolation.
+
+    cd app && python ../bench/bench_block_io.py --profile ubuntu --json /tmp/block.json
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+sys.path.insert(0, str(APP_DIR))
+
+from configs.config import VM_PROFILES  # noqa: E402
+from methods.manager.OverlayManager import (  # noqa: E402
+    BLOCK_DEFAULTS, block_options, qcow2_runtime_opts,
+)
+
+_RUN_RE = re.compile(r"Run completed in ([0-9.]+) seconds")
+
+
+def _variants(profile: dict) -> list[tuple[str, dict]]:
+    tuned = block_options(profile)
+    out = [("defaults", dict(BLOCK_DEFAULTS))]
+    for key, value in tuned.items():
+        if key in ("iothread", "blockdev") or value == BLOCK_DEFAULTS[key]:
+            continue  # device-side options have no qemu-img equivalent
+        opts = {**BLOCK_DEFAULTS, key: value}
+        if key == "aio" and value == "native":
+            opts["cache"] = "none"
+        out.append((f"{key}={value}", opts))
+    for aio in ("threads", "native", "io_uring"):
+        if aio != tuned["aio"]:
+            out.append((f"aio={aio}", {**tuned, "aio": aio,
+                                      "cache": "none" if aio == "native" else tuned["cache"]}))
+    out.append(("profile", tuned))
+    return out
+
+
+def _bench_once(base: Path, opts: dict, *, write: bool, count: int, depth: int,
+                size: str, workdir: Path) -> float:
+    overlay = workdir / "bench-overlay.qcow2"
+    overlay.unlink(missing_ok=True)
+    subprocess.check_call(
+        ["qemu-img", "create", "-q", "-f", "qcow2", "-F", "qcow2", "-b", str(base), str(overlay)]
+    )
+    image_opts = ",".join([
+        "driver=qcow2", f"file.filename={overlay}", f"discard={opts['discard']}",
+        *qcow2_runtime_opts(opts),
+    ])
+    cmd = [
+        "qemu-img", "bench", "--image-opts",
+        "-c", str(count), "-d", str(depth), "-s", size,
+        "-t", opts["cache"], "-i", opts["aio"],
+    ]
+    if write:
+        cmd.append("-w")
+    cmd.append(image_opts)
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"qemu-img bench failed: {res.stderr.strip()}")
+    m = _RUN_RE.search(res.stdout)
+    if not m:
+        raise RuntimeError(f"unexpected qemu-img bench output: {res.stdout!r}")
+    return float(m.group(1))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profile", default="alpine", choices=[k for k, p in VM_PROFILES.items() if p.get("overlay_dir")])
+    ap.add_argument("--base", type=Path, help="override the profile's base image")
+    ap.add_argument("--count", type=int, default=20000, help="requests per run")
+    ap.add_argument("--depth", type=int, default=16, help="queue depth")
+    ap.add_argument("--size", default="4k", help="request size")
+    ap.add_argument("--json", type=Path, help="write results as JSON")
+    args = ap.parse_args(argv)
+
+    profile = VM_PROFILES[args.profile]
+    base = args.base or Path(profile["base_image"])
+    if not base.exists():
+        ap.error(f"base image not found: {base}")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="blockbench_", dir=base.parent) as tmp:
+        for name, opts in _variants(profile):
+            row = {"variant": name, "options": opts}
+            for mode in ("read", "write"):
+                try:
+                    secs = _bench_once(base, opts, write=(mode == "write"), count=args.count,
+                                       depth=args.depth, size=args.size, workdir=Path(tmp))
+                    row[f"{mode}_s"] = secs
+                    row[f"{mode}_iops"] = round(args.count / secs) if secs else None
+                except Exception as e:
+                    row[f"{mode}_error"] = str(e)
+            results.append(row)
+            print(f"{name:<28} read {row.get('read_iops', '-'):>8} iops   "
+                  f"write {row.get('write_iops', '-'):>8} iops")
+
+    if args.json:
+        args.json.write_text(json.dumps({"profile": args.profile, "base": str(base),
+                                         "count": args.count, "depth": args.depth,
+                                         "size": args.size, "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# /bench/bench_http_metrics.py
+"""
+Per-request overhead of the HTTP metrics middleware.
+
+Drives a tiny FastAPI app directly through ASGI (no server, no sockets) with:
+  - no metrics middleware (baseline),
+  - the previous @app.middleware("http") installer (BaseHTTPMiddleware under the hood),
+  - the pure-ASGI HTTPMetricsMiddleware,
+and prints µs/request and the overhead over the baseline.
+
+    cd app && python ../bench/bench_http_metrics.py --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+sys.path.insert(0, str(APP_DIR))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from prometheus_client import CollectorRegistry, Counter, Histogram  # noqa: E402
+
+from observability.http_metrics import HTTPMetricsMiddleware  # noqa: E402
+
+
+def _base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/vm/{vmid}")
+    async def vm(vmid: str):
+        return {"vmid": vmid}
+
+    return app
+
+
+def _legacy_app() -> FastAPI:
+    """The installer this middleware replaced (separate registry, same work per request)."""
+    app = _base_app()
+    reg = CollectorRegistry()
+    lat = Histogram("legacy_duration_seconds", "", ["path", "method", "status"], registry=reg)
+    cnt = Counter("legacy_requests_total", "", ["path", "method", "status"], registry=reg)
+
+    @app.middleware("http")
+    async def _metrics_middleware(request: Request, call_next):
+        path = getattr(request.scope.get("route"), "path", request.url.path)
+        start = time.perf_counter()
+        resp = await call_next(request)
+        status = str(resp.status_code)
+        lat.labels(path=path, method=request.method, status=status).observe(time.perf_counter() - start)
+        cnt.labels(path=path, method=request.method, status=status).inc()
+        return resp
+
+    return app
+
+
+def _asgi_app() -> FastAPI:
+    app = _base_app()
+    app.add_middleware(HTTPMetricsMiddleware)
+    return app
+
+
+async def _drive(app, n: int) -> float:
+    never = asyncio.Event()
+
+    def receiver():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await never.wait()  # client stays connected
+
+        return receive
+
+    async def send(message):
+        pass
+
+    def scope(i: int) -> dict:
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": f"/vm/{i:012x}", "raw_path": b"",
+            "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+
+    for i in range(200):  # warm-up: route compilation, label children
+        await app(scope(i), receiver(), send)
+    t0 = time.perf_counter()
+    for i in range(n):
+        await app(scope(i), receiver(), send)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=20000)
+    ap.add_argument("--rounds", type=int, default=3, help="best-of rounds per variant")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    variants = {"none": _base_app, "legacy_http_middleware": _legacy_app, "pure_asgi": _asgi_app}
+    results = {}
+    for name, factory in variants.items():
+        app = factory()
+        results[name] = min(asyncio.run(_drive(app, args.requests)) for _ in range(args.rounds))
+
+    base = results["none"]
+    print(f"{'variant':<24}{'µs/req':>10}{'overhead µs':>14}")
+    for name, us in results.items():
+        print(f"{name:<24}{us:>10.1f}{us - base:>14.1f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"requests": args.requests,
+                                               "us_per_request": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# /bench/bench_launch.py
+"""
+End-to-end launch benchmark against the stand-in binaries in tests/fakes/ (no guests).
+
+Each simulated user runs the same path as /run-script: overlay (qemu-img create) →
+boot_vm (QEMU -daemonize, pidfile wait) → VNC bridge → session in Redis, then opens the
+bridge as a browser would (WebSocket, RFB handshake) until the first framebuffer update.
+Closing the WebSocket triggers the bridge's own cleanup (cleanup_vm); cleanup time runs
+until the QEMU process is gone and the session is out of Redis.
+
+Reported per concurrency level (users launching at the same moment): launches/sec,
+p50/p99 launch latency, p50/p99 cleanup time, and memory per session (fake QEMU RSS,
+which FAKE_QEMU_RSS_MB can inflate, and bridge RSS: in-process growth for the native
+bridge, child processes for websockify).
+
+Redis is an in-process fakeredis TCP server unless --redis-url points at a real one.
+
+    python bench/bench_launch.py --levels 1 10 100 --rounds 3 --json /tmp/launch.json
+    python bench/bench_launch.py --bridge websockify --no-connect
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+
+import psutil
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_DIR = ROOT / "app"
+FAKES = ROOT / "tests" / "fakes"
+sys.path.insert(0, str(APP_DIR))
+
+PROFILE = "bench"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100); 0 for an empty sample."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+
+def _rss(pid: int) -> int:
+    try:
+        return psutil.Process(pid).memory_info().rss
+    except psutil.Error:
+        return 0
+
+
+def _gone(pid: int) -> bool:
+    try:
+        return psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return True
+
+
+def fake_environment(work: Path, bridge: str = "native", redis_url: str | None = None) -> None:
+    """Point the app at the fakes (and a Redis) before configs.config is imported."""
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{work / 'bench.db'}")
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ.setdefault("LOG_DIR", str(work / "logs"))
+    os.environ["QEMU_BIN"] = str(FAKES / "qemu-system-x86_64")
+    os.environ["QEMU_IMG_BIN"] = str(FAKES / "qemu-img")
+    os.environ["WEBSOCKIFY_BIN"] = str(FAKES / "websockify")
+    os.environ["VNC_BRIDGE"] = bridge
+    os.environ["OVERLAY_POOL_SIZE"] = "0"
+    if redis_url:
+        os.environ["REDIS_URL"] = redis_url
+    else:
+        import fakeredis
+
+        port = _free_port()
+        server = fakeredis.TcpFakeServer(("127.0.0.1", port))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["REDIS_URL"] = f"redis://127.0.0.1:{port}/0"
+
+
+def add_bench_profile(work: Path, memory_mb: int) -> None:
+    """A VM profile whose base image and overlays live in the scratch dir."""
+    import configs.config as cfg
+
+    base = work / "base.qcow2"
+    base.write_bytes(b"QFI\xfb".ljust(65536, b"\0"))
+    overlays = work / "overlays"
+    overlays.mkdir(exist_ok=True)
+    cfg.VM_PROFILES[PROFILE] = {
+        "overlay_dir": overlays, "overlay_prefix": PROFILE, "base_image": base,
+        "default_memory": memory_mb, "smp": 1,
+    }
+
+
+def _rfb_first_frame(port: int, timeout: float) -> ExitStack:
+    """Browser side: WebSocket to the bridge, RFB 3.8 handshake, wait for the first update."""
+    from websockets.sync.client import connect
+
+    deadline = time.perf_counter() + timeout
+    stack = ExitStack()
+    while True:  # websockify may still be binding its port; the browser retries too
+        try:
+            ws = stack.enter_context(connect(f"ws://127.0.0.1:{port}", subprotocols=["binary"],
+                                             open_timeout=timeout, compression=None, max_size=None))
+            break
+        except ConnectionRefusedError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.01)
+    buf = bytearray()
+
+    def take(n: int) -> bytes:
+        while len(buf) < n:
+            buf.extend(ws.recv(timeout=timeout))
+        out = bytes(buf[:n])
+        del buf[:n]
+        return out
+
+    version = take(12)
+    ws.send(version)
+    n_types = take(1)[0]
+    ws.send(take(n_types)[:1])
+    if struct.unpack(">I", take(4))[0] != 0:
+        raise RuntimeError("RFB security handshake refused")
+    ws.send(b"\x01")                                  # ClientInit: shared
+    (name_len,) = struct.unpack(">20xI", take(24))
+    take(name_len)
+    ws.send(struct.pack(">BBHHHH", 3, 0, 0, 0, 0xFFFF, 0xFFFF))  # full FramebufferUpdateRequest
+    if take(1)[0] != 0:
+        raise RuntimeError("expected a FramebufferUpdate")
+    return stack
+
+
+class Bench:
+    def __init__(self, args, work: Path) -> None:
+        from methods.manager import get_websockify_service
+        from methods.manager.OverlayManager import QemuOverlayManager
+        from methods.manager.SessionManager import get_session_store
+        from utils import cleanup_vm
+
+        add_bench_profile(work, args.memory_mb)
+        self.args = args
+        self.store = get_session_store()
+        self.bridge = get_websockify_service()
+        self._manager = QemuOverlayManager
+        self._cleanup_vm = cleanup_vm
+
+    def launch(self, user_id: str) -> dict:
+        vmid = uuid.uuid4().hex[:12]
+        t0 = time.perf_counter()
+        manager = self._manager(user_id, vmid, PROFILE)
+        manager.create_overlay()
+        meta = manager.boot_vm(vmid)
+        port = self.bridge.start(vmid, meta["vnc_socket"])
+        self.store.set(vmid, {**meta, "user_id": user_id, "http_port": port, "os_type": PROFILE})
+        viewer = _rfb_first_frame(port, self.args.timeout) if self.args.connect else None
+        return {"vmid": vmid, "pid": meta["pid"], "viewer": viewer, "launch_s": time.perf_counter() - t0}
+
+    def cleanup(self, vm: dict) -> float:
+        t0 = time.perf_counter()
+        if vm["viewer"] is not None:
+            vm["viewer"].close()                      # the bridge cleans up on disconnect
+        else:
+            self.bridge.stop(vm["vmid"])
+            self._cleanup_vm(vm["vmid"], self.store)
+        deadline = t0 + self.args.timeout
+        while not (_gone(vm["pid"]) and self.store.get(vm["vmid"]) is None):
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"{vm['vmid']} not cleaned up after {self.args.timeout}s")
+            time.sleep(0.005)
+        return time.perf_counter() - t0
+
+    def teardown(self) -> None:
+        """Stop whatever a failed round left behind."""
+        for vmid, _ in self.store.items():
+            self.bridge.stop(vmid)
+            self._cleanup_vm(vmid, self.store)
+
+    def bridge_rss(self) -> int:
+        me = psutil.Process()
+        rss = me.memory_info().rss
+        for child in me.children(recursive=True):
+            try:
+                if any(Path(a).name == "websockify" for a in child.cmdline()[:3]):
+                    rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def level(self, users: int) -> dict:
+        launches, cleanups, qemu_rss, bridge_rss = [], [], [], []
+        launch_wall = 0.0
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            for _ in range(self.args.rounds):
+                before = self.bridge_rss()
+                t0 = time.perf_counter()
+                vms = list(pool.map(self.launch, (f"bench-{i}" for i in range(users))))
+                launch_wall += time.perf_counter() - t0
+                launches += [vm["launch_s"] for vm in vms]
+                qemu_rss.append(sum(_rss(vm["pid"]) for vm in vms) / users)
+                bridge_rss.append(max(self.bridge_rss() - before, 0) / users)
+                cleanups += list(pool.map(self.cleanup, vms))
+        mib = 1 << 20
+        return {
+            "users": users,
+            "launches": len(launches),
+            "launches_per_s": round(len(launches) / launch_wall, 2) if launch_wall else 0.0,
+            "launch_p50_ms": round(percentile(launches, 50) * 1000, 1),
+            "launch_p99_ms": round(percentile(launches, 99) * 1000, 1),
+            "cleanup_p50_ms": round(percentile(cleanups, 50) * 1000, 1),
+            "cleanup_p99_ms": round(percentile(cleanups, 99) * 1000, 1),
+            "qemu_rss_mib_per_session": round(sum(qemu_rss) / len(qemu_rss) / mib, 2),
+            "bridge_rss_mib_per_session": round(sum(bridge_rss) / len(bridge_rss) / mib, 2),
+        }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--levels", type=int, nargs="+", default=[1, 10, 100], help="concurrent users per level")
+    ap.add_argument("--rounds", type=int, default=3, help="launch/cleanup rounds per level")
+    ap.add_argument("--bridge", choices=("native", "websockify"), default="native")
+    ap.add_argument("--no-connect", dest="connect", action="store_false",
+                    help="skip the browser side; clean up with bridge.stop + cleanup_vm")
+    ap.add_argument("--memory-mb", type=int, default=256, help="-m passed to the fake QEMU")
+    ap.add_argument("--qemu-rss-mb", type=int, default=0, help="resident ballast per fake QEMU")
+    ap.add_argument("--boot-ms", type=int, default=0, help="fake QEMU start-up delay")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--redis-url", help="real Redis instead of in-process fakeredis")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--verbose", action="store_true", help="show app logs")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    with tempfile.TemporaryDirectory(prefix="bench-launch-") as tmp:
+        work = Path(tmp)
+        if args.qemu_rss_mb:
+            os.environ["FAKE_QEMU_RSS_MB"] = str(args.qemu_rss_mb)
+        if args.boot_ms:
+            os.environ["FAKE_QEMU_BOOT_MS"] = str(args.boot_ms)
+        fake_environment(work, args.bridge, args.redis_url)
+        bench = Bench(args, work)
+        results = []
+        print(f"{'users':>6} {'launch/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'clean p50':>10} {'clean p99':>10} {'qemu MiB':>9} {'bridge MiB':>11}")
+        try:
+            for users in args.levels:
+                r = bench.level(users)
+                results.append(r)
+                print(f"{users:>6} {r['launches_per_s']:>9} {r['launch_p50_ms']:>8} {r['launch_p99_ms']:>8} "
+                      f"{r['cleanup_p50_ms']:>10} {r['cleanup_p99_ms']:>10} "
+                      f"{r['qemu_rss_mib_per_session']:>9} {r['bridge_rss_mib_per_session']:>11}")
+        finally:
+            bench.teardown()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(
+            {"bridge": args.bridge, "connect": args.connect, "rounds": args.rounds, "levels": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# /bench/loadtest.py
+"""
+HTTP load test for the API with SLO checks.
+
+Virtual users register, then replay a weighted mix of /auth/token, /auth/me,
+/vm/run-script, /vm/get_user_snapshots, /api/sessions/active and /metrics for
+--duration seconds. Per endpoint it records throughput, a latency histogram and
+p50/p90/p99/max; 4xx/5xx replies and transport errors count as errors.
+
+By default the app runs in-process (httpx ASGITransport, lifespan included) on SQLite,
+an in-process fakeredis server and the stand-in QEMU/qemu-img from tests/fakes/, so it
+needs no services at all; --url drives a running deployment instead.
+
+The run fails (exit 1) when an SLO is violated:
+  --slo-p99 NAME=MS      p99 ceiling per endpoint ("*" for all), repeatable
+  --max-error-rate R     overall error rate (default 0.01)
+  --baseline FILE        a previous --json result; p99 may not grow by more than
+                         --max-regress-pct (default 25) on any endpoint
+
+    python bench/loadtest.py --users 20 --duration 30 --json /tmp/load.json
+    python bench/loadtest.py --slo-p99 auth_me=50 --slo-p99 '*=1000' --baseline /tmp/load-main.json
+    python bench/loadtest.py --url http://127.0.0.1:8000 --os-type alpine   # RECAPTCHA_BYPASS on the server
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from bench_launch import APP_DIR, PROFILE, ROOT, add_bench_profile, fake_environment, percentile
+
+DEFAULT_MIX = "auth_token=5,auth_me=35,run_script=5,snapshots=15,sessions_active=30,metrics=10"
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# name → (method, path, needs auth)
+ENDPOINTS = {
+    "auth_token": ("POST", "/auth/token", False),
+    "auth_me": ("GET", "/auth/me", True),
+    "run_script": ("POST", "/vm/run-script", True),
+    "snapshots": ("GET", "/vm/get_user_snapshots", True),
+    "sessions_active": ("GET", "/api/sessions/active", False),
+    "metrics": ("GET", "/metrics", False),
+}
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"unknown endpoint in mix: {name} (known: {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def parse_thresholds(items: list[str]) -> dict[str, float]:
+    out = {}
+    for item in items:
+        name, _, ms = item.partition("=")
+        if not ms or (name != "*" and name not in ENDPOINTS):
+            raise SystemExit(f"bad --slo-p99 {item!r}; expected NAME=MS with NAME in {', '.join(ENDPOINTS)} or *")
+        out[name] = float(ms)
+    return out
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: dict[str, int] = {name: 0 for name in ENDPOINTS}
+        self.statuses: dict[str, dict[str, int]] = {name: {} for name in ENDPOINTS}
+
+    def record(self, name: str, seconds: float, status: str, ok: bool) -> None:
+        self.samples[name].append(seconds * 1000)
+        self.statuses[name][status] = self.statuses[name].get(status, 0) + 1
+        if not ok:
+            self.errors[name] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, ms in self.samples.items():
+            if not ms:
+                continue
+            hist = {str(b): sum(1 for v in ms if v <= b) for b in BUCKETS_MS}
+            hist["+Inf"] = len(ms)
+            endpoints[name] = {
+                "count": len(ms),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(ms), 4),
+                "rps": round(len(ms) / elapsed, 2),
+                "p50_ms": round(percentile(ms, 50), 2),
+                "p90_ms": round(percentile(ms, 90), 2),
+                "p99_ms": round(percentile(ms, 99), 2),
+                "max_ms": round(max(ms), 2),
+                "histogram_ms": hist,  # cumulative, Prometheus-style "le" buckets
+                "statuses": self.statuses[name],
+            }
+        total = sum(e["count"] for e in endpoints.values())
+        errors = sum(e["errors"] for e in endpoints.values())
+        return {
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "rps": round(total / elapsed, 2),
+            "endpoints": endpoints,
+        }
+
+
+class VirtualUser:
+    def __init__(self, n: int, client: httpx.AsyncClient, args, rec: Recorder) -> None:
+        self.login = f"{args.user_prefix}{n}"
+        self.password = f"pw-{args.user_prefix}{n}"
+        self.client = client
+        self.args = args
+        self.rec = rec
+        self.token = None
+
+    def _auth_body(self) -> dict:
+        return {"username": self.login, "password": self.password, "g_recaptcha_response": "loadtest"}
+
+    async def setup(self) -> None:
+        r = await self.client.post("/auth/register", json={
+            "login": self.login, "password": self.password, "g_recaptcha_response": "loadtest"})
+        if r.status_code not in (200, 409):
+            raise RuntimeError(f"cannot register {self.login}: {r.status_code} {r.text[:200]}")
+        r = await self.client.post("/auth/token", json=self._auth_body())
+        r.raise_for_status()
+        self.token = r.json()["access_token"]
+
+    async def call(self, name: str) -> None:
+        method, path, needs_auth = ENDPOINTS[name]
+        headers = {"Authorization": f"Bearer {self.token}"} if needs_auth else {}
+        body = None
+        if name == "auth_token":
+            body = self._auth_body()
+        elif name == "run_script":
+            body = {"os_type": self.args.os_type}
+        start = time.perf_counter()
+        try:
+            r = await self.client.request(method, path, json=body, headers=headers)
+        except httpx.HTTPError as e:
+            self.rec.record(name, time.perf_counter() - start, type(e).__name__, False)
+            return
+        self.rec.record(name, time.perf_counter() - start, str(r.status_code), r.status_code < 400)
+        if name == "auth_token" and r.status_code == 200:
+            self.token = r.json()["access_token"]
+
+    async def run(self, mix: dict[str, float], deadline: float) -> None:
+        names, weights = list(mix), list(mix.values())
+        rng = random.Random(self.login)
+        while time.perf_counter() < deadline:
+            await self.call(rng.choices(names, weights)[0])
+            if self.args.think_ms:
+                await asyncio.sleep(rng.expovariate(1000 / self.args.think_ms))
+
+
+def check_slos(result: dict, p99: dict[str, float], max_error_rate: float,
+               baseline: dict | None, max_regress_pct: float) -> list[str]:
+    violations = []
+    if result["error_rate"] > max_error_rate:
+        violations.append(f"error rate {result['error_rate']:.2%} > {max_error_rate:.2%}")
+    for name, ep in result["endpoints"].items():
+        limit = p99.get(name, p99.get("*"))
+        if limit is not None and ep["p99_ms"] > limit:
+            violations.append(f"{name}: p99 {ep['p99_ms']} ms > {limit} ms")
+        base = (baseline or {}).get("endpoints", {}).get(name)
+        if base and base["p99_ms"] > 0:
+            allowed = base["p99_ms"] * (1 + max_regress_pct / 100)
+            if ep["p99_ms"] > allowed:
+                violations.append(f"{name}: p99 {ep['p99_ms']} ms regressed over baseline "
+                                  f"{base['p99_ms']} ms (+{max_regress_pct:g}% allowed)")
+    return violations
+
+
+async def drive(args, mix: dict[str, float], transport) -> tuple[dict, float]:
+    rec = Recorder()
+    base_url = args.url or "http://loadtest"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    clients = [httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=args.timeout)
+               for _ in range(args.users)]
+    try:
+        users = [VirtualUser(i, c, args, rec) for i, c in enumerate(clients)]
+        await asyncio.gather(*(u.setup() for u in users))
+        start = time.perf_counter()
+        await asyncio.gather(*(u.run(mix, start + args.duration) for u in users))
+        elapsed = time.perf_counter() - start
+    finally:
+        await asyncio.gather(*(c.aclose() for c in clients))
+    return rec.summary(elapsed), elapsed
+
+
+async def run_in_process(args, mix: dict[str, float], work: Path) -> tuple[dict, float]:
+    fake_environment(work, redis_url=args.redis_url)
+    os.environ.setdefault("RECAPTCHA_BYPASS", "1")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.chdir(APP_DIR)  # StaticFiles mounts are relative to app/
+    sys.path.insert(0, str(APP_DIR))
+    add_bench_profile(work, 256)
+    from main import app
+    from methods.database.database import Base, engine
+
+    Base.metadata.create_all(engine)
+    async with app.router.lifespan_context(app):  # samplers run; shutdown reaps the fake VMs
+        return await drive(args, mix, httpx.ASGITransport(app=app))
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds of load after setup")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights, NAME=W,...")
+    ap.add_argument("--think-ms", type=float, default=50.0, help="mean pause between a user's requests (0: none)")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--url", help="drive a running server instead of the in-process app")
+    ap.add_argument("--os-type", default=None, help=f"profile for run-script (in-process default: {PROFILE})")
+    ap.add_argument("--user-prefix", default="load")
+    ap.add_argument("--redis-url", help="in-process mode: real Redis instead of fakeredis")
+    ap.add_argument("--slo-p99", action="append", default=[], metavar="NAME=MS")
+    ap.add_argument("--max-error-rate", type=float, default=0.01)
+    ap.add_argument("--baseline", help="previous --json result to compare p99 against")
+    ap.add_argument("--max-regress-pct", type=float, default=25.0)
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--verbose", action="store_true", help="show app logs")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    p99 = parse_thresholds(args.slo_p99)
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    args.os_type = args.os_type or ("alpine" if args.url else PROFILE)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    started_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    if args.url:
+        result, elapsed = asyncio.run(drive(args, mix, None))
+    else:
+        with tempfile.TemporaryDirectory(prefix="loadtest-") as tmp:
+            result, elapsed = asyncio.run(run_in_process(args, mix, Path(tmp)))
+
+    violations = check_slos(result, p99, args.max_error_rate, baseline, args.max_regress_pct)
+
+    print(f"{'endpoint':<16} {'count':>7} {'rps':>8} {'err%':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, ep in result["endpoints"].items():
+        print(f"{name:<16} {ep['count']:>7} {ep['rps']:>8} {ep['error_rate'] * 100:>6.2f} "
+              f"{ep['p50_ms']:>8} {ep['p90_ms']:>8} {ep['p99_ms']:>8} {ep['max_ms']:>8}")
+    print(f"{'total':<16} {result['requests']:>7} {result['rps']:>8} {result['error_rate'] * 100:>6.2f}")
+    for v in violations:
+        print(f"SLO violated: {v}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "commit": _commit(),
+            "started_at": started_at,
+            "target": args.url or "in-process",
+            "config": {"users": args.users, "duration_s": args.duration, "mix": mix,
+                       "think_ms": args.think_ms, "os_type": args.os_type},
+            "elapsed_s": round(elapsed, 2),
+            **result,
+            "slo": {"p99_ms": p99, "max_error_rate": args.max_error_rate,
+                    "baseline": args.baseline, "max_regress_pct": args.max_regress_pct,
+                    "passed": not violations, "violations": violations},
+        }, indent=2))
+
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
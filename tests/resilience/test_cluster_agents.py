@@ -0,0 +1,100 @@
+"""
+Two node agents as real processes against one Redis (fakeredis TCP server): both register,
+the scheduler ranks them by advertised capacity, and a dead agent drops out after the TTL.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+import redis
+
+from methods.manager import Scheduler as sch
+from methods.manager.NodeRegistry import NodeRegistry
+
+fakeredis = pytest.importorskip("fakeredis")
+
+APP_DIR = Path(__file__).resolve().parents[2] / "app"
+
+# agents see a local alpine base image; everything else comes from the environment
+AGENT_BOOT = """
+import sys
+from pathlib import Path
+import configs.config as c
+c.VM_PROFILES["alpine"]["base_image"] = Path(sys.argv[1])
+import node_agent, uvicorn
+uvicorn.run(node_agent.app, host="127.0.0.1", port=c.AGENT_PORT, log_level="warning")
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def redis_url():
+    port = _free_port()
+    server = fakeredis.TcpFakeServer(("127.0.0.1", port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"redis://127.0.0.1:{port}/0"
+    server.shutdown()
+    server.server_close()
+
+
+def _agent(node_id, mem_mb, redis_url, base_image, tmp_path):
+    port = _free_port()
+    env = {**os.environ, "REDIS_URL": redis_url, "NODE_ID": node_id, "AGENT_PORT": str(port),
+           "NODE_AGENT_URL": f"http://127.0.0.1:{port}", "NODE_PUBLIC_HOST": f"{node_id}.test",
+           "NODE_MEM_MB": str(mem_mb), "NODE_HEARTBEAT_S": "1", "NODE_TTL_S": "2",
+           "AGENT_TOKEN": "secret", "LOG_DIR": str(tmp_path / node_id)}
+    return subprocess.Popen([sys.executable, "-c", AGENT_BOOT, str(base_image)], cwd=APP_DIR, env=env)
+
+
+def _wait(cond, timeout=20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def test_agents_register_and_are_ranked(redis_url, tmp_path):
+    base = tmp_path / "alpine-base.qcow2"
+    base.write_bytes(b"\0" * 65536)
+    registry = NodeRegistry(redis.Redis.from_url(redis_url, decode_responses=True), ttl_s=2)
+    agents = {"n-big": _agent("n-big", 4096, redis_url, base, tmp_path),
+              "n-small": _agent("n-small", 2500, redis_url, base, tmp_path)}
+    try:
+        assert _wait(lambda: {n["id"] for n in registry.alive()} == set(agents))
+        nodes = {n["id"]: n for n in registry.alive()}
+        assert nodes["n-big"]["mem_total_mb"] == 4096 and "alpine" in nodes["n-big"]["images"]
+        assert nodes["n-small"]["public_host"] == "n-small.test"
+
+        scheduler = sch.Scheduler(registry, token="secret", timeout_s=30)
+        assert scheduler.place("alpine", 1024)["id"] == "n-big"
+        assert scheduler.place("alpine", 2048)["id"] == "n-big"  # n-small lacks room after the reserve
+        assert scheduler.place("ubuntu", 1024) is None           # no node has that base image
+
+        # agents enforce the shared token
+        url = nodes["n-small"]["url"]
+        assert httpx.post(f"{url}/agent/stop", json={"vmid": "x"}).status_code == 401
+        assert httpx.post(f"{url}/agent/stop", json={"vmid": "x"},
+                          headers={"X-Agent-Token": "secret"}).status_code == 404
+
+        agents["n-big"].terminate()
+        agents["n-big"].wait(timeout=15)
+        assert _wait(lambda: [n["id"] for n in registry.alive()] == ["n-small"])
+        assert scheduler.place("alpine", 1024)["id"] == "n-small"
+    finally:
+        for p in agents.values():
+            if p.poll() is None:
+                p.terminate()
+                p.wait(timeout=15)
@@ -0,0 +1,90 @@
+"""
+The launch path against the stand-in binaries in tests/fakes/: overlay via fake qemu-img,
+boot_vm via fake QEMU (-daemonize/-pidfile/-vnc/-qmp), QMP and RFB handshakes, cleanup_vm.
+"""
+import asyncio
+import struct
+import uuid
+from pathlib import Path
+
+import psutil
+import pytest
+
+from methods.manager import OverlayManager as om
+from methods.manager.QMPClient import QMPClient
+from methods.manager.SessionManager import SessionStore
+from utils import cleanup_vm
+
+fakeredis = pytest.importorskip("fakeredis")
+
+FAKES = Path(__file__).resolve().parents[1] / "fakes"
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    base = tmp_path / "base.qcow2"
+    base.write_bytes(b"QFI\xfb".ljust(4096, b"\0"))
+    (tmp_path / "overlays").mkdir()
+    monkeypatch.setitem(om.VM_PROFILES, "fake", {
+        "overlay_dir": tmp_path / "overlays", "overlay_prefix": "fake", "base_image": base,
+        "default_memory": 256, "smp": 1,
+    })
+    monkeypatch.setattr(om, "QEMU_BIN", str(FAKES / "qemu-system-x86_64"))
+    monkeypatch.setattr(om, "QEMU_IMG_BIN", str(FAKES / "qemu-img"))
+    monkeypatch.setattr(om.get_overlay_pool(), "take", lambda os_type, dest: False)
+    return om.QemuOverlayManager("u1", uuid.uuid4().hex[:12], "fake")
+
+
+async def _handshakes(meta):
+    async with QMPClient(meta["qmp_socket"]) as qmp:
+        balloon = await qmp.execute("query-balloon")
+        devices = await qmp.execute("query-block")
+
+    reader, writer = await asyncio.open_unix_connection(meta["vnc_socket"])
+    try:
+        version = await reader.readexactly(12)
+        writer.write(version)
+        n = (await reader.readexactly(1))[0]
+        writer.write((await reader.readexactly(n))[:1])
+        assert struct.unpack(">I", await reader.readexactly(4))[0] == 0
+        writer.write(b"\x01")
+        width, height, name_len = struct.unpack(">HH16xI", await reader.readexactly(24))
+        await reader.readexactly(name_len)
+        writer.write(struct.pack(">BBHHHH", 3, 0, 0, 0, width, height))
+        update = await reader.readexactly(4)
+    finally:
+        writer.close()
+    return balloon, devices, version, (width, height), update
+
+
+def test_boot_handshake_and_cleanup(manager):
+    store = SessionStore(fakeredis.FakeRedis(decode_responses=True))
+    overlay = manager.create_overlay()
+    assert overlay.read_bytes()[:4] == b"QFI\xfb"
+
+    meta = manager.boot_vm(manager.vmid)
+    store.set(manager.vmid, {**meta, "os_type": "fake"})
+    proc = psutil.Process(meta["pid"])
+    try:
+        # the daemon looks like QEMU to the reconciler and the RSS metric
+        assert Path(proc.cmdline()[0]).name == "qemu-system-x86_64"
+        balloon, devices, version, size, update = asyncio.run(_handshakes(meta))
+        assert balloon == {"actual": 256 << 20}
+        assert devices[0]["inserted"]["file"] == str(overlay)
+        assert version == b"RFB 003.008\n" and size == (640, 480)
+        assert update[0] == 0 and struct.unpack(">H", update[2:])[0] == 1
+    finally:
+        cleanup_vm(manager.vmid, store)
+
+    proc.wait(timeout=10)
+    assert not overlay.exists()
+    assert not Path(meta["qmp_socket"]).exists() and not Path(meta["vnc_socket"]).exists()
+    assert store.get(manager.vmid) is None
+
+
+def test_boot_failure_surfaces(manager, monkeypatch):
+    monkeypatch.setenv("FAKE_QEMU_FAIL", "could not load PC BIOS")
+    manager.create_overlay()
+    with pytest.raises(RuntimeError, match="could not load PC BIOS"):
+        manager.boot_vm(manager.vmid)
+    assert not (om.RUN_DIR / f"qemu-{manager.vmid}.pid").exists()
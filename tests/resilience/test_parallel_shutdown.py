@@ -0,0 +1,67 @@
+# tests/resilience/test_parallel_shutdown.py
+import asyncio
+import json
+import subprocess
+import threading
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from methods.manager.SessionManager import SessionStore
+from methods.manager import ShutdownCoordinator as sc
+
+
+def _spawn_sleeper():
+    proc = subprocess.Popen(["sleep", "30"])
+    threading.Thread(target=proc.wait, daemon=True).start()  # reap once killed
+    return proc
+
+
+async def _fake_qmp(path, on_powerdown):
+    async def handle(reader, writer):
+        writer.write(b'{"QMP": {"version": {}, "capabilities": []}}\n')
+        while line := await reader.readline():
+            cmd = json.loads(line)["execute"]
+            if cmd == "system_powerdown":
+                on_powerdown()
+            writer.write(b'{"return": {}}\n')
+            await writer.drain()
+        writer.close()
+    return await asyncio.start_unix_server(handle, path=str(path))
+
+
+def test_shutdown_powers_down_kills_stragglers_and_clears_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(sc, "RUN_DIR", tmp_path)
+    monkeypatch.setattr("utils.RUN_DIR", tmp_path)
+
+    store = SessionStore(fakeredis.FakeRedis(decode_responses=True))
+    polite, stubborn = _spawn_sleeper(), _spawn_sleeper()
+    overlays = {}
+    for vmid, proc in (("vm-a", polite), ("vm-b", stubborn)):
+        overlays[vmid] = tmp_path / f"{vmid}.qcow2"
+        overlays[vmid].write_bytes(b"x")
+        (tmp_path / f"vnc-{vmid}.sock").write_text("")
+        store.set(vmid, {
+            "user_id": f"u-{vmid}", "os_type": "alpine", "pid": proc.pid,
+            "overlay_path": str(overlays[vmid]),
+            "qmp_socket": str(tmp_path / f"qmp-{vmid}.sock"),
+        })
+
+    async def scenario():
+        server = await _fake_qmp(tmp_path / "qmp-vm-a.sock", polite.terminate)
+        try:
+            return await sc.shutdown_all_vms(store, deadline_s=1.0, poll_s=0.05)
+        finally:
+            server.close()
+
+    summary = asyncio.run(scenario())
+
+    assert summary["sessions"] == 2
+    assert summary["powered_off"] == 1 and summary["killed"] == 1
+    assert polite.wait(timeout=5) is not None and stubborn.wait(timeout=5) is not None
+    assert not any(p.exists() for p in overlays.values())
+    assert not list(tmp_path.glob("vnc-*.sock"))
+    assert store.items() == []
+    assert store.get_running_by_user("u-vm-a") is None
+    assert store.r.keys("vm:by_pid:*") == []
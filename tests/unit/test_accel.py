@@ -0,0 +1,50 @@
+import pytest
+
+from methods.manager import OverlayManager as om
+
+
+@pytest.fixture(autouse=True)
+def _reset_accel_cache():
+    om.detect_accel.cache_clear()
+    yield
+    om.detect_accel.cache_clear()
+
+
+def test_detect_accel_prefers_kvm_when_device_usable(monkeypatch):
+    monkeypatch.setattr(om, "QEMU_ACCEL", "auto")
+    monkeypatch.setattr(om, "kvm_available", lambda: True)
+    assert om.detect_accel() == "kvm"
+
+
+def test_detect_accel_falls_back_to_tcg(monkeypatch):
+    monkeypatch.setattr(om, "QEMU_ACCEL", "kvm")
+    monkeypatch.setattr(om, "kvm_available", lambda: False)
+    assert om.detect_accel() == "tcg"
+
+
+def test_tcg_args_use_mttcg_and_tb_size(monkeypatch):
+    monkeypatch.setattr(om, "QEMU_ACCEL", "tcg")
+    monkeypatch.setattr(om, "TCG_TB_SIZE", 512)
+    mgr = om.QemuOverlayManager("u1", "vm1", "ubuntu")
+    args, accel = mgr._accel_args()
+    assert accel == "tcg"
+    assert args[:2] == ["-accel", "tcg,thread=multi,tb-size=512"]
+    assert "-cpu" not in args
+    assert args[args.index("-smp") + 1] == str(mgr.profile["smp"])
+
+
+def test_kvm_args_default_to_host_cpu_and_honour_profile(monkeypatch):
+    monkeypatch.setattr(om, "kvm_available", lambda: True)
+    mgr = om.QemuOverlayManager("u1", "vm1", "alpine")
+    monkeypatch.setitem(mgr.profile, "cpu", "max")
+    args, accel = mgr._accel_args(smp=4)
+    assert accel == "kvm"
+    assert args == ["-accel", "kvm", "-cpu", "max", "-smp", "4"]
+
+
+def test_profile_kvm_without_host_kvm_degrades_to_tcg(monkeypatch):
+    monkeypatch.setattr(om, "kvm_available", lambda: False)
+    mgr = om.QemuOverlayManager("u1", "vm1", "alpine")
+    monkeypatch.setitem(mgr.profile, "accel", "kvm")
+    _, accel = mgr._accel_args()
+    assert accel == "tcg"
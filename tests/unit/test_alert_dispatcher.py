@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from observability.report import AlertDispatcher
+
+
+@pytest.fixture
+def telegram():
+    """Local stand-in for api.telegram.org recording sendMessage bodies."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            received.append((self.path, body))
+            if body["text"] == "slow":
+                time.sleep(1)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"ok": true}')
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}", received
+    srv.shutdown()
+
+
+def _dispatcher(base, **kw):
+    return AlertDispatcher(base, token="T", chat_id="42", **kw)
+
+
+def test_repeats_are_coalesced_into_a_digest(telegram):
+    base, received = telegram
+    d = _dispatcher(base, digest_s=0.3)
+
+    async def scenario():
+        stop = asyncio.Event()
+        task = asyncio.create_task(d.run(stop))
+        await asyncio.sleep(0)
+        d.submit("CPU high (91%)", key="cpu")
+        d.submit("CPU high (95%)", key="cpu")
+        d.submit("CPU high (97%)", key="cpu")
+        d.submit("feedback")
+        await asyncio.sleep(0.6)
+        stop.set()
+        await task
+
+    asyncio.run(scenario())
+
+    texts = [body["text"] for _, body in received]
+    assert received[0][0] == "/botT/sendMessage" and received[0][1]["chat_id"] == "42"
+    assert texts[:2] == ["CPU high (91%)", "feedback"]
+    assert len(texts) == 3 and "×2 CPU high (97%)" in texts[2]
+
+
+def test_submit_does_not_block_and_accepts_threads(telegram):
+    base, received = telegram
+    d = _dispatcher(base, timeout_s=5)
+
+    async def scenario():
+        stop = asyncio.Event()
+        task = asyncio.create_task(d.run(stop))
+        await asyncio.sleep(0)
+        t0 = time.perf_counter()
+        d.submit("slow")
+        await asyncio.to_thread(d.submit, "from thread")
+        assert time.perf_counter() - t0 < 0.5
+        await asyncio.sleep(1.5)
+        stop.set()
+        await task
+
+    asyncio.run(scenario())
+    assert [body["text"] for _, body in received] == ["slow", "from thread"]
+
+
+def test_full_queue_drops_and_timeouts_do_not_hang():
+    d = AlertDispatcher("http://10.255.255.1", token="T", chat_id="42", maxsize=1, timeout_s=0.2)
+    assert d.submit("before start") is False
+
+    async def scenario():
+        stop = asyncio.Event()
+        task = asyncio.create_task(d.run(stop))
+        await asyncio.sleep(0)
+        results = [d.submit(f"m{i}") for i in range(3)]
+        stop.set()
+        await asyncio.wait_for(task, timeout=5)
+        return results
+
+    assert asyncio.run(scenario()) == [True, False, False]
@@ -0,0 +1,60 @@
+import struct
+
+from methods.manager import BaseImageCache as bic
+
+CLUSTER_BITS = 16
+CLUSTER = 1 << CLUSTER_BITS
+
+
+def _fake_qcow2(path, *, l2_offsets, size=64 * CLUSTER):
+    """Minimal qcow2-shaped file: header, one-cluster L1 at 3*CLUSTER, refcount table at CLUSTER."""
+    l1_off, rc_off = 3 * CLUSTER, CLUSTER
+    hdr = bytearray(72)
+    hdr[0:4] = bic.QCOW2_MAGIC
+    hdr[4:8] = struct.pack(">I", 3)
+    hdr[20:24] = struct.pack(">I", CLUSTER_BITS)
+    hdr[36:60] = struct.pack(">IQQI", len(l2_offsets), l1_off, rc_off, 1)
+    data = bytearray(size)
+    data[:72] = hdr
+    for i, off in enumerate(l2_offsets):
+        data[l1_off + 8 * i: l1_off + 8 * i + 8] = struct.pack(">Q", off | (1 << 63))
+    path.write_bytes(bytes(data))
+
+
+def test_hot_ranges_cover_qcow2_metadata(tmp_path):
+    img = tmp_path / "base.qcow2"
+    _fake_qcow2(img, l2_offsets=[40 * CLUSTER, 0, 50 * CLUSTER])
+    ranges = bic.hot_ranges(img, budget_bytes=0)
+    covered = lambda off: any(s <= off < s + n for s, n in ranges)
+    for off in (0, CLUSTER, 3 * CLUSTER, 40 * CLUSTER, 50 * CLUSTER):
+        assert covered(off)
+    assert not covered(20 * CLUSTER)
+
+
+def test_hot_ranges_plain_file_uses_budget(tmp_path):
+    img = tmp_path / "base.raw"
+    img.write_bytes(b"\0" * (10 * bic.PAGE))
+    assert bic.hot_ranges(img, budget_bytes=3 * bic.PAGE + 1) == [(0, 3 * bic.PAGE + 1)]
+
+
+def test_warm_and_residency(tmp_path):
+    img = tmp_path / "base.raw"
+    img.write_bytes(b"x" * (8 * bic.PAGE))
+    assert bic.warm(img, budget_bytes=1 << 20) == 8 * bic.PAGE
+    res = bic.residency(img)
+    if res is not None:
+        resident, size = res
+        assert size == 8 * bic.PAGE
+        assert 0 <= resident <= size
+
+
+def test_refresh_skips_iso_profiles(tmp_path):
+    img = tmp_path / "base.raw"
+    img.write_bytes(b"x" * bic.PAGE)
+    profiles = {
+        "alpine": {"overlay_dir": tmp_path, "overlay_prefix": "alpine", "base_image": img},
+        "custom": {"base_image": tmp_path},
+    }
+    cache = bic.BaseImageCache(profiles, warm_mb=1, mlock_mb=0)
+    assert list(cache._images()) == ["alpine"]
+    cache.refresh()
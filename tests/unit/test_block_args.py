@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+
+from methods.manager import OverlayManager as om
+
+
+def _mgr(monkeypatch, block):
+    mgr = om.QemuOverlayManager("u1", "vm1", "alpine")
+    monkeypatch.setitem(mgr.profile, "block", block)
+    return mgr
+
+
+def test_defaults_match_legacy_drive_line(monkeypatch):
+    mgr = _mgr(monkeypatch, None)
+    assert mgr._drive_args(Path("/o.qcow2")) == [
+        "-drive",
+        "file=/o.qcow2,format=qcow2,id=drive0,cache=writeback,aio=threads,discard=unmap,if=virtio",
+    ]
+
+
+def test_iothread_and_qcow2_cache_options(monkeypatch):
+    mgr = _mgr(monkeypatch, {"iothread": True, "aio": "io_uring", "l2_cache_size": "4M",
+                             "cache_clean_interval": 900, "detect_zeroes": "unmap"})
+    args = mgr._drive_args(Path("/o.qcow2"))
+    assert args[:2] == ["-object", "iothread,id=io-drive0"]
+    drive = args[args.index("-drive") + 1]
+    assert "if=none" in drive and "aio=io_uring" in drive
+    assert "l2-cache-size=4M" in drive and "cache-clean-interval=900" in drive
+    assert "detect-zeroes=unmap" in drive
+    assert args[-2:] == ["-device", "virtio-blk-pci,drive=drive0,id=vdrive0,iothread=io-drive0"]
+
+
+def test_blockdev_maps_cache_mode_to_node_flags(monkeypatch):
+    mgr = _mgr(monkeypatch, {"blockdev": True, "cache": "directsync", "aio": "native"})
+    args = mgr._drive_args(Path("/o.qcow2"))
+    file_node, fmt_node, throttle_node = [args[i + 1] for i, a in enumerate(args) if a == "-blockdev"]
+    assert "driver=file" in file_node and "aio=native" in file_node and "cache.direct=on" in file_node
+    assert "driver=qcow2" in fmt_node and "file=drive0-file" in fmt_node
+    assert "driver=throttle" in throttle_node and "file=drive0" in throttle_node
+    assert args[-1].endswith("write-cache=off")
+
+
+def test_native_aio_requires_direct_io(monkeypatch):
+    mgr = _mgr(monkeypatch, {"aio": "native"})
+    with pytest.raises(ValueError):
+        mgr._drive_args(Path("/o.qcow2"))
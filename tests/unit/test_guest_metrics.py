@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from prometheus_client import REGISTRY
+
+from observability import guest_metrics as gm
+
+
+def _stats(rd, wr):
+    return {"rd_bytes": rd, "wr_bytes": wr, "rd_operations": rd // 512, "wr_operations": wr // 512,
+            "rd_total_time_ns": 1_000_000, "wr_total_time_ns": 0}
+
+
+async def _fake_qmp(path, state):
+    async def handle(reader, writer):
+        writer.write(b'{"QMP": {"version": {}, "capabilities": []}}\n')
+        while line := await reader.readline():
+            cmd = json.loads(line)["execute"]
+            if cmd == "query-blockstats":
+                reply = {"return": [{"device": "drive0", "stats": _stats(*state["io"])},
+                                    {"device": "ide1-cd0", "stats": _stats(0, 0)}]}
+            elif cmd == "query-balloon":
+                reply = {"return": {"actual": 512 << 20}}
+            else:
+                reply = {"return": {}}
+            writer.write(json.dumps(reply).encode() + b"\n")
+            await writer.drain()
+        writer.close()
+    return await asyncio.start_unix_server(handle, path=str(path))
+
+
+def _val(name, **labels):
+    return REGISTRY.get_sample_value(name, labels)
+
+
+def test_top_k_users():
+    assert gm.top_k_users({"a": 1, "b": 5, "c": 3}, 2) == (["b", "c"], ["a"])
+
+
+def test_sampler_exports_deltas_and_folds_users_beyond_top_k(tmp_path):
+    states = {f"gm{i}": {"io": (0, 0)} for i in range(3)}
+    sessions = [(vmid, {"user_id": f"gm-u{i}", "os_type": "alpine",
+                        "qmp_socket": str(tmp_path / f"{vmid}.sock")})
+                for i, vmid in enumerate(states)]
+    sampler = gm.GuestStatsSampler(top_k=1)
+
+    async def scenario():
+        servers = [await _fake_qmp(tmp_path / f"{v}.sock", st) for v, st in states.items()]
+        try:
+            await sampler.sample(sessions)
+            states["gm0"]["io"] = (4096, 1024)
+            states["gm1"]["io"] = (1 << 20, 0)
+            states["gm2"]["io"] = (512, 0)
+            await sampler.sample(sessions)
+            states["gm1"]["io"] = (2 << 20, 0)
+            await sampler.sample(sessions[:2] + [("gm-dead", {"user_id": "gm-u9", "os_type": "alpine",
+                                                               "qmp_socket": str(tmp_path / "none")})])
+        finally:
+            for s in servers:
+                s.close()
+
+    asyncio.run(scenario())
+
+    assert _val("vmshare_vm_block_bytes_total", vmid="gm0", os_type="alpine", direction="read") == 4096
+    assert _val("vmshare_vm_block_bytes_total", vmid="gm1", os_type="alpine", direction="read") == 2 << 20
+    assert _val("vmshare_vm_balloon_actual_bytes", vmid="gm0", os_type="alpine") == 512 << 20
+    assert _val("vmshare_vm_qmp_up", vmid="gm-dead", os_type="alpine") == 0
+    # gm2 left the session list → its series are gone
+    assert _val("vmshare_vm_block_bytes_total", vmid="gm2", os_type="alpine", direction="read") is None
+    # one user keeps a series, the rest are folded into "other"
+    users = {s.labels["user_id"] for m in REGISTRY.collect() if m.name == "vmshare_user_block_bytes_per_second"
+             for s in m.samples}
+    assert "other" in users
+    assert users & {"gm-u0", "gm-u1", "gm-u2", "gm-u9"} == {"gm-u1"}  # busiest user in the last interval
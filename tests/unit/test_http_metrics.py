@@ -0,0 +1,59 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from observability.http_metrics import HTTPMetricsMiddleware, UNMATCHED
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(HTTPMetricsMiddleware)
+
+    @app.post("/hm-test/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    @app.get("/hm-test/stream")
+    async def stream():
+        async def gen():
+            for _ in range(3):
+                yield b"x" * 10
+        return StreamingResponse(gen())
+
+    return app
+
+
+def _val(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_route_template_status_and_sizes():
+    client = TestClient(_app())
+    labels = {"method": "POST", "path": "/hm-test/items/{item_id}"}
+    before = _val("vmshare_requests_total", status="200", **labels)
+    req_before = _val("vmshare_request_size_bytes_sum", **labels)
+
+    for i in range(3):
+        assert client.post(f"/hm-test/items/{i}", content=b"abcd").status_code == 200
+
+    assert _val("vmshare_requests_total", status="200", **labels) - before == 3
+    assert _val("vmshare_request_size_bytes_sum", **labels) - req_before == 12
+    assert _val("vmshare_response_size_bytes_count", **labels) >= 3
+    # raw paths never become labels
+    assert REGISTRY.get_sample_value(
+        "vmshare_requests_total", {"method": "POST", "path": "/hm-test/items/1", "status": "200"}) is None
+
+
+def test_unmatched_and_streaming_response():
+    client = TestClient(_app())
+    before_404 = _val("vmshare_requests_total", method="GET", path=UNMATCHED, status="404")
+    stream_labels = {"method": "GET", "path": "/hm-test/stream"}
+    before_bytes = _val("vmshare_response_size_bytes_sum", **stream_labels)
+
+    assert client.get("/hm-test/nope/123").status_code == 404
+    resp = client.get("/hm-test/stream")
+
+    assert resp.content == b"x" * 30
+    assert _val("vmshare_requests_total", method="GET", path=UNMATCHED, status="404") - before_404 == 1
+    assert _val("vmshare_response_size_bytes_sum", **stream_labels) - before_bytes == 30
@@ -0,0 +1,118 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+from prometheus_client import REGISTRY
+
+from methods.manager import IoThrottle as io
+from methods.manager import OverlayManager as om
+
+
+def test_limits_validation_and_user_override(monkeypatch):
+    monkeypatch.setattr(io, "IO_USER_LIMITS", {"7": {"iops": 500, "iops_max": 0}})
+    profile = {"io": {"iops": 2000, "iops_max": 4000, "bps": 0, "max_length": 5}}
+    with pytest.raises(ValueError):
+        io.io_limits(profile, "7")  # max_length without any burst left
+    assert io.io_limits(profile, "8") == {"iops": 2000, "iops_max": 4000, "max_length": 5}
+    with pytest.raises(ValueError):
+        io.normalize_io_limits({"bps_max": 10})
+    with pytest.raises(ValueError):
+        io.normalize_io_limits({"net": 1})
+
+
+def test_drive_line_joins_user_throttle_group(monkeypatch):
+    mgr = om.QemuOverlayManager("7", "vm1", "alpine")
+    monkeypatch.setitem(mgr.profile, "io", {"iops": 300, "bps": 1 << 20})
+    drive = mgr._drive_args(Path("/o.qcow2"))[1]
+    assert "throttling.iops-total=300" in drive and "throttling.bps-total=1048576" in drive
+    assert "throttling.group=io-u7" in drive
+
+
+def test_blockdev_puts_throttle_filter_on_top(monkeypatch):
+    mgr = om.QemuOverlayManager("7", "vm1", "alpine")
+    monkeypatch.setitem(mgr.profile, "block", {"blockdev": True})
+    monkeypatch.setitem(mgr.profile, "io", None)
+    args = mgr._drive_args(Path("/o.qcow2")) + mgr._drive_args(Path("/p.qcow2"), "drive1")
+    assert args.count("throttle-group,id=io-u7") == 1  # one group for all of the user's disks
+    assert "virtio-blk-pci,drive=drive1-throttle,id=vdrive1" in args
+
+
+async def _fake_qmp(path, state):
+    async def handle(reader, writer):
+        writer.write(b'{"QMP": {"version": {}, "capabilities": []}}\n')
+        while line := await reader.readline():
+            msg = json.loads(line)
+            state["calls"].append(msg)
+            if msg["execute"] == "query-block":
+                reply = [{"device": "drive0", "qdev": "/machine/peripheral-anon/device[0]",
+                          "removable": False, "inserted": {"node-name": "#block123"}},
+                         {"device": "ide1-cd0", "removable": True, "inserted": {}}]
+            elif msg["execute"] == "query-blockstats":
+                reply = [{"device": "drive0", "stats": {"rd_operations": state["ops"],
+                                                        "rd_bytes": state["ops"] * 4096}}]
+            else:
+                reply = {}
+            writer.write(json.dumps({"return": reply}).encode() + b"\n")
+            await writer.drain()
+        writer.close()
+    return await asyncio.start_unix_server(handle, path=str(path))
+
+
+def test_set_io_limits_over_qmp(tmp_path):
+    state = {"calls": [], "ops": 0}
+    sock = tmp_path / "qmp.sock"
+
+    async def scenario():
+        server = await _fake_qmp(sock, state)
+        try:
+            n = await io.set_io_limits(str(sock), {"iops": 100, "iops_max": 200, "max_length": 3},
+                                       group="io-u7")
+            await io.set_io_limits(str(sock), {"bps": 5}, group="io-u7", blockdev=True)
+        finally:
+            server.close()
+        return n
+
+    assert asyncio.run(scenario()) == 1  # the CD-ROM is left alone
+    throttle = [c["arguments"] for c in state["calls"] if c["execute"] == "block_set_io_throttle"]
+    assert throttle == [{"device": "drive0", "bps": 0, "bps_rd": 0, "bps_wr": 0, "iops": 100,
+                         "iops_rd": 0, "iops_wr": 0, "iops_max": 200, "iops_max_length": 3,
+                         "group": "io-u7"}]
+    qom = next(c["arguments"] for c in state["calls"] if c["execute"] == "qom-set")
+    assert qom["path"] == "/objects/io-u7" and qom["value"]["bps-total"] == 5
+    assert qom["value"]["iops-total"] == 0  # full struct: old limits do not linger
+
+
+def test_fair_share_tightens_noisy_vm_and_restores(tmp_path):
+    states = {"noisy": {"calls": [], "ops": 0}, "quiet": {"calls": [], "ops": 0}}
+    sessions = [(v, {"user_id": f"u-{v}", "os_type": "alpine", "qmp_socket": str(tmp_path / f"{v}.sock")})
+                for v in states]
+    applied = []
+
+    async def apply(vmid, sess, limits):
+        applied.append((vmid, limits))
+
+    policy = io.IoFairShare(host_iops=1000, host_bps=0, contention=0.8, hold_s=30,
+                            min_iops=50, apply=apply)
+
+    async def scenario():
+        servers = [await _fake_qmp(tmp_path / f"{v}.sock", st) for v, st in states.items()]
+        try:
+            await policy.evaluate(sessions, now=0)
+            states["noisy"]["ops"] += 900   # 900 IOPS over one second
+            states["quiet"]["ops"] += 10
+            first = await policy.evaluate(sessions, now=1)
+            states["noisy"]["ops"] += 500   # clamped, contention gone
+            second = await policy.evaluate(sessions, now=2)
+            third = await policy.evaluate(sessions, now=40)
+        finally:
+            for s in servers:
+                s.close()
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == {"contended": True, "tightened": ["noisy"], "restored": []}
+    assert second["tightened"] == [] and second["restored"] == []  # still held
+    assert third["restored"] == ["noisy"]
+    assert applied == [("noisy", {"iops": 500}), ("noisy", {})]
+    assert REGISTRY.get_sample_value("vmshare_io_throttled_vms") == 0
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+fakeredis = pytest.importorskip("fakeredis")
+import redis
+
+from methods.manager.LaunchJobs import LaunchJobs
+from methods.manager.SessionManager import SessionStore
+from routers import vm as vm_router
+
+
+class _Manager:
+    def __init__(self, user_id, vmid, os_type):
+        self.vmid = vmid
+
+    def create_overlay(self):
+        return f"/tmp/{self.vmid}.qcow2"
+
+    def boot_vm(self, vmid, drive_path=None):
+        return {"pid": 4242, "vnc_socket": f"/tmp/vnc-{vmid}.sock"}
+
+
+class _Bridge:
+    def start(self, vmid, target):
+        return 6080
+
+
+@pytest.fixture
+def client(monkeypatch):
+    store = SessionStore(fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(vm_router, "QemuOverlayManager", _Manager)
+    monkeypatch.setattr(vm_router, "LAUNCH_POLL_S", 0.01)
+    app = FastAPI()
+    app.include_router(vm_router.router, prefix="/vm")
+    app.dependency_overrides[vm_router.get_current_user] = lambda: SimpleNamespace(id=7, login="alice")
+    app.dependency_overrides[vm_router.get_session_store] = lambda: store
+    app.dependency_overrides[vm_router.get_websockify_service] = lambda: _Bridge()
+    with TestClient(app) as c:
+        c.store = store
+        yield c
+
+
+def _sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":") and ": " in line)
+        if "event" in fields:
+            events.append(fields["event"])
+    return events
+
+
+def test_async_launch_returns_202_and_streams_stages(client):
+    res = client.post("/vm/run-script", json={"os_type": "alpine"}, headers={"Prefer": "respond-async"})
+    assert res.status_code == 202
+    job = res.json()["job"]
+    assert res.headers["location"] == f"/vm/launch/{job}"
+
+    with client.stream("GET", f"/vm/launch/{job}/events") as stream:
+        assert stream.headers["content-type"].startswith("text/event-stream")
+        stages = _sse(stream.read().decode())
+    assert stages == ["reserved", "overlay_ready", "qemu_started", "bridge_ready", "done"]
+
+    status = client.get(f"/vm/launch/{job}").json()
+    assert status["state"] == "done" and "path=ws/6080%3Ftoken%3Drw." in status["events"][-1]["redirect"]
+    assert client.store.get(job)["http_port"] == "6080"
+    assert not client.store.r.exists("user:7:launch")   # reservation released
+
+    # a second click now gets the running VM (200), not another launch
+    again = client.post("/vm/run-script", json={"os_type": "alpine"}, headers={"Prefer": "respond-async"})
+    assert again.status_code == 200 and again.json()["vm"]["vmid"] == job
+
+
+def test_duplicate_async_request_gets_the_job_in_flight(client):
+    client.store.reserve_launch("7", "inflight")
+    LaunchJobs(client.store.r).create("inflight", "7")
+    res = client.post("/vm/run-script", json={"os_type": "alpine"}, headers={"Prefer": "respond-async"})
+    assert res.status_code == 202 and res.json()["job"] == "inflight"
+
+
+def test_job_of_a_reservation_not_yet_launching_is_pending(client):
+    client.store.reserve_launch("7", "inflight")   # the holder is still validating its input
+    res = client.post("/vm/run-script", json={"os_type": "alpine"}, headers={"Prefer": "respond-async"})
+    assert res.status_code == 202 and res.json()["job"] == "inflight"
+    assert client.get("/vm/launch/inflight").json()["state"] == "pending"
+
+    # ...and gives up before creating the job: the stream ends instead of waiting forever
+    threading.Timer(0.1, client.store.release_launch, ("7", "inflight")).start()
+    with client.stream("GET", "/vm/launch/inflight/events") as stream:
+        assert _sse(stream.read().decode()) == ["failed"]
+
+
+def test_shutdown_drains_background_launches():
+    started, cancelled = asyncio.Event(), []
+
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        quick = asyncio.create_task(asyncio.sleep(0))
+        stuck = asyncio.create_task(slow())
+        vm_router._LAUNCH_TASKS.update({quick, stuck})
+        await started.wait()
+        await vm_router.drain_launches(timeout_s=0.05)
+        vm_router._LAUNCH_TASKS.difference_update({quick, stuck})
+        return quick.done() and stuck.cancelled()
+
+    assert asyncio.run(main()) and cancelled
+
+
+def test_running_vm_on_a_worker_node_is_reached_through_the_relay(client):
+    client.store.set("vmw", {"user_id": "7", "http_port": "6100", "node_id": "w1", "node_host": "10.0.0.5"})
+    iso = client.post("/vm/run-iso").json()
+    snap = client.post("/vm/run_snapshot", json={"os_type": "alpine", "snapshot": "7__alpine__vmx.qcow2"}).json()
+    for res in (iso, snap):
+        assert res["vm"]["vmid"] == "vmw" and "path=ws/w1/6100%3Ftoken%3Drw." in res["redirect"]
+    assert iso["redirect"].endswith("&reconnect=1&reconnect_delay=1500")
+
+
+def test_reservation_is_released_when_the_job_cannot_be_created(client, monkeypatch):
+    def down(self, job, user_id):
+        raise redis.ConnectionError("redis is down")
+    monkeypatch.setattr(LaunchJobs, "create", down)
+    res = client.post("/vm/run-script", json={"os_type": "alpine"})
+    assert res.status_code == 500
+    assert not client.store.r.exists("user:7:launch")   # the user can try again at once
+
+
+def test_other_users_jobs_are_hidden(client):
+    LaunchJobs(client.store.r).create("theirs", "8")
+    assert client.get("/vm/launch/theirs").status_code == 404
+    assert client.get("/vm/launch/theirs/events").status_code == 404
+
+
+def test_failed_stage_carries_the_detail():
+    jobs = LaunchJobs(fakeredis.FakeRedis(decode_responses=True))
+    jobs.create("j1", "7")
+    first = jobs.emit("j1", "reserved", vmid="j1")
+    jobs.progress("j1")("failed", detail="No capacity for a new VM right now, try again later")
+    assert jobs.get("j1")["state"] == "failed"
+    assert [ev["stage"] for _, ev in jobs.events("j1", after=first)] == ["failed"]
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from methods.manager.SessionManager import SessionStore
+from routers import vm as vm_router
+
+
+def _store():
+    return SessionStore(fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_reserve_release_is_compare_and_delete():
+    store = _store()
+    assert store.reserve_launch("u1", "vmA") is None
+    assert store.reserve_launch("u1", "vmB") == "vmA"
+    store.release_launch("u1", "vmB")              # not the holder: no effect
+    assert store.reserve_launch("u1", "vmB") == "vmA"
+    store.release_launch("u1", "vmA")
+    assert store.reserve_launch("u1", "vmB") is None
+    assert 0 < store.r.ttl("user:u1:launch") <= vm_router.LAUNCH_LEASE_S
+
+
+def test_duplicate_request_attaches_to_launch_in_flight(monkeypatch):
+    monkeypatch.setattr(vm_router, "LAUNCH_POLL_S", 0.01)
+    store = _store()
+
+    async def first():
+        assert await vm_router._reserve_launch(store, "u1", "vmA") is None
+        await asyncio.sleep(0.05)                  # overlay + boot
+        store.set("vmA", {"user_id": "u1", "http_port": 6080})
+        store.release_launch("u1", "vmA")
+
+    async def main():
+        task = asyncio.create_task(first())
+        await asyncio.sleep(0)
+        attached = await vm_router._reserve_launch(store, "u1", "vmB")
+        await task
+        return attached
+
+    attached = asyncio.run(main())
+    assert attached["vmid"] == "vmA"
+    assert store.get("vmB") is None and not store.r.exists("user:u1:launch")
+
+
+def test_duplicate_takes_over_a_failed_launch(monkeypatch):
+    monkeypatch.setattr(vm_router, "LAUNCH_POLL_S", 0.01)
+    store = _store()
+
+    async def main():
+        assert await vm_router._reserve_launch(store, "u1", "vmA") is None
+        waiter = asyncio.create_task(vm_router._reserve_launch(store, "u1", "vmB"))
+        await asyncio.sleep(0.03)
+        assert not waiter.done()
+        store.release_launch("u1", "vmA")         # boot failed, no session
+        return await waiter
+
+    assert asyncio.run(main()) is None
+    assert store.r.get("user:u1:launch") == "vmB"
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from prometheus_client import REGISTRY
+
+from methods.manager.SessionManager import SessionStore
+from methods.manager import LifecycleEvents as le
+
+
+def _store():
+    return SessionStore(fakeredis.FakeRedis(decode_responses=True))
+
+
+def _kinds(entries):
+    return [ev["kind"] for _, ev in entries]
+
+
+def test_session_writes_append_events_atomically():
+    store = _store()
+    store.set("vm1", {"user_id": "u1", "os_type": "alpine", "pid": 42})
+    store.event("connected", "vm1", os_type="alpine")
+    store.delete("vm1")
+    store.delete("vm1")                                  # nothing left: no second cleaned_up
+    store.set("vm2", {"user_id": "u2"})
+    store.delete_many(["vm2", "never-existed"])
+
+    history = le.LifecycleEvents(store.r).history()
+    assert _kinds(history) == ["launched", "connected", "cleaned_up", "launched", "cleaned_up"]
+    launched = history[0][1]
+    assert launched["vmid"] == "vm1" and launched["user_id"] == "u1" and launched["pid"] == "42"
+    assert launched["node_id"] and int(launched["ts"]) > 0
+
+
+def test_consumer_group_ack_replay_and_claim():
+    events = le.LifecycleEvents(fakeredis.FakeRedis(decode_responses=True))
+    events.ensure_group("quota", start="0")
+    events.ensure_group("quota", start="0")              # idempotent
+    for kind in ("launched", "connected", "cleaned_up"):
+        events.publish(kind, "vm1")
+
+    first = events.read("quota", "a", count=2)
+    assert _kinds(first) == ["launched", "connected"]
+    events.ack("quota", [first[0][0]])
+    assert _kinds(events.read("quota", "a", pending=True)) == ["connected"]  # replayed after a crash
+    assert _kinds(events.claim("quota", "b", min_idle_ms=0)) == ["connected"]  # or taken over
+    assert _kinds(events.read("quota", "b")) == ["cleaned_up"]
+
+
+def test_metrics_consumer_measures_from_event_timestamps():
+    events = le.LifecycleEvents(fakeredis.FakeRedis(decode_responses=True))
+    events.ensure_group("metrics", start="0")
+    for kind, ts in (("launched", 1_000), ("connected", 3_500), ("connected", 9_000), ("cleaned_up", 61_000)):
+        events.r.xadd(le.STREAM, {"kind": kind, "vmid": "vm1", "ts": str(ts), "os_type": "lc-test"})
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name, {"os_type": "lc-test"}) or 0.0
+
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(le.consume("metrics", le.LifecycleMetrics(), stop, events=events,
+                                              consumer="t", interval_sec=0.01))
+        while events.r.xpending(le.STREAM, "metrics")["pending"] or not sample("vmshare_session_lifetime_seconds_count"):
+            await asyncio.sleep(0.01)
+        stop.set()
+        await task
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert sample("vmshare_launch_to_connect_seconds_count") == 1        # first connect only
+    assert sample("vmshare_launch_to_connect_seconds_sum") == 2.5
+    assert sample("vmshare_session_lifetime_seconds_sum") == 60.0
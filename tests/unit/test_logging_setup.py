@@ -0,0 +1,89 @@
+import json
+import logging
+import logging.handlers
+import time
+
+import pytest
+
+from configs import config
+from configs import logging_setup as ls
+
+
+def _record(name, level=logging.INFO, msg="hello %s", args=("world",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_parse_rules_and_prefix_match():
+    rules = ls.parse_rules("methods.auth=0.1, routers=0.5,bad")
+    assert rules == {"methods.auth": 0.1, "routers": 0.5}
+    assert ls._match(rules, "methods.auth.auth") == 0.1
+    assert ls._match(rules, "routers.vm") == 0.5
+    assert ls._match(rules, "methods.manager") is None
+
+
+def test_sampling_keeps_warnings():
+    f = ls.SamplingFilter({"chatty": 0.0})
+    assert not f.filter(_record("chatty.sub"))
+    assert f.filter(_record("chatty", logging.WARNING))
+    assert f.filter(_record("quiet"))
+
+
+def test_rate_limit_reports_suppressed(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ls.time, "monotonic", lambda: now[0])
+    f = ls.RateLimitFilter({"chatty": 2})
+    passed = [f.filter(_record("chatty")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert f.filter(_record("chatty", logging.ERROR))
+    now[0] += 1.0
+    rec = _record("chatty")
+    assert f.filter(rec)
+    assert rec.getMessage() == "[3 suppressed] hello world"
+
+
+@pytest.fixture
+def restore_logging():
+    yield
+    ls.setup_logging(config.log_file_path, json_output=config.LOG_JSON,
+                     sample=config.LOG_SAMPLE, rate_limit=config.LOG_RATE_LIMIT)
+
+
+def test_pipeline_writes_json_and_rotates(tmp_path, restore_logging):
+    log_file = tmp_path / "app.log"
+    ls.setup_logging(str(log_file), json_output=True, max_bytes=2000, backup_count=2)
+    root = logging.getLogger()
+    assert len(root.handlers) == 1 and isinstance(root.handlers[0], logging.handlers.QueueHandler)
+
+    log = logging.getLogger("pipeline.test")
+    for i in range(50):
+        log.info("line %d", i)
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        log.exception("failed")
+    ls.stop_logging()  # drains the queue
+
+    lines = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert lines[-1]["msg"] == "failed" and "RuntimeError: boom" in lines[-1]["exc"]
+    assert lines[-1]["logger"] == "pipeline.test" and lines[-1]["level"] == "ERROR"
+    assert (tmp_path / "app.log.1").exists()
+
+
+def test_workers_append_without_rotating(tmp_path, restore_logging):
+    assert ls.multi_process({"WEB_CONCURRENCY": "4"}) and ls.multi_process({"PROMETHEUS_MULTIPROC_DIR": "/tmp/p"})
+    assert not ls.multi_process({"WEB_CONCURRENCY": "1"})
+    log_file = tmp_path / "app.log"
+    ls.setup_logging(str(log_file), max_bytes=200, rotate=False)
+    assert isinstance(ls._listener.handlers[0], logging.handlers.WatchedFileHandler)
+    log = logging.getLogger("pipeline.workers")
+    for i in range(20):
+        log.info("line %d", i)
+    deadline = time.monotonic() + 5
+    while "line 19" not in log_file.read_text() and time.monotonic() < deadline:
+        time.sleep(0.01)  # the writer thread drains the queue
+    log_file.rename(tmp_path / "app.log.1")  # logrotate moves the file away
+    log.info("after rotate")
+    ls.stop_logging()
+    assert not (tmp_path / "app.log.2").exists()
+    assert log_file.read_text().strip().endswith("after rotate")
+    assert "line 19" in (tmp_path / "app.log.1").read_text()
@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+from prometheus_client import REGISTRY
+
+from methods.manager import MemoryBalloon as mb
+from methods.manager import OverlayManager as om
+
+
+def test_balloon_device_is_opt_in_per_profile(monkeypatch):
+    assert mb.balloon_args({}) == []
+    args = mb.balloon_args({"balloon": True})
+    assert args[0] == "-device" and "free-page-reporting=on" in args[1]
+    monkeypatch.setattr(mb, "BALLOON", True)
+    assert mb.balloon_args({}) and mb.balloon_args({"balloon": False}) == []
+
+
+def test_ksm_stats_and_density(tmp_path):
+    for name, value in {"pages_shared": 10, "pages_sharing": 300, "pages_unshared": 5,
+                        "pages_volatile": 1, "full_scans": 7}.items():
+        (tmp_path / name).write_text(f"{value}\n")
+    assert mb.ksm_stats(tmp_path)["pages_sharing"] == 300
+    assert mb.ksm_stats(tmp_path / "missing") is None
+    mb.export_density(3, tmp_path)
+    assert REGISTRY.get_sample_value("vmshare_ksm_pages", {"state": "sharing"}) == 300
+    assert REGISTRY.get_sample_value("vmshare_ksm_saved_bytes") == 300 * mb.mmap.PAGESIZE
+    assert REGISTRY.get_sample_value("vmshare_vms_per_gib") > 0
+
+    assert mb.ksm_enable(100, tmp_path)
+    assert (tmp_path / "run").read_text() == "1" and (tmp_path / "pages_to_scan").read_text() == "100"
+
+
+def test_policy_inflates_idle_guests_under_pressure_and_gives_memory_back(monkeypatch):
+    used = [90.0]
+    cpu = {"idle": 1.0, "busy": 80.0}
+    applied = []
+
+    async def apply(vmid, sess, target_mb):
+        applied.append((vmid, target_mb))
+
+    policy = mb.BalloonPolicy(pressure_pct=85, release_pct=75, idle_cpu_pct=5, target_pct=50, min_mb=256,
+                              memory=lambda: SimpleNamespace(percent=used[0]), apply=apply)
+    monkeypatch.setattr(policy, "_cpu_percent", lambda vmid, sess: cpu[vmid])
+    monkeypatch.setitem(om.VM_PROFILES["alpine"], "balloon", True)
+    sessions = [("idle", {"os_type": "alpine", "memory_mb": "1024"}),
+                ("busy", {"os_type": "alpine", "memory_mb": "1024"}),
+                ("plain", {"os_type": "tiny", "memory_mb": "1024"})]  # no balloon device
+
+    first = asyncio.run(policy.evaluate(sessions))
+    assert first["inflated"] == ["idle"] and applied == [("idle", 512)]
+    assert REGISTRY.get_sample_value("vmshare_balloon_reclaimed_bytes") == 512 << 20
+
+    cpu["idle"] = 50.0  # guest woke up: memory back at once, even under pressure
+    assert asyncio.run(policy.evaluate(sessions))["deflated"] == ["idle"]
+    cpu["idle"] = 1.0
+    asyncio.run(policy.evaluate(sessions))
+    used[0] = 70.0
+    assert asyncio.run(policy.evaluate(sessions))["deflated"] == ["idle"]
+    assert applied[-1] == ("idle", 1024)
+    assert REGISTRY.get_sample_value("vmshare_balloon_inflated_vms") == 0
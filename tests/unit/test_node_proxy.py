@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+import pytest
+import websockets
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from methods.manager.SessionManager import SessionStore
+from routers import node_proxy
+
+
+@pytest.fixture
+def bridge():
+    """A node's VNC bridge stand-in: echoes binary frames, reports the path it was asked for."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    state = {}
+
+    async def handler(ws):
+        await ws.send(ws.request.path)
+        async for msg in ws:
+            await ws.send(msg)
+
+    async def main():
+        server = await websockets.serve(handler, "127.0.0.1", 0, subprotocols=["binary"])
+        state["port"] = server.sockets[0].getsockname()[1]
+        state["server"] = server
+        ready.set()
+        await server.wait_closed()
+
+    t = threading.Thread(target=loop.run_until_complete, args=(main(),), daemon=True)
+    t.start()
+    ready.wait(5)
+    yield state["port"]
+    loop.call_soon_threadsafe(state["server"].close)
+    t.join(5)
+
+
+def test_relays_only_bridges_of_remote_sessions(bridge):
+    store = SessionStore(fakeredis.FakeRedis(decode_responses=True))
+    store.set("v1", {"user_id": "7", "http_port": bridge, "node_id": "w1", "node_host": "127.0.0.1"})
+    app = FastAPI()
+    app.include_router(node_proxy.router)
+    app.dependency_overrides[node_proxy.get_session_store] = lambda: store
+    client = TestClient(app)
+
+    with client.websocket_connect(f"/ws/w1/{bridge}?token=ro.1.sig", subprotocols=["binary"]) as ws:
+        assert ws.accepted_subprotocol == "binary"
+        assert ws.receive_text() == f"/ws/{bridge}?token=ro.1.sig"
+        ws.send_bytes(b"RFB 003.008\n")
+        assert ws.receive_bytes() == b"RFB 003.008\n"
+
+    for path in (f"/ws/w2/{bridge}", f"/ws/w1/{bridge + 1}"):  # wrong node, or not a session's port
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect(path) as ws:
+                ws.receive_bytes()
@@ -0,0 +1,55 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from methods.manager import OverlayPool as op
+
+
+@pytest.fixture()
+def pool(tmp_path, monkeypatch):
+    base = tmp_path / "base.qcow2"
+    base.write_bytes(b"base")
+    ovl_dir = tmp_path / "overlays"
+    ovl_dir.mkdir()
+    profiles = {
+        "alpine": {"overlay_dir": ovl_dir, "overlay_prefix": "alpine", "base_image": base},
+        "custom": {"base_image": tmp_path},  # ISO-only → never pooled
+    }
+
+    def fake_qemu_img(cmd, **kwargs):
+        Path(cmd[-1]).write_bytes(b"overlay")
+    monkeypatch.setattr(op.subprocess, "check_call", fake_qemu_img)
+    return op.OverlayPool(profiles, size=2)
+
+
+def test_refill_tops_up_and_take_renames_into_place(pool, tmp_path):
+    assert pool.refill("alpine") == 2
+    assert pool.refill("custom") == 0
+
+    dest = tmp_path / "overlays" / "alpine_vm1.qcow2"
+    assert pool.take("alpine", dest) is True
+    assert dest.read_bytes() == b"overlay"
+    assert len(pool.stock("alpine")) == 1
+
+    assert pool.refill("alpine") == 1
+
+
+def test_empty_pool_reports_miss(pool, tmp_path):
+    assert pool.take("alpine", tmp_path / "overlays" / "alpine_vm2.qcow2") is False
+    assert pool.take("custom", tmp_path / "x.qcow2") is False
+
+
+def test_base_image_change_invalidates_stock(pool, tmp_path):
+    pool.refill("alpine")
+    old = set(pool.stock("alpine"))
+
+    base = tmp_path / "base.qcow2"
+    base.write_bytes(b"new base contents")
+    st = base.stat()
+    os.utime(base, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    assert pool.stock("alpine") == []
+    assert pool.refill("alpine") == 2
+    assert not (old & set(pool.stock("alpine")))
+    assert all(not p.exists() for p in old)
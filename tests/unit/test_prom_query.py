@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+
+from observability.prom_query import PromQueryCache, align_range
+
+
+def _upstream(calls, status=200, delay=0.0):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(dict(request.url.params))
+        await asyncio.sleep(delay)
+        return httpx.Response(status, json={"status": "success", "data": {"n": len(calls)}})
+    return httpx.MockTransport(handler)
+
+
+def test_align_range_snaps_to_step():
+    assert align_range(1000.7, 1061.2, 15) == (990, 1050)
+    assert align_range(5.5, 6.5, 0) == (5.5, 6.5)
+
+
+def test_identical_inflight_queries_share_one_upstream_call():
+    calls = []
+    cache = PromQueryCache("http://prom", transport=_upstream(calls, delay=0.05))
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.query("up") for _ in range(5)))
+        await cache.aclose()
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(r == (200, {"status": "success", "data": {"n": 1}}) for r in results)
+
+
+def test_range_queries_within_one_step_hit_the_cache():
+    calls = []
+    cache = PromQueryCache("http://prom", ttl_s=60, transport=_upstream(calls))
+
+    async def scenario():
+        await cache.query("rate(x[1m])", start=1000.2, end=4600.2, step=30)
+        await cache.query("rate(x[1m])", start=1010.9, end=4610.9, step=30)  # same buckets
+        await cache.query("rate(x[1m])", start=1040.0, end=4640.0, step=30)  # next bucket
+        await cache.aclose()
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert float(calls[0]["start"]) == 990 and float(calls[0]["end"]) == 4590
+
+
+def test_errors_are_not_cached():
+    calls = []
+    cache = PromQueryCache("http://prom", ttl_s=60, transport=_upstream(calls, status=422))
+
+    async def scenario():
+        first = await cache.query("bad{")
+        second = await cache.query("bad{")
+        await cache.aclose()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first[0] == second[0] == 422
+    assert len(calls) == 2
@@ -0,0 +1,87 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from methods.manager.SessionManager import SessionStore
+from methods.manager import Reconciler as rc
+
+
+def _store():
+    # no leases: the tests fast-forward time.time, which fakeredis key expiry reads too
+    return SessionStore(fakeredis.FakeRedis(decode_responses=True), ttl_s=0)
+
+
+def _layout(tmp_path):
+    run_dir, overlays = tmp_path / "run", tmp_path / "overlays"
+    run_dir.mkdir()
+    overlays.mkdir()
+    profiles = {"alpine": {"overlay_dir": overlays, "overlay_prefix": "alpine"}}
+    return run_dir, overlays, profiles
+
+
+def test_files_without_session_are_reclaimed_after_grace(tmp_path, monkeypatch):
+    run_dir, overlays, profiles = _layout(tmp_path)
+    store = _store()
+    store.set("live", {"user_id": "u1", "os_type": "alpine", "pid": 4242})
+
+    for vmid in ("live", "gone"):
+        (run_dir / f"vnc-{vmid}.sock").write_text("")
+        (run_dir / f"qemu-{vmid}.pid").write_text("1")
+        (overlays / f"alpine_{vmid}.qcow2").write_bytes(b"x" * 8192)
+    pool_file = overlays / ".alpine_pool_abc_def.qcow2"
+    pool_file.write_bytes(b"x")
+
+    r = rc.Reconciler(profiles, run_dir=run_dir, grace_s=60)
+    monkeypatch.setattr(r, "_qemu_alive", lambda pid: pid == 4242)
+    assert r.reconcile(store)["overlay"] == 0  # everything is still within the grace period
+
+    real_time = time.time
+    monkeypatch.setattr(rc.time, "time", lambda: real_time() + 3600)
+    summary = r.reconcile(store)
+
+    assert summary["run_file"] == 2 and summary["overlay"] == 1
+    assert summary["disk_bytes"] > 0
+    assert not (overlays / "alpine_gone.qcow2").exists()
+    assert not list(run_dir.glob("*gone*"))
+    assert (overlays / "alpine_live.qcow2").exists() and (run_dir / "vnc-live.sock").exists()
+    assert pool_file.exists()
+
+
+def test_session_with_dead_qemu_is_dropped(tmp_path):
+    run_dir, overlays, profiles = _layout(tmp_path)
+    store = _store()
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    overlay = overlays / "alpine_stale.qcow2"
+    overlay.write_bytes(b"x")
+    store.set("stale", {"user_id": "u1", "os_type": "alpine", "pid": dead.pid,
+                        "overlay_path": str(overlay)})
+
+    summary = rc.Reconciler(profiles, run_dir=run_dir, grace_s=60).reconcile(store)
+
+    assert summary["session"] == 1
+    assert store.get("stale") is None and store.get_running_by_user("u1") is None
+    assert not overlay.exists()
+
+
+def test_orphan_qemu_process_is_killed(tmp_path):
+    run_dir, _, profiles = _layout(tmp_path)
+    pidfile = run_dir / "qemu-lost.pid"
+    proc = subprocess.Popen(
+        ["qemu-system-x86_64", "-c", "import time; time.sleep(30)", "-pidfile", str(pidfile)],
+        executable=sys.executable,
+    )
+    pidfile.write_text(str(proc.pid))
+    try:
+        summary = rc.Reconciler(profiles, run_dir=run_dir, grace_s=0).reconcile(_store())
+        assert summary["qemu"] == 1
+        assert summary["memory_bytes"] > 0
+        assert proc.wait(timeout=10) is not None
+        assert not pidfile.exists()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
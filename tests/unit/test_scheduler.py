@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from methods.manager import Scheduler as sch
+from methods.manager.NodeRegistry import NodeRegistry
+
+
+def _node(node_id, free, load=0.0, images=None, total=8192, cpus=4):
+    return {"id": node_id, "url": f"http://{node_id}", "public_host": node_id, "mem_total_mb": total,
+            "mem_free_mb": free, "pending_mb": 0, "cpus": cpus, "load": load, "vms": 0,
+            "images": {"alpine": 1.0} if images is None else images, "heartbeat_ms": 0}
+
+
+def test_ranking_uses_memory_load_and_locality():
+    roomy_busy = _node("a", free=6000, load=4.0)
+    roomy_idle = _node("b", free=6000, load=0.0)
+    cold = _node("c", free=6000, load=0.0, images={"alpine": 0.0})
+    full = _node("d", free=1500)
+    no_image = _node("e", free=8000, images={})
+    ranked = sch.rank_nodes([roomy_busy, roomy_idle, cold, full, no_image], "alpine", 1024)
+    assert [n["id"] for n in ranked] == ["b", "c", "a"]
+
+
+def test_launch_reserves_and_falls_back_to_next_node():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    registry = NodeRegistry(r, ttl_s=30)
+    base = {"public_host": "h", "mem_total_mb": 8192, "cpus": 4, "load": 0, "vms": 0,
+            "images": {"alpine": 1.0}}
+    registry.heartbeat("big", {**base, "url": "http://big", "mem_free_mb": 7000})
+    registry.heartbeat("small", {**base, "url": "http://small", "mem_free_mb": 3000})
+    seen = []
+
+    def handler(request):
+        node = request.url.host
+        if request.url.path == "/agent/stop":
+            seen.append((node, "stop"))
+            return httpx.Response(404)
+        seen.append((node, int(r.hget(f"node:{node}", "pending_mb"))))
+        if node == "big":
+            return httpx.Response(500)
+        return httpx.Response(200, json={"vm": {"vmid": "v1"}, "http_port": 6001,
+                                         "node_id": "small", "node_host": "h"})
+
+    s = sch.Scheduler(registry, token="t", transport=httpx.MockTransport(handler))
+    out = asyncio.run(s.launch("u1", "v1", "alpine"))
+    assert out["node"]["id"] == "small" and out["http_port"] == 6001
+    assert seen == [("big", 1024), ("big", "stop"), ("small", 1024)]  # memory held while each agent boots
+    assert {n["id"]: n["pending_mb"] for n in registry.alive()} == {"big": 0, "small": 0}
+
+    registry.remove("small")
+    with pytest.raises(sch.NoCapacityError):
+        asyncio.run(s.launch("u1", "v2", "alpine"))
+
+
+def test_cleanup_of_remote_vm_goes_to_its_agent(monkeypatch):
+    import utils
+    from methods.manager import NodeRegistry as nr
+    from methods.manager.SessionManager import SessionStore
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    registry = NodeRegistry(r, ttl_s=30)
+    registry.heartbeat("w1", {"url": "http://w1:9100"})
+    monkeypatch.setattr(nr, "NODE_REGISTRY", registry)
+    store = SessionStore(r)
+    store.set("v1", {"user_id": "7", "pid": 4242, "node_id": "w1"})
+    store.set("v2", {"user_id": "8", "pid": 4243, "node_id": "dead"})
+    posted = []
+    monkeypatch.setattr(nr.httpx, "post", lambda url, **kw: posted.append((url, kw["json"])) or httpx.Response(200))
+    monkeypatch.setattr(utils.os, "kill", lambda *a: pytest.fail("killed a local pid for a remote VM"))
+    monkeypatch.setattr(utils.subprocess, "run", lambda *a, **kw: pytest.fail("pkill for a remote VM"))
+
+    utils.cleanup_vm("v1", store)
+    assert posted == [("http://w1:9100/agent/stop", {"vmid": "v1"})]
+    assert store.get("v1") is not None   # the agent deletes it when it has stopped the VM
+    utils.cleanup_vm("v2", store)        # node gone: nothing left to stop
+    assert store.get("v2") is None and len(posted) == 1
+
+
+def test_launch_timeout_stops_the_node_instead_of_falling_back():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    registry = NodeRegistry(r, ttl_s=30)
+    base = {"public_host": "h", "mem_total_mb": 8192, "cpus": 4, "load": 0, "vms": 0,
+            "images": {"alpine": 1.0}, "mem_free_mb": 7000}
+    for node in ("slow", "down"):
+        registry.heartbeat(node, {**base, "url": f"http://{node}", "mem_free_mb": 7000 if node == "down" else 6000})
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.host, request.url.path))
+        if request.url.host == "down":
+            raise httpx.ConnectError("refused", request=request)
+        if request.url.path == "/agent/launch":
+            raise httpx.ReadTimeout("slow boot", request=request)
+        return httpx.Response(200, json={"stopped": True})
+
+    s = sch.Scheduler(registry, transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(s.launch("u1", "v1", "alpine"))
+    assert seen == [("down", "/agent/launch"), ("slow", "/agent/launch"), ("slow", "/agent/stop")]
@@ -0,0 +1,109 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from methods.manager.SessionManager import SessionStore
+from methods.manager import SessionLease as sl
+
+
+def _store(ttl_s=300):
+    return SessionStore(fakeredis.FakeRedis(decode_responses=True), ttl_s=ttl_s)
+
+
+class _Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_store_lease_lifecycle():
+    store = _store(ttl_s=60)
+    store.set("vm1", {"user_id": "u1", "pid": 42, "os_type": "alpine"})
+    r = store.r
+    assert 0 < r.ttl("vm:vm1:hb") <= 60
+    assert 60 < r.ttl("vm:vm1") <= 120 and 60 < r.ttl("vm:by_pid:42") <= 120
+
+    r.delete("vm:vm1:hb")                      # the lease ran out
+    assert store.lapsed(["vm1"]) == (["vm1"], [])
+    assert store.heartbeat("vm1")
+    assert store.get("vm1")["last_seen"] and store.lapsed(["vm1"]) == ([], [])
+
+    store.delete("vm1")
+    assert not r.exists("vm:vm1:hb")
+    assert not store.heartbeat("vm1") and not r.exists("vm:vm1")  # no resurrection
+
+
+def test_heartbeat_racing_a_delete_writes_nothing():
+    server = fakeredis.FakeServer()
+    store, other = (SessionStore(fakeredis.FakeRedis(server=server, decode_responses=True), ttl_s=60)
+                    for _ in range(2))
+    store.set("vm1", {"user_id": "u1"})
+    pipeline = store.r.pipeline
+
+    def racy_pipeline(*a, **kw):  # the session is deleted between the check and the write
+        pipe = pipeline(*a, **kw)
+        real = pipe.hset
+        def hset(*args, **kwargs):
+            other.delete("vm1")
+            return real(*args, **kwargs)
+        pipe.hset = hset
+        return pipe
+
+    store.r.pipeline = racy_pipeline
+    assert not store.heartbeat("vm1")
+    assert not store.r.exists("vm:vm1") and not store.r.exists("vm:vm1:hb")
+
+
+def test_coalescer_writes_once_per_interval():
+    clock, store = _Clock(), _store()
+    store.set("vm1", {"user_id": "u1"})
+    writes = []
+    real = store.heartbeat
+    store.heartbeat = lambda vmid: writes.append(vmid) or real(vmid)
+    hb = sl.HeartbeatCoalescer(interval_s=30, ttl_s=300, clock=clock)
+
+    assert hb.beat("vm1", store)
+    for _ in range(500):                       # a busy session's log lines
+        assert not hb.beat("vm1", store)
+    clock.t = 29.9
+    assert not hb.due("vm1")
+    clock.t = 30
+    assert hb.beat("vm1", store)
+    assert writes == ["vm1", "vm1"]
+
+    assert sl.HeartbeatCoalescer(interval_s=30, ttl_s=45).interval_s == 15  # renews well inside the TTL
+    store.delete("vm1")
+    clock.t = 60
+    assert not hb.beat("vm1", store) and hb.due("vm1")
+
+
+def test_sweep_reclaims_lapsed_adopts_legacy_and_skips_remote(monkeypatch):
+    store = _store()
+    cleaned = []
+    monkeypatch.setattr(sl, "cleanup_vm", lambda vmid, s: cleaned.append(vmid) or s.delete(vmid))
+    monkeypatch.setattr(sl, "VM_PROFILES", {"alpine": {}})
+    r = store.r
+
+    store.set("lapsed", {"user_id": "u1", "os_type": "alpine"})
+    r.delete("vm:lapsed:hb")
+    store.set("remote", {"user_id": "u2", "node_id": "other-node"})
+    r.delete("vm:remote:hb")
+    r.hset("vm:legacy", mapping={"user_id": "u3"})  # written before sessions had leases
+    r.sadd("vms:active", "legacy", "gone")
+    r.sadd("vms:by_os:alpine", "gone")              # hash already expired
+
+    assert sl.sweep(store) == 1
+    assert cleaned == ["lapsed"]
+    assert store.get("remote") is not None           # its own node reclaims it
+    assert r.exists("vm:legacy:hb")
+    assert r.smembers("vms:active") == {"remote", "legacy"}
+    assert not r.sismember("vms:by_os:alpine", "gone")
+    assert not sl.reclaim(store, "legacy", "expired")  # lease is live again
+
+
+def test_lease_vmid():
+    assert sl.lease_vmid("vm:abc123:hb") == "abc123"
+    assert sl.lease_vmid("vm:abc123") is None
+    assert sl.lease_vmid("node:n1") is None
@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from methods.assets import assets
+
+APP_JS = "import { util } from './core/util.js';\nexport const app = util + 1;\n" + "// padding\n" * 40
+
+
+def _tree(root):
+    (root / "core").mkdir(parents=True)
+    (root / "core" / "util.js").write_text("export const util = 41;\n")
+    (root / "app.js").write_text(APP_JS)
+    (root / "style.css").write_text("body { margin: 0 }\n")
+    (root / "index.html").write_text(
+        '<html><head><link rel="stylesheet" href="style.css" /></head>'
+        '<body><script type="module" src="app.js"></script></body></html>'
+    )
+    return root
+
+
+def test_build_hashes_preloads_and_compresses(tmp_path):
+    src, out = _tree(tmp_path / "static"), tmp_path / "build"
+    manifest = assets.build_static(src, out)
+    assert set(manifest) == {"app.js", "style.css", "core/util.js"}
+    assert json.loads((out / assets.MANIFEST).read_text()) == manifest
+
+    app_js = manifest["app.js"]
+    assert assets.HASHED.search(app_js) and (out / app_js).read_text() == APP_JS
+    html = (out / "index.html").read_text()
+    assert f'src="{app_js}"' in html and f'href="{manifest["style.css"]}"' in html
+    assert f'"./core/util.js":"./{manifest["core/util.js"]}"' in html        # import map
+    assert f'rel="modulepreload" href="./{manifest["core/util.js"]}"' in html
+
+    assert gzip.decompress((out / (app_js + ".gz")).read_bytes()).decode() == APP_JS
+    assert not (out / "core" / "util.js.gz").exists()                        # too small to bother
+    assert assets.static_root(src, out) == out
+    os.utime(src / "style.css", (1e10, 1e10))                                # edited after the build
+    assert assets.static_root(src, out) == src
+
+
+def test_serves_variants_with_cache_headers(tmp_path):
+    out = tmp_path / "build"
+    manifest = assets.build_static(_tree(tmp_path / "static"), out)
+    app = FastAPI()
+    app.mount("/static", assets.PrecompressedStaticFiles(directory=out), name="static")
+    client = TestClient(app)
+    url = "/static/" + manifest["app.js"]
+
+    res = client.get(url, headers={"accept-encoding": "gzip, br;q=0"})
+    assert res.text == APP_JS                                                # httpx decodes the gzip
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["content-type"].startswith("text/javascript")
+    assert res.headers["cache-control"] == assets.IMMUTABLE
+    assert res.headers["vary"] == "Accept-Encoding"
+    etag = res.headers["etag"]
+    assert etag.endswith('-gzip"')
+    again = client.get(url, headers={"accept-encoding": "gzip", "if-none-match": etag})
+    assert again.status_code == 304
+
+    plain = client.get(url, headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.headers["etag"] != etag
+    page = client.get("/static/index.html", headers={"accept-encoding": "identity"})
+    assert page.headers["cache-control"] == assets.REVALIDATE
+
+
+def test_accept_encoding_parsing():
+    assert assets._accepted("gzip;q=0.5, br;q=0, deflate") == {"gzip", "deflate"}
+    assert assets._accepted("") == set()
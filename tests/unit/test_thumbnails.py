@@ -0,0 +1,118 @@
+import asyncio
+import json
+import struct
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from methods.manager import Thumbnails as th
+from routers import vm as vm_router
+
+
+def _ppm(w, h, comment=b""):
+    return b"P6\n" + comment + f"{w} {h}\n255\n".encode() + bytes((0x20, 0x40, 0x80)) * (w * h)
+
+
+def _png_size(data):
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    return struct.unpack(">II", data[16:24])
+
+
+async def _fake_qmp(path, calls):
+    async def handle(reader, writer):
+        writer.write(b'{"QMP": {"version": {}, "capabilities": []}}\n')
+        while line := await reader.readline():
+            msg = json.loads(line)
+            calls.append(msg["execute"])
+            if msg["execute"] == "screendump":
+                Path(msg["arguments"]["filename"]).write_bytes(_ppm(640, 480))
+            writer.write(b'{"return": {}}\n')
+            await writer.drain()
+        writer.close()
+    return await asyncio.start_unix_server(handle, path=str(path))
+
+
+def test_render_downscales_ppm_to_png():
+    if th.Image is not None:
+        pytest.skip("Pillow installed: WebP path")
+    data, media_type = th.render(_ppm(640, 480, b"# qemu\n"), 320)
+    assert media_type == "image/png" and _png_size(data) == (320, 240)
+    raw = zlib.decompress(data[data.index(b"IDAT") + 4:-16])
+    assert len(raw) == 240 * (1 + 320 * 3) and raw[1:4] == b"\x20\x40\x80"
+    assert _png_size(th.render(_ppm(100, 50), 320)[0]) == (100, 50)  # never upscaled
+    with pytest.raises(ValueError):
+        th.parse_ppm(_ppm(640, 480)[:-1])
+
+
+class _Store:
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    def get(self, vmid):
+        return self.sessions.get(vmid)
+
+
+def test_only_watched_local_vms_are_captured(tmp_path, monkeypatch):
+    monkeypatch.setattr(th, "RUN_DIR", tmp_path)
+    cache = th.ThumbnailCache(fakeredis.FakeRedis(decode_responses=True))
+    svc = th.ThumbnailService(cache, rate=2, min_interval_s=10)
+    store = _Store({v: {"os_type": "alpine", "qmp_socket": str(tmp_path / f"{v}.sock")} for v in ("a", "b", "idle")})
+    store.sessions["remote"] = {"node_id": "elsewhere"}
+    calls = {v: [] for v in ("a", "b", "idle")}
+
+    async def scenario():
+        servers = [await _fake_qmp(tmp_path / f"{v}.sock", c) for v, c in calls.items()]
+        try:
+            for v in ("remote", "a", "b"):
+                cache.want(v)
+            results = [await svc.step(store) for _ in range(3)]
+        finally:
+            for s in servers:
+                s.close()
+        return results
+
+    assert asyncio.run(scenario()) == [True, True, False]  # a and b once each, then not due yet
+    assert calls["a"] == calls["b"] == ["qmp_capabilities", "screendump"]
+    assert calls["idle"] == [] and svc._remote == {"remote"}
+    assert not list(tmp_path.glob("*.ppm"))
+    assert svc.interval(100) == 50  # 100 watched VMs at 2/s: each refreshed every 50 s
+    first = cache.get("a")
+    assert first.media_type in ("image/png", "image/webp")
+    assert cache.put("a", first.data, first.media_type) == first.etag  # same screen, same ETag
+
+
+@pytest.fixture
+def client():
+    store = fakeredis.FakeRedis(decode_responses=True)
+    cache = th.ThumbnailCache(store)
+    sessions = _Store({"vm1": {"user_id": "7"}, "vm2": {"user_id": "8"}})
+    app = FastAPI()
+    app.include_router(vm_router.router, prefix="/vm")
+    app.dependency_overrides[vm_router.get_current_user] = lambda: SimpleNamespace(id=7, role="user")
+    app.dependency_overrides[vm_router.get_session_store] = lambda: sessions
+    app.dependency_overrides[vm_router.get_thumbnail_cache] = lambda: cache
+    with TestClient(app) as c:
+        c.cache = cache
+        yield c
+
+
+def test_thumbnail_endpoint_records_demand_and_revalidates(client):
+    assert client.get("/vm/thumb/vm2").status_code == 404  # someone else's VM
+    assert client.cache.watched() == []
+
+    pending = client.get("/vm/thumb/vm1")
+    assert pending.status_code == 202 and "retry-after" in pending.headers
+    assert client.cache.watched() == ["vm1"]
+
+    etag = client.cache.put("vm1", b"\x89PNG-bytes", "image/png")
+    res = client.get("/vm/thumb/vm1")
+    assert res.status_code == 200 and res.content == b"\x89PNG-bytes"
+    assert res.headers["content-type"] == "image/png" and res.headers["etag"] == f'"{etag}"'
+    assert res.headers["cache-control"].startswith("private")
+    assert client.get("/vm/thumb/vm1", headers={"If-None-Match": f'"{etag}"'}).status_code == 304
@@ -0,0 +1,335 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from methods.manager import VncBridge as vb
+from methods.manager.ProcessManager import ProcRegistry
+from methods.manager.ViewerTokens import viewer_role, viewer_token
+
+sync_client = pytest.importorskip("websockets.sync.client")
+from websockets.exceptions import ConnectionClosed
+
+HANDSHAKE = b"RFB 003.008\n" + b"\x01" + b"\x01"  # version, security None, ClientInit(shared)
+FBUR_FULL = struct.pack(">BBHHHH", 3, 0, 0, 0, 640, 480)
+FBUR_INCR = struct.pack(">BBHHHH", 3, 1, 0, 0, 640, 480)
+
+
+def test_parser_follows_handshake_and_messages():
+    seen = []
+    p = vb.RfbClientParser(seen.append)
+    stream = (HANDSHAKE + struct.pack(">BxH", 2, 2) + b"\0" * 8 + FBUR_FULL
+              + struct.pack(">BBxxI", 4, 1, 0x61) + struct.pack(">BBHH", 5, 0, 10, 10) + FBUR_INCR)
+    for i in range(0, len(stream), 5):  # arbitrary fragmentation
+        p.feed(stream[i:i + 5])
+    assert seen == [False, True]
+    p.feed(b"\x99")
+    assert not p.active
+
+
+def _fake_vnc(path):
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(str(path))
+    srv.listen(1)
+
+    def serve():
+        conn, _ = srv.accept()
+        with conn:
+            conn.sendall(b"RFB 003.008\n")
+            conn.recv(12)
+            conn.sendall(b"\x01\x01")
+            conn.recv(1)
+            conn.sendall(b"\0\0\0\0")
+            conn.recv(1)
+            conn.sendall(struct.pack(">HH16sI", 640, 480, b"\0" * 16, 0))
+            while data := conn.recv(10):
+                if data[0] == 3:
+                    conn.sendall(struct.pack(">BxH", 0, 1) + b"\0" * 12)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return srv
+
+
+class _Store:
+    def __init__(self):
+        self.beats = []
+        self.events = []
+
+    def get(self, vmid):
+        return {"os_type": "vnc-test"}
+
+    def heartbeat(self, vmid):
+        self.beats.append(vmid)
+        return True
+
+    def event(self, kind, vmid, **fields):
+        self.events.append(kind)
+
+
+def _count(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_bridge_relays_and_measures(tmp_path, monkeypatch):
+    cleaned = []
+    monkeypatch.setattr(vb, "cleanup_vm", lambda vmid, store: cleaned.append(vmid))
+    sock = tmp_path / "vnc.sock"
+    srv = _fake_vnc(sock)
+    registry, store = ProcRegistry(), _Store()
+    bridge = vb.VncBridgeService(registry, store_factory=lambda: store)
+    first_before = _count("vmshare_vnc_time_to_first_frame_seconds_count", os_type="vnc-test")
+
+    port = bridge.start("vm1", str(sock))
+    try:
+        with sync_client.connect(f"ws://127.0.0.1:{port}/ws/{port}", subprotocols=["binary"]) as ws:
+            assert ws.recv() == b"RFB 003.008\n"
+            ws.send(b"RFB 003.008\n")
+            assert ws.recv() == b"\x01\x01"
+            ws.send(b"\x01")
+            assert ws.recv() == b"\0\0\0\0"
+            ws.send(b"\x01")
+            assert len(ws.recv()) == 24
+            ws.send(FBUR_FULL)
+            assert ws.recv()[:1] == b"\x00"
+    finally:
+        srv.close()
+
+    deadline = time.time() + 5
+    while (not cleaned or registry.get("ws:vm1") is not None) and time.time() < deadline:
+        time.sleep(0.05)
+    assert cleaned == ["vm1"]
+    assert store.beats and store.beats[0] == "vm1"  # lease renewed on connect
+    assert store.events == ["connected", "disconnected"]
+    assert registry.get("ws:vm1") is None  # bridge stopped after the browser left
+    assert _count("vmshare_vnc_time_to_first_frame_seconds_count", os_type="vnc-test") - first_before == 1
+    assert _count("vmshare_vnc_update_latency_seconds_count", os_type="vnc-test", incremental="0") >= 1
+    assert _count("vmshare_vnc_bytes_total", os_type="vnc-test", direction="down") > 0
+    assert _count("vmshare_vnc_sessions", os_type="vnc-test") == 0
+
+
+def _rect(x, y, w, h, enc):
+    return struct.pack(">HHHHi", x, y, w, h, enc)
+
+
+def test_server_framer_splits_messages():
+    raw = _rect(0, 0, 2, 2, vb.RAW) + b"\1" * 16
+    copy = _rect(4, 4, 2, 2, vb.COPYRECT) + struct.pack(">HH", 0, 0)
+    hextile = (_rect(0, 0, 20, 16, vb.HEXTILE)
+               + b"\x01" + b"\2" * (16 * 16 * 4)                 # raw tile
+               + bytes([2 | 8 | 16]) + b"\3" * 4 + b"\x02" + b"\4" * 12)  # bg + 2 coloured subrects
+    cursor = _rect(1, 1, 3, 2, vb.CURSOR) + b"\5" * 24 + b"\xe0\xe0"
+    stream = (struct.pack(">BxH", 0, 3) + raw + copy + hextile
+              + struct.pack(">BxH", 0, 2) + raw + cursor
+              + b"\x02" + struct.pack(">B3xI", 3, 5) + b"hello"
+              + struct.pack(">BxH", 0, 1) + _rect(0, 0, 800, 600, vb.DESKTOP_SIZE))
+    framer, out = vb.RfbServerFramer(640, 480), []
+    for i in range(0, len(stream), 7):
+        out += framer.feed(stream[i:i + 7])
+    assert [(t, droppable) for t, _, droppable in out] == [(0, True), (0, False), (2, False), (3, False), (0, False)]
+    assert b"".join(m for _, m, _ in out) == stream
+    assert framer.cursor == struct.pack(">BxH", 0, 1) + cursor
+    assert framer.size == (800, 600)
+
+
+def test_slow_viewer_skips_updates_then_resyncs():
+    class _Ws:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, data):
+            self.sent.append(data)
+
+    async def main():
+        ws, resyncs = _Ws(), []
+
+        async def resync():
+            resyncs.append(1)
+
+        viewer = vb._Viewer(ws, "ro", vb._SessionStats("vnc-test"), max_queue=10)
+        assert viewer.offer(b"u" * 8, True)
+        assert not viewer.offer(b"v" * 8, True)     # would pass max_queue: skipped
+        assert viewer.offer(b"\x02", False)          # a bell always gets through
+        assert not viewer.offer(b"w", True)          # still behind until the queue drains
+        pump = asyncio.ensure_future(viewer.pump(resync))
+        await asyncio.sleep(0.01)
+        assert viewer.offer(b"x", True)
+        await asyncio.sleep(0.01)
+        pump.cancel()
+        viewer.stats.close()
+        return ws.sent, resyncs
+
+    sent, resyncs = asyncio.run(main())
+    assert sent == [b"u" * 8, b"\x02", b"x"] and resyncs == [1]
+
+
+def _fake_shared_vnc(path, keys):
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(str(path))
+    srv.listen(1)
+
+    def recv(conn, n):
+        buf = b""
+        while len(buf) < n:
+            chunk = conn.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError
+            buf += chunk
+        return buf
+
+    def serve():
+        conn, _ = srv.accept()
+        with conn:
+            try:
+                conn.sendall(b"RFB 003.008\n")
+                recv(conn, 12)
+                conn.sendall(b"\x01\x01")
+                recv(conn, 1)
+                conn.sendall(b"\0\0\0\0")
+                recv(conn, 1)
+                conn.sendall(struct.pack(">HH16sI", 640, 480, b"\0" * 16, 4) + b"fake")
+                while True:
+                    t = recv(conn, 1)[0]
+                    if t == 0:
+                        recv(conn, 19)
+                    elif t == 2:
+                        recv(conn, 4 * struct.unpack(">xH", recv(conn, 3))[0])
+                    elif t == 3:
+                        recv(conn, 9)
+                        conn.sendall(struct.pack(">BxH", 0, 1) + _rect(0, 0, 1, 1, vb.RAW) + b"\0" * 4)
+                    elif t == 4:
+                        keys.append(struct.unpack(">BxxI", recv(conn, 7))[1])
+            except ConnectionError:
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    return srv
+
+
+def _viewer_handshake(ws):
+    assert ws.recv() == b"RFB 003.008\n"
+    ws.send(b"RFB 003.008\n")
+    assert ws.recv() == b"\x01\x01"
+    ws.send(b"\x01")
+    assert ws.recv() == b"\0\0\0\0"
+    ws.send(b"\x01")
+    init = ws.recv()
+    assert init[:4] == struct.pack(">HH", 640, 480) and init[4:20] == vb.PIXEL_FORMAT and init.endswith(b"fake")
+
+
+def _viewer_url(port, vmid, role):
+    return f"ws://127.0.0.1:{port}/ws/{port}?token={viewer_token(vmid, role, 60)}"
+
+
+def test_viewer_tokens_are_bound_to_vm_role_and_expiry():
+    ro = viewer_token("vm1", "ro", 60, now=1000)
+    assert viewer_role("vm1", ro, now=1000) == "ro"
+    assert viewer_role("vm1", "rw" + ro[2:], now=1000) is None   # edited into the owner's
+    assert viewer_role("vm2", ro, now=1000) is None              # another VM
+    assert viewer_role("vm1", ro, now=1060) is None              # expired
+    assert viewer_role("vm1", None) is None and viewer_role("vm1", "garbage") is None
+
+
+def test_shared_session_fans_out_and_gates_input(tmp_path, monkeypatch):
+    cleaned, keys = [], []
+    monkeypatch.setattr(vb, "cleanup_vm", lambda vmid, store: cleaned.append(vmid))
+    monkeypatch.setattr(vb, "VNC_SHARING", "shared")
+    sock = tmp_path / "vnc.sock"
+    srv = _fake_shared_vnc(sock, keys)
+    registry, store = ProcRegistry(), _Store()
+    bridge = vb.VncBridgeService(registry, store_factory=lambda: store)
+    port = bridge.start("vm2", str(sock))
+    key = lambda k: struct.pack(">BBxxI", 4, 1, k)
+    try:
+        with sync_client.connect(_viewer_url(port, "vm2", "rw"), subprotocols=["binary"]) as rw:
+            _viewer_handshake(rw)
+            with sync_client.connect(_viewer_url(port, "vm2", "ro"), subprotocols=["binary"]) as ro:
+                _viewer_handshake(ro)
+                rw.send(key(0x61) + FBUR_FULL)
+                assert rw.recv(timeout=5)[:1] == ro.recv(timeout=5)[:1] == b"\x00"
+                ro.send(key(0x62) + FBUR_FULL)          # read-only: the key never reaches the VM
+                assert rw.recv(timeout=5)[:1] == ro.recv(timeout=5)[:1] == b"\x00"
+            time.sleep(0.2)
+            assert not cleaned and registry.get("ws:vm2") is not None  # one viewer left, session stays
+    finally:
+        srv.close()
+
+    deadline = time.time() + 5
+    while (not cleaned or registry.get("ws:vm2") is not None) and time.time() < deadline:
+        time.sleep(0.05)
+    assert keys == [0x61]
+    assert cleaned == ["vm2"] and registry.get("ws:vm2") is None
+    assert store.events == ["connected", "connected", "disconnected", "disconnected"]
+    assert _count("vmshare_vnc_viewers", os_type="vnc-test", role="ro") == 0
+
+
+def test_share_link_cannot_take_control_or_keep_the_vm(tmp_path, monkeypatch):
+    cleaned, keys = [], []
+    monkeypatch.setattr(vb, "cleanup_vm", lambda vmid, store: cleaned.append(vmid))
+    monkeypatch.setattr(vb, "VNC_SHARING", "shared")
+    sock = tmp_path / "vnc.sock"
+    srv = _fake_shared_vnc(sock, keys)
+    registry, store = ProcRegistry(), _Store()
+    bridge = vb.VncBridgeService(registry, store_factory=lambda: store)
+    port = bridge.start("vm3", str(sock))
+    key = lambda k: struct.pack(">BBxxI", 4, 1, k)
+    forged = _viewer_url(port, "vm3", "ro").replace("token=ro.", "token=rw.")
+    try:
+        for url in (f"ws://127.0.0.1:{port}/ws/{port}", f"ws://127.0.0.1:{port}/ws/{port}?view=rw", forged):
+            with sync_client.connect(url, subprotocols=["binary"]) as ws:
+                with pytest.raises(ConnectionClosed) as closed:
+                    ws.recv(timeout=5)
+            assert closed.value.rcvd.code == 1008
+
+        with sync_client.connect(_viewer_url(port, "vm3", "ro"), subprotocols=["binary"]) as ro:
+            _viewer_handshake(ro)                       # first in, but a share link never gets the seat
+            ro.send(key(0x62) + FBUR_FULL)
+            assert ro.recv(timeout=5)[:1] == b"\x00"
+            with sync_client.connect(_viewer_url(port, "vm3", "rw"), subprotocols=["binary"]) as rw:
+                _viewer_handshake(rw)
+                rw.send(key(0x61) + FBUR_FULL)
+                assert rw.recv(timeout=5)[:1] == b"\x00"
+            with pytest.raises(ConnectionClosed):       # the owner left: the viewer is dropped
+                while True:
+                    ro.recv(timeout=5)
+    finally:
+        srv.close()
+
+    deadline = time.time() + 5
+    while (not cleaned or registry.get("ws:vm3") is not None) and time.time() < deadline:
+        time.sleep(0.05)
+    assert keys == [0x61]
+    assert cleaned == ["vm3"] and registry.get("ws:vm3") is None
+
+
+def test_hub_refuses_joiners_once_qemu_closed_the_connection(tmp_path):
+    async def qemu(reader, writer):  # handshake, then the VM goes away
+        writer.write(b"RFB 003.008\n")
+        await reader.readexactly(12)
+        writer.write(b"\x01\x01")
+        await reader.readexactly(1)
+        writer.write(b"\0\0\0\0")
+        await reader.readexactly(1)
+        writer.write(struct.pack(">HH16sI", 640, 480, b"\0" * 16, 4) + b"fake")
+        await reader.readexactly(20)  # SetPixelFormat, then SetEncodings
+        await reader.readexactly(4 * struct.unpack(">xxH", await reader.readexactly(4))[0])
+        writer.close()
+
+    async def main():
+        sock = str(tmp_path / "vnc.sock")
+        server = await asyncio.start_unix_server(qemu, sock)
+        hub = vb.VncHub("vm4", lambda: asyncio.open_unix_connection(sock), policy="shared")
+        assert hub.admit(owner=True) == "rw"
+        await hub.open()
+        await asyncio.wait_for(hub._pump_task, 5)
+        with pytest.raises(ConnectionError):  # a late joiner does not attach to the dead upstream
+            await hub.open()
+        hub.release("rw", owner=True)
+        ended = await hub.close(owner=True)  # ...but the owner leaving still ends the session
+        server.close()
+        return ended
+
+    assert asyncio.run(main())
@@ -0,0 +1,56 @@
+import struct
+
+import pytest
+
+from methods.manager import VncQuality as vq
+from methods.manager.VncBridge import RfbClientParser
+
+# what noVNC sends: tight, zrle, hextile, raw, copyrect, quality 6, compression 2, audio, cursor
+NOVNC = [7, 16, 5, 0, 1, -32 + 6, -256 + 2, vq.AUDIO, -239]
+
+
+def test_vnc_args_from_profile():
+    assert vq.vnc_args("/run/v.sock", {}) == ["-vnc", "unix:/run/v.sock"]  # bare legacy display
+    args = vq.vnc_args("/run/v.sock", {"vnc": {"lossy": True, "audio": True}})
+    assert args[:2] == ["-vnc", "unix:/run/v.sock,lossy=on,audiodev=vnc-audio"]
+    assert "none,id=vnc-audio" in args
+    with pytest.raises(ValueError):
+        vq.vnc_options({"vnc": {"encodings": ["jpeg"]}})
+    with pytest.raises(ValueError):
+        vq.vnc_options({"vnc": {"quality": 12}})
+
+
+def test_controller_rewrites_and_adapts(monkeypatch):
+    monkeypatch.setattr(vq, "VNC_SLOW_RTT_MS", 250)
+    monkeypatch.setattr(vq, "VNC_CONGESTED_BYTES", 1000)
+    q = vq.QualityController(vq.vnc_options({"vnc": {"encodings": ["zrle", "tight"]}}))
+    assert q.rewrite(NOVNC) == [16, 7, 5, 0, 1, -239, -32 + 6, -256 + 2]  # audio stripped, zrle first
+
+    assert q.adapt(rtt=0.4, send_buffer=0, stalled=False)      # slow RTT: quality 6 → 3
+    assert (q.quality, q.compression) == (3, 5)
+    assert q.adapt(rtt=0.01, send_buffer=5000, stalled=False)  # backed up: → 0
+    assert not q.adapt(rtt=None, send_buffer=0, stalled=True)  # already at the floor
+    for _ in range(vq.RECOVER_WINDOWS - 1):
+        assert not q.adapt(rtt=0.01, send_buffer=0, stalled=False)
+    assert q.adapt(rtt=0.01, send_buffer=0, stalled=False) and q.quality == 1
+    assert q.encodings()[-2:] == [-32 + 1, -256 + 7]
+
+    q.rewrite([7, 0, -32 + 9])                                 # browser raises its setting
+    assert (q.ceiling, q.quality) == (9, 1)                    # the link earns it back
+    fixed = vq.QualityController(vq.vnc_options({"vnc": {"adaptive": False}}))
+    fixed.rewrite(NOVNC)
+    assert not fixed.adapt(rtt=2.0, send_buffer=10 ** 9, stalled=True)
+
+
+def test_parser_relays_rewritten_set_encodings():
+    q = vq.QualityController(vq.vnc_options({"vnc": {"quality": 4}}))
+    p = RfbClientParser(lambda incremental: None, q.rewrite)
+    handshake = b"RFB 003.008\n" + b"\x01" + b"\x01"
+    key = struct.pack(">BBxxI", 4, 1, 0x61)
+    stream = handshake + vq.set_encodings(NOVNC) + key
+    out = b"".join(p.feed(stream[i:i + 5]) for i in range(0, len(stream), 5))
+    expected = [7, 16, 5, 0, 1, -239, -32 + 4, -256 + 2]
+    assert out == handshake + vq.set_encodings(expected) + key
+
+    p.feed(b"\x99")                                            # lost the framing: plain relay from here
+    assert not p.active and p.feed(b"raw") == b"raw"